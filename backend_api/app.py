@@ -6,71 +6,175 @@ Unified backend (Flask) using the shared SQLAlchemy models in /database.
 Implements:
 - CRUD for passwords (list/add/update/trash/restore/delete/favorite)
 - Simple reveal (returns stored encrypted_password as-is; client-side decrypt if you use zero-knowledge)
+- Password storage behind backend_api/repository.py (SQL, or an embedded log file with VAULT_STORE=log)
 - Stats endpoint (weak/medium/strong + favorites + trashed + security score)
+  and a security score trend from daily snapshots (backend_api/snapshots.py)
 - Profile endpoint (get/update username/email)
 - Sessions + devices listing + revoke (optional, for 'pro' feel)
+- Account deletion (queued, batched purge with progress)
+- Background re-encryption of a vault to one token format (backend_api/reencrypt.py)
 - Export/Import JSON (for backups / portability)
+- Keyset-paginated, hash-chained audit journal (+ verification endpoint)
+- Server-Sent Events stream of vault changes (backend_api/events.py)
+- Background maintenance (expiry sweeper) + status endpoint
+- Optional user-sharded storage (database/engine.py): per-user rows are read and
+  written through the user's shard, row ids carry the shard index
 """
 
 from __future__ import annotations
 
+import json
+import os
 from datetime import datetime
-from flask import Flask, jsonify, request
+from flask import Flask, Response, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import select, update, delete
 from sqlalchemy.exc import IntegrityError
 
-from database.engine import SessionLocal, init_db
-from database.models import Password, User, Session, UserDevice, ActivityLog
+from database.engine import (
+    SessionLocal,
+    encode_row_id,
+    init_db,
+    row_sessionmaker,
+    shard_of,
+    user_session,
+)
+from database.models import User, Session, ActivityLog
+from database.queries import STATEMENTS
+from backend_api.events import ChangeBus, stream as sse_stream
+from backend_api.maintenance import build_default_scheduler
+from backend_api.purge import request_account_purge, purge_status
+from backend_api.reencrypt import SERVER_TARGETS, reencryption_status, request_reencryption, run_pending_reencryptions
+from backend_api.repository import PASSWORD_FIELDS, LogPasswordRepository, build_repository
+from backend_api.snapshots import BUCKETS, snapshot_user, summarize_rows, take_snapshots, trend
+from src.security.audit import list_events, verify_journal
+from src.security.ciphertext import pack
+from src.security.envelope import entry_key_version
+from src.security.kdf_service import KDF
 
 app = Flask(__name__)
 CORS(app)
 init_db()
-
-
-def _log(db, user_id: int | None, action: str) -> None:
+passwords = build_repository()
+maintenance = build_default_scheduler(passwords=passwords)
+change_bus = ChangeBus(replay_size=int(os.getenv("SSE_REPLAY_BUFFER", "256")))
+maintenance.add_job(
+    "security_snapshots",
+    lambda: take_snapshots(passwords),
+    float(os.getenv("SECURITY_SNAPSHOT_INTERVAL_SECONDS", "3600")),
+)
+maintenance.add_job(
+    "reencrypt",
+    lambda: run_pending_reencryptions(
+        passwords,
+        batch_size=int(os.getenv("REENCRYPT_BATCH_SIZE", "200")),
+        rate_per_second=float(os.getenv("REENCRYPT_RATE_PER_SECOND", "500")) or None,
+        max_batches_per_run=int(os.getenv("REENCRYPT_MAX_BATCHES_PER_RUN", "50")),
+    ),
+    float(os.getenv("REENCRYPT_INTERVAL_SECONDS", "30")),
+)
+if isinstance(passwords, LogPasswordRepository):
+    maintenance.add_job(
+        "vault_log_compaction",
+        lambda: {"compacted": int(passwords.store.maybe_compact()), **passwords.store.stats()},
+        float(os.getenv("VAULT_LOG_COMPACT_INTERVAL_SECONDS", "300")),
+        gauges=("records", "log_bytes", "dead_bytes", "generation", "unindexed_frames", "recovered_bytes"),
+    )
+
+
+def _log(
+    db,
+    user_id: int | None,
+    category: str,
+    verb: str,
+    target_id: int | None = None,
+    target_label: str | None = None,
+    details: str | None = None,
+) -> None:
     try:
-        db.add(ActivityLog(user_id=user_id or 0, action=action))
+        db.add(ActivityLog.event(
+            user_id or 0, category, verb,
+            target_id=target_id, target_label=target_label, details=details,
+        ))
         db.commit()
     except Exception:
         db.rollback()
 
 
+def _audit(user_id: int, category: str, verb: str, **kwargs) -> None:
+    """_log through the user's own session (password endpoints hold none)."""
+    with user_session(user_id) as db:
+        _log(db, user_id, category, verb, **kwargs)
+
+
+def _publish(user_id: int, entry_id: int | None, op: str) -> None:
+    """Repository listener: notify /events subscribers of every committed change.
+    Writes made through the API carry the writer's X-Client-Id."""
+    src = request.headers.get("X-Client-Id") if has_request_context() else None
+    change_bus.publish(user_id, entry_id, op, src=src)
+
+
+passwords.add_listener(_publish)
+
+
+def _iso(value: datetime | None) -> str | None:
+    return value.isoformat() if value else None
+
+
+@app.before_request
+def _note_activity():
+    maintenance.note_activity()
+
+
 @app.get("/health")
 def health():
-    return jsonify({"ok": True, "time": datetime.utcnow().isoformat()})
+    return jsonify({
+        "ok": True,
+        "time": datetime.utcnow().isoformat(),
+        "statement_cache": STATEMENTS.stats(),
+        "kdf": KDF.stats(),
+    })
 
 
 # --------------------------- PASSWORDS ---------------------------
 
+def _row_json(row: tuple) -> dict:
+    (pid, uid, site_name, site_url, site_icon, username, encrypted_password,
+     category, strength, favorite, trashed_at, last_updated, created_at) = row
+    return {
+        "id": pid,
+        "user_id": uid,
+        "site_name": site_name,
+        "site_url": site_url or "",
+        "site_icon": site_icon or "🔒",
+        "username": username,
+        "encrypted_password": encrypted_password,
+        "category": category,
+        "strength": strength,
+        "favorite": bool(favorite),
+        "trashed_at": _iso(trashed_at),
+        "last_updated": _iso(last_updated),
+        "created_at": _iso(created_at),
+    }
+
+
 @app.get("/passwords/<int:user_id>")
 def list_passwords(user_id: int):
-    db = SessionLocal()
-    try:
-        rows = db.execute(
-            select(Password).where(Password.user_id == user_id).order_by(Password.last_updated.desc())
-        ).scalars().all()
+    return jsonify([_row_json(row) for row in passwords.list_rows(user_id)])
 
-        return jsonify([
-            {
-                "id": p.id,
-                "user_id": p.user_id,
-                "site_name": p.site_name,
-                "site_url": p.site_url or "",
-                "site_icon": p.site_icon or "🔒",
-                "username": p.username,
-                "encrypted_password": p.encrypted_password,
-                "category": p.category,
-                "strength": p.strength,
-                "favorite": bool(p.favorite),
-                "trashed_at": p.trashed_at.isoformat() if p.trashed_at else None,
-                "last_updated": p.last_updated.isoformat() if p.last_updated else None,
-                "created_at": p.created_at.isoformat() if p.created_at else None,
-            }
-            for p in rows
-        ])
-    finally:
-        db.close()
+
+def _entry_fields(data: dict) -> dict:
+    return {
+        "site_name": str(data["site_name"]),
+        "site_url": str(data.get("site_url") or "") or None,
+        "site_icon": str(data.get("site_icon") or "🔒"),
+        "username": str(data["username"]),
+        "encrypted_password": str(data["encrypted_password"]),
+        "key_version": entry_key_version(str(data["encrypted_password"])),
+        "category": str(data.get("category") or "personal"),
+        "strength": str(data.get("strength") or "medium"),
+        "favorite": bool(data.get("favorite") or False),
+        "trashed_at": None,
+    }
 
 
 @app.post("/passwords")
@@ -81,177 +185,130 @@ def add_password():
     if miss:
         return jsonify({"ok": False, "error": f"Missing fields: {', '.join(miss)}"}), 400
 
-    db = SessionLocal()
     try:
-        p = Password(
-            user_id=int(data["user_id"]),
-            site_name=str(data["site_name"]),
-            site_url=str(data.get("site_url") or "") or None,
-            site_icon=str(data.get("site_icon") or "🔒"),
-            username=str(data["username"]),
-            encrypted_password=str(data["encrypted_password"]),
-            category=str(data.get("category") or "personal"),
-            strength=str(data.get("strength") or "medium"),
-            favorite=bool(data.get("favorite") or False),
-            trashed_at=None,
-        )
-        db.add(p)
-        db.commit()
-        _log(db, p.user_id, f"password:add:{p.site_name}")
-        return jsonify({"ok": True, "id": p.id})
+        uid = int(data["user_id"])
+        fields = _entry_fields(data)
+        pid = passwords.add(uid, fields)
+        _audit(uid, "password", "add", target_id=pid, target_label=fields["site_name"])
+        return jsonify({"ok": True, "id": pid})
     except Exception as e:
-        db.rollback()
         return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
 
 
-@app.put("/passwords/<int:pid>")
-def update_password(pid: int):
-    data = request.get_json(force=True) or {}
-    db = SessionLocal()
+def _change_password(pid: int, changes: dict, verb: str):
     try:
-        p = db.get(Password, pid)
+        p = passwords.update(pid, changes, op=verb)
         if not p:
             return jsonify({"ok": False, "error": "Not found"}), 404
-
-        for field in ["site_name", "site_url", "site_icon", "username", "encrypted_password", "category", "strength"]:
-            if field in data and data[field] is not None:
-                setattr(p, field, data[field])
-
-        if "favorite" in data and data["favorite"] is not None:
-            p.favorite = bool(data["favorite"])
-
-        db.commit()
-        _log(db, p.user_id, f"password:update:{p.site_name}")
+        _audit(p["user_id"], "password", verb, target_id=pid, target_label=p["site_name"])
         return jsonify({"ok": True})
     except Exception as e:
-        db.rollback()
         return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
+
+
+@app.put("/passwords/<int:pid>")
+def update_password(pid: int):
+    data = request.get_json(force=True) or {}
+    changes = {
+        field: data[field]
+        for field in ["site_name", "site_url", "site_icon", "username", "encrypted_password", "category", "strength"]
+        if field in data and data[field] is not None
+    }
+    if "favorite" in data and data["favorite"] is not None:
+        changes["favorite"] = bool(data["favorite"])
+    if "encrypted_password" in changes:
+        changes["key_version"] = entry_key_version(changes["encrypted_password"])
+    return _change_password(pid, changes, "update")
 
 
 @app.post("/passwords/<int:pid>/trash")
 def trash_password(pid: int):
-    db = SessionLocal()
-    try:
-        p = db.get(Password, pid)
-        if not p:
-            return jsonify({"ok": False, "error": "Not found"}), 404
-        p.trashed_at = datetime.utcnow()
-        db.commit()
-        _log(db, p.user_id, f"password:trash:{p.site_name}")
-        return jsonify({"ok": True})
-    except Exception as e:
-        db.rollback()
-        return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
+    return _change_password(pid, {"trashed_at": datetime.utcnow()}, "trash")
 
 
 @app.post("/passwords/<int:pid>/restore")
 def restore_password(pid: int):
-    db = SessionLocal()
-    try:
-        p = db.get(Password, pid)
-        if not p:
-            return jsonify({"ok": False, "error": "Not found"}), 404
-        p.trashed_at = None
-        db.commit()
-        _log(db, p.user_id, f"password:restore:{p.site_name}")
-        return jsonify({"ok": True})
-    except Exception as e:
-        db.rollback()
-        return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
+    return _change_password(pid, {"trashed_at": None}, "restore")
 
 
 @app.delete("/passwords/<int:pid>")
 def delete_password(pid: int):
-    db = SessionLocal()
     try:
-        p = db.get(Password, pid)
+        p = passwords.delete(pid)
         if not p:
             return jsonify({"ok": False, "error": "Not found"}), 404
-        uid = p.user_id
-        name = p.site_name
-        db.delete(p)
-        db.commit()
-        _log(db, uid, f"password:delete:{name}")
+        _audit(p["user_id"], "password", "delete", target_id=pid, target_label=p["site_name"])
         return jsonify({"ok": True})
     except Exception as e:
-        db.rollback()
         return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
+
+
+@app.get("/passwords/<int:pid>/entry")
+def get_password_entry(pid: int):
+    """One row in the list format, for clients applying a change event."""
+    p = passwords.get(pid)
+    if not p:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    return jsonify({"ok": True, "entry": _row_json(tuple(p[name] for name in PASSWORD_FIELDS))})
 
 
 @app.get("/passwords/<int:pid>/reveal")
 def reveal_password(pid: int):
-    """Return encrypted_password as stored (server never decrypts)."""
-    db = SessionLocal()
-    try:
-        p = db.get(Password, pid)
-        if not p:
-            return jsonify({"ok": False, "error": "Not found"}), 404
-        _log(db, p.user_id, f"password:reveal:{p.site_name}")
-        return jsonify({"ok": True, "encrypted_password": p.encrypted_password})
-    finally:
-        db.close()
+    """Return encrypted_password as stored (server never decrypts).
+
+    JSON carries the text token; with `Accept: application/octet-stream` the
+    packed binary ciphertext (src/security/ciphertext.py) is sent instead.
+    """
+    p = passwords.get(pid)
+    if not p:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    _audit(p["user_id"], "password", "reveal", target_id=pid, target_label=p["site_name"])
+    if request.accept_mimetypes.best == "application/octet-stream":
+        return Response(pack(p["encrypted_password"] or ""), mimetype="application/octet-stream")
+    return jsonify({"ok": True, "encrypted_password": p["encrypted_password"]})
 
 
 @app.post("/passwords/<int:pid>/favorite")
 def toggle_favorite(pid: int):
-    db = SessionLocal()
     try:
-        p = db.get(Password, pid)
+        p = passwords.toggle_favorite(pid)
         if not p:
             return jsonify({"ok": False, "error": "Not found"}), 404
-        p.favorite = not bool(p.favorite)
-        db.commit()
-        _log(db, p.user_id, f"password:favorite:{p.site_name}:{int(p.favorite)}")
-        return jsonify({"ok": True, "favorite": bool(p.favorite)})
+        _audit(p["user_id"], "password", "favorite", target_id=pid, target_label=p["site_name"],
+               details=str(int(p["favorite"])))
+        return jsonify({"ok": True, "favorite": bool(p["favorite"])})
     except Exception as e:
-        db.rollback()
         return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
 
 
 # --------------------------- STATS / DASHBOARD ---------------------------
 
 @app.get("/stats/<int:user_id>")
 def stats(user_id: int):
-    db = SessionLocal()
+    summary = summarize_rows(passwords.list_rows(user_id))
+    summary.pop("added")
+    return jsonify({"ok": True, **summary})
+
+
+@app.get("/stats/<int:user_id>/trend")
+def stats_trend(user_id: int):
+    """Security score series from daily snapshots: ?bucket=day|week|month&range=12w."""
+    bucket = request.args.get("bucket", "week")
+    if bucket not in BUCKETS:
+        return jsonify({"ok": False, "error": f"bucket must be one of {', '.join(BUCKETS)}"}), 400
     try:
-        rows = db.execute(select(Password).where(Password.user_id == user_id)).scalars().all()
-        total = len(rows)
-        weak = sum(1 for p in rows if (p.strength or "").lower() == "weak")
-        medium = sum(1 for p in rows if (p.strength or "").lower() == "medium")
-        strong = sum(1 for p in rows if (p.strength or "").lower() == "strong")
-        favorites = sum(1 for p in rows if p.favorite)
-        trashed = sum(1 for p in rows if p.trashed_at is not None)
-
-        # simple score: strong=2, medium=1, weak=0 (ignore trashed)
-        active = [p for p in rows if p.trashed_at is None]
-        denom = max(1, len(active) * 2)
-        score = int(100 * (sum(2 if (p.strength or "").lower()=="strong" else 1 if (p.strength or "").lower()=="medium" else 0 for p in active) / denom))
-
-        return jsonify({
-            "ok": True,
-            "total": total,
-            "active": len(active),
-            "weak": weak,
-            "medium": medium,
-            "strong": strong,
-            "favorites": favorites,
-            "trashed": trashed,
-            "score": score,
-        })
-    finally:
-        db.close()
+        # first request of the day before the job ran: snapshot this user now
+        snapshot_user(passwords, user_id, only_missing=True)
+    except IntegrityError:
+        pass  # unknown user: no snapshot, empty series
+    try:
+        points = trend(user_id, bucket, request.args.get("range"))
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    for point in points:
+        point["start"] = point["start"].isoformat()
+        point["day"] = point["day"].isoformat()
+    return jsonify({"ok": True, "bucket": bucket, "points": points})
 
 
 # --------------------------- PROFILE ---------------------------
@@ -283,7 +340,8 @@ def update_profile(user_id: int):
             u.email = str(data["email"]).strip()
 
         db.commit()
-        _log(db, u.id, "profile:update")
+        with user_session(u.id) as log_db:
+            _log(log_db, u.id, "profile", "update", target_id=u.id)
         return jsonify({"ok": True})
     except IntegrityError:
         db.rollback()
@@ -295,16 +353,70 @@ def update_profile(user_id: int):
         db.close()
 
 
+@app.delete("/account/<int:user_id>")
+def delete_account(user_id: int):
+    """Queue a batched purge of the account; progress via GET /account/<id>/purge."""
+    try:
+        purge = request_account_purge(user_id)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    if not purge:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    return jsonify({"ok": True, "purge": purge}), 202
+
+
+@app.get("/account/<int:user_id>/purge")
+def account_purge_status(user_id: int):
+    purge = purge_status(user_id)
+    if not purge:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    return jsonify({"ok": True, "purge": purge})
+
+
+@app.post("/vault/<int:user_id>/reencrypt")
+def vault_reencrypt(user_id: int):
+    """Queue re-encryption of every entry to {"target": "fernet"|"gcm1"}; progress via GET."""
+    data = request.get_json(force=True, silent=True) or {}
+    target = str(data.get("target") or "fernet")
+    if target not in SERVER_TARGETS:
+        return jsonify({"ok": False, "error": f"target must be one of {', '.join(SERVER_TARGETS)}"}), 400
+    try:
+        job = request_reencryption(user_id, target)
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)}), 500
+    if not job:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    _audit(user_id, "vault", "reencrypt", details=target)
+    return jsonify({"ok": True, "job": job}), 202
+
+
+@app.get("/vault/<int:user_id>/key-versions")
+def vault_key_versions(user_id: int):
+    """Entries per data key version ("ek1:" tokens; null = other formats), for lazy re-encryption."""
+    counts = passwords.key_version_counts(user_id)
+    return jsonify({"ok": True, "versions": [{"version": v, "entries": n} for v, n in sorted(
+        counts.items(), key=lambda kv: (kv[0] is not None, kv[0] or 0))]})
+
+
+@app.get("/vault/<int:user_id>/reencrypt")
+def vault_reencrypt_status(user_id: int):
+    job = reencryption_status(user_id)
+    if not job:
+        return jsonify({"ok": False, "error": "Not found"}), 404
+    return jsonify({"ok": True, "job": job})
+
+
 # --------------------------- DEVICES / SESSIONS ---------------------------
 
 @app.get("/devices/<int:user_id>")
 def list_devices(user_id: int):
-    db = SessionLocal()
+    db = user_session(user_id)
     try:
-        devs = db.execute(select(UserDevice).where(UserDevice.user_id == user_id).order_by(UserDevice.last_used.desc())).scalars().all()
+        shard = shard_of(user_id)
+        devs = db.execute(STATEMENTS.get("user_devices.by_user"), {"user_id": user_id}).scalars().all()
         return jsonify({"ok": True, "devices": [
             {
-                "id": d.id,
+                "id": encode_row_id(d.id, shard),
                 "device_name": d.device_name,
                 "ip_address": d.ip_address,
                 "last_used": d.last_used.isoformat() if d.last_used else None,
@@ -316,12 +428,13 @@ def list_devices(user_id: int):
 
 @app.get("/sessions/<int:user_id>")
 def list_sessions(user_id: int):
-    db = SessionLocal()
+    db = user_session(user_id)
     try:
-        sess = db.execute(select(Session).where(Session.user_id == user_id).order_by(Session.created_at.desc())).scalars().all()
+        shard = shard_of(user_id)
+        sess = db.execute(STATEMENTS.get("sessions.by_user"), {"user_id": user_id}).scalars().all()
         return jsonify({"ok": True, "sessions": [
             {
-                "id": s.id,
+                "id": encode_row_id(s.id, shard),
                 "device_info": s.device_info or "",
                 "created_at": s.created_at.isoformat() if s.created_at else None,
                 "expires_at": s.expires_at.isoformat() if s.expires_at else None,
@@ -333,15 +446,16 @@ def list_sessions(user_id: int):
 
 @app.delete("/sessions/<int:session_id>")
 def revoke_session(session_id: int):
-    db = SessionLocal()
+    factory, local_id = row_sessionmaker(session_id)
+    db = factory()
     try:
-        s = db.get(Session, session_id)
+        s = db.get(Session, local_id)
         if not s:
             return jsonify({"ok": False, "error": "Not found"}), 404
         uid = s.user_id
         db.delete(s)
         db.commit()
-        _log(db, uid, f"session:revoke:{session_id}")
+        _log(db, uid, "session", "revoke", target_id=session_id)
         return jsonify({"ok": True})
     except Exception as e:
         db.rollback()
@@ -352,23 +466,21 @@ def revoke_session(session_id: int):
 
 @app.delete("/devices/<int:user_id>/revoke")
 def revoke_device_sessions(user_id: int):
-    db = SessionLocal()
+    db = user_session(user_id)
     try:
         data = request.get_json(silent=True) or {}
         device_name = (data.get("device_name") or "").strip()
         if not device_name:
             return jsonify({"ok": False, "error": "device_name required"}), 400
         sess = db.execute(
-            select(Session).where(
-                Session.user_id == user_id,
-                Session.device_info == device_name
-            )
+            STATEMENTS.get("sessions.by_user_device"),
+            {"user_id": user_id, "device_info": device_name},
         ).scalars().all()
         count = len(sess)
         for s in sess:
             db.delete(s)
         db.commit()
-        _log(db, user_id, f"session:revoke_device:{device_name}:{count}")
+        _log(db, user_id, "session", "revoke_device", target_label=device_name, details=str(count))
         return jsonify({"ok": True, "revoked": count})
     except Exception as e:
         db.rollback()
@@ -381,34 +493,28 @@ def revoke_device_sessions(user_id: int):
 
 @app.get("/export/<int:user_id>")
 def export_vault(user_id: int):
-    """Export JSON. Recommend encrypting client-side before saving to disk."""
-    db = SessionLocal()
-    try:
-        rows = db.execute(select(Password).where(Password.user_id == user_id)).scalars().all()
-        payload = {
-            "version": 1,
-            "exported_at": datetime.utcnow().isoformat(),
-            "passwords": [
-                {
-                    "site_name": p.site_name,
-                    "site_url": p.site_url or "",
-                    "site_icon": p.site_icon or "🔒",
-                    "username": p.username,
-                    "encrypted_password": p.encrypted_password,
-                    "category": p.category,
-                    "strength": p.strength,
-                    "favorite": bool(p.favorite),
-                    "trashed_at": p.trashed_at.isoformat() if p.trashed_at else None,
-                    "last_updated": p.last_updated.isoformat() if p.last_updated else None,
-                    "created_at": p.created_at.isoformat() if p.created_at else None,
-                }
-                for p in rows
-            ],
-        }
-        _log(db, user_id, "vault:export")
-        return jsonify({"ok": True, "vault": payload})
-    finally:
-        db.close()
+    """Export JSON. Recommend encrypting client-side before saving to disk.
+
+    ?stream=1: JSON lines instead (the meta first, then one entry per line),
+    so clients can write a .pgvault v2 file without holding the vault. Rows
+    are read from the database as the response is sent (constant memory).
+    """
+    meta = {"version": 1, "exported_at": datetime.utcnow().isoformat()}
+    _audit(user_id, "vault", "export")
+    if request.args.get("stream") in ("1", "true"):
+        def _lines():
+            yield json.dumps(meta) + "\n"
+            for row in passwords.iter_export_rows(user_id):
+                yield json.dumps({k: v for k, v in _row_json(row).items() if k not in ("id", "user_id")}) + "\n"
+        return Response(stream_with_context(_lines()), mimetype="application/x-ndjson")
+    payload = {
+        **meta,
+        "passwords": [
+            {k: v for k, v in _row_json(row).items() if k not in ("id", "user_id")}
+            for row in passwords.export_rows(user_id)
+        ],
+    }
+    return jsonify({"ok": True, "vault": payload})
 
 
 @app.post("/import/<int:user_id>")
@@ -419,36 +525,77 @@ def import_vault(user_id: int):
     if not isinstance(items, list):
         return jsonify({"ok": False, "error": "Invalid vault format"}), 400
 
-    db = SessionLocal()
     try:
-        imported = 0
-        for it in items:
-            if not it.get("site_name") or not it.get("username") or not it.get("encrypted_password"):
-                continue
-            p = Password(
-                user_id=user_id,
-                site_name=str(it.get("site_name")),
-                site_url=str(it.get("site_url") or "") or None,
-                site_icon=str(it.get("site_icon") or "🔒"),
-                username=str(it.get("username")),
-                encrypted_password=str(it.get("encrypted_password")),
-                category=str(it.get("category") or "personal"),
-                strength=str(it.get("strength") or "medium"),
-                favorite=bool(it.get("favorite") or False),
-                trashed_at=None,
-            )
-            db.add(p)
-            imported += 1
-        db.commit()
-        _log(db, user_id, f"vault:import:{imported}")
+        # generator: entries are inserted and committed in batches
+        imported = passwords.add_many(user_id, (
+            _entry_fields(it) for it in items
+            if it.get("site_name") and it.get("username") and it.get("encrypted_password")
+        ), batch_size=int(os.getenv("IMPORT_BATCH_SIZE", "500")))
+        _audit(user_id, "vault", "import", details=str(imported))
         return jsonify({"ok": True, "imported": imported})
     except Exception as e:
-        db.rollback()
         return jsonify({"ok": False, "error": str(e)}), 500
-    finally:
-        db.close()
+
+
+# --------------------------- AUDIT JOURNAL ---------------------------
+
+@app.get("/audit/<int:user_id>")
+def audit_journal(user_id: int):
+    """Keyset-paginated journal: ?category=&since=&until=&cursor=&limit= (ISO dates)."""
+    args = request.args
+    try:
+        since = datetime.fromisoformat(args["since"]) if args.get("since") else None
+        until = datetime.fromisoformat(args["until"]) if args.get("until") else None
+        page = list_events(
+            user_id,
+            category=args.get("category") or None,
+            since=since,
+            until=until,
+            cursor=args.get("cursor") or None,
+            limit=int(args.get("limit") or 50),
+        )
+    except ValueError as e:
+        return jsonify({"ok": False, "error": str(e)}), 400
+    for item in page["items"]:
+        item["created_at"] = _iso(item["created_at"])
+    return jsonify({"ok": True, **page})
+
+
+@app.get("/audit/<int:user_id>/verify")
+def audit_verify(user_id: int):
+    """Verify the user's audit hash chain since the last checkpoint (advances it when intact)."""
+    return jsonify(verify_journal(user_id))
+
+
+# --------------------------- CHANGE EVENTS (SSE) ---------------------------
+
+@app.get("/events/<int:user_id>")
+def vault_events(user_id: int):
+    """text/event-stream of {"id", "op", "version"} after each committed write.
+
+    Resume with the Last-Event-ID header (or ?last_event_id=); a "reset" event
+    means the missed changes are gone and the client should reload once.
+    """
+    last_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    return Response(
+        stream_with_context(sse_stream(change_bus, user_id, last_id)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# --------------------------- MAINTENANCE ---------------------------
+
+@app.get("/maintenance/status")
+def maintenance_status():
+    return jsonify({"ok": True, **maintenance.metrics(), "events_published": change_bus.published})
 
 
 if __name__ == "__main__":
+    debug = True
+    # With the debug reloader only the child process serves requests
+    if os.getenv("MAINTENANCE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"}:
+        if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            maintenance.start()
     # Always bind localhost for safety
-    app.run(host="127.0.0.1", port=5000, debug=True)
+    app.run(host="127.0.0.1", port=5000, debug=debug)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""backend_api/events.py
+
+Vault change notifications for GET /events/<user_id> (Server-Sent Events).
+
+- ChangeBus.publish(): called for every committed change of the password
+  repository (API writes, trash retention, account purge, re-encryption;
+  see PasswordRepository.add_listener); events are compact:
+  {"id": <entry id or null>, "op": ..., "version": <seq>} with op in add /
+  update / trash / restore / favorite / delete / import / purge, plus "src"
+  (the X-Client-Id of an API writer, so a client can skip its own)
+- every user has a monotonic sequence and a small replay buffer; SSE event
+  ids are "<boot>-<seq>", so a reconnect with Last-Event-ID replays what was
+  missed, and an id from another server run (or too old for the buffer)
+  gets a "reset" event: the client reloads once, then follows the stream
+- stream(): the SSE generator, with a ": ping" comment as heartbeat
+
+The bus is in-process: run the backend as one process (the default).
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class ChangeBus:
+    def __init__(self, replay_size: int = 256) -> None:
+        self.boot = uuid.uuid4().hex[:8]
+        self.replay_size = replay_size
+        self._cond = threading.Condition()
+        self._seq: Dict[int, int] = {}
+        self._events: Dict[int, Deque[dict]] = {}
+        self.published = 0
+
+    def publish(self, user_id: int, entry_id: Optional[int], op: str, src: Optional[str] = None) -> dict:
+        uid = int(user_id)
+        with self._cond:
+            seq = self._seq.get(uid, 0) + 1
+            self._seq[uid] = seq
+            evt = {"id": entry_id, "op": op, "version": seq}
+            if src:
+                evt["src"] = src
+            self._events.setdefault(uid, deque(maxlen=self.replay_size)).append(evt)
+            self.published += 1
+            self._cond.notify_all()
+        return evt
+
+    def event_id(self, evt: dict) -> str:
+        return f"{self.boot}-{evt['version']}"
+
+    def parse_event_id(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Sequence to resume after; None when it cannot be resumed here."""
+        boot, _, seq = (last_event_id or "").partition("-")
+        if boot != self.boot or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def since(self, user_id: int, last_event_id: Optional[str]) -> Tuple[bool, List[dict]]:
+        """(resumable, events after last_event_id)."""
+        uid = int(user_id)
+        with self._cond:
+            buf = list(self._events.get(uid, ()))
+            current = self._seq.get(uid, 0)
+        after = self.parse_event_id(last_event_id)
+        if after is None or after > current:
+            return False, []
+        missed = [e for e in buf if e["version"] > after]
+        # the oldest missed event fell out of the buffer
+        if current > after and (not missed or missed[0]["version"] != after + 1):
+            return False, []
+        return True, missed
+
+    def wait(self, user_id: int, after: int, timeout: float) -> List[dict]:
+        uid = int(user_id)
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq.get(uid, 0) > after, timeout=timeout)
+            return [e for e in self._events.get(uid, ()) if e["version"] > after]
+
+    def current(self, user_id: int) -> int:
+        with self._cond:
+            return self._seq.get(int(user_id), 0)
+
+
+def _frame(bus: ChangeBus, evt: dict, name: str = "change") -> str:
+    return f"id: {bus.event_id(evt)}\nevent: {name}\ndata: {json.dumps(evt, separators=(',', ':'))}\n\n"
+
+
+def stream(
+    bus: ChangeBus,
+    user_id: int,
+    last_event_id: Optional[str] = None,
+    heartbeat_seconds: Optional[float] = None,
+    max_seconds: Optional[float] = None,
+) -> Iterator[str]:
+    """SSE frames for one subscriber. Stops after `max_seconds` when given
+    (clients reconnect with Last-Event-ID, which is cheap)."""
+    heartbeat = heartbeat_seconds if heartbeat_seconds is not None else _env_float("SSE_HEARTBEAT_SECONDS", 15.0)
+    limit = max_seconds if max_seconds is not None else _env_float("SSE_MAX_STREAM_SECONDS", 0.0)
+    started = time.monotonic()
+
+    yield "retry: 3000\n\n"
+    if last_event_id:
+        resumable, missed = bus.since(user_id, last_event_id)
+        if resumable:
+            for evt in missed:
+                yield _frame(bus, evt)
+            after = missed[-1]["version"] if missed else bus.parse_event_id(last_event_id)
+        else:
+            after = bus.current(user_id)
+            yield _frame(bus, {"id": None, "op": "reset", "version": after}, "reset")
+    else:
+        after = bus.current(user_id)
+
+    while not (limit and time.monotonic() - started >= limit):
+        events = bus.wait(user_id, after, heartbeat)
+        if not events:
+            yield ": ping\n\n"
+            continue
+        if events[0]["version"] != after + 1:
+            # fell behind the replay buffer while waiting
+            after = events[-1]["version"]
+            yield _frame(bus, {"id": None, "op": "reset", "version": after}, "reset")
+            continue
+        for evt in events:
+            yield _frame(bus, evt)
+        after = events[-1]["version"]
+
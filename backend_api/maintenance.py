@@ -0,0 +1,539 @@
+# -*- coding: utf-8 -*-
+"""backend_api/maintenance.py
+
+Background maintenance for the backend.
+
+- RetentionPolicy: how long expired / used / trashed rows are kept (env configurable)
+- delete_in_batches: select a small batch of ids through an index, delete them,
+  commit, pause, repeat -> transactions stay small and writers are never blocked long
+- sweep_expired: the expiry sweeper (sessions, OTP codes, trusted devices,
+  used recovery codes, trashed passwords)
+- account purges (backend_api/purge.py) are run as the "account_purge" job
+- sqlite_housekeeping: optimize / incremental vacuum / WAL checkpoint at idle
+  moments or past size thresholds (database/sqlite_maintenance.py)
+- sqlite_backup_job: online snapshot when BACKUP_DIR is set (database/backup.py)
+- checkpoint_audit_chains: verifies the audit hash chains written since the
+  last checkpoint and signs new checkpoints (database/audit_chain.py)
+- archive_audit_logs: moves checkpointed audit rows older than
+  RETENTION_AUDIT_ARCHIVE_DAYS into compressed per-user/month segments
+  (database/audit_archive.py)
+- MaintenanceScheduler: tiny thread-based scheduler running named jobs at a fixed
+  period and keeping per-job metrics (served by GET /maintenance/status)
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import delete, select
+
+from database.models import (
+    ActivityLog,
+    AuditCheckpoint,
+    PasswordHistory,
+    OTPCode,
+    Session,
+    TrustedDevice,
+    RecoveryCode,
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _session_factory():
+    # Resolved at call time so a reloaded database.engine (tests) is honoured
+    from database.engine import SessionLocal
+    return SessionLocal
+
+
+# ============================================================
+# RETENTION / BATCH DELETES
+# ============================================================
+@dataclass
+class RetentionPolicy:
+    batch_size: int = 500
+    batch_pause_seconds: float = 0.05
+    session_grace_hours: int = 0
+    otp_grace_hours: int = 1
+    trusted_device_grace_days: int = 0
+    used_recovery_code_days: int = 30
+    trash_days: int = 30
+    audit_archive_days: int = 180
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            batch_size=max(1, _env_int("MAINTENANCE_BATCH_SIZE", cls.batch_size)),
+            batch_pause_seconds=max(0.0, _env_float("MAINTENANCE_BATCH_PAUSE", cls.batch_pause_seconds)),
+            session_grace_hours=_env_int("RETENTION_SESSION_GRACE_HOURS", cls.session_grace_hours),
+            otp_grace_hours=_env_int("RETENTION_OTP_GRACE_HOURS", cls.otp_grace_hours),
+            trusted_device_grace_days=_env_int("RETENTION_TRUSTED_DEVICE_DAYS", cls.trusted_device_grace_days),
+            used_recovery_code_days=_env_int("RETENTION_USED_RECOVERY_CODE_DAYS", cls.used_recovery_code_days),
+            trash_days=_env_int("RETENTION_TRASH_DAYS", cls.trash_days),
+            audit_archive_days=_env_int("RETENTION_AUDIT_ARCHIVE_DAYS", cls.audit_archive_days),
+        )
+
+
+def delete_in_batches(
+    model,
+    *criteria,
+    batch_size: int = 500,
+    pause_seconds: float = 0.0,
+    before_delete: Optional[Callable] = None,
+    session_factory=None,
+    max_batches: Optional[int] = None,
+) -> int:
+    """Delete rows of `model` matching `criteria` in id batches, one commit per batch.
+
+    The id batch is selected first and deleted by primary key afterwards
+    (MySQL does not allow LIMIT inside an IN subquery). `before_delete(db, ids)`
+    runs in the same transaction, e.g. to remove child rows or record progress.
+    Stops after `max_batches` batches when given.
+    """
+    factory = session_factory or _session_factory()
+    deleted = 0
+    batches = 0
+    while True:
+        with factory() as db:
+            ids = db.execute(
+                select(model.id).where(*criteria).limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            if before_delete is not None:
+                before_delete(db, ids)
+            db.execute(delete(model).where(model.id.in_(ids)), execution_options={"synchronize_session": False})
+            db.commit()
+        deleted += len(ids)
+        batches += 1
+        if len(ids) < batch_size or (max_batches is not None and batches >= max_batches):
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+    return deleted
+
+
+def delete_password_history(db, ids) -> None:
+    db.execute(
+        delete(PasswordHistory).where(PasswordHistory.password_id.in_(ids)),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def sweep_expired(
+    policy: Optional[RetentionPolicy] = None,
+    now: Optional[datetime] = None,
+    session_factory=None,
+    passwords=None,
+) -> Dict[str, int]:
+    """Delete expired or retention-exceeded rows. Returns deleted counts per table.
+
+    Without an explicit `session_factory` every data database is swept (each
+    shard file in sharded mode). Trashed entries are removed through the
+    password repository (`passwords`, default build_repository()), so the
+    embedded log store is covered as well.
+    """
+    policy = policy or RetentionPolicy.from_env()
+    now = now or datetime.utcnow()
+    if session_factory is not None:
+        factories = [session_factory]
+    else:
+        from database.engine import data_sessionmakers
+        factories = data_sessionmakers()
+
+    totals: Dict[str, int] = {}
+    for factory in factories:
+        for key, n in _sweep_one(policy, now, factory).items():
+            totals[key] = totals.get(key, 0) + n
+
+    if passwords is None:
+        from backend_api.repository import build_repository
+        passwords = build_repository()
+    totals["trashed_passwords"] = passwords.purge_trashed(
+        now - timedelta(days=policy.trash_days),
+        batch_size=policy.batch_size,
+        pause_seconds=policy.batch_pause_seconds,
+    )
+    return totals
+
+
+def _sweep_one(policy: RetentionPolicy, now: datetime, session_factory) -> Dict[str, int]:
+    kw = {
+        "batch_size": policy.batch_size,
+        "pause_seconds": policy.batch_pause_seconds,
+        "session_factory": session_factory,
+    }
+    return {
+        "sessions": delete_in_batches(
+            Session, Session.expires_at < now - timedelta(hours=policy.session_grace_hours), **kw
+        ),
+        "otp_codes": delete_in_batches(
+            OTPCode, OTPCode.expires_at < now - timedelta(hours=policy.otp_grace_hours), **kw
+        ),
+        "trusted_devices": delete_in_batches(
+            TrustedDevice,
+            TrustedDevice.trusted_until < now - timedelta(days=policy.trusted_device_grace_days),
+            **kw,
+        ),
+        "recovery_codes": delete_in_batches(
+            RecoveryCode,
+            RecoveryCode.used_at.is_not(None),
+            RecoveryCode.used_at < now - timedelta(days=policy.used_recovery_code_days),
+            **kw,
+        ),
+    }
+
+
+# ============================================================
+# AUDIT CHAIN / ARCHIVAL
+# ============================================================
+def checkpoint_audit_chains(session_factory=None, batch_size: Optional[int] = None) -> Dict[str, int]:
+    """verify_chains() on every data database; sums the counters ("broken" > 0 needs a look)."""
+    from database.audit_chain import verify_chains
+
+    if session_factory is not None:
+        factories = [session_factory]
+    else:
+        from database.engine import data_sessionmakers
+        factories = data_sessionmakers()
+    size = batch_size or _env_int("AUDIT_VERIFY_BATCH_SIZE", 1000)
+    totals: Dict[str, int] = {"users": 0, "rows": 0, "broken": 0, "checkpoints": 0}
+    for factory in factories:
+        report = verify_chains(factory, batch_size=size)
+        for failure in report["failures"]:
+            print(f"⚠️ Audit chain broken for user {failure['user_id']} at row {failure['row_id']}: {failure['reason']}")
+        for k in totals:
+            totals[k] += report[k]
+    return totals
+
+
+def archive_audit_logs(
+    policy: Optional[RetentionPolicy] = None,
+    now: Optional[datetime] = None,
+    archive=None,
+    session_factory=None,
+) -> Dict[str, int]:
+    """Move activity_logs rows older than `policy.audit_archive_days` to cold segments.
+
+    Runs through delete_in_batches: each id batch is written to the archive
+    (one block per user and month) inside before_delete, then deleted from
+    the hot table in the same small transaction. 0 days disables archival.
+
+    Only rows covered by the user's audit chain checkpoint are moved, so the
+    hot table always verifies from its checkpoint; the chains are
+    checkpointed first.
+    """
+    policy = policy or RetentionPolicy.from_env()
+    if policy.audit_archive_days <= 0:
+        return {"archived": 0}
+    now = now or datetime.utcnow()
+    if archive is None:
+        from database.audit_archive import default_archive
+        archive = default_archive()
+    if session_factory is not None:
+        factories = [session_factory]
+    else:
+        from database.engine import data_sessionmakers
+        factories = data_sessionmakers()
+
+    columns = ActivityLog.__table__.columns
+    checkpointed = (
+        select(AuditCheckpoint.last_log_id)
+        .where(AuditCheckpoint.user_id == ActivityLog.user_id)
+        .scalar_subquery()
+    )
+
+    def _archive(db, ids) -> None:
+        by_user: Dict[int, list] = {}
+        for row in db.execute(select(*columns).where(ActivityLog.id.in_(ids))).mappings():
+            by_user.setdefault(row["user_id"], []).append(dict(row))
+        for user_id, rows in by_user.items():
+            archive.append(user_id, rows)
+
+    archived = 0
+    for factory in factories:
+        checkpoint_audit_chains(factory)
+        archived += delete_in_batches(
+            ActivityLog,
+            ActivityLog.created_at < now - timedelta(days=policy.audit_archive_days),
+            ActivityLog.id <= checkpointed,
+            batch_size=policy.batch_size,
+            pause_seconds=policy.batch_pause_seconds,
+            before_delete=_archive,
+            session_factory=factory,
+        )
+    return {"archived": archived}
+
+
+# ============================================================
+# SQLITE HOUSEKEEPING
+# ============================================================
+def sqlite_housekeeping(
+    scheduler: "MaintenanceScheduler",
+    idle_after_seconds: Optional[float] = None,
+    wal_threshold_bytes: Optional[int] = None,
+    freelist_threshold_bytes: Optional[int] = None,
+    max_vacuum_pages: Optional[int] = None,
+) -> Dict[str, int]:
+    """ANALYZE/optimize + incremental vacuum + WAL checkpoint, only when it is cheap or needed.
+
+    Runs when the API has been idle for a while, or when the WAL / free pages
+    grew past their thresholds. A busy run uses a PASSIVE checkpoint that never
+    waits on readers. In sharded mode every shard file is handled and the
+    returned numbers are summed.
+    """
+    from database.engine import all_engines
+    from database.sqlite_maintenance import (
+        db_file_sizes, freelist_bytes, run_sqlite_maintenance, sqlite_db_path,
+    )
+
+    idle_after = idle_after_seconds if idle_after_seconds is not None else _env_float("MAINTENANCE_IDLE_SECONDS", 60.0)
+    wal_limit = wal_threshold_bytes if wal_threshold_bytes is not None else _env_int("MAINTENANCE_WAL_THRESHOLD_BYTES", 64 * 1024 * 1024)
+    free_limit = (freelist_threshold_bytes if freelist_threshold_bytes is not None
+                  else _env_int("MAINTENANCE_FREELIST_THRESHOLD_BYTES", 32 * 1024 * 1024))
+    pages = max_vacuum_pages if max_vacuum_pages is not None else _env_int("MAINTENANCE_VACUUM_PAGES", 2000)
+    idle = scheduler.idle_seconds() >= idle_after
+
+    totals: Dict[str, int] = {}
+    for engine in all_engines():
+        if not sqlite_db_path(engine):
+            result = {"skipped": 1}
+        else:
+            sizes = db_file_sizes(engine)
+            free = freelist_bytes(engine)
+            over = sizes["wal_bytes"] >= wal_limit or free >= free_limit
+            if not (idle or over):
+                result = {"skipped": 1, "db_bytes": sizes["db_bytes"], "wal_bytes": sizes["wal_bytes"], "freelist_bytes": free}
+            else:
+                result = run_sqlite_maintenance(
+                    engine,
+                    max_vacuum_pages=pages,
+                    checkpoint_mode="TRUNCATE" if idle else "PASSIVE",
+                )
+                result["freelist_bytes"] = freelist_bytes(engine)
+        for key, value in result.items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def sqlite_backup_job(dest_dir: str) -> Dict[str, int]:
+    """Scheduled online backup (database/backup.py) with env-configured retention."""
+    from database.backup import backup_sqlite
+
+    report = backup_sqlite(
+        dest_dir,
+        pages_per_step=_env_int("BACKUP_PAGES_PER_STEP", 256),
+        step_sleep=_env_float("BACKUP_STEP_SLEEP", 0.005),
+        compress=os.getenv("BACKUP_COMPRESS", "true").strip().lower() in {"1", "true", "yes", "on"},
+        keep=_env_int("BACKUP_KEEP", 7),
+    )
+    return {
+        "snapshots": 1,
+        "bytes": report["bytes"],
+        "source_bytes": report["source_bytes"],
+        "pages": report["pages"],
+        "copy_ms": int(report["copy_seconds"] * 1000),
+        "pruned": len(report["pruned"]),
+    }
+
+
+# ============================================================
+# SCHEDULER
+# ============================================================
+@dataclass
+class JobMetrics:
+    runs: int = 0
+    failures: int = 0
+    last_started: Optional[datetime] = None
+    last_duration_ms: float = 0.0
+    last_result: Dict[str, int] = field(default_factory=dict)
+    last_error: Optional[str] = None
+    totals: Dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "last_started": self.last_started.isoformat() if self.last_started else None,
+            "last_duration_ms": round(self.last_duration_ms, 2),
+            "last_result": dict(self.last_result),
+            "last_error": self.last_error,
+            "totals": dict(self.totals),
+        }
+
+
+@dataclass
+class _Job:
+    name: str
+    fn: Callable[[], Optional[Dict[str, int]]]
+    every_seconds: float
+    next_run: float = 0.0
+    gauges: frozenset = frozenset()
+    metrics: JobMetrics = field(default_factory=JobMetrics)
+
+
+class MaintenanceScheduler:
+    """Runs registered jobs periodically on one daemon thread.
+
+    Jobs run one at a time, so maintenance never competes with itself for the
+    database. A job returns a dict of numeric counters that are accumulated
+    in its metrics; keys listed as `gauges` (sizes, ...) are reported in
+    last_result only. note_activity() is called per API request so jobs can
+    prefer low-traffic moments (see idle_seconds()).
+    """
+
+    def __init__(self, tick_seconds: float = 5.0):
+        self.tick_seconds = tick_seconds
+        self._jobs: Dict[str, _Job] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_activity = time.monotonic()
+
+    def add_job(
+        self,
+        name: str,
+        fn: Callable[[], Optional[Dict[str, int]]],
+        every_seconds: float,
+        gauges: tuple = (),
+    ) -> None:
+        with self._lock:
+            self._jobs[name] = _Job(name=name, fn=fn, every_seconds=float(every_seconds),
+                                    next_run=time.monotonic() + float(every_seconds),
+                                    gauges=frozenset(gauges))
+
+    def note_activity(self) -> None:
+        self._last_activity = time.monotonic()
+
+    def idle_seconds(self) -> float:
+        return time.monotonic() - self._last_activity
+
+    def run_job(self, name: str) -> Dict[str, int]:
+        job = self._jobs[name]
+        m = job.metrics
+        m.last_started = datetime.utcnow()
+        t0 = time.perf_counter()
+        try:
+            result = job.fn() or {}
+            m.runs += 1
+            m.last_error = None
+            m.last_result = dict(result)
+            for k, v in result.items():
+                if isinstance(v, (int, float)) and k not in job.gauges:
+                    m.totals[k] = m.totals.get(k, 0) + v
+            return result
+        except Exception as e:
+            m.failures += 1
+            m.last_error = str(e)
+            print(f"❌ Maintenance job '{name}' failed: {e}")
+            return {}
+        finally:
+            m.last_duration_ms = (time.perf_counter() - t0) * 1000.0
+            job.next_run = time.monotonic() + job.every_seconds
+
+    def run_pending(self) -> None:
+        now = time.monotonic()
+        for job in list(self._jobs.values()):
+            if self._stop.is_set():
+                return
+            if job.next_run <= now:
+                self.run_job(job.name)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.tick_seconds):
+            self.run_pending()
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="pg-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = 5.0) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def metrics(self) -> dict:
+        return {
+            "running": self.running,
+            "jobs": {
+                name: {"every_seconds": job.every_seconds, **job.metrics.to_dict()}
+                for name, job in self._jobs.items()
+            },
+        }
+
+
+def build_default_scheduler(policy: Optional[RetentionPolicy] = None, passwords=None) -> MaintenanceScheduler:
+    """`passwords`: the application's password repository (opened once: a log
+    store must not be opened twice); default build_repository()."""
+    policy = policy or RetentionPolicy.from_env()
+    if passwords is None:
+        from backend_api.repository import build_repository
+        passwords = build_repository()
+    scheduler = MaintenanceScheduler()
+    scheduler.add_job(
+        "expiry_sweep",
+        lambda: sweep_expired(policy, passwords=passwords),
+        every_seconds=_env_int("MAINTENANCE_SWEEP_INTERVAL_SECONDS", 15 * 60),
+    )
+
+    from backend_api.purge import run_pending_purges
+    scheduler.add_job(
+        "account_purge",
+        lambda: run_pending_purges(batch_size=policy.batch_size, pause_seconds=policy.batch_pause_seconds,
+                                   passwords=passwords),
+        every_seconds=_env_int("MAINTENANCE_PURGE_INTERVAL_SECONDS", 30),
+    )
+
+    scheduler.add_job(
+        "audit_chain_checkpoint",
+        checkpoint_audit_chains,
+        every_seconds=_env_int("AUDIT_CHECKPOINT_INTERVAL_SECONDS", 3600),
+    )
+
+    scheduler.add_job(
+        "audit_archive",
+        lambda: archive_audit_logs(policy),
+        every_seconds=_env_int("AUDIT_ARCHIVE_INTERVAL_SECONDS", 6 * 3600),
+    )
+
+    scheduler.add_job(
+        "sqlite_maintenance",
+        lambda: sqlite_housekeeping(scheduler),
+        every_seconds=_env_int("MAINTENANCE_SQLITE_INTERVAL_SECONDS", 10 * 60),
+        gauges=("db_bytes", "wal_bytes", "freelist_bytes", "checkpoint_busy"),
+    )
+
+    backup_dir = os.getenv("BACKUP_DIR")
+    if backup_dir:
+        scheduler.add_job(
+            "sqlite_backup",
+            lambda: sqlite_backup_job(backup_dir),
+            every_seconds=_env_int("BACKUP_INTERVAL_SECONDS", 24 * 3600),
+            gauges=("bytes", "source_bytes", "pages"),
+        )
+    return scheduler
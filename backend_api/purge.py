@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""backend_api/purge.py
+
+Chunked, resumable account deletion.
+
+Deleting a User through the ORM cascade loads every child row and removes
+them one by one in a single transaction. Instead:
+- request_account_purge() locks the account and records an AccountPurge row
+- run_purge() deletes each child table in bounded id batches (one commit per
+  batch, progress written in the same transaction), then deletes the user
+  row itself (the DB cascade covers anything written meanwhile)
+- the purge state (step + deleted_rows) is persisted, so an interrupted or
+  budget-limited run simply continues where it stopped on the next run
+- in sharded mode the child tables are purged in the user's shard, the user
+  row, purge state and shard map entry in the directory
+- archived audit segments of the user (database/audit_archive.py) are
+  removed once the purge is done
+- password entries go through the password repository
+  (backend_api/repository.py), so an embedded log store is purged too
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import delete, select, update
+
+from backend_api.maintenance import delete_in_batches, _session_factory
+from database.models import (
+    AccountPurge,
+    ActivityLog,
+    AuditCheckpoint,
+    OTPCode,
+    RecoveryCode,
+    ReencryptJob,
+    SecuritySnapshot,
+    Session,
+    TrustedDevice,
+    User,
+    UserDevice,
+    UserShard,
+    VaultKey,
+)
+
+# (step name, model); biggest tables first.
+# model None: the user's password entries, deleted through the repository
+PURGE_STEPS = (
+    ("passwords", None),
+    ("activity_logs", ActivityLog),
+    ("audit_checkpoints", AuditCheckpoint),
+    ("security_snapshots", SecuritySnapshot),
+    ("vault_keys", VaultKey),
+    ("sessions", Session),
+    ("user_devices", UserDevice),
+    ("trusted_devices", TrustedDevice),
+    ("recovery_codes", RecoveryCode),
+    ("otp_codes", OTPCode),
+    ("users", User),
+)
+_STEP_NAMES = [name for name, _model in PURGE_STEPS]
+
+# Never matches at login (src/security/password_hash.py): a stored hash
+# without "$" is verified as a legacy hex PBKDF2 digest, and "!" is not a
+# hex digit
+_LOCKED_PASSWORD_HASH = "!purge"
+
+
+def _data_factory(user_id: int, session_factory=None):
+    if session_factory is not None:
+        return session_factory
+    from database.engine import user_sessionmaker
+    return user_sessionmaker(user_id)
+
+
+def request_account_purge(user_id: int, session_factory=None) -> Optional[dict]:
+    """Lock the account and queue its purge. Returns the purge state or None if unknown."""
+    factory = session_factory or _session_factory()
+    uid = int(user_id)
+    with factory() as db:
+        existing = db.execute(select(AccountPurge).where(AccountPurge.user_id == uid)).scalar_one_or_none()
+        if existing:
+            return existing.to_dict()
+        u = db.get(User, uid)
+        if not u:
+            return None
+        u.password_hash = _LOCKED_PASSWORD_HASH
+        purge = AccountPurge(user_id=uid, status="pending", step=_STEP_NAMES[0], deleted_rows=0)
+        db.add(purge)
+        db.commit()
+        return purge.to_dict()
+
+
+def purge_status(user_id: int, session_factory=None) -> Optional[dict]:
+    factory = session_factory or _session_factory()
+    with factory() as db:
+        purge = db.execute(select(AccountPurge).where(AccountPurge.user_id == int(user_id))).scalar_one_or_none()
+        return purge.to_dict() if purge else None
+
+
+def _advance(factory, purge_id: int, name: str) -> None:
+    """Step `name` is finished: record the next one."""
+    nxt = _STEP_NAMES.index(name) + 1
+    with factory() as db:
+        db.execute(
+            update(AccountPurge)
+            .where(AccountPurge.id == purge_id)
+            .values(step=_STEP_NAMES[nxt] if nxt < len(_STEP_NAMES) else None,
+                    updated_at=datetime.utcnow())
+        )
+        db.commit()
+
+
+def _purge_table(factory, data_factory, purge_id: int, uid: int, name: str, model,
+                 batch_size: int, pause_seconds: float, budget: Optional[int]) -> int:
+    """Delete the user's rows of one table, recording progress with each batch."""
+    step_factory = factory if model is User else data_factory
+
+    def _progress(db, ids):
+        stmt = (
+            update(AccountPurge)
+            .where(AccountPurge.id == purge_id)
+            .values(
+                deleted_rows=AccountPurge.deleted_rows + len(ids),
+                step=name,
+                updated_at=datetime.utcnow(),
+            )
+        )
+        if step_factory is factory:
+            db.execute(stmt)
+            return
+        # Shard batch and purge state live in different files: deleted_rows
+        # may over-count one batch if the shard commit fails afterwards.
+        with factory() as state_db:
+            state_db.execute(stmt)
+            state_db.commit()
+
+    criteria = (model.id == uid,) if model is User else (model.user_id == uid,)
+    return delete_in_batches(
+        model,
+        *criteria,
+        batch_size=batch_size,
+        pause_seconds=pause_seconds,
+        before_delete=_progress,
+        session_factory=step_factory,
+        max_batches=budget,
+    )
+
+
+def run_purge(
+    purge_id: int,
+    batch_size: int = 500,
+    pause_seconds: float = 0.05,
+    max_batches: Optional[int] = None,
+    session_factory=None,
+    passwords=None,
+) -> Dict[str, int]:
+    """Advance one purge. Stops after `max_batches` batches; call again to resume.
+
+    passwords: the password repository (default build_repository())."""
+    factory = session_factory or _session_factory()
+    with factory() as db:
+        purge = db.get(AccountPurge, purge_id)
+        if not purge or purge.status == "done":
+            return {"deleted": 0, "done": 1}
+        uid = purge.user_id
+        start = _STEP_NAMES.index(purge.step) if purge.step in _STEP_NAMES else 0
+        purge.status = "running"
+        purge.updated_at = datetime.utcnow()
+        db.commit()
+
+    if passwords is None:
+        from backend_api.repository import build_repository
+        passwords = build_repository()
+    data_factory = _data_factory(uid, session_factory)
+    deleted = 0
+    budget = max_batches
+    for name, model in PURGE_STEPS[start:]:
+        if model is None:
+            n = passwords.delete_user(uid, batch_size=batch_size, pause_seconds=pause_seconds, max_batches=budget)
+            if n:
+                with factory() as db:
+                    db.execute(
+                        update(AccountPurge)
+                        .where(AccountPurge.id == purge_id)
+                        .values(deleted_rows=AccountPurge.deleted_rows + n, step=name,
+                                updated_at=datetime.utcnow())
+                    )
+                    db.commit()
+        else:
+            n = _purge_table(factory, data_factory, purge_id, uid, name, model,
+                             batch_size, pause_seconds, budget)
+        deleted += n
+        if budget is not None:
+            used = -(-n // batch_size)
+            if used >= budget:
+                # budget exhausted: the step may have rows left, resume from it next run
+                return {"deleted": deleted, "done": 0}
+            budget -= used
+        _advance(factory, purge_id, name)
+
+    with factory() as db:
+        now = datetime.utcnow()
+        db.execute(
+            update(AccountPurge)
+            .where(AccountPurge.id == purge_id)
+            .values(status="done", step=None, updated_at=now, finished_at=now)
+        )
+        db.execute(delete(UserShard).where(UserShard.user_id == uid))
+        db.execute(delete(ReencryptJob).where(ReencryptJob.user_id == uid))
+        db.commit()
+    from database.audit_archive import default_archive
+    from database.engine import forget_shard
+    default_archive().drop_user(uid)
+    forget_shard(uid)
+    return {"deleted": deleted, "done": 1}
+
+
+def run_pending_purges(
+    batch_size: int = 500,
+    pause_seconds: float = 0.05,
+    max_batches_per_run: int = 200,
+    session_factory=None,
+    passwords=None,
+) -> Dict[str, int]:
+    """Maintenance job: advance every unfinished purge within a shared batch budget."""
+    factory = session_factory or _session_factory()
+    if passwords is None:
+        from backend_api.repository import build_repository
+        passwords = build_repository()
+    with factory() as db:
+        ids = db.execute(
+            select(AccountPurge.id)
+            .where(AccountPurge.status != "done")
+            .order_by(AccountPurge.requested_at)
+        ).scalars().all()
+
+    totals = {"purges": len(ids), "completed": 0, "deleted_rows": 0}
+    budget = max_batches_per_run
+    for pid in ids:
+        if budget <= 0:
+            break
+        result = run_purge(pid, batch_size=batch_size, pause_seconds=pause_seconds,
+                           max_batches=budget, session_factory=session_factory, passwords=passwords)
+        totals["deleted_rows"] += result["deleted"]
+        totals["completed"] += result["done"]
+        budget -= max(1, -(-result["deleted"] // batch_size))
+    return totals
+
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""backend_api/reencrypt.py
+
+Resumable background re-encryption (format migration / key rotation).
+
+- request_reencryption(): queue a job for one user and a target format
+  (a ReencryptJob row in the directory database)
+- run_reencryption(): stream the user's entries in id batches
+  (repository.secrets_page, stored binary form), decrypt + re-encrypt each batch with
+  src/security/bulk.py and write it back in one transaction per batch
+  (repository.swap_secrets: compare-and-swap on the old token, so an entry
+  edited meanwhile keeps the user's version). Entries already in the target
+  format are skipped, so runs are idempotent.
+- the checkpoint (last id) and counters are stored after every batch: an
+  interrupted or budget-limited run resumes where it stopped
+- throttling: at most `rate_per_second` entries per second, plus the batch
+  budget of each maintenance run, so normal traffic keeps the database
+- progress and throughput: ReencryptJob.to_dict() (GET /vault/<id>/reencrypt)
+
+The backend holds the storage keys of "fernet" and "gcm1" tokens, so those are
+the targets the maintenance job runs. "zk1" needs the user's vault key and is
+only available to callers passing zk_key= (client-side tooling).
+
+CLI:
+    python -m backend_api.reencrypt --user 3 --target fernet [--batch-size 200] [--rate 500]
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import select, update
+
+from backend_api.maintenance import _session_factory
+from database.models import ReencryptJob, User
+from src.security.bulk import decrypt_many, encrypt_many, token_format
+
+SERVER_TARGETS = ("fernet", "gcm1")
+TARGETS = SERVER_TARGETS + ("zk1",)
+_OPEN_STATUSES = ("pending", "running")
+
+
+def request_reencryption(user_id: int, target: str, session_factory=None) -> Optional[dict]:
+    """Queue (or re-queue) the user's job. Returns the job state, None if the user is unknown.
+
+    Re-requesting the same target keeps the checkpoint; a new target starts over.
+    """
+    if target not in TARGETS:
+        raise ValueError(f"target must be one of {', '.join(TARGETS)}")
+    factory = session_factory or _session_factory()
+    uid = int(user_id)
+    with factory() as db:
+        if db.get(User, uid) is None:
+            return None
+        job = db.execute(select(ReencryptJob).where(ReencryptJob.user_id == uid)).scalar_one_or_none()
+        now = datetime.utcnow()
+        if job is None:
+            job = ReencryptJob(user_id=uid, target=target)
+            db.add(job)
+        elif job.target != target or job.status == "done":
+            job.target = target
+            job.last_id = 0
+            job.processed = job.rewritten = job.skipped = job.failed = 0
+            job.run_seconds = 0.0
+            job.finished_at = None
+        job.status = "pending"
+        job.error = None
+        job.requested_at = job.requested_at or now
+        job.updated_at = now
+        db.commit()
+        return job.to_dict()
+
+
+def reencryption_status(user_id: int, session_factory=None) -> Optional[dict]:
+    factory = session_factory or _session_factory()
+    with factory() as db:
+        job = db.execute(select(ReencryptJob).where(ReencryptJob.user_id == int(user_id))).scalar_one_or_none()
+        return job.to_dict() if job else None
+
+
+def _needs_rewrite(token, target: str, rotate_zk: bool) -> bool:
+    fmt = token_format(token)
+    if fmt is None or fmt == "ek1":
+        # empty / stored in clear: nothing to decrypt; envelope entries are
+        # never moved back to a single-key format (their keys stay client-side)
+        return False
+    return fmt != target or (fmt == "zk1" and rotate_zk)
+
+
+def run_reencryption(
+    repository,
+    job_id: int,
+    batch_size: int = 200,
+    rate_per_second: Optional[float] = None,
+    max_batches: Optional[int] = None,
+    zk_key=None,
+    source_zk_key=None,
+    workers: Optional[int] = None,
+    session_factory=None,
+) -> Dict[str, int]:
+    """Advance one job. Stops after `max_batches` batches; call again to resume.
+
+    zk_key: vault key for a "zk1" target; source_zk_key: key of existing zk1
+    tokens (when it differs from zk_key, those are rotated too).
+    """
+    factory = session_factory or _session_factory()
+    with factory() as db:
+        job = db.get(ReencryptJob, job_id)
+        if job is None or job.status not in _OPEN_STATUSES:
+            return {"processed": 0, "rewritten": 0, "batches": 0, "done": 1}
+        uid, target, after = job.user_id, job.target, job.last_id or 0
+        if target == "zk1" and zk_key is None:
+            return {"processed": 0, "rewritten": 0, "batches": 0, "done": 0}
+        if job.status == "pending" and not after:
+            job.total = repository.count(uid)
+        job.status = "running"
+        job.updated_at = datetime.utcnow()
+        db.commit()
+
+    rotate_zk = target == "zk1" and source_zk_key is not None and bytes(source_zk_key) != bytes(zk_key)
+    totals = {"processed": 0, "rewritten": 0, "batches": 0, "done": 0}
+    try:
+        while max_batches is None or totals["batches"] < max_batches:
+            started = time.monotonic()
+            # stored form: packed blobs decrypt without a base64 round trip
+            rows = repository.secrets_page(uid, after, batch_size, raw=True)
+            if not rows:
+                totals["done"] = 1
+                break
+
+            todo = [(pid, tok) for pid, tok in rows if _needs_rewrite(tok, target, rotate_zk)]
+            plains = list(decrypt_many(
+                (tok for _, tok in todo),
+                zk_key=source_zk_key if source_zk_key is not None else zk_key,
+                workers=workers,
+                errors="none",
+            ))
+            readable = [(pid, tok, p) for (pid, tok), p in zip(todo, plains) if p is not None]
+            fresh = encrypt_many((p for _, _, p in readable), target, zk_key=zk_key, workers=workers)
+            changes = [(pid, tok, new) for (pid, tok, _), new in zip(readable, fresh)]
+            rewritten = repository.swap_secrets(uid, changes) if changes else 0
+
+            after = rows[-1][0]
+            failed = len(todo) - len(readable)
+            elapsed = time.monotonic() - started
+            if rate_per_second:
+                # throttle: this batch may not go faster than the configured rate
+                pause = len(rows) / float(rate_per_second) - elapsed
+                if pause > 0:
+                    time.sleep(pause)
+            with factory() as db:
+                db.execute(
+                    update(ReencryptJob)
+                    .where(ReencryptJob.id == job_id)
+                    .values(
+                        last_id=after,
+                        processed=ReencryptJob.processed + len(rows),
+                        rewritten=ReencryptJob.rewritten + rewritten,
+                        skipped=ReencryptJob.skipped + (len(rows) - len(todo)) + (len(changes) - rewritten),
+                        failed=ReencryptJob.failed + failed,
+                        run_seconds=ReencryptJob.run_seconds + elapsed,
+                        updated_at=datetime.utcnow(),
+                    )
+                )
+                db.commit()
+            totals["processed"] += len(rows)
+            totals["rewritten"] += rewritten
+            totals["batches"] += 1
+            if len(rows) < batch_size:
+                totals["done"] = 1
+                break
+    except Exception as e:
+        with factory() as db:
+            db.execute(
+                update(ReencryptJob)
+                .where(ReencryptJob.id == job_id)
+                .values(status="failed", error=str(e)[:255], updated_at=datetime.utcnow())
+            )
+            db.commit()
+        raise
+
+    if totals["done"]:
+        with factory() as db:
+            now = datetime.utcnow()
+            db.execute(
+                update(ReencryptJob)
+                .where(ReencryptJob.id == job_id)
+                .values(status="done", updated_at=now, finished_at=now)
+            )
+            db.commit()
+    return totals
+
+
+def run_pending_reencryptions(
+    repository,
+    batch_size: int = 200,
+    rate_per_second: Optional[float] = None,
+    max_batches_per_run: int = 50,
+    session_factory=None,
+) -> Dict[str, int]:
+    """Maintenance job: advance queued server-side jobs within a shared batch budget."""
+    factory = session_factory or _session_factory()
+    with factory() as db:
+        ids = db.execute(
+            select(ReencryptJob.id)
+            .where(ReencryptJob.status.in_(_OPEN_STATUSES), ReencryptJob.target.in_(SERVER_TARGETS))
+            .order_by(ReencryptJob.requested_at)
+        ).scalars().all()
+
+    totals = {"jobs": len(ids), "completed": 0, "rewritten": 0, "processed": 0}
+    budget = max_batches_per_run
+    for job_id in ids:
+        if budget <= 0:
+            break
+        try:
+            result = run_reencryption(
+                repository, job_id, batch_size=batch_size, rate_per_second=rate_per_second,
+                max_batches=budget, session_factory=session_factory,
+            )
+        except Exception:
+            continue  # recorded on the job as "failed"; the others go on
+        totals["processed"] += result["processed"]
+        totals["rewritten"] += result["rewritten"]
+        totals["completed"] += result["done"]
+        budget -= max(1, result["batches"])
+    return totals
+
+
+def main(argv: Optional[list] = None) -> int:
+    from backend_api.repository import build_repository
+    from database.engine import init_db
+
+    parser = argparse.ArgumentParser(description="Re-encrypt a user's vault entries to one format")
+    parser.add_argument("--user", type=int, required=True)
+    parser.add_argument("--target", choices=SERVER_TARGETS, default="fernet")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=None, help="max entries per second")
+    args = parser.parse_args(argv)
+
+    init_db()
+    job = request_reencryption(args.user, args.target)
+    if job is None:
+        print(f"unknown user {args.user}")
+        return 1
+    repository = build_repository()
+    while True:
+        result = run_reencryption(repository, job["id"], batch_size=args.batch_size,
+                                  rate_per_second=args.rate, max_batches=10)
+        state = reencryption_status(args.user)
+        print(
+            f"{state['processed']}/{state['total']} entries, {state['rewritten']} rewritten, "
+            f"{state['failed']} unreadable, {state['rows_per_second'] or 0} rows/s"
+        )
+        if result["done"]:
+            return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+"""backend_api/repository.py
+
+Password storage behind one interface, so the Flask endpoints do not care
+where rows live.
+
+- PasswordRepository: the operations the /passwords, /stats, /export and
+  /import endpoints need. Rows are tuples in PASSWORD_FIELDS order, records
+  are dicts keyed by the same names; ids are the public ids of the API.
+- SqlPasswordRepository: SQLAlchemy (shard-aware, see database/engine.py)
+- LogPasswordRepository: embedded append-only log file (database/logstore.py)
+- build_repository(): picks one from VAULT_STORE=sql|log (VAULT_LOG_PATH,
+  VAULT_LOG_FSYNC)
+- add_listener(): fn(user_id, entry_id, op) runs after every committed change,
+  whoever made it (endpoints, maintenance jobs, re-encryption); the app feeds
+  the /events change bus from it. entry_id None: several entries at once
+
+Users, profiles, sessions and audit logs stay in the SQL database either way.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import Text, func, or_, select, type_coerce, update
+
+import database.engine as db_engine
+import database.queries as db_queries
+from backend_api.maintenance import delete_in_batches, delete_password_history
+from database.models import Password
+from src.security.ciphertext import pack, unpack
+from src.security.envelope import entry_key_version
+
+PASSWORD_FIELDS = (
+    "id",
+    "user_id",
+    "site_name",
+    "site_url",
+    "site_icon",
+    "username",
+    "encrypted_password",
+    "category",
+    "strength",
+    "favorite",
+    "trashed_at",
+    "last_updated",
+    "created_at",
+)
+# Fields a caller may change through update() (key_version: data key of an
+# "ek1:" token, src/security/envelope.py; stored but not part of the row tuples)
+MUTABLE_FIELDS = (frozenset(PASSWORD_FIELDS) | {"key_version"}) - {"id", "user_id", "last_updated", "created_at"}
+
+
+class PasswordRepository:
+    """Storage operations for password entries."""
+
+    _listeners: tuple = ()
+
+    def add_listener(self, fn: Callable[[int, Optional[int], str], None]) -> None:
+        self._listeners = (*self._listeners, fn)
+
+    def _notify(self, user_id: int, entry_id: Optional[int], op: str) -> None:
+        for fn in self._listeners:
+            try:
+                fn(int(user_id), entry_id, op)
+            except Exception:
+                pass  # a listener never fails the write
+
+    def list_rows(self, user_id: int) -> List[tuple]:
+        """All entries of a user, most recently updated first."""
+        raise NotImplementedError
+
+    def export_rows(self, user_id: int) -> List[tuple]:
+        return self.list_rows(user_id)
+
+    def iter_export_rows(self, user_id: int) -> Iterator[tuple]:
+        """export_rows() as a generator that does not load the whole vault."""
+        yield from self.export_rows(user_id)
+
+    def add(self, user_id: int, fields: dict) -> int:
+        raise NotImplementedError
+
+    def add_many(self, user_id: int, items: Iterable[dict], batch_size: int = 500) -> int:
+        """Insert `items` (any iterable, consumed lazily), one commit per
+        `batch_size` entries. Returns the number inserted."""
+        raise NotImplementedError
+
+    def get(self, pid: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update(self, pid: int, changes: dict, op: str = "update") -> Optional[dict]:
+        """Apply `changes` (MUTABLE_FIELDS only). Returns the updated record, None if unknown.
+        `op` names the change for listeners (update, trash, restore, ...)."""
+        raise NotImplementedError
+
+    def toggle_favorite(self, pid: int) -> Optional[dict]:
+        raise NotImplementedError
+
+    def delete(self, pid: int) -> Optional[dict]:
+        """Delete an entry. Returns the deleted record, None if unknown."""
+        raise NotImplementedError
+
+    def count(self, user_id: int) -> int:
+        raise NotImplementedError
+
+    def key_version_counts(self, user_id: int) -> Dict[Optional[int], int]:
+        """{key_version: entries}; None counts entries that are not "ek1:" tokens."""
+        raise NotImplementedError
+
+    def count_keyed(self, user_id: int) -> int:
+        """Entries encrypted under a data key of the user ("ek1:" tokens, key_version set)."""
+        raise NotImplementedError
+
+    def delete_keyed(self, user_id: int) -> int:
+        """Delete the entries counted by count_keyed() (their data keys are
+        gone, src/security/envelope.discard_data_keys). Returns entries deleted."""
+        raise NotImplementedError
+
+    def secrets_page(self, user_id: int, after_id: int, limit: int, raw: bool = False) -> List[tuple]:
+        """(id, encrypted_password) of a user's entries with id > after_id, id order.
+
+        raw=True: packed binary ciphertexts (src/security/ciphertext.py), as
+        stored by the SQL store, for callers that decrypt in bulk; swap_secrets
+        accepts them as the old value.
+        """
+        raise NotImplementedError
+
+    def swap_secrets(self, user_id: int, changes: Iterable[tuple]) -> int:
+        """Apply (id, old token, new token) where the entry still holds the old
+        token, in one transaction; last_updated is kept. Returns rows changed."""
+        raise NotImplementedError
+
+    def delete_user(
+        self, user_id: int, batch_size: int = 500, pause_seconds: float = 0.0, max_batches: Optional[int] = None
+    ) -> int:
+        """Delete every entry of a user (account purge), `batch_size` per
+        transaction, at most `max_batches` batches. Returns entries deleted."""
+        raise NotImplementedError
+
+    def purge_trashed(self, cutoff: datetime, batch_size: int = 500, pause_seconds: float = 0.0) -> int:
+        """Delete the entries of all users trashed before `cutoff` (trash retention)."""
+        raise NotImplementedError
+
+
+# ============================================================
+# SQL
+# ============================================================
+class SqlPasswordRepository(PasswordRepository):
+    def _record(self, p, pid: int) -> dict:
+        rec = {name: getattr(p, name) for name in PASSWORD_FIELDS}
+        rec["id"] = pid
+        return rec
+
+    def _rows(self, statement: str, user_id: int) -> List[tuple]:
+        shard = db_engine.shard_of(user_id)
+        with db_engine.user_session(user_id) as db:
+            return [
+                (db_engine.encode_row_id(row[0], shard), *row[1:])
+                for row in db.execute(db_queries.STATEMENTS.get(statement), {"user_id": user_id})
+            ]
+
+    def list_rows(self, user_id: int) -> List[tuple]:
+        return self._rows("passwords.rows_by_user", user_id)
+
+    def export_rows(self, user_id: int) -> List[tuple]:
+        return self._rows("passwords.export_rows", user_id)
+
+    def iter_export_rows(self, user_id: int, yield_per: int = 500) -> Iterator[tuple]:
+        shard = db_engine.shard_of(user_id)
+        with db_engine.user_session(user_id) as db:
+            result = db.execute(
+                db_queries.STATEMENTS.get("passwords.export_rows"),
+                {"user_id": user_id},
+                execution_options={"yield_per": yield_per},
+            )
+            for row in result:
+                yield (db_engine.encode_row_id(row[0], shard), *row[1:])
+
+    def add(self, user_id: int, fields: dict) -> int:
+        with db_engine.user_session(user_id) as db:
+            p = Password(user_id=int(user_id), **fields)
+            db.add(p)
+            db.commit()
+            pid = db_engine.encode_row_id(p.id, db_engine.shard_of(user_id))
+        self._notify(user_id, pid, "add")
+        return pid
+
+    def add_many(self, user_id: int, items: Iterable[dict], batch_size: int = 500) -> int:
+        n = 0
+        try:
+            with db_engine.user_session(user_id) as db:
+                for fields in items:
+                    db.add(Password(user_id=int(user_id), **fields))
+                    n += 1
+                    if n % batch_size == 0:
+                        db.commit()
+                        db.expunge_all()  # keep the session small
+                db.commit()
+        finally:
+            if n:
+                self._notify(user_id, None, "import")
+        return n
+
+    def get(self, pid: int) -> Optional[dict]:
+        factory, local_id = db_engine.row_sessionmaker(pid)
+        with factory() as db:
+            p = db.get(Password, local_id)
+            return self._record(p, pid) if p else None
+
+    def _change(self, pid: int, apply, op: str) -> Optional[dict]:
+        factory, local_id = db_engine.row_sessionmaker(pid)
+        with factory() as db:
+            p = db.get(Password, local_id)
+            if not p:
+                return None
+            apply(p)
+            db.commit()
+            rec = self._record(p, pid)
+        self._notify(rec["user_id"], pid, op)
+        return rec
+
+    def update(self, pid: int, changes: dict, op: str = "update") -> Optional[dict]:
+        def _apply(p):
+            for name, value in changes.items():
+                if name in MUTABLE_FIELDS:
+                    setattr(p, name, value)
+        return self._change(pid, _apply, op)
+
+    def toggle_favorite(self, pid: int) -> Optional[dict]:
+        def _apply(p):
+            p.favorite = not bool(p.favorite)
+        return self._change(pid, _apply, "favorite")
+
+    def delete(self, pid: int) -> Optional[dict]:
+        factory, local_id = db_engine.row_sessionmaker(pid)
+        with factory() as db:
+            p = db.get(Password, local_id)
+            if not p:
+                return None
+            rec = self._record(p, pid)
+            db.delete(p)
+            db.commit()
+        self._notify(rec["user_id"], pid, "delete")
+        return rec
+
+    def count(self, user_id: int) -> int:
+        with db_engine.user_session(user_id) as db:
+            count = db.execute(db_queries.STATEMENTS.get("passwords.count_by_user"), {"user_id": user_id})
+            return int(count.scalar() or 0)
+
+    def key_version_counts(self, user_id: int) -> Dict[Optional[int], int]:
+        with db_engine.user_session(user_id) as db:
+            return {
+                row[0]: int(row[1])
+                for row in db.execute(db_queries.STATEMENTS.get("passwords.key_versions"), {"user_id": user_id})
+            }
+
+    def count_keyed(self, user_id: int) -> int:
+        with db_engine.user_session(user_id) as db:
+            return int(db.execute(
+                select(func.count()).select_from(Password)
+                .where(Password.user_id == int(user_id), Password.key_version.is_not(None))
+            ).scalar_one())
+
+    def delete_keyed(self, user_id: int) -> int:
+        n = delete_in_batches(
+            Password,
+            Password.user_id == int(user_id),
+            Password.key_version.is_not(None),
+            before_delete=delete_password_history,
+            session_factory=db_engine.user_sessionmaker(user_id),
+        )
+        if n:
+            self._notify(user_id, None, "delete")
+        return n
+
+    def secrets_page(self, user_id: int, after_id: int, limit: int, raw: bool = False) -> List[tuple]:
+        shard = db_engine.shard_of(user_id)
+        after = db_engine.decode_row_id(after_id)[1] if after_id else 0
+        with db_engine.user_session(user_id) as db:
+            return [
+                (db_engine.encode_row_id(row[0], shard), row[1])
+                for row in db.execute(
+                    db_queries.STATEMENTS.get("passwords.secret_blobs_page" if raw else "passwords.secrets_page"),
+                    {"user_id": user_id, "after_id": after, "limit": limit},
+                )
+            ]
+
+    @staticmethod
+    def _holds(old):
+        """Match the stored value against `old`: packed bytes (raw pages) or a
+        text token, stored packed or still as text (not backfilled yet)."""
+        if not isinstance(old, str):
+            return Password.encrypted_password == bytes(old)
+        return or_(
+            Password.encrypted_password == old,
+            type_coerce(Password.encrypted_password, Text) == type_coerce(old, Text),
+        )
+
+    def swap_secrets(self, user_id: int, changes: Iterable[tuple]) -> int:
+        changed = []
+        with db_engine.user_session(user_id) as db:
+            for pid, old, new in changes:
+                if db.execute(
+                    update(Password)
+                    .where(
+                        Password.id == db_engine.decode_row_id(pid)[1],
+                        Password.user_id == int(user_id),
+                        self._holds(old),
+                    )
+                    # not a user edit: keep last_updated (the column has onupdate)
+                    .values(
+                        encrypted_password=new,
+                        key_version=entry_key_version(new),
+                        last_updated=Password.last_updated,
+                    ),
+                    execution_options={"synchronize_session": False},
+                ).rowcount:
+                    changed.append(pid)
+            db.commit()
+        for pid in changed:
+            self._notify(user_id, pid, "update")
+        return len(changed)
+
+    def delete_user(
+        self, user_id: int, batch_size: int = 500, pause_seconds: float = 0.0, max_batches: Optional[int] = None
+    ) -> int:
+        n = delete_in_batches(
+            Password,
+            Password.user_id == int(user_id),
+            batch_size=batch_size,
+            pause_seconds=pause_seconds,
+            before_delete=delete_password_history,
+            session_factory=db_engine.user_sessionmaker(user_id),
+            max_batches=max_batches,
+        )
+        if n:
+            self._notify(user_id, None, "purge")
+        return n
+
+    def purge_trashed(self, cutoff: datetime, batch_size: int = 500, pause_seconds: float = 0.0) -> int:
+        users = set()
+
+        def _before_delete(db, ids):
+            users.update(db.execute(select(Password.user_id).where(Password.id.in_(ids))).scalars())
+            delete_password_history(db, ids)
+
+        n = sum(
+            delete_in_batches(
+                Password,
+                Password.trashed_at.is_not(None),
+                Password.trashed_at < cutoff,
+                batch_size=batch_size,
+                pause_seconds=pause_seconds,
+                before_delete=_before_delete,
+                session_factory=factory,
+            )
+            for factory in db_engine.data_sessionmakers()
+        )
+        for uid in sorted(users):
+            self._notify(uid, None, "delete")
+        return n
+
+
+# ============================================================
+# EMBEDDED LOG FILE
+# ============================================================
+_DATETIME_FIELDS = ("trashed_at", "last_updated", "created_at")
+
+
+def _to_stored(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _from_stored(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+class LogPasswordRepository(PasswordRepository):
+    """Password entries as records in a LogStore (timestamps stored as ISO strings)."""
+
+    def __init__(self, store) -> None:
+        self.store = store
+
+    def _row(self, rid: int, uid: int, rec: dict) -> tuple:
+        return tuple(
+            rid if name == "id" else uid if name == "user_id"
+            else _from_stored(rec.get(name)) if name in _DATETIME_FIELDS
+            else rec.get(name)
+            for name in PASSWORD_FIELDS
+        )
+
+    def _record(self, rid: int, uid: int, rec: dict) -> dict:
+        return dict(zip(PASSWORD_FIELDS, self._row(rid, uid, rec)))
+
+    def list_rows(self, user_id: int) -> List[tuple]:
+        uid = int(user_id)
+        rows = [self._row(rid, uid, rec) for rid, rec in self.store.records_for_user(uid)]
+        rows.sort(key=lambda r: r[11] or datetime.min, reverse=True)
+        return rows
+
+    def export_rows(self, user_id: int) -> List[tuple]:
+        return list(self.iter_export_rows(user_id))
+
+    def iter_export_rows(self, user_id: int) -> Iterator[tuple]:
+        uid = int(user_id)
+        for rid, rec in self.store.iter_records_for_user(uid):
+            yield self._row(rid, uid, rec)
+
+    def _new(self, fields: dict) -> dict:
+        now = datetime.utcnow().isoformat()
+        rec = {name: _to_stored(fields.get(name)) for name in MUTABLE_FIELDS}
+        rec["last_updated"] = now
+        rec["created_at"] = now
+        return rec
+
+    def add(self, user_id: int, fields: dict) -> int:
+        pid = self.store.put(int(user_id), self._new(fields))
+        self._notify(user_id, pid, "add")
+        return pid
+
+    def add_many(self, user_id: int, items: Iterable[dict], batch_size: int = 500) -> int:
+        n = 0
+        batch: List[dict] = []
+        try:
+            for fields in items:
+                batch.append(self._new(fields))
+                if len(batch) >= batch_size:
+                    n += len(self.store.put_many(int(user_id), batch))
+                    batch = []
+            if batch:
+                n += len(self.store.put_many(int(user_id), batch))
+        finally:
+            if n:
+                self._notify(user_id, None, "import")
+        return n
+
+    def get(self, pid: int) -> Optional[dict]:
+        found = self.store.get(pid)
+        if found is None:
+            return None
+        uid, rec = found
+        return self._record(int(pid), uid, rec)
+
+    def update(self, pid: int, changes: dict, op: str = "update") -> Optional[dict]:
+        with self.store.lock:
+            found = self.store.get(pid)
+            if found is None:
+                return None
+            uid, rec = found
+            for name, value in changes.items():
+                if name in MUTABLE_FIELDS:
+                    rec[name] = _to_stored(value)
+            rec["last_updated"] = datetime.utcnow().isoformat()
+            self.store.put(uid, rec, rid=int(pid))
+        self._notify(uid, int(pid), op)
+        return self._record(int(pid), uid, rec)
+
+    def toggle_favorite(self, pid: int) -> Optional[dict]:
+        with self.store.lock:
+            found = self.store.get(pid)
+            if found is None:
+                return None
+            return self.update(pid, {"favorite": not bool(found[1].get("favorite"))}, op="favorite")
+
+    def delete(self, pid: int) -> Optional[dict]:
+        with self.store.lock:
+            rec = self.get(pid)
+            if rec is None:
+                return None
+            self.store.delete(pid)
+        self._notify(rec["user_id"], int(pid), "delete")
+        return rec
+
+    def count(self, user_id: int) -> int:
+        return len(self.store.records_for_user(int(user_id)))
+
+    def key_version_counts(self, user_id: int) -> Dict[Optional[int], int]:
+        counts: Dict[Optional[int], int] = {}
+        for _rid, rec in self.store.records_for_user(int(user_id)):
+            version = rec.get("key_version")
+            counts[version] = counts.get(version, 0) + 1
+        return counts
+
+    def count_keyed(self, user_id: int) -> int:
+        records = self.store.records_for_user(int(user_id))
+        return sum(1 for _rid, rec in records if rec.get("key_version") is not None)
+
+    def delete_keyed(self, user_id: int) -> int:
+        with self.store.lock:
+            ids = [
+                rid for rid, rec in self.store.records_for_user(int(user_id))
+                if rec.get("key_version") is not None
+            ]
+            for rid in ids:
+                self.store.delete(rid)
+        if ids:
+            self._notify(user_id, None, "delete")
+        return len(ids)
+
+    def secrets_page(self, user_id: int, after_id: int, limit: int, raw: bool = False) -> List[tuple]:
+        # records keep text tokens: raw pages pack them like the SQL blob column
+        page = sorted(
+            (rid, rec.get("encrypted_password"))
+            for rid, rec in self.store.records_for_user(int(user_id))
+            if rid > after_id
+        )[:limit]
+        return [(rid, pack(token)) for rid, token in page] if raw else page
+
+    def swap_secrets(self, user_id: int, changes: Iterable[tuple]) -> int:
+        changed = []
+        with self.store.lock:
+            for pid, old, new in changes:
+                if not isinstance(old, str):
+                    old = unpack(old)  # from a raw page
+                found = self.store.get(pid)
+                if found is None or found[0] != int(user_id) or found[1].get("encrypted_password") != old:
+                    continue
+                rec = dict(found[1], encrypted_password=new, key_version=entry_key_version(new))
+                self.store.put(found[0], rec, rid=int(pid))
+                changed.append(int(pid))
+        for pid in changed:
+            self._notify(user_id, pid, "update")
+        return len(changed)
+
+    def delete_user(
+        self, user_id: int, batch_size: int = 500, pause_seconds: float = 0.0, max_batches: Optional[int] = None
+    ) -> int:
+        # in-memory index: no need to pause between batches
+        limit = None if max_batches is None else batch_size * max_batches
+        with self.store.lock:
+            ids = [rid for rid, _rec in self.store.records_for_user(int(user_id))][:limit]
+            for rid in ids:
+                self.store.delete(rid)
+        if ids:
+            self._notify(user_id, None, "purge")
+        return len(ids)
+
+    def purge_trashed(self, cutoff: datetime, batch_size: int = 500, pause_seconds: float = 0.0) -> int:
+        n = 0
+        users = set()
+        with self.store.lock:
+            for uid in self.store.user_ids():
+                for rid, rec in self.store.records_for_user(uid):
+                    trashed_at = _from_stored(rec.get("trashed_at"))
+                    if trashed_at is not None and trashed_at < cutoff:
+                        self.store.delete(rid)
+                        users.add(uid)
+                        n += 1
+        for uid in sorted(users):
+            self._notify(uid, None, "delete")
+        return n
+
+
+def build_repository() -> PasswordRepository:
+    kind = os.getenv("VAULT_STORE", "sql").strip().lower()
+    if kind == "log":
+        from database.logstore import LogStore
+
+        store = LogStore(
+            os.getenv("VAULT_LOG_PATH", "password_guardian.vlog"),
+            sync=os.getenv("VAULT_LOG_FSYNC", "false").strip().lower() in {"1", "true", "yes", "on"},
+        )
+        return LogPasswordRepository(store)
+    if kind != "sql":
+        raise ValueError(f"Unknown VAULT_STORE: {kind}")
+    return SqlPasswordRepository()
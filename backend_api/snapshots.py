@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""backend_api/snapshots.py
+
+Server-side history of the security score.
+
+- summarize_rows(): the /stats numbers (score, strength mix, counts) for a
+  list of password rows (backend_api/repository.PASSWORD_FIELDS layout)
+- snapshot_user() / take_snapshots(): the "security_snapshots" job, one row
+  per user and day, written to the user's data database
+- trend(): the series behind GET /stats/<user_id>/trend, read from the
+  snapshots only, so it costs the same whatever the vault size
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import select
+
+from database.models import SecuritySnapshot, User
+
+SNAPSHOT_FIELDS = ("score", "total", "active", "weak", "medium", "strong", "favorites", "trashed", "added")
+BUCKETS = ("day", "week", "month")
+DEFAULT_RANGES = {"day": "30d", "week": "12w", "month": "6m"}
+MAX_RANGE_DAYS = 3 * 366
+_RANGE_RE = re.compile(r"^(\d{1,4})([dwmy])$")
+_RANGE_DAYS = {"d": 1, "w": 7, "m": 31, "y": 366}
+
+
+def summarize_rows(rows: Iterable[tuple], day: Optional[date] = None) -> Dict[str, int]:
+    """Counts and score of one user's rows; `added` counts rows created on `day`."""
+    total = weak = medium = strong = favorites = trashed = added = points = active = 0
+    for r in rows:
+        total += 1
+        strength = (r[8] or "").lower()
+        weak += strength == "weak"
+        medium += strength == "medium"
+        strong += strength == "strong"
+        favorites += bool(r[9])
+        if r[10] is not None:
+            trashed += 1
+        else:
+            # simple score: strong=2, medium=1, weak=0 (ignore trashed)
+            active += 1
+            points += 2 if strength == "strong" else 1 if strength == "medium" else 0
+        if day is not None and r[12] is not None and r[12].date() == day:
+            added += 1
+    return {
+        "score": int(100 * points / max(1, active * 2)),
+        "total": total,
+        "active": active,
+        "weak": weak,
+        "medium": medium,
+        "strong": strong,
+        "favorites": favorites,
+        "trashed": trashed,
+        "added": added,
+    }
+
+
+def snapshot_user(repository, user_id: int, day: Optional[date] = None, only_missing: bool = False) -> bool:
+    """Write (or overwrite) the user's snapshot for `day`. Returns False when
+    `only_missing` and the day already has one: the vault is not read then."""
+    from database.engine import user_session
+
+    day = day or datetime.utcnow().date()
+    with user_session(user_id) as db:
+        snap = db.execute(
+            select(SecuritySnapshot).where(SecuritySnapshot.user_id == user_id, SecuritySnapshot.day == day)
+        ).scalar_one_or_none()
+        if snap is not None and only_missing:
+            return False
+        summary = summarize_rows(repository.list_rows(user_id), day)
+        if snap is None:
+            snap = SecuritySnapshot(user_id=user_id, day=day)
+            db.add(snap)
+        for name in SNAPSHOT_FIELDS:
+            setattr(snap, name, summary[name])
+        snap.created_at = datetime.utcnow()
+        db.commit()
+        return True
+
+
+def take_snapshots(
+    repository,
+    day: Optional[date] = None,
+    only_missing: bool = True,
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """Snapshot every user for `day` (default: today, UTC).
+
+    Users are read from the directory in id batches. With `only_missing` the
+    job can run often (e.g. hourly, surviving restarts) and still reads each
+    vault once a day.
+    """
+    from database.engine import SessionLocal
+
+    day = day or datetime.utcnow().date()
+    users = written = 0
+    last_id = 0
+    while True:
+        with SessionLocal() as db:
+            ids = db.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            ).scalars().all()
+        if not ids:
+            break
+        for uid in ids:
+            written += snapshot_user(repository, uid, day, only_missing=only_missing)
+        users += len(ids)
+        last_id = ids[-1]
+    return {"users": users, "written": written}
+
+
+def parse_range(value: Optional[str], bucket: str) -> int:
+    """"30d" / "12w" / "6m" / "1y" -> number of days (ValueError when invalid)."""
+    m = _RANGE_RE.match((value or DEFAULT_RANGES[bucket]).strip().lower())
+    if not m:
+        raise ValueError("range must look like 30d, 12w, 6m or 1y")
+    days = int(m.group(1)) * _RANGE_DAYS[m.group(2)]
+    if not 1 <= days <= MAX_RANGE_DAYS:
+        raise ValueError(f"range must be between 1 and {MAX_RANGE_DAYS} days")
+    return days
+
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def trend(
+    user_id: int,
+    bucket: str = "week",
+    range_: Optional[str] = None,
+    today: Optional[date] = None,
+) -> List[dict]:
+    """Points oldest first: the last snapshot of each bucket, `added` summed over it."""
+    from database.engine import user_session
+    from database.queries import STATEMENTS
+
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    today = today or datetime.utcnow().date()
+    since = bucket_start(today - timedelta(days=parse_range(range_, bucket) - 1), bucket)
+
+    points: List[dict] = []
+    with user_session(user_id) as db:
+        for row in db.execute(STATEMENTS.get("security_snapshots.range"), {"user_id": user_id, "since": since}):
+            start = bucket_start(row.day, bucket)
+            values = {name: getattr(row, name) for name in SNAPSHOT_FIELDS}
+            if points and points[-1]["start"] == start:
+                values["added"] += points[-1]["added"]
+                points[-1].update(values, day=row.day)
+            else:
+                points.append({"start": start, "day": row.day, **values})
+    return points
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""benchmarks/bench_bulk_crypto.py
+
+decrypt_many / encrypt_many (src/security/bulk.py) against the per-token
+decrypt_any() loop, for each stored format.
+
+Usage:
+    python -m benchmarks.bench_bulk_crypto              # 100000 tokens
+    python -m benchmarks.bench_bulk_crypto 20000 4      # tokens, workers
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+
+def _s(fn) -> float:
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def run(n: int, workers: int | None) -> None:
+    from src.security.bulk import decrypt_many, encrypt_many
+    from src.security.encryption import decrypt_any
+
+    zk_key = os.urandom(32)
+    print(f"{'format':>7} {'encrypt_many s':>15} {'decrypt_many s':>15} {'decrypt_any s':>14} {'tokens/s':>10}")
+    for fmt in ("fernet", "gcm1", "zk1"):
+        tokens = []
+        enc_s = _s(lambda: tokens.extend(encrypt_many((f"password-{i}" for i in range(n)), fmt, zk_key, workers)))
+        dec_s = _s(lambda: sum(1 for _ in decrypt_many(tokens, zk_key, workers)))
+        one_s = _s(lambda: [decrypt_any(t) for t in tokens]) if fmt != "zk1" else float("nan")
+        print(f"{fmt:>7} {enc_s:>15.2f} {dec_s:>15.2f} {one_s:>14.2f} {n / dec_s:>10.0f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 100000, int(args[1]) if len(args) > 1 else None)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""benchmarks/bench_key_derivation.py
+
+Startup cost of src/security/encryption.py, measured in fresh interpreters:
+importing the module (no key derivation any more), the first Fernet
+round-trip (derives the key), and the same first use in a second process
+when the key cache is enabled (PG_KEY_CACHE=file, read instead of derived).
+
+Usage:
+    python -m benchmarks.bench_key_derivation        # 5 runs each
+    python -m benchmarks.bench_key_derivation 20
+"""
+
+from __future__ import annotations
+
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+_PROBE = r"""
+import time
+t0 = time.perf_counter()
+import src.security.encryption as enc
+t1 = time.perf_counter()
+enc.decrypt_any(enc.encrypt_for_storage("probe"))
+enc.decrypt_any(enc.encrypt_aes_gcm("probe"))
+t2 = time.perf_counter()
+print((t1 - t0) * 1000.0, (t2 - t1) * 1000.0)
+"""
+
+
+def _probe(env: dict) -> tuple[float, float]:
+    root = Path(__file__).resolve().parent.parent
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE], cwd=root, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(out[0]), float(out[1])
+
+
+def run(runs: int) -> None:
+    tmp = tempfile.mkdtemp(prefix="pg_bench_keys_")
+    try:
+        base = dict(os.environ, PG_KEY_CACHE="off")
+        cached = dict(os.environ, PG_KEY_CACHE="file", PG_KEY_CACHE_FILE=os.path.join(tmp, "keys.json"))
+        _probe(cached)  # fills the cache file
+
+        print(f"{'scenario':<22} {'import ms':>10} {'first use ms':>13}")
+        for name, env in (("no cache", base), ("key cache (file)", cached)):
+            samples = [_probe(env) for _ in range(runs)]
+            imp = statistics.median(s[0] for s in samples)
+            first = statistics.median(s[1] for s in samples)
+            print(f"{name:<22} {imp:>10.1f} {first:>13.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
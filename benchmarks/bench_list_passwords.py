@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""benchmarks/bench_list_passwords.py
+
+Compare the ORM read path (select(Password) -> Password instances) with the
+Core column select used by /passwords/<user_id> and /export/<user_id>.
+
+Usage:
+    python -m benchmarks.bench_list_passwords            # 10k and 100k rows
+    python -m benchmarks.bench_list_passwords 5000 50000
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def _seed(engine_module, models_module, user_id: int, n: int) -> None:
+    from sqlalchemy import insert
+
+    Password = models_module.Password
+    # foreign keys are enforced: the owner has to exist first
+    user = {
+        "id": user_id,
+        "username": f"bench{user_id}",
+        "email": f"bench{user_id}@example.com",
+        "password_hash": "x",
+        "salt": "y",
+    }
+    rows = [
+        {
+            "user_id": user_id,
+            "site_name": f"site-{i}",
+            "site_url": f"https://site-{i}.example.com",
+            "site_icon": "🔒",
+            "username": f"user{i}@example.com",
+            "encrypted_password": "gAAAAA" + "x" * 94,
+            "category": "personal",
+            "strength": ("weak", "medium", "strong")[i % 3],
+            "favorite": bool(i % 7 == 0),
+        }
+        for i in range(n)
+    ]
+    with engine_module.engine.begin() as conn:
+        conn.execute(insert(models_module.User), [user])
+        conn.execute(insert(Password), rows)
+
+
+def _measure(fn) -> tuple[float, int]:
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(sizes: list[int]) -> None:
+    fd, db_path = tempfile.mkstemp(prefix="pg_bench_list_", suffix=".db")
+    os.close(fd)
+    os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+    import database.engine as engine_module
+    import database.models as models_module
+    from database.queries import STATEMENTS
+    from sqlalchemy import select
+
+    engine_module.init_db()
+    Password = models_module.Password
+
+    def orm_path(uid: int):
+        with engine_module.SessionLocal() as s:
+            rows = s.execute(
+                select(Password).where(Password.user_id == uid).order_by(Password.last_updated.desc())
+            ).scalars().all()
+            return [(p.id, p.site_name, p.username, p.encrypted_password, p.last_updated) for p in rows]
+
+    def core_path(uid: int):
+        with engine_module.SessionLocal() as s:
+            return [
+                (r[0], r[2], r[5], r[6], r[11])
+                for r in s.execute(STATEMENTS.get("passwords.rows_by_user"), {"user_id": uid})
+            ]
+
+    try:
+        print(f"{'rows':>8} {'path':>5} {'seconds':>9} {'rows/s':>11} {'peak MiB':>9} {'B/row':>7}")
+        for uid, n in enumerate(sizes, start=1):
+            _seed(engine_module, models_module, uid, n)
+            # warm up statement/compiled caches
+            orm_path(uid)
+            core_path(uid)
+            for name, fn in (("orm", orm_path), ("core", core_path)):
+                elapsed, peak = _measure(lambda: fn(uid))
+                print(
+                    f"{n:>8} {name:>5} {elapsed:>9.3f} {n / max(elapsed, 1e-9):>11.0f} "
+                    f"{peak / (1024 * 1024):>9.1f} {peak // max(n, 1):>7}"
+                )
+    finally:
+        engine_module.engine.dispose()
+        try:
+            os.remove(db_path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]] or [10_000, 100_000]
+    run(args)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""benchmarks/bench_logstore.py
+
+Latency of the embedded vault log (database/logstore.py): cold open through
+the mmap'd index, first (decrypting) and warm list, single put/update/delete.
+
+Usage:
+    python -m benchmarks.bench_logstore            # 100 and 1000 entries
+    python -m benchmarks.bench_logstore 200 5000
+"""
+
+from __future__ import annotations
+
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+def _ms(fn, repeat: int = 1) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) * 1000.0 / repeat
+
+
+def run(sizes: list[int]) -> None:
+    from database.logstore import LogStore
+
+    tmp = Path(tempfile.mkdtemp(prefix="pg_bench_log_"))
+    try:
+        print(f"{'entries':>8} {'open ms':>8} {'list ms':>8} {'warm ms':>8} {'put ms':>8} {'upd ms':>8} {'del ms':>8}")
+        for n in sizes:
+            path = tmp / f"vault-{n}.vlog"
+            record = {
+                "site_name": "site", "site_url": "https://site.example.com", "site_icon": "🔒",
+                "username": "user@example.com", "encrypted_password": "gAAAAA" + "x" * 94,
+                "category": "personal", "strength": "strong", "favorite": False, "trashed_at": None,
+            }
+            with LogStore(path) as store:
+                store.put_many(1, [dict(record, site_name=f"site-{i}") for i in range(n)])
+
+            store = None
+
+            def _open():
+                nonlocal store
+                store = LogStore(path)
+
+            open_ms = _ms(_open)
+            list_ms = _ms(lambda: store.records_for_user(1))
+            warm_ms = _ms(lambda: store.records_for_user(1), repeat=20)
+            put_ms = _ms(lambda: store.put(1, record), repeat=200)
+            upd_ms = _ms(lambda: store.put(1, record, rid=1), repeat=200)
+            ids = iter(range(2, n))
+            del_ms = _ms(lambda: store.delete(next(ids)), repeat=min(200, n - 2))
+            store.close()
+            print(f"{n:>8} {open_ms:>8.3f} {list_ms:>8.3f} {warm_ms:>8.3f} {put_ms:>8.3f} {upd_ms:>8.3f} {del_ms:>8.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]] or [100, 1000]
+    run(args)
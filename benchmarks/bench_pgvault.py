@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""benchmarks/bench_pgvault.py
+
+Peak memory and time of an encrypted export + import round trip, .pgvault
+v1 (one JSON document, src/security/encryption.py) against the streamed v2
+format (src/security/pgvault.py). The KDF is the same for both and excluded
+(cheap parameters).
+
+Usage:
+    python -m benchmarks.bench_pgvault            # 50000 entries
+    python -m benchmarks.bench_pgvault 200000
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+_KDF = {"name": "argon2id", "time_cost": 1, "memory_cost": 8192, "parallelism": 1, "hash_len": 32}
+
+
+def _entries(n: int):
+    for i in range(n):
+        yield {
+            "site_name": f"site-{i}.example",
+            "username": f"user{i}@example.com",
+            "encrypted_password": "gAAAAAB" + os.urandom(60).hex(),
+            "category": "personal",
+            "strength": "strong",
+            "favorite": False,
+        }
+
+
+def _measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+def run(n: int) -> None:
+    import src.security.encryption as enc
+    from src.security.pgvault import open_pgvault, write_pgvault
+
+    # v1 has no KDF parameter: pin it to the cheap one for the comparison
+    real_kdf = enc._argon2_key
+    enc._argon2_key = lambda p, s, **kw: real_kdf(p, s, 1, 8192, 1, 32)
+    try:
+        def v1():
+            blob = enc.encrypt_vault_payload({"version": 1, "passwords": list(_entries(n))}, "pass")
+            data = json.dumps(blob)
+            vault = enc.decrypt_vault_payload(json.loads(data), "pass")
+            assert len(vault["passwords"]) == n
+
+        def v2():
+            path = "bench.pgvault"
+            try:
+                with open(path, "wb") as fh:
+                    write_pgvault(fh, _entries(n), "pass", meta={"version": 1}, kdf=_KDF)
+                with open(path, "rb") as fh:
+                    assert sum(1 for _ in open_pgvault(fh, "pass")) == n
+            finally:
+                os.remove(path)
+
+        print(f"{'format':>7} {'seconds':>9} {'peak MiB':>9}")
+        for name, fn in (("v1", v1), ("v2", v2)):
+            s, mib = _measure(fn)
+            print(f"{name:>7} {s:>9.2f} {mib:>9.1f}")
+    finally:
+        enc._argon2_key = real_kdf
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(int(args[0]) if args else 50000)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""database/audit_archive.py
+
+Cold storage for old audit rows (activity_logs).
+
+Rows past the retention window are moved out of the hot table into
+compressed, append-only segment files, one per user and month:
+
+    <root>/<user_id>/2026-03.seg     blocks: "PGAB" | u32 length | u32 crc32 | zlib(JSON lines)
+    <root>/<user_id>/index.json      per segment: committed bytes, rows, time range, block list
+
+Each archival batch appends one block per (user, month) and then replaces
+index.json atomically. Readers only look at blocks listed in the index, and
+a writer cuts a segment back to its committed size before appending, so a
+crash mid-append leaves at worst a torn tail that is dropped on the next
+write. The caller deletes the hot rows only after append() returned; a
+crash in between archives a batch twice, which readers de-duplicate by id.
+
+Queries use the block time ranges from the index and only decompress the
+blocks that overlap the requested window.
+
+Used by the "audit_archive" maintenance job (backend_api/maintenance.py)
+and, transparently, by list_events() in src/security/audit.py.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import struct
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+INDEX_VERSION = 1
+_BLOCK_MAGIC = b"PGAB"
+_BLOCK_HEADER = struct.Struct(">4sII")
+_TS_FORMAT = "microseconds"
+
+
+class AuditArchiveError(Exception):
+    """Corrupt segment block or index."""
+
+
+def _ts(value: datetime) -> str:
+    return value.isoformat(timespec=_TS_FORMAT)
+
+
+def _stored(value):
+    return _ts(value) if isinstance(value, datetime) else value
+
+
+def _key(rec: dict) -> Tuple[datetime, int]:
+    return rec["created_at"], rec["id"]
+
+
+class AuditArchive:
+    """Per-user, per-month compressed segments of archived audit rows."""
+
+    def __init__(self, root: str, sync: bool = True, level: int = 6) -> None:
+        self.root = root
+        self.sync = sync
+        self.level = level
+        self._lock = threading.Lock()
+        # user_id -> (mtime_ns, size, parsed index)
+        self._index_cache: Dict[int, tuple] = {}
+
+    # ---------- paths / index ----------
+    def _user_dir(self, user_id: int) -> str:
+        return os.path.join(self.root, str(int(user_id)))
+
+    def _index_path(self, user_id: int) -> str:
+        return os.path.join(self._user_dir(user_id), "index.json")
+
+    def _load_index(self, user_id: int) -> dict:
+        path = self._index_path(user_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return {"version": INDEX_VERSION, "segments": {}}
+        cached = self._index_cache.get(int(user_id))
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != INDEX_VERSION:
+            raise AuditArchiveError(f"Unsupported archive index version in {path}")
+        self._index_cache[int(user_id)] = (st.st_mtime_ns, st.st_size, index)
+        return index
+
+    def _write_index(self, user_id: int, index: dict) -> None:
+        path = self._index_path(user_id)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, separators=(",", ":"))
+            f.flush()
+            if self.sync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._index_cache.pop(int(user_id), None)
+
+    def has_user(self, user_id: int) -> bool:
+        return os.path.exists(self._index_path(user_id))
+
+    # ---------- write ----------
+    def append(self, user_id: int, rows: Iterable[dict]) -> int:
+        """Archive rows (column dicts) of one user. Returns the number of rows written."""
+        by_month: Dict[str, List[dict]] = {}
+        for row in rows:
+            by_month.setdefault(row["created_at"].strftime("%Y-%m"), []).append(row)
+        if not by_month:
+            return 0
+
+        with self._lock:
+            os.makedirs(self._user_dir(user_id), exist_ok=True)
+            index = json.loads(json.dumps(self._load_index(user_id)))  # private copy
+            written = 0
+            for month, items in sorted(by_month.items()):
+                items.sort(key=_key)
+                payload = "\n".join(
+                    json.dumps({k: _stored(v) for k, v in r.items()}, separators=(",", ":"))
+                    for r in items
+                ).encode("utf-8")
+                data = zlib.compress(payload, self.level)
+                seg = index["segments"].setdefault(
+                    month, {"bytes": 0, "rows": 0, "min_at": None, "max_at": None, "blocks": []}
+                )
+                path = os.path.join(self._user_dir(user_id), f"{month}.seg")
+                with open(path, "ab") as f:
+                    if f.tell() != seg["bytes"]:
+                        f.truncate(seg["bytes"])  # torn tail of an interrupted append
+                        f.seek(seg["bytes"])
+                    f.write(_BLOCK_HEADER.pack(_BLOCK_MAGIC, len(data), zlib.crc32(data)))
+                    f.write(data)
+                    f.flush()
+                    if self.sync:
+                        os.fsync(f.fileno())
+                first, last = _ts(items[0]["created_at"]), _ts(items[-1]["created_at"])
+                seg["blocks"].append([seg["bytes"], len(data), first, last, len(items)])
+                seg["bytes"] += _BLOCK_HEADER.size + len(data)
+                seg["rows"] += len(items)
+                seg["min_at"] = min(filter(None, (seg["min_at"], first)))
+                seg["max_at"] = max(filter(None, (seg["max_at"], last)))
+                written += len(items)
+            self._write_index(user_id, index)
+            return written
+
+    def drop_user(self, user_id: int) -> None:
+        with self._lock:
+            shutil.rmtree(self._user_dir(user_id), ignore_errors=True)
+            self._index_cache.pop(int(user_id), None)
+
+    # ---------- read ----------
+    def _read_block(self, f, offset: int, length: int) -> Iterator[dict]:
+        f.seek(offset)
+        magic, size, crc = _BLOCK_HEADER.unpack(f.read(_BLOCK_HEADER.size))
+        data = f.read(size)
+        if magic != _BLOCK_MAGIC or size != length or zlib.crc32(data) != crc:
+            raise AuditArchiveError(f"Corrupt archive block at offset {offset} in {f.name}")
+        for line in zlib.decompress(data).splitlines():
+            rec = json.loads(line)
+            rec["created_at"] = datetime.fromisoformat(rec["created_at"])
+            yield rec
+
+    def scan(
+        self,
+        user_id: int,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[dict]:
+        """Archived rows of a user with since <= created_at < until (block order)."""
+        lo = _ts(since) if since else None
+        hi = _ts(until) if until else None
+        index = self._load_index(user_id)
+        for month, seg in sorted(index["segments"].items()):
+            if (hi and seg["min_at"] >= hi) or (lo and seg["max_at"] < lo):
+                continue
+            path = os.path.join(self._user_dir(user_id), f"{month}.seg")
+            with open(path, "rb") as f:
+                for offset, length, first, last, _n in seg["blocks"]:
+                    if (hi and first >= hi) or (lo and last < lo):
+                        continue
+                    for rec in self._read_block(f, offset, length):
+                        at = rec["created_at"]
+                        if (since is None or at >= since) and (until is None or at < until):
+                            yield rec
+
+    def query(
+        self,
+        user_id: int,
+        category: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        before: Optional[Tuple[datetime, int]] = None,
+        limit: int = 50,
+    ) -> List[dict]:
+        """Newest-first archived rows, optionally below a (created_at, id) keyset position."""
+        if not self.has_user(user_id):
+            return []
+        upper = until
+        if before is not None:
+            # rows sharing the cursor's timestamp may still be below it (smaller id)
+            tick = before[0] + timedelta(microseconds=1)
+            upper = min(upper, tick) if upper else tick
+        seen = set()
+        found = []
+        for rec in self.scan(user_id, since, upper):
+            if rec["id"] in seen:
+                continue
+            if category and rec.get("category") != category:
+                continue
+            if until is not None and rec["created_at"] >= until:
+                continue
+            if before is not None and _key(rec) >= before:
+                continue
+            seen.add(rec["id"])
+            found.append(rec)
+        found.sort(key=_key, reverse=True)
+        return found[: max(0, int(limit))]
+
+    def stats(self) -> Dict[str, int]:
+        users = segments = rows = size = 0
+        if not os.path.isdir(self.root):
+            return {"users": 0, "segments": 0, "rows": 0, "bytes": 0}
+        for name in os.listdir(self.root):
+            if not name.isdigit():
+                continue
+            index = self._load_index(int(name))
+            users += 1
+            for seg in index["segments"].values():
+                segments += 1
+                rows += seg["rows"]
+                size += seg["bytes"]
+        return {"users": users, "segments": segments, "rows": rows, "bytes": size}
+
+
+_archives: Dict[str, AuditArchive] = {}
+_archives_lock = threading.Lock()
+
+
+def default_archive() -> AuditArchive:
+    """Archive at AUDIT_ARCHIVE_DIR (default "audit_archive"), one instance per path."""
+    root = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+    with _archives_lock:
+        archive = _archives.get(root)
+        if archive is None:
+            archive = AuditArchive(
+                root,
+                sync=os.getenv("AUDIT_ARCHIVE_FSYNC", "true").strip().lower() in {"1", "true", "yes", "on"},
+            )
+            _archives[root] = archive
+        return archive
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+"""database/audit_chain.py
+
+Tamper-evident audit journal.
+
+Every activity_logs row carries chain_hash = HMAC(key, previous chain_hash of
+the same user + the row's content), so editing, deleting or re-ordering a
+row breaks the chain from that point on. The key comes from AUDIT_CHAIN_KEY
+(hex or passphrase), AUDIT_CHAIN_KEY_FILE, or a key file created next to the
+SQLite database ("<db>.chain.key").
+
+Writing: install() hooks Session flushes, so every ActivityLog added through
+the ORM (backend _log, src/security/audit.py, ...) is chained without changes
+at the call sites. The last hash of each user is cached per engine, so a
+steady-state write costs no extra query. After the INSERT the hook checks that
+nobody else wrote in between (the new id must follow the last id this process
+wrote); otherwise (another process, first write, rollback) it reads the real
+previous row inside the same transaction and re-hashes.
+
+Verifying: verify_chains() streams only the rows after each user's last
+checkpoint (yield_per), then stores a new HMAC-signed checkpoint for every
+intact chain, so a run costs what was written since the previous one.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import event, func, select, update, bindparam
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+GENESIS = "0" * 64
+_TABLE = "activity_logs"
+
+_keys: Dict[str, bytes] = {}
+_keys_lock = threading.Lock()
+
+# (engine, user_id) -> last chain_hash, engine -> last activity_logs id written here
+_heads: Dict[tuple, str] = {}
+_last_ids: Dict[object, int] = {}
+_state_lock = threading.Lock()
+
+
+# ============================================================
+# KEY / DIGESTS
+# ============================================================
+def _default_key_path() -> str:
+    from database.engine import engine
+    from database.sqlite_maintenance import sqlite_db_path
+
+    path = sqlite_db_path(engine)
+    return path + ".chain.key" if path else "audit_chain.key"
+
+
+def chain_key() -> bytes:
+    raw = os.getenv("AUDIT_CHAIN_KEY")
+    if raw:
+        try:
+            return bytes.fromhex(raw) if len(raw) == 64 else hashlib.sha256(raw.encode("utf-8")).digest()
+        except ValueError:
+            return hashlib.sha256(raw.encode("utf-8")).digest()
+    path = os.getenv("AUDIT_CHAIN_KEY_FILE") or _default_key_path()
+    with _keys_lock:
+        key = _keys.get(path)
+        if key is None:
+            from database.logstore import load_or_create_key
+            key = _keys[path] = load_or_create_key(path)
+        return key
+
+
+def _field(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def row_digest(key: bytes, prev_hash: str, row) -> str:
+    """Chain hash of an ActivityLog object, a result row or a column dict.
+
+    Ids are left out (shard moves renumber rows); created_at is taken to the
+    second because MySQL TIMESTAMP drops microseconds.
+    """
+    created = _field(row, "created_at")
+    payload = json.dumps(
+        [
+            prev_hash,
+            _field(row, "user_id"),
+            _field(row, "action"),
+            _field(row, "category"),
+            _field(row, "verb"),
+            _field(row, "target_id"),
+            _field(row, "target_label"),
+            _field(row, "details"),
+            _field(row, "ip_address"),
+            created.isoformat(timespec="seconds") if created else None,
+        ],
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return hmac.new(key, payload, hashlib.sha256).hexdigest()
+
+
+def checkpoint_signature(key: bytes, user_id: int, last_log_id: int, last_hash: str, verified_rows: int) -> str:
+    msg = f"checkpoint|{int(user_id)}|{int(last_log_id)}|{last_hash}|{int(verified_rows)}".encode("utf-8")
+    return hmac.new(key, msg, hashlib.sha256).hexdigest()
+
+
+# ============================================================
+# WRITE PATH (session hooks)
+# ============================================================
+def _is_log(obj) -> bool:
+    return getattr(obj, "__tablename__", None) == _TABLE
+
+
+def _previous_hash(conn, table, user_id: int, before_id: Optional[int] = None) -> str:
+    stmt = select(table.c.chain_hash).where(table.c.user_id == user_id, table.c.chain_hash.is_not(None))
+    if before_id is not None:
+        stmt = stmt.where(table.c.id < before_id)
+    return conn.execute(stmt.order_by(table.c.id.desc()).limit(1)).scalar() or GENESIS
+
+
+def _before_flush(session, flush_context, instances) -> None:
+    new = [o for o in session.new if _is_log(o) and o.chain_hash is None]
+    if not new:
+        return
+    bind = session.get_bind()
+    key = chain_key()
+    new.sort(key=lambda o: sa_inspect(o).insert_order)
+    pending = {}
+    for obj in new:
+        if obj.created_at is None:
+            obj.created_at = datetime.utcnow()
+        uid = int(obj.user_id or 0)
+        obj.user_id = uid
+        prev = pending.get(uid)
+        if prev is None:
+            with _state_lock:
+                prev = _heads.get((bind, uid))
+        if prev is None:
+            # cache miss: once per user and process
+            prev = _previous_hash(session.connection(), type(obj).__table__, uid)
+        obj._chain_prev = prev
+        obj.chain_hash = pending[uid] = row_digest(key, prev, obj)
+    session.info.setdefault("_audit_chain_new", []).extend(new)
+
+
+def _after_flush(session, flush_context) -> None:
+    new = session.info.pop("_audit_chain_new", None)
+    if not new:
+        return
+    bind = session.get_bind()
+    conn = session.connection()
+    key = None
+    touched = session.info.setdefault("_audit_chain_touched", set())
+    with _state_lock:
+        last = _last_ids.get(bind)
+        for obj in sorted(new, key=lambda o: o.id):
+            uid = obj.user_id
+            head = _heads.get((bind, uid))
+            # in this flush, earlier rows of the same user already moved the head
+            if last is None or obj.id != last + 1 or (head is not None and head != obj._chain_prev):
+                table = type(obj).__table__
+                actual = _previous_hash(conn, table, uid, before_id=obj.id)
+                if actual != obj._chain_prev:
+                    key = key or chain_key()
+                    digest = row_digest(key, actual, obj)
+                    conn.execute(update(table).where(table.c.id == obj.id).values(chain_hash=digest))
+                    # already written by the UPDATE: no history, no second flush
+                    set_committed_value(obj, "chain_hash", digest)
+            _heads[(bind, uid)] = obj.chain_hash
+            touched.add((bind, uid))
+            last = obj.id
+        _last_ids[bind] = last
+
+
+def _after_commit(session) -> None:
+    session.info.pop("_audit_chain_touched", None)
+
+
+def _after_rollback(session) -> None:
+    touched = session.info.pop("_audit_chain_touched", None)
+    session.info.pop("_audit_chain_new", None)
+    if not touched:
+        return
+    with _state_lock:
+        for head_key in touched:
+            _heads.pop(head_key, None)
+            _last_ids.pop(head_key[0], None)
+
+
+def install() -> None:
+    """Register the flush hooks on every ORM Session (idempotent)."""
+    for name, fn in (
+        ("before_flush", _before_flush),
+        ("after_flush", _after_flush),
+        ("after_commit", _after_commit),
+        ("after_rollback", _after_rollback),
+    ):
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
+
+
+def forget_heads(bind=None) -> None:
+    """Drop cached chain heads (all engines, or one)."""
+    with _state_lock:
+        for head_key in [k for k in _heads if bind is None or k[0] is bind]:
+            del _heads[head_key]
+        for eng in [e for e in _last_ids if bind is None or e is bind]:
+            del _last_ids[eng]
+
+
+# ============================================================
+# MIGRATION: chain rows written before chain_hash existed
+# ============================================================
+def seal_unchained_rows(eng, batch_size: int = 1000) -> int:
+    """Give chain hashes to rows that have none, in id order. Returns rows sealed."""
+    from database.models import ActivityLog
+
+    table = ActivityLog.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values(chain_hash=bindparam("b_chain_hash"))
+    )
+    key = None
+    heads: Dict[int, str] = {}
+    done = 0
+    last_id = 0
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(
+                select(table)
+                .where(table.c.chain_hash.is_(None), table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            key = key or chain_key()
+            params = []
+            for row in rows:
+                uid = row["user_id"]
+                prev = heads.get(uid)
+                if prev is None:
+                    prev = _previous_hash(conn, table, uid, before_id=row["id"])
+                heads[uid] = row_digest(key, prev, row)
+                params.append({"row_id": row["id"], "b_chain_hash": heads[uid]})
+            conn.execute(stmt, params)
+        done += len(rows)
+        last_id = rows[-1]["id"]
+    if done:
+        forget_heads(eng)
+    return done
+
+
+# ============================================================
+# VERIFICATION / CHECKPOINTS
+# ============================================================
+def verify_chains(
+    session_factory,
+    user_id: Optional[int] = None,
+    batch_size: int = 1000,
+    checkpoint: bool = True,
+) -> dict:
+    """Verify the chains of one database (or one user) since their last checkpoint.
+
+    Rows are streamed ordered by (user_id, id). Each intact chain gets a new
+    signed checkpoint (when `checkpoint`); a broken one keeps its old
+    checkpoint and is reported in "failures" with the first bad row.
+    """
+    from database.models import ActivityLog, AuditCheckpoint
+
+    key = chain_key()
+    log = ActivityLog.__table__
+    cp = AuditCheckpoint.__table__
+    report = {"users": 0, "rows": 0, "broken": 0, "checkpoints": 0, "failures": []}
+    intact = []
+
+    with session_factory() as db:
+        cp_stmt = select(cp.c.user_id, cp.c.last_log_id, cp.c.last_hash, cp.c.verified_rows, cp.c.signature)
+        if user_id is not None:
+            cp_stmt = cp_stmt.where(cp.c.user_id == int(user_id))
+        checkpoints = {r.user_id: r for r in db.execute(cp_stmt)}
+
+        stmt = (
+            select(log)
+            .outerjoin(cp, cp.c.user_id == log.c.user_id)
+            .where(log.c.id > func.coalesce(cp.c.last_log_id, 0))
+            .order_by(log.c.user_id, log.c.id)
+            .execution_options(yield_per=batch_size)
+        )
+        if user_id is not None:
+            stmt = stmt.where(log.c.user_id == int(user_id))
+
+        uid = None
+        state = None  # [prev_hash, last_id, rows, failed]
+
+        def _finish():
+            if state is None:
+                return
+            report["users"] += 1
+            if state[3]:
+                report["broken"] += 1
+            elif state[2]:
+                intact.append((uid, state[1], state[0], state[2]))
+
+        for row in db.execute(stmt).mappings():
+            if row["user_id"] != uid:
+                _finish()
+                uid = row["user_id"]
+                prior = checkpoints.get(uid)
+                state = [GENESIS, 0, 0, False]
+                if prior is not None:
+                    expected = checkpoint_signature(
+                        key, uid, prior.last_log_id, prior.last_hash, prior.verified_rows
+                    )
+                    if not hmac.compare_digest(expected, prior.signature):
+                        state[3] = True
+                        report["failures"].append({"user_id": uid, "row_id": None, "reason": "checkpoint signature"})
+                        continue
+                    state = [prior.last_hash, prior.last_log_id, 0, False]
+            if state[3]:
+                continue
+            digest = row_digest(key, state[0], row)
+            if row["chain_hash"] is None or not hmac.compare_digest(digest, row["chain_hash"]):
+                state[3] = True
+                report["failures"].append({"user_id": uid, "row_id": row["id"], "reason": "hash mismatch"})
+                continue
+            state[0], state[1] = digest, row["id"]
+            state[2] += 1
+            report["rows"] += 1
+        _finish()
+
+    if checkpoint and intact:
+        with session_factory() as db:
+            for uid, last_id, last_hash, rows in intact:
+                prior = checkpoints.get(uid)
+                total = (prior.verified_rows if prior is not None else 0) + rows
+                values = {
+                    "last_log_id": last_id,
+                    "last_hash": last_hash,
+                    "verified_rows": total,
+                    "created_at": datetime.utcnow(),
+                    "signature": checkpoint_signature(key, uid, last_id, last_hash, total),
+                }
+                if prior is None:
+                    db.execute(cp.insert().values(user_id=uid, **values))
+                else:
+                    db.execute(update(cp).where(cp.c.user_id == uid).values(**values))
+            db.commit()
+        report["checkpoints"] = len(intact)
+    return report
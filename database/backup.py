@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""database/backup.py
+
+Online backups of the SQLite database through the SQLite backup API.
+
+- The source connection holds a read transaction for the whole copy. In WAL
+  mode this pins a consistent snapshot: writers keep committing, and the
+  backup never has to restart because the source changed underneath it.
+- Pages are copied in small steps with a sleep after each step, so the copy
+  never monopolises disk I/O.
+- Each snapshot is verified with PRAGMA integrity_check before it is kept,
+  optionally gzip-compressed, and old snapshots are pruned (retention).
+
+CLI:
+    python -m database.backup --dest backups --keep 7
+    python -m database.backup --dest backups --no-compress
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+SNAPSHOT_PREFIX = "password_guardian-"
+_SNAPSHOT_SUFFIXES = (".db", ".db.gz")
+
+
+def default_source_path() -> str:
+    from database.engine import engine
+    from database.sqlite_maintenance import sqlite_db_path
+
+    path = sqlite_db_path(engine)
+    if not path:
+        raise RuntimeError("Online backup is only available for a file-based SQLite database")
+    return path
+
+
+def list_snapshots(dest_dir: str | Path) -> List[Path]:
+    """Snapshots in `dest_dir`, oldest first (names sort by timestamp)."""
+    d = Path(dest_dir)
+    if not d.is_dir():
+        return []
+    return sorted(
+        p for p in d.iterdir()
+        if p.name.startswith(SNAPSHOT_PREFIX) and p.name.endswith(_SNAPSHOT_SUFFIXES)
+    )
+
+
+def prune_snapshots(dest_dir: str | Path, keep: int) -> List[Path]:
+    """Delete all but the newest `keep` snapshots. Returns the deleted paths."""
+    snaps = list_snapshots(dest_dir)
+    doomed = snaps[:-keep] if keep > 0 else snaps
+    for p in doomed:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+    return doomed
+
+
+def integrity_check(db_path: str | Path) -> str:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(str(r[0]) for r in rows)
+
+
+def online_copy(
+    source: str,
+    dest_path: str | Path,
+    pages_per_step: int = 256,
+    step_sleep: float = 0.005,
+) -> dict:
+    """Copy `source` into `dest_path` page-step by page-step. Returns page/step counts."""
+    steps = {"count": 0, "pages": 0}
+
+    def _progress(_status, remaining, total):
+        steps["count"] += 1
+        steps["pages"] = total
+        if remaining and step_sleep > 0:
+            time.sleep(step_sleep)
+
+    src = sqlite3.connect(source, timeout=30, isolation_level=None, check_same_thread=False)
+    dst = sqlite3.connect(str(dest_path))
+    try:
+        # Pin a read snapshot so concurrent writers don't force the copy to restart
+        src.execute("BEGIN")
+        src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+        src.backup(dst, pages=max(1, int(pages_per_step)), progress=_progress)
+        src.execute("ROLLBACK")
+    finally:
+        dst.close()
+        src.close()
+    return steps
+
+
+def backup_sqlite(
+    dest_dir: str | Path,
+    source_path: Optional[str] = None,
+    pages_per_step: int = 256,
+    step_sleep: float = 0.005,
+    compress: bool = True,
+    keep: int = 7,
+    verify: bool = True,
+) -> dict:
+    """Write a timestamped snapshot of the database into `dest_dir`.
+
+    Returns a report with the snapshot path, its size, page count, duration,
+    integrity result and pruned snapshots. Raises RuntimeError if the
+    integrity check fails (the broken snapshot is removed).
+    """
+    source = source_path or default_source_path()
+    dest = Path(dest_dir)
+    dest.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
+    final_db = dest / f"{SNAPSHOT_PREFIX}{stamp}.db"
+    tmp_db = dest / f".{final_db.name}.tmp"
+
+    t0 = time.perf_counter()
+    steps = online_copy(source, tmp_db, pages_per_step=pages_per_step, step_sleep=step_sleep)
+    copy_seconds = time.perf_counter() - t0
+
+    integrity = "skipped"
+    if verify:
+        integrity = integrity_check(tmp_db)
+        if integrity != "ok":
+            tmp_db.unlink(missing_ok=True)
+            raise RuntimeError(f"Backup integrity check failed: {integrity}")
+
+    if compress:
+        final = final_db.with_name(final_db.name + ".gz")
+        tmp_gz = dest / f".{final.name}.tmp"
+        with open(tmp_db, "rb") as fin, gzip.open(tmp_gz, "wb", compresslevel=6) as fout:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        tmp_db.unlink()
+        os.replace(tmp_gz, final)
+    else:
+        final = final_db
+        os.replace(tmp_db, final)
+
+    pruned = prune_snapshots(dest, keep) if keep else []
+    return {
+        "path": str(final),
+        "bytes": final.stat().st_size,
+        "source_bytes": os.path.getsize(source),
+        "pages": steps["pages"],
+        "steps": steps["count"],
+        "copy_seconds": round(copy_seconds, 3),
+        "total_seconds": round(time.perf_counter() - t0, 3),
+        "integrity": integrity,
+        "pruned": [str(p) for p in pruned],
+    }
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Online backup of the Password Guardian SQLite database")
+    parser.add_argument("--dest", default=os.getenv("BACKUP_DIR", "backups"), help="snapshot directory")
+    parser.add_argument("--source", default=None, help="database file (default: DATABASE_URL)")
+    parser.add_argument("--keep", type=int, default=int(os.getenv("BACKUP_KEEP", "7")), help="snapshots to keep (0 = all)")
+    parser.add_argument("--pages", type=int, default=256, help="pages copied per step")
+    parser.add_argument("--sleep", type=float, default=0.005, help="seconds to sleep between steps")
+    parser.add_argument("--no-compress", action="store_true", help="store plain .db snapshots")
+    parser.add_argument("--no-verify", action="store_true", help="skip PRAGMA integrity_check")
+    args = parser.parse_args(argv)
+
+    report = backup_sqlite(
+        args.dest,
+        source_path=args.source,
+        pages_per_step=args.pages,
+        step_sleep=args.sleep,
+        compress=not args.no_compress,
+        keep=args.keep,
+        verify=not args.no_verify,
+    )
+    print(f"✅ Backup written: {report['path']} ({report['bytes']} bytes, "
+          f"{report['pages']} pages in {report['copy_seconds']}s, integrity={report['integrity']})")
+    for p in report["pruned"]:
+        print(f"   pruned {p}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
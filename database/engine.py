@@ -3,11 +3,19 @@
 Database engine setup using SQLAlchemy.
 - Uses DATABASE_URL if provided (MySQL/Postgres/SQLite).
 - Defaults to local SQLite file (runs out-of-the-box, no MySQL required).
+- Optional user-sharded mode (SQLite only, DB_SHARDS=N > 1): the DATABASE_URL
+  file becomes the *directory* (users, email lookups, shard map, purge queue)
+  and each user's rows (passwords, sessions, devices, audit logs, ...) live in
+  one of N shard files under DB_SHARD_DIR, so writers for different users no
+  longer queue on a single SQLite write lock. Use user_session(user_id) for
+  per-user data and SessionLocal for the directory; rebalancing and the move
+  of existing data into shards is done by `python -m database.shards`.
 """
 
 from __future__ import annotations
 
 import os
+import threading
 from pathlib import Path
 
 try:
@@ -43,32 +51,305 @@ if DATABASE_URL.startswith("sqlite"):
     # Needed for SQLite with threads (GUI + backend)
     connect_args = {"check_same_thread": False}
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args=connect_args,
-    pool_pre_ping=True,
-)
+
+def _sqlite_listener(url: str, foreign_keys: bool = True):
+    def _sqlite_on_connect(dbapi_conn, _record) -> None:
+        cur = dbapi_conn.cursor()
+        if foreign_keys:
+            # SQLite ignores ON DELETE CASCADE unless foreign keys are enabled per connection
+            cur.execute("PRAGMA foreign_keys=ON")
+        if ":memory:" not in url:
+            # WAL: readers never block the writer; checkpoints run as a maintenance job
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+        cur.close()
+    return _sqlite_on_connect
+
+
+def _create_engine(url: str, foreign_keys: bool = True):
+    eng = create_engine(url, connect_args=connect_args, pool_pre_ping=True)
+    if url.startswith("sqlite"):
+        from sqlalchemy import event
+        event.listen(eng, "connect", _sqlite_listener(url, foreign_keys))
+    return eng
+
+
+engine = _create_engine(DATABASE_URL)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Chain every audit row written through the ORM (database/audit_chain.py)
+from database import audit_chain as _audit_chain  # noqa: E402
+
+_audit_chain.install()
+
+
+# ============================================================
+# USER SHARDS
+# ============================================================
+def _env_shard_count() -> int:
+    try:
+        return max(0, int(os.getenv("DB_SHARDS", "0") or 0))
+    except ValueError:
+        return 0
+
+
+SHARD_COUNT = _env_shard_count() if DATABASE_URL.startswith("sqlite") else 0
+SHARDED = SHARD_COUNT > 1
+SHARD_DIR = os.getenv("DB_SHARD_DIR", "shards")
+
+
+def shard_url(index: int) -> str:
+    return "sqlite:///" + os.path.join(SHARD_DIR, f"password_guardian_shard{index:02d}.db").replace("\\", "/")
+
+
+if SHARDED:
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    # Shard files hold no users table rows (users live in the directory), so
+    # FK enforcement is off there; the purge job deletes children explicitly.
+    shard_engines = [_create_engine(shard_url(i), foreign_keys=False) for i in range(SHARD_COUNT)]
+else:
+    shard_engines = []
+shard_sessions = [sessionmaker(autocommit=False, autoflush=False, bind=e) for e in shard_engines]
+
+_shard_cache: dict[int, int] = {}
+_shard_lock = threading.Lock()
+
+
+def shard_of(user_id: int) -> int:
+    """Shard index of a user (0 when not sharded).
+
+    The assignment is stored in the directory (user_shards) so it stays stable
+    when DB_SHARDS changes; new users default to user_id % SHARD_COUNT.
+    """
+    if not SHARDED:
+        return 0
+    uid = int(user_id)
+    cached = _shard_cache.get(uid)
+    if cached is not None:
+        return cached
+    from database.models import UserShard
+    from sqlalchemy.exc import IntegrityError
+
+    with _shard_lock:
+        with SessionLocal() as db:
+            row = db.get(UserShard, uid)
+            if row is None:
+                row = UserShard(user_id=uid, shard=uid % SHARD_COUNT)
+                db.add(row)
+                try:
+                    db.commit()
+                except IntegrityError:
+                    # another process assigned it first
+                    db.rollback()
+                    row = db.get(UserShard, uid)
+            shard = int(row.shard)
+        _shard_cache[uid] = shard
+        return shard
+
+
+def forget_shard(user_id: int) -> None:
+    """Drop a cached assignment (after a move or purge)."""
+    _shard_cache.pop(int(user_id), None)
+
+
+def user_sessionmaker(user_id: int):
+    """Session factory for a user's own rows (the directory when not sharded)."""
+    return shard_sessions[shard_of(user_id)] if SHARDED else SessionLocal
+
+
+def user_session(user_id: int):
+    return user_sessionmaker(user_id)()
+
+
+def encode_row_id(local_id: int | None, shard: int) -> int | None:
+    """Public id of a shard row: ids repeat across shard files, so the shard
+    index is folded into the id handed out by the API (identity when not sharded)."""
+    if local_id is None or not SHARDED:
+        return local_id
+    return int(local_id) * SHARD_COUNT + int(shard)
+
+
+def decode_row_id(public_id: int) -> tuple[int, int]:
+    """(shard, local id) of a public id produced by encode_row_id."""
+    if not SHARDED:
+        return 0, int(public_id)
+    return int(public_id) % SHARD_COUNT, int(public_id) // SHARD_COUNT
+
+
+def row_sessionmaker(public_id: int):
+    """(session factory, local id) for a public row id."""
+    shard, local = decode_row_id(public_id)
+    return (shard_sessions[shard] if SHARDED else SessionLocal), local
+
+
+def data_sessionmakers() -> list:
+    """Every factory that holds per-user rows (the shards, or the single database)."""
+    return list(shard_sessions) if SHARDED else [SessionLocal]
+
+
+def all_engines() -> list:
+    return [engine, *shard_engines]
+
 
 def init_db() -> None:
     # Import here to avoid circular imports on module load
     from database.models import Base
-    Base.metadata.create_all(bind=engine)
+    for eng in all_engines():
+        Base.metadata.create_all(bind=eng)
 
     # Lightweight migrations for SQLite (add new columns if missing)
     if DATABASE_URL.startswith("sqlite"):
-        from sqlalchemy import text
-
-        with engine.begin() as conn:
-            def _has_column(table: str, column: str) -> bool:
-                rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
-                return any(r[1] == column for r in rows)
-
-            if not _has_column("users", "mfa_enabled"):
-                conn.execute(text("ALTER TABLE users ADD COLUMN mfa_enabled BOOLEAN DEFAULT 0"))
-            if not _has_column("users", "totp_enabled"):
-                conn.execute(text("ALTER TABLE users ADD COLUMN totp_enabled BOOLEAN DEFAULT 0"))
-            if not _has_column("users", "totp_secret"):
-                conn.execute(text("ALTER TABLE users ADD COLUMN totp_secret VARCHAR(64)"))
+        for eng in all_engines():
+            _migrate_sqlite(eng)
+
+
+def backfill_activity_log_columns(eng, batch_size: int = 1000) -> int:
+    """Fill category/verb/target_* of rows written before those columns existed.
+
+    Parses the legacy `action` string; one transaction per batch. Returns the
+    number of rows updated.
+    """
+    from sqlalchemy import select, update, bindparam
+    from database.models import ActivityLog
+
+    stmt = (
+        update(ActivityLog.__table__)
+        .where(ActivityLog.__table__.c.id == bindparam("row_id"))
+        .values(
+            category=bindparam("b_category"),
+            verb=bindparam("b_verb"),
+            target_id=bindparam("b_target_id"),
+            target_label=bindparam("b_target_label"),
+        )
+    )
+    done = 0
+    last_id = 0
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(
+                select(ActivityLog.id, ActivityLog.action)
+                .where(ActivityLog.category.is_(None), ActivityLog.id > last_id)
+                .order_by(ActivityLog.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return done
+            params = []
+            for row_id, action in rows:
+                category, verb, target_id, label = ActivityLog.parse_action(action)
+                params.append({
+                    "row_id": row_id,
+                    # "" marks unparseable rows as migrated
+                    "b_category": category or "",
+                    "b_verb": verb,
+                    "b_target_id": target_id,
+                    "b_target_label": label,
+                })
+            conn.execute(stmt, params)
+        done += len(rows)
+        last_id = rows[-1][0]
+
+
+def pack_text_ciphertexts(eng, batch_size: int = 1000) -> int:
+    """Convert passwords.encrypted_password values still stored as text tokens
+    into the packed binary form (database/models.CipherText), one transaction
+    per batch. SQLite only (typeof). Returns the number of rows converted."""
+    from sqlalchemy import bindparam, func, select, update
+    from database.models import Password
+    from src.security.ciphertext import pack
+
+    table = Password.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        # not a user edit: keep last_updated (the column has onupdate)
+        .values(encrypted_password=bindparam("b_blob"), last_updated=table.c.last_updated)
+    )
+    done = 0
+    while True:
+        with eng.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, table.c.encrypted_password)
+                .where(func.typeof(table.c.encrypted_password) == "text")
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return done
+            # bytes go through CipherText untouched
+            conn.execute(stmt, [{"row_id": row_id, "b_blob": pack(token)} for row_id, token in rows])
+        done += len(rows)
+
+
+def _migrate_sqlite(eng) -> None:
+    from sqlalchemy import text
+
+    with eng.begin() as conn:
+        def _has_column(table: str, column: str) -> bool:
+            rows = conn.execute(text(f"PRAGMA table_info({table})")).fetchall()
+            return any(r[1] == column for r in rows)
+
+        if not _has_column("users", "mfa_enabled"):
+            conn.execute(text("ALTER TABLE users ADD COLUMN mfa_enabled BOOLEAN DEFAULT 0"))
+        if not _has_column("users", "totp_enabled"):
+            conn.execute(text("ALTER TABLE users ADD COLUMN totp_enabled BOOLEAN DEFAULT 0"))
+        if not _has_column("users", "totp_secret"):
+            conn.execute(text("ALTER TABLE users ADD COLUMN totp_secret VARCHAR(64)"))
+
+        # Envelope encryption: data key version of "ek1:" entries (src/security/envelope.py)
+        if not _has_column("passwords", "key_version"):
+            conn.execute(text("ALTER TABLE passwords ADD COLUMN key_version INTEGER"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_passwords_key_version ON passwords (key_version)"))
+        # Binary ciphertexts: text tokens left to convert (stays empty once backfilled)
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_passwords_text_secrets ON passwords (id) "
+            "WHERE typeof(encrypted_password) = 'text'"
+        ))
+
+        # Indexes used by the expiry sweeper (backend_api/maintenance.py)
+        for table, column in (
+            ("passwords", "trashed_at"),
+            ("otp_codes", "expires_at"),
+            ("sessions", "expires_at"),
+            ("recovery_codes", "used_at"),
+        ):
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})"))
+
+        # Structured audit events (category / verb / target)
+        for column, ddl in (
+            ("category", "VARCHAR(30)"),
+            ("verb", "VARCHAR(40)"),
+            ("target_id", "INTEGER"),
+            ("target_label", "VARCHAR(255)"),
+        ):
+            if not _has_column("activity_logs", column):
+                conn.execute(text(f"ALTER TABLE activity_logs ADD COLUMN {column} {ddl}"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_activity_logs_user_category_created "
+            "ON activity_logs (user_id, category, created_at)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_activity_logs_user_created ON activity_logs (user_id, created_at)"
+        ))
+        # Partial index: stays empty once backfilled, keeps the startup check below an index probe
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_activity_logs_uncategorized ON activity_logs (id) WHERE category IS NULL"
+        ))
+
+        # Tamper-evident chain (database/audit_chain.py); same partial-index trick for the sealing pass
+        if not _has_column("activity_logs", "chain_hash"):
+            conn.execute(text("ALTER TABLE activity_logs ADD COLUMN chain_hash VARCHAR(64)"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_activity_logs_unsealed ON activity_logs (id) WHERE chain_hash IS NULL"
+        ))
+
+    backfill_activity_log_columns(eng)
+    pack_text_ciphertexts(eng)
+
+    from database.audit_chain import seal_unchained_rows
+    seal_unchained_rows(eng)
+
+    # Needs its own autocommit connection (VACUUM cannot run inside a transaction)
+    from database.sqlite_maintenance import ensure_incremental_auto_vacuum
+    ensure_incremental_auto_vacuum(eng)
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+"""database/logstore.py
+
+Embedded single-file record store for local-only deployments (no SQL engine).
+
+Layout:
+- <path>        append-only log: header (magic, generation, next id) followed by
+                frames [length:u32][crc32:u32][nonce + AES-GCM ciphertext]; each
+                frame holds one JSON operation ({"op": "put"|"del", "id", "user_id", "rec"})
+- <path>.idx    offset index: header (magic, generation, covered log bytes, next id, count)
+                + fixed-size entries (id, offset, user_id, frame length). Loaded
+                through mmap at startup, so opening a vault only replays the log
+                tail written after the last index checkpoint.
+- <path>.key    32-byte record key, created on first use (0600) unless a key is given
+
+Crash safety: a torn tail frame (short or bad CRC) is cut off on open. A frame
+that passes the CRC but fails authentication is never dropped silently, it
+raises LogStoreError (wrong key or tampering). Compaction writes the live
+frames to a new file and swaps it in with os.replace; the generation number
+tells a stale index apart, in which case the log is rescanned.
+
+No SQLAlchemy import here: backend_api/repository.py wraps this as the
+"log" password repository (VAULT_STORE=log).
+"""
+
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+MAGIC = b"PGVLOG01"
+INDEX_MAGIC = b"PGVIDX01"
+_HEADER = struct.Struct("<8sQQ")        # magic, generation, next_id
+_FRAME = struct.Struct("<II")           # payload length, crc32
+_INDEX_HEADER = struct.Struct("<8sQQQQ")  # magic, generation, covered log bytes, next_id, entries
+_INDEX_ENTRY = struct.Struct("<QQQQ")   # id, offset, user_id, frame length
+_NONCE_SIZE = 12
+
+
+class LogStoreError(Exception):
+    pass
+
+
+def load_or_create_key(key_path: str | Path) -> bytes:
+    p = Path(key_path)
+    if p.exists():
+        key = p.read_bytes()
+        if len(key) != 32:
+            raise LogStoreError(f"Invalid key file: {p}")
+        return key
+    key = AESGCM.generate_key(bit_length=256)
+    fd = os.open(str(p), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        os.write(fd, key)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return key
+
+
+def _fsync_dir(path: Path) -> None:
+    if os.name == "nt":
+        return
+    fd = os.open(str(path.parent), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LogStore:
+    """Append-only encrypted record log with an in-memory id -> offset index.
+
+    Records are decrypted once on first read and then served from memory.
+
+    - `sync`: fsync after every append (durable against power loss, but each
+      write then costs a disk flush); by default writes reach the OS only
+    - compaction runs when dead bytes exceed `compact_ratio` of the file and
+      `compact_min_bytes`; maybe_compact() can also be called periodically
+    - the index sidecar is rewritten every `checkpoint_every` appends and on close
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        key: Optional[bytes] = None,
+        sync: bool = False,
+        compact_ratio: float = 0.5,
+        compact_min_bytes: int = 256 * 1024,
+        checkpoint_every: int = 256,
+    ) -> None:
+        self.path = Path(path)
+        self.index_path = Path(str(self.path) + ".idx")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._aead = AESGCM(key or load_or_create_key(str(self.path) + ".key"))
+        self.sync = sync
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.checkpoint_every = max(1, checkpoint_every)
+
+        self._lock = threading.RLock()
+        self._entries: Dict[int, Tuple[int, int, int]] = {}   # id -> (offset, user_id, frame length)
+        self._by_user: Dict[int, Set[int]] = {}
+        self._cache: Dict[int, dict] = {}                      # id -> decoded record
+        self._fh = None
+        self._mm: Optional[mmap.mmap] = None
+        self._size = 0
+        self._generation = 0
+        self._next_id = 1
+        self._unindexed = 0
+        self.recovered_bytes = 0
+        self.replayed_frames = 0
+        self._open()
+
+    @property
+    def lock(self):
+        """Held by every operation; take it to make a read-modify-write atomic."""
+        return self._lock
+
+    # ---------------- open / recovery ----------------
+    def _open(self) -> None:
+        tmp = Path(str(self.path) + ".compact")
+        if tmp.exists():
+            tmp.unlink()  # interrupted compaction: the old log is still complete
+        if not self.path.exists() or self.path.stat().st_size < _HEADER.size:
+            self._write_new_log(self.path, generation=1, next_id=1, frames=b"")
+        self._fh = open(self.path, "r+b")
+        magic, self._generation, self._next_id = _HEADER.unpack(self._fh.read(_HEADER.size))
+        if magic != MAGIC:
+            raise LogStoreError(f"Not a vault log: {self.path}")
+        self._size = os.fstat(self._fh.fileno()).st_size
+        self._remap()
+
+        start = self._load_index()
+        if start is None:
+            self._entries.clear()
+            self._by_user.clear()
+            start = _HEADER.size
+        self._replay(start)
+
+    def _write_new_log(self, path: Path, generation: int, next_id: int, frames: bytes) -> None:
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, generation, next_id))
+            f.write(frames)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remap(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _load_index(self) -> Optional[int]:
+        """Load the index sidecar; returns the log offset to replay from, None if unusable."""
+        try:
+            with open(self.index_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < _INDEX_HEADER.size:
+                    return None
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError:
+            return None
+        try:
+            magic, generation, covered, next_id, count = _INDEX_HEADER.unpack_from(mm, 0)
+            if (magic != INDEX_MAGIC or generation != self._generation or covered > self._size
+                    or len(mm) < _INDEX_HEADER.size + count * _INDEX_ENTRY.size):
+                return None
+            base = memoryview(mm)
+            try:
+                start = _INDEX_HEADER.size
+                for rid, offset, uid, length in _INDEX_ENTRY.iter_unpack(base[start:start + count * _INDEX_ENTRY.size]):
+                    self._entries[rid] = (offset, uid, length)
+                    self._by_user.setdefault(uid, set()).add(rid)
+            finally:
+                base.release()
+            # ids of records deleted before the checkpoint are never handed out again
+            self._next_id = max(self._next_id, next_id)
+            return covered
+        finally:
+            mm.close()
+
+    def _frames(self, start: int) -> Iterator[Tuple[int, int, bytes]]:
+        """(offset, frame length, payload) of valid frames from `start`; stops at a torn tail."""
+        mm, pos, end = self._mm, start, self._size
+        while pos < end:
+            if pos + _FRAME.size > end:
+                break
+            length, crc = _FRAME.unpack_from(mm, pos)
+            body_end = pos + _FRAME.size + length
+            if length < _NONCE_SIZE + 16 or body_end > end:
+                break
+            payload = mm[pos + _FRAME.size:body_end]
+            if zlib.crc32(payload) != crc:
+                break
+            yield pos, body_end - pos, payload
+            pos = body_end
+        self._valid_end = pos
+
+    def _replay(self, start: int) -> None:
+        for offset, length, payload in self._frames(start):
+            op = self._decode(payload)
+            self._apply(op, offset, length)
+            self.replayed_frames += 1
+        if self._valid_end < self._size:
+            # torn write at the tail (crash mid-append): cut it off
+            self.recovered_bytes = self._size - self._valid_end
+            self._fh.truncate(self._valid_end)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+            self._size = self._valid_end
+            self._remap()
+        self._unindexed = self.replayed_frames
+
+    def _apply(self, op: dict, offset: int, length: int) -> None:
+        rid, uid = int(op["id"]), int(op["user_id"])
+        self._next_id = max(self._next_id, rid + 1)
+        if op["op"] == "put":
+            self._entries[rid] = (offset, uid, length)
+            self._by_user.setdefault(uid, set()).add(rid)
+        else:
+            self._drop(rid)
+
+    def _drop(self, rid: int) -> None:
+        self._cache.pop(rid, None)
+        old = self._entries.pop(rid, None)
+        if old is not None:
+            ids = self._by_user.get(old[1])
+            if ids is not None:
+                ids.discard(rid)
+                if not ids:
+                    del self._by_user[old[1]]
+
+    # ---------------- encoding ----------------
+    def _encode(self, op: dict) -> bytes:
+        nonce = os.urandom(_NONCE_SIZE)
+        plain = json.dumps(op, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        payload = nonce + self._aead.encrypt(nonce, plain, MAGIC)
+        return _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+
+    def _decode(self, payload: bytes) -> dict:
+        try:
+            plain = self._aead.decrypt(payload[:_NONCE_SIZE], payload[_NONCE_SIZE:], MAGIC)
+        except Exception as e:
+            raise LogStoreError(f"Record authentication failed in {self.path} (wrong key or tampered file)") from e
+        return json.loads(plain)
+
+    def _record(self, rid: int) -> dict:
+        rec = self._cache.get(rid)
+        if rec is None:
+            offset, _uid, length = self._entries[rid]
+            if offset + length > len(self._mm):
+                self._remap()
+            rec = self._decode(self._mm[offset + _FRAME.size:offset + length])["rec"]
+            self._cache[rid] = rec
+        return dict(rec)
+
+    # ---------------- writes ----------------
+    def _append(self, op: dict) -> Tuple[int, int]:
+        frame = self._encode(op)
+        offset = self._size
+        self._fh.seek(offset)
+        self._fh.write(frame)
+        self._fh.flush()
+        if self.sync:
+            os.fsync(self._fh.fileno())
+        self._size += len(frame)
+        self._unindexed += 1
+        return offset, len(frame)
+
+    def _after_write(self) -> None:
+        if not self.maybe_compact() and self._unindexed >= self.checkpoint_every:
+            self.checkpoint()
+
+    def put(self, user_id: int, record: dict, rid: Optional[int] = None) -> int:
+        """Insert (rid=None) or replace a record. Returns its id."""
+        with self._lock:
+            if rid is None:
+                rid = self._next_id
+                self._next_id += 1
+            else:
+                rid = int(rid)
+                self._next_id = max(self._next_id, rid + 1)
+            op = {"op": "put", "id": rid, "user_id": int(user_id), "rec": record}
+            offset, length = self._append(op)
+            self._drop(rid)
+            self._apply(op, offset, length)
+            self._cache[rid] = dict(record)
+            self._after_write()
+            return rid
+
+    def put_many(self, user_id: int, records: List[dict]) -> List[int]:
+        with self._lock:
+            ids = []
+            for record in records:
+                rid = self._next_id
+                self._next_id += 1
+                op = {"op": "put", "id": rid, "user_id": int(user_id), "rec": record}
+                offset, length = self._append(op)
+                self._apply(op, offset, length)
+                self._cache[rid] = dict(record)
+                ids.append(rid)
+            self._after_write()
+            return ids
+
+    def delete(self, rid: int) -> bool:
+        with self._lock:
+            entry = self._entries.get(int(rid))
+            if entry is None:
+                return False
+            self._append({"op": "del", "id": int(rid), "user_id": entry[1]})
+            self._drop(int(rid))
+            self._after_write()
+            return True
+
+    # ---------------- reads ----------------
+    def get(self, rid: int) -> Optional[Tuple[int, dict]]:
+        """(user_id, record) or None."""
+        with self._lock:
+            entry = self._entries.get(int(rid))
+            if entry is None:
+                return None
+            return entry[1], self._record(int(rid))
+
+    def records_for_user(self, user_id: int) -> List[Tuple[int, dict]]:
+        with self._lock:
+            return [(rid, self._record(rid)) for rid in sorted(self._by_user.get(int(user_id), ()))]
+
+    def iter_records_for_user(self, user_id: int) -> Iterator[Tuple[int, dict]]:
+        """records_for_user() one record at a time (only the ids are held);
+        records deleted meanwhile are skipped."""
+        with self._lock:
+            ids = sorted(self._by_user.get(int(user_id), ()))
+        for rid in ids:
+            with self._lock:
+                if rid not in self._entries:
+                    continue
+                rec = self._record(rid)
+            yield rid, rec
+
+    def user_ids(self) -> List[int]:
+        with self._lock:
+            return sorted(self._by_user)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---------------- index / compaction ----------------
+    def checkpoint(self) -> None:
+        """Persist the offset index (atomic replace) so the next open skips the replay."""
+        with self._lock:
+            parts = [_INDEX_HEADER.pack(INDEX_MAGIC, self._generation, self._size, self._next_id, len(self._entries))]
+            parts.extend(
+                _INDEX_ENTRY.pack(rid, offset, uid, length)
+                for rid, (offset, uid, length) in self._entries.items()
+            )
+            tmp = Path(str(self.index_path) + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(b"".join(parts))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.index_path)
+            self._unindexed = 0
+
+    def dead_bytes(self) -> int:
+        live = sum(length for _offset, _uid, length in self._entries.values())
+        return self._size - _HEADER.size - live
+
+    def maybe_compact(self) -> bool:
+        with self._lock:
+            dead = self.dead_bytes()
+            if dead < self.compact_min_bytes or dead < self.compact_ratio * self._size:
+                return False
+            self.compact()
+            return True
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite live frames into a fresh log (frames are copied, not re-encrypted)."""
+        with self._lock:
+            before = self._size
+            if len(self._mm) < self._size:
+                self._remap()
+            live = sorted(self._entries.items(), key=lambda kv: kv[1][0])
+            chunks, entries, pos = [], {}, _HEADER.size
+            for rid, (offset, uid, length) in live:
+                chunks.append(self._mm[offset:offset + length])
+                entries[rid] = (pos, uid, length)
+                pos += length
+            generation = self._generation + 1
+            tmp = Path(str(self.path) + ".compact")
+            self._write_new_log(tmp, generation, self._next_id, b"".join(chunks))
+
+            self._mm.close()
+            self._mm = None
+            self._fh.close()
+            os.replace(tmp, self.path)
+            _fsync_dir(self.path)
+
+            self._fh = open(self.path, "r+b")
+            self._generation = generation
+            self._size = pos
+            self._entries = entries
+            self._remap()
+            self.checkpoint()
+            return {"before_bytes": before, "after_bytes": pos, "records": len(entries)}
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "records": len(self._entries),
+                "log_bytes": self._size,
+                "dead_bytes": self.dead_bytes(),
+                "generation": self._generation,
+                "unindexed_frames": self._unindexed,
+                "recovered_bytes": self.recovered_bytes,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._fh is None:
+                return
+            if self._unindexed:
+                self.checkpoint()
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self) -> "LogStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -1,19 +1,48 @@
 # -*- coding: utf-8 -*-
 # database/models.py
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
 from sqlalchemy import (
-    String, Integer, Boolean, DateTime, Text, ForeignKey,
-    TIMESTAMP, func
+    String, Integer, Boolean, Date, DateTime, Float, Text, ForeignKey,
+    LargeBinary, TIMESTAMP, Index, UniqueConstraint, func
 )
 from sqlalchemy.orm import (
     declarative_base, relationship, Mapped, mapped_column
 )
+from sqlalchemy.types import TypeDecorator
+
+from src.security.ciphertext import is_packed, pack, unpack
 
 Base = declarative_base()
 
 
+class CipherText(TypeDecorator):
+    """Vault token stored in its packed binary form (src/security/ciphertext.py).
+
+    Python code keeps seeing the text token. Values written before the column
+    went binary are read as they are until backfilled
+    (database/engine.pack_text_ciphertexts); bytes are stored untouched.
+    """
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, bytes):
+            return value
+        if isinstance(value, (bytearray, memoryview)):
+            return bytes(value)
+        return pack(str(value))
+
+    def process_result_value(self, value, dialect):
+        if value is None or isinstance(value, str):
+            return value
+        if is_packed(value):
+            return unpack(value)
+        return bytes(value).decode("utf-8")  # text token in a converted (BLOB) column
+
+
 # ============================================================
 # USER MODEL
 # ============================================================
@@ -34,13 +63,15 @@ class User(Base):
     totp_secret: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
     # Relations
-    passwords: Mapped[List["Password"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    otp_codes: Mapped[List["OTPCode"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    sessions: Mapped[List["Session"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    devices: Mapped[List["UserDevice"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    activity_logs: Mapped[List["ActivityLog"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    trusted_devices: Mapped[List["TrustedDevice"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    recovery_codes: Mapped[List["RecoveryCode"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: children are removed by the DB (ON DELETE CASCADE) or by the
+    # batched purge job (backend_api/purge.py), never loaded into memory first.
+    passwords: Mapped[List["Password"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    otp_codes: Mapped[List["OTPCode"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    sessions: Mapped[List["Session"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    devices: Mapped[List["UserDevice"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    activity_logs: Mapped[List["ActivityLog"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    trusted_devices: Mapped[List["TrustedDevice"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    recovery_codes: Mapped[List["RecoveryCode"]] = relationship(back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
     def __repr__(self):
         return f"<User(id={self.id}, email='{self.email}')>"
@@ -71,13 +102,15 @@ class Password(Base):
     site_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
     site_icon: Mapped[Optional[str]] = mapped_column(String(10), default="🔒")
     username: Mapped[str] = mapped_column(String(255))
-    encrypted_password: Mapped[str] = mapped_column(Text)
+    encrypted_password: Mapped[str] = mapped_column(CipherText)
+    # data key version of an "ek1:" token (src/security/envelope.py), NULL for other formats
+    key_version: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, index=True)
 
     category: Mapped[str] = mapped_column(String(50), default="personal", index=True)
     strength: Mapped[str] = mapped_column(String(20), default="medium", index=True)
 
     favorite: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
-    trashed_at: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP, nullable=True)
+    trashed_at: Mapped[Optional[datetime]] = mapped_column(TIMESTAMP, nullable=True, index=True)
 
     last_updated: Mapped[datetime] = mapped_column(
         TIMESTAMP,
@@ -93,7 +126,7 @@ class Password(Base):
     # Relations
     user: Mapped["User"] = relationship(back_populates="passwords")
     history: Mapped[List["PasswordHistory"]] = relationship(
-        back_populates="password", cascade="all, delete-orphan"
+        back_populates="password", cascade="all, delete-orphan", passive_deletes=True
     )
 
     def __repr__(self):
@@ -150,7 +183,7 @@ class OTPCode(Base):
     code: Mapped[str] = mapped_column(String(6))
     purpose: Mapped[str] = mapped_column(String(50), default="login")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    expires_at: Mapped[datetime] = mapped_column(DateTime)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
     verified: Mapped[bool] = mapped_column(Boolean, default=False)
 
     user: Mapped["User"] = relationship(back_populates="otp_codes")
@@ -168,7 +201,7 @@ class Session(Base):
     )
     session_token: Mapped[str] = mapped_column(String(255))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    expires_at: Mapped[datetime] = mapped_column(DateTime)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
     device_info: Mapped[Optional[str]] = mapped_column(String(255))
 
     user: Mapped["User"] = relationship(back_populates="sessions")
@@ -224,7 +257,7 @@ class RecoveryCode(Base):
     )
     code_hash: Mapped[str] = mapped_column(String(128), index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    used_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    used_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)
 
     user: Mapped["User"] = relationship(back_populates="recovery_codes")
 
@@ -234,14 +267,212 @@ class RecoveryCode(Base):
 # ============================================================
 class ActivityLog(Base):
     __tablename__ = "activity_logs"
+    # Journal queries are (user, [category], newest first): both are index range scans
+    __table_args__ = (
+        Index("ix_activity_logs_user_category_created", "user_id", "category", "created_at"),
+        Index("ix_activity_logs_user_created", "user_id", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(
         ForeignKey("users.id", ondelete="CASCADE"), index=True
     )
+    # "category:verb:target_label", kept for display and older readers
     action: Mapped[str] = mapped_column(String(100))
+    category: Mapped[Optional[str]] = mapped_column(String(30), nullable=True)
+    verb: Mapped[Optional[str]] = mapped_column(String(40), nullable=True)
+    target_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    target_label: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     details: Mapped[Optional[str]] = mapped_column(Text)
     ip_address: Mapped[Optional[str]] = mapped_column(String(45))
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # HMAC over the previous row's chain_hash (same user) + this row (database/audit_chain.py)
+    chain_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
+    @staticmethod
+    def parse_action(action: str) -> tuple:
+        """Split a legacy action string into (category, verb, target_id, target_label).
+
+        "password:update:Gmail" -> ("password", "update", None, "Gmail")
+        "session:revoke:42"     -> ("session", "revoke", 42, None)
+        "user.profile_updated"  -> ("user", "profile_updated", None, None)
+        """
+        text = (action or "").strip()
+        sep = ":" if ":" in text else "."
+        parts = text.split(sep, 2)
+        category = parts[0] or None
+        verb = parts[1] if len(parts) > 1 and parts[1] else None
+        label = parts[2] if len(parts) > 2 and parts[2] else None
+        target_id = None
+        if category == "session" and label and label.isdigit():
+            target_id, label = int(label), None
+        return category, verb, target_id, label
+
+    @classmethod
+    def event(
+        cls,
+        user_id: int,
+        category: str,
+        verb: str,
+        target_id: Optional[int] = None,
+        target_label: Optional[str] = None,
+        **kwargs,
+    ) -> "ActivityLog":
+        action = ":".join(str(p) for p in (category, verb, target_label) if p)
+        return cls(
+            user_id=user_id,
+            action=action[:100],
+            category=category,
+            verb=verb,
+            target_id=target_id,
+            target_label=target_label[:255] if target_label else None,
+            **{"created_at": datetime.utcnow(), **kwargs},
+        )
 
     user: Mapped["User"] = relationship(back_populates="activity_logs")
+
+
+# ============================================================
+# AUDIT CHAIN CHECKPOINTS (one per user, in the user's data database)
+# ============================================================
+class AuditCheckpoint(Base):
+    __tablename__ = "audit_checkpoints"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), unique=True, index=True)
+    # chain verified up to and including this activity_logs row
+    last_log_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    last_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    verified_rows: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    signature: Mapped[str] = mapped_column(String(64), nullable=False)
+
+
+# ============================================================
+# VAULT DATA KEYS (envelope encryption, see src/security/envelope.py)
+# ============================================================
+class VaultKey(Base):
+    __tablename__ = "vault_keys"
+    __table_args__ = (UniqueConstraint("user_id", "version", name="uq_vault_keys_user_version"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    # random data key, AES-GCM wrapped by the KEK derived from the master password
+    wrapped_key: Mapped[str] = mapped_column(String(128), nullable=False)
+    kek_salt: Mapped[str] = mapped_column(String(64), nullable=False)
+    kdf_time_cost: Mapped[int] = mapped_column(Integer, nullable=False)
+    kdf_memory_kib: Mapped[int] = mapped_column(Integer, nullable=False)
+    kdf_parallelism: Mapped[int] = mapped_column(Integer, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    rewrapped_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+# ============================================================
+# SECURITY SCORE SNAPSHOTS (one per user and day, see backend_api/snapshots.py)
+# ============================================================
+class SecuritySnapshot(Base):
+    __tablename__ = "security_snapshots"
+    # trend queries are (user, day range): a range scan on the unique index
+    __table_args__ = (UniqueConstraint("user_id", "day", name="uq_security_snapshots_user_day"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    day: Mapped[date] = mapped_column(Date, nullable=False)
+    score: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    active: Mapped[int] = mapped_column(Integer, default=0)
+    weak: Mapped[int] = mapped_column(Integer, default=0)
+    medium: Mapped[int] = mapped_column(Integer, default=0)
+    strong: Mapped[int] = mapped_column(Integer, default=0)
+    favorites: Mapped[int] = mapped_column(Integer, default=0)
+    trashed: Mapped[int] = mapped_column(Integer, default=0)
+    # entries created on that day
+    added: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+# ============================================================
+# RE-ENCRYPTION JOBS (resumable, throttled, see backend_api/reencrypt.py)
+# ============================================================
+class ReencryptJob(Base):
+    __tablename__ = "reencrypt_jobs"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), unique=True, index=True)
+    target: Mapped[str] = mapped_column(String(20), nullable=False)
+    status: Mapped[str] = mapped_column(String(20), default="pending", index=True)
+    # checkpoint: every entry with a (public) id up to this one was handled
+    last_id: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    processed: Mapped[int] = mapped_column(Integer, default=0)
+    rewritten: Mapped[int] = mapped_column(Integer, default=0)
+    skipped: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    run_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    error: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    requested_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def to_dict(self):
+        run = self.run_seconds or 0.0
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "target": self.target,
+            "status": self.status,
+            "last_id": self.last_id,
+            "total": self.total,
+            "processed": self.processed,
+            "rewritten": self.rewritten,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "progress": round(min(1.0, self.processed / self.total), 4) if self.total else 1.0,
+            "rows_per_second": round(self.processed / run, 1) if run > 0 else None,
+            "error": self.error,
+            "requested_at": self.requested_at.isoformat() if self.requested_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# ============================================================
+# ACCOUNT PURGE (resumable, batched account deletion)
+# ============================================================
+class AccountPurge(Base):
+    __tablename__ = "account_purges"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # no FK: the row outlives the user it describes
+    user_id: Mapped[int] = mapped_column(Integer, unique=True, index=True)
+    status: Mapped[str] = mapped_column(String(20), default="pending", index=True)
+    step: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    deleted_rows: Mapped[int] = mapped_column(Integer, default=0)
+    requested_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "step": self.step,
+            "deleted_rows": self.deleted_rows,
+            "requested_at": self.requested_at.isoformat() if self.requested_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# ============================================================
+# USER SHARD MAP (directory database, sharded mode only)
+# ============================================================
+class UserShard(Base):
+    __tablename__ = "user_shards"
+
+    # no FK: the map lives in the directory database next to users
+    user_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    shard: Mapped[int] = mapped_column(Integer, nullable=False, index=True)
+    assigned_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""database/queries.py
+Pre-built statements for the hot paths of the backend and AuthManager.
+
+- list/export only need a dozen scalar columns, so they select those columns
+  directly and get plain Row tuples back (no identity map, no instance state).
+- Every hot lookup is registered once in STATEMENTS with bound parameters and
+  executed as ``db.execute(STATEMENTS.get(name), {...})``. The expression tree
+  is built on first use only; the engine's compiled cache is keyed on the
+  statement's cache key per dialect, so the SQL is compiled once per dialect.
+- STATEMENTS counts hits/misses so the cache can be checked from a profile or
+  the /health endpoint.
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict
+
+from sqlalchemy import Date, DateTime, Integer, LargeBinary, bindparam, func, select, tuple_, type_coerce
+from sqlalchemy.sql import Executable
+
+from database.models import (
+    Password,
+    User,
+    Session,
+    UserDevice,
+    TrustedDevice,
+    RecoveryCode,
+    ActivityLog,
+    SecuritySnapshot,
+)
+
+
+class StatementRegistry:
+    """Named, lazily built, parameterized statements with a hit counter."""
+
+    def __init__(self) -> None:
+        self._factories: Dict[str, Callable[[], Executable]] = {}
+        self._built: Dict[str, Executable] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, name: str, factory: Callable[[], Executable]) -> None:
+        if name in self._factories:
+            raise ValueError(f"Statement already registered: {name}")
+        self._factories[name] = factory
+
+    def get(self, name: str) -> Executable:
+        with self._lock:
+            stmt = self._built.get(name)
+            if stmt is None:
+                try:
+                    factory = self._factories[name]
+                except KeyError:
+                    raise KeyError(f"Unknown statement: {name}") from None
+                stmt = factory()
+                self._built[name] = stmt
+                self.misses += 1
+            else:
+                self.hits += 1
+            return stmt
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "registered": len(self._factories),
+                "built": len(self._built),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+
+STATEMENTS = StatementRegistry()
+
+
+# Column order matters: rows are unpacked positionally by the callers.
+PASSWORD_ROW_COLUMNS = (
+    Password.id,
+    Password.user_id,
+    Password.site_name,
+    Password.site_url,
+    Password.site_icon,
+    Password.username,
+    Password.encrypted_password,
+    Password.category,
+    Password.strength,
+    Password.favorite,
+    Password.trashed_at,
+    Password.last_updated,
+    Password.created_at,
+)
+
+
+# ----------------- passwords -----------------
+STATEMENTS.register(
+    "passwords.rows_by_user",
+    lambda: select(*PASSWORD_ROW_COLUMNS)
+    .where(Password.user_id == bindparam("user_id"))
+    .order_by(Password.last_updated.desc()),
+)
+STATEMENTS.register(
+    "passwords.export_rows",
+    lambda: select(*PASSWORD_ROW_COLUMNS).where(Password.user_id == bindparam("user_id")),
+)
+STATEMENTS.register(
+    "passwords.by_user",
+    lambda: select(Password).where(Password.user_id == bindparam("user_id")),
+)
+STATEMENTS.register(
+    "passwords.secrets_page",
+    lambda: select(Password.id, Password.encrypted_password)
+    .where(Password.user_id == bindparam("user_id"), Password.id > bindparam("after_id"))
+    .order_by(Password.id)
+    .limit(bindparam("limit")),
+)
+# Same page with the stored value untouched (packed bytes, or a text token not backfilled yet)
+STATEMENTS.register(
+    "passwords.secret_blobs_page",
+    lambda: select(Password.id, type_coerce(Password.encrypted_password, LargeBinary))
+    .where(Password.user_id == bindparam("user_id"), Password.id > bindparam("after_id"))
+    .order_by(Password.id)
+    .limit(bindparam("limit")),
+)
+STATEMENTS.register(
+    "passwords.key_versions",
+    lambda: select(Password.key_version, func.count())
+    .where(Password.user_id == bindparam("user_id"))
+    .group_by(Password.key_version),
+)
+STATEMENTS.register(
+    "passwords.count_by_user",
+    lambda: select(func.count()).select_from(Password).where(Password.user_id == bindparam("user_id")),
+)
+
+# ----------------- users -----------------
+STATEMENTS.register(
+    "users.by_email",
+    lambda: select(User).where(User.email == bindparam("email")),
+)
+STATEMENTS.register(
+    "users.by_email_excluding_id",
+    lambda: select(User).where(User.email == bindparam("email")).where(User.id != bindparam("user_id")),
+)
+
+# ----------------- devices / sessions -----------------
+STATEMENTS.register(
+    "user_devices.by_user",
+    lambda: select(UserDevice)
+    .where(UserDevice.user_id == bindparam("user_id"))
+    .order_by(UserDevice.last_used.desc()),
+)
+STATEMENTS.register(
+    "user_devices.by_name",
+    lambda: select(UserDevice).where(
+        UserDevice.user_id == bindparam("user_id"),
+        UserDevice.device_name == bindparam("device_name"),
+    ),
+)
+STATEMENTS.register(
+    "sessions.by_user",
+    lambda: select(Session)
+    .where(Session.user_id == bindparam("user_id"))
+    .order_by(Session.created_at.desc()),
+)
+STATEMENTS.register(
+    "sessions.by_user_device",
+    lambda: select(Session).where(
+        Session.user_id == bindparam("user_id"),
+        Session.device_info == bindparam("device_info"),
+    ),
+)
+STATEMENTS.register(
+    "trusted_devices.by_fingerprint",
+    lambda: select(TrustedDevice)
+    .where(TrustedDevice.user_id == bindparam("user_id"))
+    .where(TrustedDevice.device_fingerprint == bindparam("fingerprint"))
+    .limit(1),
+)
+STATEMENTS.register(
+    "trusted_devices.active",
+    lambda: select(TrustedDevice)
+    .where(TrustedDevice.user_id == bindparam("user_id"))
+    .where(TrustedDevice.device_fingerprint == bindparam("fingerprint"))
+    .where(TrustedDevice.trusted_until > bindparam("now"))
+    .limit(1),
+)
+
+# ----------------- MFA / audit -----------------
+STATEMENTS.register(
+    "recovery_codes.unused",
+    lambda: select(RecoveryCode)
+    .where(RecoveryCode.user_id == bindparam("user_id"))
+    .where(RecoveryCode.code_hash == bindparam("code_hash"))
+    .where(RecoveryCode.used_at.is_(None))
+    .limit(1),
+)
+STATEMENTS.register(
+    "activity_logs.by_user",
+    lambda: select(ActivityLog)
+    .where(ActivityLog.user_id == bindparam("user_id"))
+    .order_by(ActivityLog.created_at.desc()),
+)
+STATEMENTS.register(
+    "activity_logs.by_user_category",
+    lambda: select(ActivityLog)
+    .where(ActivityLog.user_id == bindparam("user_id"))
+    .where(ActivityLog.category == bindparam("category"))
+    .order_by(ActivityLog.created_at.desc()),
+)
+
+
+def _activity_page(by_category: bool):
+    """Keyset page, newest first: rows strictly before (cursor_at, cursor_id).
+
+    Unused bounds are bound to sentinels (see src/security/audit.list_events)
+    so there is one statement shape per filter and no OFFSET scans.
+    """
+    q = select(ActivityLog).where(ActivityLog.user_id == bindparam("user_id"))
+    if by_category:
+        q = q.where(ActivityLog.category == bindparam("category"))
+    return (
+        q.where(ActivityLog.created_at >= bindparam("since", type_=DateTime))
+        .where(ActivityLog.created_at < bindparam("until", type_=DateTime))
+        .where(
+            tuple_(ActivityLog.created_at, ActivityLog.id)
+            < tuple_(bindparam("cursor_at", type_=DateTime), bindparam("cursor_id", type_=Integer))
+        )
+        .order_by(ActivityLog.created_at.desc(), ActivityLog.id.desc())
+        .limit(bindparam("limit", type_=Integer))
+    )
+
+
+STATEMENTS.register("activity_logs.page", lambda: _activity_page(False))
+STATEMENTS.register("activity_logs.page_by_category", lambda: _activity_page(True))
+
+
+# ----------------- security score history -----------------
+_SNAPSHOT_COLUMNS = (
+    SecuritySnapshot.day,
+    SecuritySnapshot.score,
+    SecuritySnapshot.total,
+    SecuritySnapshot.active,
+    SecuritySnapshot.weak,
+    SecuritySnapshot.medium,
+    SecuritySnapshot.strong,
+    SecuritySnapshot.favorites,
+    SecuritySnapshot.trashed,
+    SecuritySnapshot.added,
+)
+STATEMENTS.register(
+    "security_snapshots.range",
+    lambda: select(*_SNAPSHOT_COLUMNS)
+    .where(SecuritySnapshot.user_id == bindparam("user_id"))
+    .where(SecuritySnapshot.day >= bindparam("since", type_=Date))
+    .order_by(SecuritySnapshot.day),
+)
@@ -63,6 +63,7 @@ CREATE TABLE IF NOT EXISTS `otp_codes` (
   PRIMARY KEY (`id`),
   INDEX `idx_user_id` (`user_id`),
   INDEX `idx_purpose` (`purpose`),
+  INDEX `idx_expires_at` (`expires_at`),
   CONSTRAINT `fk_otp_user`
     FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -76,6 +77,7 @@ CREATE TABLE IF NOT EXISTS `sessions` (
   `device_info` VARCHAR(255) DEFAULT NULL,
   PRIMARY KEY (`id`),
   INDEX `idx_user_id` (`user_id`),
+  INDEX `idx_expires_at` (`expires_at`),
   CONSTRAINT `fk_session_user`
     FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -96,15 +98,105 @@ CREATE TABLE IF NOT EXISTS `activity_logs` (
   `id` INT NOT NULL AUTO_INCREMENT,
   `user_id` INT NOT NULL,
   `action` VARCHAR(100) NOT NULL,
+  `category` VARCHAR(30) DEFAULT NULL,
+  `verb` VARCHAR(40) DEFAULT NULL,
+  `target_id` INT DEFAULT NULL,
+  `target_label` VARCHAR(255) DEFAULT NULL,
   `details` TEXT,
   `ip_address` VARCHAR(45) DEFAULT NULL,
   `created_at` TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  `chain_hash` CHAR(64) DEFAULT NULL,
   PRIMARY KEY (`id`),
   INDEX `idx_user_id` (`user_id`),
   INDEX `idx_action` (`action`),
+  INDEX `ix_activity_logs_user_category_created` (`user_id`, `category`, `created_at`),
+  INDEX `ix_activity_logs_user_created` (`user_id`, `created_at`),
   CONSTRAINT `fk_log_user`
     FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+CREATE TABLE IF NOT EXISTS `audit_checkpoints` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `last_log_id` INT NOT NULL,
+  `last_hash` CHAR(64) NOT NULL,
+  `verified_rows` INT DEFAULT 0,
+  `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `signature` CHAR(64) NOT NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_audit_checkpoints_user` (`user_id`),
+  CONSTRAINT `fk_audit_checkpoint_user`
+    FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `security_snapshots` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `day` DATE NOT NULL,
+  `score` INT DEFAULT 0,
+  `total` INT DEFAULT 0,
+  `active` INT DEFAULT 0,
+  `weak` INT DEFAULT 0,
+  `medium` INT DEFAULT 0,
+  `strong` INT DEFAULT 0,
+  `favorites` INT DEFAULT 0,
+  `trashed` INT DEFAULT 0,
+  `added` INT DEFAULT 0,
+  `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_security_snapshots_user_day` (`user_id`, `day`),
+  CONSTRAINT `fk_security_snapshot_user`
+    FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `vault_keys` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `version` INT NOT NULL,
+  `wrapped_key` VARCHAR(128) NOT NULL,
+  `kek_salt` VARCHAR(64) NOT NULL,
+  `kdf_time_cost` INT NOT NULL,
+  `kdf_memory_kib` INT NOT NULL,
+  `kdf_parallelism` INT NOT NULL,
+  `created_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `rewrapped_at` DATETIME NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_vault_keys_user_version` (`user_id`, `version`),
+  CONSTRAINT `fk_vault_key_user`
+    FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS `reencrypt_jobs` (
+  `id` INT NOT NULL AUTO_INCREMENT,
+  `user_id` INT NOT NULL,
+  `target` VARCHAR(20) NOT NULL,
+  `status` VARCHAR(20) DEFAULT 'pending',
+  `last_id` INT DEFAULT 0,
+  `total` INT DEFAULT 0,
+  `processed` INT DEFAULT 0,
+  `rewritten` INT DEFAULT 0,
+  `skipped` INT DEFAULT 0,
+  `failed` INT DEFAULT 0,
+  `run_seconds` DOUBLE DEFAULT 0,
+  `error` VARCHAR(255) NULL,
+  `requested_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` DATETIME DEFAULT CURRENT_TIMESTAMP,
+  `finished_at` DATETIME NULL,
+  PRIMARY KEY (`id`),
+  UNIQUE KEY `uq_reencrypt_jobs_user` (`user_id`),
+  KEY `ix_reencrypt_jobs_status` (`status`),
+  CONSTRAINT `fk_reencrypt_job_user`
+    FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
 ALTER TABLE passwords
 ADD COLUMN site_url VARCHAR(500) NULL AFTER site_name;
+
+ALTER TABLE passwords
+ADD COLUMN key_version INT NULL AFTER encrypted_password,
+ADD INDEX idx_key_version (key_version);
+
+-- Binary ciphertexts (src/security/ciphertext.py); text tokens stay readable
+-- until rewritten in the packed form
+ALTER TABLE passwords
+MODIFY encrypted_password MEDIUMBLOB NOT NULL;
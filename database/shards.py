@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""database/shards.py
+
+Maintenance tool for user-sharded storage (DB_SHARDS=N, see database/engine.py).
+
+- status: users and rows per shard
+- migrate: move per-user rows of an existing single-file database (the
+  directory) into the shard files
+- move: move one user to another shard
+- rebalance: move users from the heaviest to the lightest shard until no
+  single move improves the balance (e.g. after raising DB_SHARDS)
+
+A user is moved by copying its rows into the target (new local ids, password
+history re-linked), committing, flipping the directory shard map, then
+deleting the source rows. Leftovers of an interrupted move are cleared from
+the target before copying, so a move can simply be re-run.
+
+Run it with the backend and GUI stopped: other processes cache the shard map
+and keep writing to the old shard until restarted. Public row ids change when
+a user moves (they carry the shard index); clients just reload their lists.
+
+CLI:
+    python -m database.shards status
+    python -m database.shards migrate
+    python -m database.shards move 42 3
+    python -m database.shards rebalance --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func, insert, select, update
+
+import database.engine as db_engine
+from database.models import (
+    ActivityLog,
+    AuditCheckpoint,
+    OTPCode,
+    Password,
+    PasswordHistory,
+    RecoveryCode,
+    ReencryptJob,
+    SecuritySnapshot,
+    Session,
+    TrustedDevice,
+    User,
+    UserDevice,
+    UserShard,
+    VaultKey,
+)
+
+# Per-user tables copied as-is (passwords + history are handled first)
+USER_TABLES = (Session, UserDevice, TrustedDevice, RecoveryCode, OTPCode, ActivityLog, SecuritySnapshot, VaultKey)
+
+
+def _require_sharded() -> None:
+    if not db_engine.SHARDED:
+        raise RuntimeError("Sharded mode is off: set DB_SHARDS to 2 or more (SQLite only)")
+
+
+def _delete_user_rows(db, user_id: int) -> int:
+    n = db.execute(
+        delete(PasswordHistory).where(
+            PasswordHistory.password_id.in_(select(Password.id).where(Password.user_id == user_id))
+        ),
+        execution_options={"synchronize_session": False},
+    ).rowcount or 0
+    for model in (Password, *USER_TABLES):
+        n += db.execute(
+            delete(model).where(model.user_id == user_id),
+            execution_options={"synchronize_session": False},
+        ).rowcount or 0
+    # checkpoints point at row ids, which a copy renumbers: the next run re-verifies from the start
+    db.execute(delete(AuditCheckpoint).where(AuditCheckpoint.user_id == user_id))
+    return n
+
+
+def _has_user_rows(db, user_id: int) -> bool:
+    return any(
+        db.execute(select(model.id).where(model.user_id == user_id).limit(1)).first() is not None
+        for model in (Password, *USER_TABLES)
+    )
+
+
+def copy_user_rows(user_id: int, src_factory, dst_factory, batch_size: int = 500) -> Dict[str, int]:
+    """Copy every row of `user_id` from one database to another in one target transaction."""
+    uid = int(user_id)
+    counts: Dict[str, int] = {}
+    with src_factory() as src, dst_factory() as dst:
+        _delete_user_rows(dst, uid)
+
+        pw = Password.__table__
+        id_map: Dict[int, int] = {}
+        rows = src.execute(
+            select(pw).where(pw.c.user_id == uid).order_by(pw.c.id).execution_options(yield_per=batch_size)
+        ).mappings()
+        for row in rows:
+            values = dict(row)
+            old_id = values.pop("id")
+            id_map[old_id] = dst.execute(insert(pw).values(**values)).inserted_primary_key[0]
+        counts["passwords"] = len(id_map)
+
+        hist = PasswordHistory.__table__
+        old_ids = list(id_map)
+        counts["password_history"] = 0
+        for i in range(0, len(old_ids), batch_size):
+            chunk = src.execute(select(hist).where(hist.c.password_id.in_(old_ids[i:i + batch_size]))).mappings()
+            batch = []
+            for row in chunk:
+                values = dict(row)
+                values.pop("id")
+                values["password_id"] = id_map[values["password_id"]]
+                batch.append(values)
+            if batch:
+                dst.execute(insert(hist), batch)
+                counts["password_history"] += len(batch)
+
+        for model in USER_TABLES:
+            table = model.__table__
+            rows = src.execute(
+                select(table).where(table.c.user_id == uid).order_by(table.c.id)
+                .execution_options(yield_per=batch_size)
+            ).mappings()
+            batch, total = [], 0
+            for row in rows:
+                values = dict(row)
+                values.pop("id")
+                batch.append(values)
+                if len(batch) >= batch_size:
+                    dst.execute(insert(table), batch)
+                    total += len(batch)
+                    batch = []
+            if batch:
+                dst.execute(insert(table), batch)
+                total += len(batch)
+            counts[table.name] = total
+        dst.commit()
+    return counts
+
+
+def _assign(user_id: int, shard: int) -> None:
+    with db_engine.SessionLocal() as db:
+        row = db.get(UserShard, int(user_id))
+        if row is None:
+            db.add(UserShard(user_id=int(user_id), shard=int(shard)))
+        else:
+            row.shard = int(shard)
+            row.assigned_at = datetime.utcnow()
+        db.commit()
+    db_engine.forget_shard(user_id)
+
+
+def move_user(user_id: int, target_shard: int, batch_size: int = 500) -> Dict[str, int]:
+    """Move a user's rows to `target_shard`. Returns copied row counts per table."""
+    _require_sharded()
+    if not 0 <= int(target_shard) < db_engine.SHARD_COUNT:
+        raise ValueError(f"Shard {target_shard} out of range 0..{db_engine.SHARD_COUNT - 1}")
+    uid = int(user_id)
+    source = db_engine.shard_of(uid)
+    if source == int(target_shard):
+        return {}
+    src = db_engine.shard_sessions[source]
+    counts = copy_user_rows(uid, src, db_engine.shard_sessions[int(target_shard)], batch_size=batch_size)
+    _assign(uid, target_shard)
+    with db_engine.SessionLocal() as db:
+        # the re-encryption checkpoint is a row id of the old shard: start over (runs are idempotent)
+        db.execute(update(ReencryptJob).where(ReencryptJob.user_id == uid).values(last_id=0))
+        db.commit()
+    with src() as db:
+        _delete_user_rows(db, uid)
+        db.commit()
+    return counts
+
+
+def migrate_from_directory(batch_size: int = 500) -> Dict[str, int]:
+    """Move per-user rows still stored in the directory database into the shards."""
+    _require_sharded()
+    with db_engine.SessionLocal() as db:
+        user_ids = db.execute(select(User.id).order_by(User.id)).scalars().all()
+    moved = {"users": 0, "rows": 0}
+    for uid in user_ids:
+        with db_engine.SessionLocal() as db:
+            if not _has_user_rows(db, uid):
+                continue
+        counts = copy_user_rows(uid, db_engine.SessionLocal, db_engine.user_sessionmaker(uid), batch_size=batch_size)
+        with db_engine.SessionLocal() as db:
+            _delete_user_rows(db, uid)
+            db.commit()
+        moved["users"] += 1
+        moved["rows"] += sum(counts.values())
+    return moved
+
+
+def _user_weights(shard: int) -> Dict[int, int]:
+    """Row count per user in one shard (passwords + audit logs dominate)."""
+    weights: Dict[int, int] = {}
+    with db_engine.shard_sessions[shard]() as db:
+        for model in (Password, ActivityLog, Session):
+            for uid, n in db.execute(select(model.user_id, func.count()).group_by(model.user_id)):
+                weights[uid] = weights.get(uid, 0) + int(n)
+    return weights
+
+
+def shard_status() -> List[dict]:
+    _require_sharded()
+    out = []
+    for i in range(db_engine.SHARD_COUNT):
+        weights = _user_weights(i)
+        out.append({"shard": i, "users": len(weights), "rows": sum(weights.values())})
+    return out
+
+
+def plan_rebalance() -> List[tuple]:
+    """Greedy plan of (user_id, from_shard, to_shard) moves.
+
+    Repeatedly moves the biggest user of the heaviest shard that still fits in
+    the gap to the lightest shard, so every move strictly improves the balance.
+    """
+    _require_sharded()
+    weights = {i: _user_weights(i) for i in range(db_engine.SHARD_COUNT)}
+    load = {i: sum(w.values()) for i, w in weights.items()}
+    moves = []
+    while True:
+        heavy = max(load, key=load.get)
+        light = min(load, key=load.get)
+        gap = load[heavy] - load[light]
+        fits = [(w, uid) for uid, w in weights[heavy].items() if 0 < w < gap]
+        if not fits:
+            return moves
+        w, uid = max(fits)
+        moves.append((uid, heavy, light))
+        weights[light][uid] = weights[heavy].pop(uid)
+        load[heavy] -= w
+        load[light] += w
+
+
+def rebalance(dry_run: bool = False, batch_size: int = 500) -> List[tuple]:
+    moves = plan_rebalance()
+    if not dry_run:
+        for uid, _src, dst in moves:
+            move_user(uid, dst, batch_size=batch_size)
+    return moves
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Password Guardian shard maintenance")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("status", help="users and rows per shard")
+    p = sub.add_parser("migrate", help="move per-user rows from the directory into the shards")
+    p.add_argument("--batch", type=int, default=500)
+    p = sub.add_parser("move", help="move one user to another shard")
+    p.add_argument("user_id", type=int)
+    p.add_argument("shard", type=int)
+    p.add_argument("--batch", type=int, default=500)
+    p = sub.add_parser("rebalance", help="even out rows across shards")
+    p.add_argument("--dry-run", action="store_true")
+    p.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    db_engine.init_db()
+    if args.cmd == "status":
+        for s in shard_status():
+            print(f"shard {s['shard']:02d}: {s['users']} users, {s['rows']} rows")
+    elif args.cmd == "migrate":
+        moved = migrate_from_directory(batch_size=args.batch)
+        print(f"✅ Migrated {moved['users']} users ({moved['rows']} rows) into {db_engine.SHARD_COUNT} shards")
+    elif args.cmd == "move":
+        counts = move_user(args.user_id, args.shard, batch_size=args.batch)
+        print(f"✅ User {args.user_id} on shard {args.shard} ({sum(counts.values())} rows moved)")
+    elif args.cmd == "rebalance":
+        moves = rebalance(dry_run=args.dry_run, batch_size=args.batch)
+        for uid, src, dst in moves:
+            print(f"{'would move' if args.dry_run else 'moved'} user {uid}: shard {src} -> {dst}")
+        if not moves:
+            print("✅ Shards already balanced")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
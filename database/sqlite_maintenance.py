@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""database/sqlite_maintenance.py
+
+Housekeeping for the local SQLite database (no-ops on other backends).
+
+- ensure_incremental_auto_vacuum: one-time migration to auto_vacuum=INCREMENTAL
+  (needs a full VACUUM once so the setting applies to an existing file)
+- run_sqlite_maintenance: PRAGMA optimize / ANALYZE, a bounded incremental
+  vacuum and a WAL checkpoint; returns reclaimed bytes and time per step
+"""
+
+from __future__ import annotations
+
+import os
+import time
+from typing import Optional
+
+_AUTO_VACUUM_INCREMENTAL = 2
+
+
+def is_sqlite(engine) -> bool:
+    return engine.dialect.name == "sqlite"
+
+
+def sqlite_db_path(engine) -> Optional[str]:
+    """Filesystem path of the SQLite database, None for in-memory / non-SQLite."""
+    if not is_sqlite(engine):
+        return None
+    db = engine.url.database
+    if not db or db == ":memory:" or db.startswith("file::memory:"):
+        return None
+    return os.path.abspath(db)
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def db_file_sizes(engine) -> dict:
+    path = sqlite_db_path(engine)
+    if not path:
+        return {"db_bytes": 0, "wal_bytes": 0}
+    return {"db_bytes": _size(path), "wal_bytes": _size(path + "-wal")}
+
+
+def _autocommit(engine):
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def ensure_incremental_auto_vacuum(engine) -> bool:
+    """Switch the database to auto_vacuum=INCREMENTAL. Returns True if a VACUUM ran."""
+    if not sqlite_db_path(engine):
+        return False
+    with _autocommit(engine) as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == _AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        return True
+
+
+def freelist_bytes(engine) -> int:
+    if not sqlite_db_path(engine):
+        return 0
+    with _autocommit(engine) as conn:
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar() or 0
+        return int(free_pages) * int(page_size)
+
+
+def run_sqlite_maintenance(
+    engine,
+    full_analyze: bool = False,
+    max_vacuum_pages: int = 2000,
+    checkpoint_mode: str = "TRUNCATE",
+) -> dict:
+    """Run statistics, incremental vacuum and a WAL checkpoint.
+
+    - `full_analyze`: run ANALYZE (e.g. after a mass import) instead of the
+      cheaper PRAGMA optimize, which only re-analyzes tables that need it
+    - `max_vacuum_pages`: upper bound on pages released in one run, so the
+      write lock is only held briefly
+    - `checkpoint_mode`: PASSIVE never waits on readers; TRUNCATE also shrinks
+      the -wal file back to zero
+    """
+    if not sqlite_db_path(engine):
+        return {"skipped": 1}
+    mode = checkpoint_mode.upper()
+    if mode not in {"PASSIVE", "FULL", "RESTART", "TRUNCATE"}:
+        raise ValueError(f"Invalid checkpoint mode: {checkpoint_mode}")
+
+    before = db_file_sizes(engine)
+    result: dict = {}
+    t_total = time.perf_counter()
+    with _autocommit(engine) as conn:
+        t0 = time.perf_counter()
+        conn.exec_driver_sql("ANALYZE" if full_analyze else "PRAGMA optimize")
+        result["analyze_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+
+        t0 = time.perf_counter()
+        free_before = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        if free_before and conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == _AUTO_VACUUM_INCREMENTAL:
+            # executescript steps the pragma to completion (execute() frees a single page)
+            conn.connection.dbapi_connection.executescript(
+                f"PRAGMA incremental_vacuum({int(max_vacuum_pages)});"
+            )
+        free_after = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        result["vacuum_pages"] = int(free_before) - int(free_after)
+        result["vacuum_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+
+        t0 = time.perf_counter()
+        busy, wal_frames, checkpointed = conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})").one()
+        result["checkpoint_busy"] = int(busy)
+        result["checkpointed_frames"] = max(0, int(checkpointed))
+        result["checkpoint_ms"] = round((time.perf_counter() - t0) * 1000.0, 2)
+
+    after = db_file_sizes(engine)
+    result["reclaimed_bytes"] = (before["db_bytes"] + before["wal_bytes"]) - (after["db_bytes"] + after["wal_bytes"])
+    result["db_bytes"] = after["db_bytes"]
+    result["wal_bytes"] = after["wal_bytes"]
+    result["total_ms"] = round((time.perf_counter() - t_total) * 1000.0, 2)
+    return result
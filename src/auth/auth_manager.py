@@ -10,21 +10,24 @@ import secrets
 import smtplib
 import ssl
 import hashlib
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
-from database.engine import SessionLocal
+from database.engine import SessionLocal, user_session, user_sessionmaker
 from database.models import (
     User,
-    OTPCode,
-    ActivityLog,
     TrustedDevice,
     RecoveryCode,
     Session,
     UserDevice,
 )
-from sqlalchemy import select, update
+from database.queries import STATEMENTS
+from src.security.audit import event_to_dict, list_events
+from src.security import password_hash
+from src.security.kdf_service import KdfTimeout
+from sqlalchemy import update
 
 
 def _safe_print(*args, **kwargs):
@@ -41,34 +44,29 @@ print = _safe_print  # type: ignore
 # ----------------- Password Hashing -----------------
 def hash_password(password: str, salt: str = None) -> tuple[str, str]:
     """
-    Hash password using PBKDF2-HMAC-SHA256
-    Returns: (password_hash, salt)
+    Hash password with the configured algorithm (src/security/password_hash.py)
+    Returns: (password_hash "algo$params$salt$hash", user salt)
+    The user salt is kept for recovery codes; the hash carries its own.
     """
     if salt is None:
         salt = os.urandom(32).hex()
-    
-    pwd_hash = hashlib.pbkdf2_hmac(
-        'sha256',
-        password.encode('utf-8'),
-        salt.encode('utf-8'),
-        100000  # 100,000 iterations
-    )
-    
-    return pwd_hash.hex(), salt
+    return password_hash.hash_password(password), salt
 
 
 def verify_password(stored_hash: str, salt: str, provided_password: str) -> bool:
     """
-    Verify a password against its hash
+    Verify a password against its hash (versioned or legacy hex), in constant time
     Returns: True if password matches
     """
-    pwd_hash, _ = hash_password(provided_password, salt)
-    return pwd_hash == stored_hash
+    return password_hash.verify(stored_hash, provided_password, legacy_salt=salt)
 
 
 # ----------------- Auth Manager Class -----------------
 class AuthManager:
-    def __init__(self):
+    def __init__(self, passwords=None):
+        """`passwords`: the PasswordRepository holding the vault entries
+        (backend_api/repository.py); built from VAULT_STORE on first use."""
+        self._passwords = passwords
         self.email_cfg = self._load_email_cfg()
         # in-memory caches
         self.pending_2fa: dict[object, dict] = {}
@@ -77,6 +75,15 @@ class AuthManager:
         self._last_password = None
         self.mfa_enabled_emails: set[str] = set()
         self.recovery_codes: dict[int, list[str]] = {}
+        self._rehash_pool: ThreadPoolExecutor | None = None
+        self.last_rehash: Future | None = None
+
+    @property
+    def passwords(self):
+        if self._passwords is None:
+            from backend_api.repository import build_repository
+            self._passwords = build_repository()
+        return self._passwords
 
     # ---- normalize email key ----
     def _key(self, email_or_key) -> object:
@@ -191,12 +198,10 @@ class AuthManager:
         device_name = self._device_label()
         now = datetime.utcnow()
         try:
-            with SessionLocal() as s:
+            with user_session(user_id) as s:
                 existing = s.execute(
-                    select(UserDevice).where(
-                        UserDevice.user_id == user_id,
-                        UserDevice.device_name == device_name,
-                    )
+                    STATEMENTS.get("user_devices.by_name"),
+                    {"user_id": user_id, "device_name": device_name},
                 ).scalar_one_or_none()
                 if existing:
                     existing.last_used = now
@@ -225,7 +230,7 @@ class AuthManager:
     def _user_by_email(self, email: str) -> dict | None:
         k = self._key(email) # thawes f database ela user b email taeo if laqo treturni info taweo 
         with SessionLocal() as s:
-            row = s.execute(select(User).where(User.email == k)).first()
+            row = s.execute(STATEMENTS.get("users.by_email"), {"email": k}).first()
             if not row:
                 return None
             u: User = row[0]
@@ -241,18 +246,48 @@ class AuthManager:
                 "totp_secret": u.totp_secret,
             }
 
-    def _set_password(self, email: str, new_password: str) -> bool:
-        pw_hash, salt = hash_password(new_password)
-        k = self._key(email)
-        
+    def _commit_with_password(self, db, u: dict, pw_hash: str, salt: str) -> None:
+        """Commit `db` (vault key changes in the user's data database) and the
+        new password hash together: one transaction when both live in the same
+        database; with shards, the old hash is put back if the keys fail to commit."""
+        uid = int(u["id"])
+        new = update(User).where(User.id == uid).values(password_hash=pw_hash, salt=salt)
+        if user_sessionmaker(uid) is SessionLocal:
+            db.execute(new)
+            db.commit()
+            return
         with SessionLocal() as s:
-            s.execute(
-                update(User)
-                .where(User.email == k)
-                .values(password_hash=pw_hash, salt=salt)
-            )
+            s.execute(new)
             s.commit()
-            return True
+        try:
+            db.commit()
+        except Exception:
+            with SessionLocal() as s:
+                s.execute(
+                    update(User).where(User.id == uid)
+                    .values(password_hash=u["password_hash"], salt=u["salt"])
+                )
+                s.commit()
+            raise
+
+    def _rehash_later(self, user_id: int, old_hash: str, password: str) -> Future:
+        """Replace a stale hash (old algorithm / cost) after a successful login,
+        off the login path. Only written if the hash did not change meanwhile."""
+        def _job() -> bool:
+            new_hash = password_hash.hash_password(password)
+            with SessionLocal() as s:
+                done = s.execute(
+                    update(User)
+                    .where(User.id == int(user_id), User.password_hash == old_hash)
+                    .values(password_hash=new_hash)
+                ).rowcount
+                s.commit()
+            return bool(done)
+
+        if self._rehash_pool is None:
+            self._rehash_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rehash")
+        self.last_rehash = self._rehash_pool.submit(_job)
+        return self.last_rehash
 
     def _create_user(self, username: str, email: str, password: str) -> int | None:
         pw_hash, salt = hash_password(password)
@@ -278,10 +313,13 @@ class AuthManager:
         if not isinstance(k, str) or "@" not in k or "." not in k:
             return True
         with SessionLocal() as s:
-            q = select(User).where(User.email == k)
             if exclude_user_id is not None:
-                q = q.where(User.id != int(exclude_user_id))
-            return s.execute(q).scalar_one_or_none() is not None
+                q = STATEMENTS.get("users.by_email_excluding_id")
+                params = {"email": k, "user_id": int(exclude_user_id)}
+            else:
+                q = STATEMENTS.get("users.by_email")
+                params = {"email": k}
+            return s.execute(q, params).scalar_one_or_none() is not None
 
     def update_profile(self, user_id: int, username: str, email: str) -> bool:
         try:
@@ -298,10 +336,10 @@ class AuthManager:
                 if not u:
                     return False
 
-                existing = (
-                    s.execute(select(User).where(User.email == new_email).where(User.id != uid))
-                    .scalar_one_or_none()
-                )
+                existing = s.execute(
+                    STATEMENTS.get("users.by_email_excluding_id"),
+                    {"email": new_email, "user_id": uid},
+                ).scalar_one_or_none()
                 if existing:
                     return False
 
@@ -326,10 +364,28 @@ class AuthManager:
             print(f"âŒ update_profile error: {e}")
             return False
 
-    def update_master_password(self, email: str, new_password: str) -> bool:
+    def change_master_password(self, email: str, current_password: str, new_password: str) -> bool:
+        """Password change with the current password known: the envelope data
+        keys are re-wrapped under the new one (entries are not re-encrypted)."""
         if not new_password or len(str(new_password)) < 8:
             return False
-        return self._set_password(email, new_password)
+        u = self._user_by_email(email)
+        if not u or not verify_password(u["password_hash"], u["salt"], current_password):
+            return False
+        from src.security.envelope import EnvelopeError, rewrap_data_keys
+
+        pw_hash, salt = hash_password(new_password)
+        try:
+            with user_session(int(u["id"])) as db:
+                rewrap_data_keys(int(u["id"]), current_password, new_password, db=db)
+                self._commit_with_password(db, u, pw_hash, salt)
+        except EnvelopeError:
+            print(f"❌ vault keys of {email} could not be unwrapped; password not changed")
+            return False
+        except Exception as e:
+            print(f"❌ change_master_password error: {e}")
+            return False
+        return True
 
     # ------------ Public API ------------
     def register_user(self, username: str, email: str, password: str):
@@ -423,11 +479,20 @@ class AuthManager:
                 }
             
             # Verify password using hashing
-            if not verify_password(u["password_hash"], u["salt"], password):
+            try:
+                password_ok = verify_password(u["password_hash"], u["salt"], password)
+            except KdfTimeout:
+                return {
+                    "error": "⏳ Serveur occupé.\n\nVeuillez réessayer dans un instant.",
+                    "2fa_sent": False
+                }
+            if not password_ok:
                 return {
                     "error": "❌ Mot de passe incorrect.\n\nVeuillez réessayer.", 
                     "2fa_sent": False
                 }
+            if password_hash.needs_rehash(u["password_hash"]):
+                self._rehash_later(u["id"], u["password_hash"], password)
 
             self._last_password = password
             totp_enabled = bool(u.get("totp_enabled") and u.get("totp_secret"))
@@ -601,17 +666,48 @@ class AuthManager:
         return (str(entry["code"]) == str(code).strip() 
                 and datetime.utcnow() < entry["expires"])
 
-    def update_password_with_code(self, email: str, code: str, new_password: str) -> bool:
+    def entries_lost_on_reset(self, email: str) -> int:
+        """Vault entries a reset by code would make unreadable: they are
+        encrypted under data keys wrapped by the forgotten password."""
+        from src.security.envelope import locked_entry_count
+
+        u = self._user_by_email(email)
+        if not u:
+            return 0
+        return locked_entry_count(int(u["id"]), self.passwords)
+
+    def update_password_with_code(self, email: str, code: str, new_password: str,
+                                  discard_locked_entries: bool = False) -> bool:
+        """Reset with an e-mailed code. The data keys stay wrapped by the old
+        password, so they are dropped with the password change; when entries
+        are encrypted under them (entries_lost_on_reset) the reset is refused
+        unless `discard_locked_entries` confirms they may be deleted."""
         if not self.verify_reset_code(email, code):
             print(f"❌ Invalid reset code for {email}")
             return False
-        
-        ok = self._set_password(email, new_password)
-        if ok:
-            self.pending_reset.pop(self._key(email), None)
-            print(f"✅ Password updated for {email}")
-        
-        return ok
+        u = self._user_by_email(email)
+        if not u:
+            return False
+
+        from src.security.envelope import discard_data_keys, locked_entry_count
+
+        locked = locked_entry_count(int(u["id"]), self.passwords)
+        if locked and not discard_locked_entries:
+            print(f"❌ Reset refused for {email}: {locked} entries would become unreadable")
+            return False
+
+        pw_hash, salt = hash_password(new_password)
+        try:
+            with user_session(int(u["id"])) as db:
+                discard_data_keys(int(u["id"]), db, self.passwords)
+                self._commit_with_password(db, u, pw_hash, salt)
+        except Exception as e:
+            print(f"❌ update_password_with_code error: {e}")
+            return False
+
+        self.pending_reset.pop(self._key(email), None)
+        print(f"✅ Password updated for {email}")
+        return True
     
     def resend_verification_code(self, email: str) -> bool:
         """Resend email verification code"""
@@ -656,16 +752,16 @@ class AuthManager:
             return False, "❌ Nouvelle adresse email invalide.", None
 
         with SessionLocal() as s:
-            user = s.execute(select(User).where(User.email == old_k)).scalar_one_or_none()
+            user = s.execute(STATEMENTS.get("users.by_email"), {"email": old_k}).scalar_one_or_none()
             if not user:
                 return False, "❌ Compte introuvable.", None
             if bool(user.email_verified):
                 return False, "❌ Cet email est déjà vérifié.", None
 
-            exists = (
-                s.execute(select(User).where(User.email == new_k).where(User.id != user.id))
-                .scalar_one_or_none()
-            )
+            exists = s.execute(
+                STATEMENTS.get("users.by_email_excluding_id"),
+                {"email": new_k, "user_id": user.id},
+            ).scalar_one_or_none()
             if exists:
                 return False, "❌ Cet e-mail est déjà utilisé.", None
 
@@ -679,7 +775,7 @@ class AuthManager:
         sent = self.resend_verification_code(new_k)
         if not sent:
             with SessionLocal() as s:
-                user = s.execute(select(User).where(User.email == new_k)).scalar_one_or_none()
+                user = s.execute(STATEMENTS.get("users.by_email"), {"email": new_k}).scalar_one_or_none()
                 if user:
                     user.email = old_k
                     s.commit()
@@ -692,21 +788,26 @@ class AuthManager:
 
     # ---------- Audit logs ----------
     def list_audit_logs(self, user_id: int, filter_key: str = "all") -> list[dict]:
-        with SessionLocal() as s:
-            q = select(ActivityLog).where(ActivityLog.user_id == int(user_id))
+        with user_session(user_id) as s:
             if filter_key and filter_key != "all":
-                q = q.where(ActivityLog.action.like(f"{filter_key}:%"))
-            rows = s.execute(q.order_by(ActivityLog.created_at.desc())).scalars().all()
-            return [
-                {
-                    "id": r.id,
-                    "action": r.action,
-                    "details": r.details,
-                    "ip_address": r.ip_address,
-                    "created_at": r.created_at,
-                }
-                for r in rows
-            ]
+                q = STATEMENTS.get("activity_logs.by_user_category")
+                params = {"user_id": int(user_id), "category": filter_key}
+            else:
+                q = STATEMENTS.get("activity_logs.by_user")
+                params = {"user_id": int(user_id)}
+            return [event_to_dict(r) for r in s.execute(q, params).scalars().all()]
+
+    def list_audit_logs_page(
+        self,
+        user_id: int,
+        filter_key: str = "all",
+        since: datetime | None = None,
+        until: datetime | None = None,
+        cursor: str | None = None,
+        limit: int = 50,
+    ) -> dict:
+        """Keyset-paginated journal: {"items": [...], "next_cursor": str | None}."""
+        return list_events(user_id, filter_key, since=since, until=until, cursor=cursor, limit=limit)
 
     # ---------- MFA helpers (email-based + TOTP + recovery codes + device trust) ----------
     def set_mfa_enabled(self, email: str, enabled: bool) -> None:
@@ -774,18 +875,19 @@ class AuthManager:
 
     def generate_recovery_codes(self, user_id: int, count: int = 8) -> list[str]:
         """Generate and store hashed recovery codes, return plaintext once."""
-        u = None
         with SessionLocal() as s:
             u = s.get(User, int(user_id))
             if not u:
                 return []
+            salt = u.salt
+        with user_session(user_id) as s:
             # delete old codes
             s.query(RecoveryCode).filter(RecoveryCode.user_id == int(user_id)).delete()
             codes: list[str] = []
             for _ in range(max(1, count)):
                 c = self._gen_code(8)
                 codes.append(c)
-                s.add(RecoveryCode(user_id=int(user_id), code_hash=self._hash_recovery(c, u.salt)))
+                s.add(RecoveryCode(user_id=int(user_id), code_hash=self._hash_recovery(c, salt)))
             s.commit()
             return codes
 
@@ -799,13 +901,11 @@ class AuthManager:
             if not u:
                 return False
             h = self._hash_recovery(code, u.salt)
-            rc = (
-                s.query(RecoveryCode)
-                .filter(RecoveryCode.user_id == int(user_id))
-                .filter(RecoveryCode.code_hash == h)
-                .filter(RecoveryCode.used_at.is_(None))
-                .first()
-            )
+        with user_session(user_id) as s:
+            rc = s.execute(
+                STATEMENTS.get("recovery_codes.unused"),
+                {"user_id": int(user_id), "code_hash": h},
+            ).scalars().first()
             if not rc:
                 return False
             rc.used_at = datetime.utcnow()
@@ -817,13 +917,11 @@ class AuthManager:
         name = device_name or fp[:12]
         now = datetime.utcnow()
         until = now + timedelta(days=days)
-        with SessionLocal() as s:
-            td = (
-                s.query(TrustedDevice)
-                .filter(TrustedDevice.user_id == int(user_id))
-                .filter(TrustedDevice.device_fingerprint == fp)
-                .first()
-            )
+        with user_session(user_id) as s:
+            td = s.execute(
+                STATEMENTS.get("trusted_devices.by_fingerprint"),
+                {"user_id": int(user_id), "fingerprint": fp},
+            ).scalars().first()
             if td:
                 td.trusted_until = until
                 td.last_used = now
@@ -845,14 +943,11 @@ class AuthManager:
     def is_device_trusted(self, user_id: int) -> bool:
         fp = self._device_fingerprint()
         now = datetime.utcnow()
-        with SessionLocal() as s:
-            td = (
-                s.query(TrustedDevice)
-                .filter(TrustedDevice.user_id == int(user_id))
-                .filter(TrustedDevice.device_fingerprint == fp)
-                .filter(TrustedDevice.trusted_until > now)
-                .first()
-            )
+        with user_session(user_id) as s:
+            td = s.execute(
+                STATEMENTS.get("trusted_devices.active"),
+                {"user_id": int(user_id), "fingerprint": fp, "now": now},
+            ).scalars().first()
             if td:
                 td.last_used = now
                 s.commit()
@@ -2,19 +2,68 @@
 """src/backend/api_client.py
 
 HTTP client used by the PyQt GUI to talk to Flask backend.
+
+start_event_listener() follows GET /events/<user_id> (Server-Sent Events) on
+a background thread and hands each change event to a callback; writes are
+tagged with X-Client-Id so the listener can skip this client's own changes.
 """
 
 from __future__ import annotations
 
-from typing import Tuple, List, Dict, Any, Optional
+import json
+import threading
+import uuid
+from typing import Callable, Iterable, Iterator, Tuple, List, Dict, Any, Optional
 import requests
 
 
+def iter_sse(lines: Iterable[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """SSE text lines -> {"id", "event", "data"} per dispatched event (comments skipped)."""
+    fields: Dict[str, str] = {}
+    data: List[str] = []
+    for line in lines:
+        if line == "":
+            if data:
+                yield {"id": fields.get("id"), "event": fields.get("event", "message"), "data": "\n".join(data)}
+            fields, data = {}, []
+            continue
+        if line.startswith(":"):
+            continue
+        name, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if name == "data":
+            data.append(value)
+        elif name in ("id", "event"):
+            fields[name] = value
+
+
+class _EventListener:
+    """One /events connection: its thread, stop flag and open response."""
+
+    def __init__(self) -> None:
+        self.stop = threading.Event()
+        self.response = None
+        self.thread: Optional[threading.Thread] = None
+
+    def close(self) -> None:
+        self.stop.set()
+        r = self.response
+        if r is not None:
+            try:
+                r.close()  # unblocks iter_lines()
+            except Exception:
+                pass
+
+
 class APIClient:
     def __init__(self, base_url: str = "http://127.0.0.1:5000", timeout: int = 15):
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
         self.session = requests.Session()
+        self.client_id = uuid.uuid4().hex
+        self.session.headers["X-Client-Id"] = self.client_id
+        self._listener: Optional[_EventListener] = None
+        self._listener_lock = threading.Lock()
 
     # ---------- PASSWORDS ----------
     def get_passwords(self, user_id: int) -> Tuple[bool, str, List[Dict[str, Any]]]:
@@ -121,6 +170,21 @@ class APIClient:
         except Exception as e:
             return False, str(e), {}
 
+    def get_stats_trend(
+        self, user_id: int, bucket: str = "week", range_: Optional[str] = None
+    ) -> Tuple[bool, str, List[Dict[str, Any]]]:
+        """Security score series from daily snapshots, oldest point first."""
+        try:
+            params = {"bucket": bucket}
+            if range_:
+                params["range"] = range_
+            r = self.session.get(f"{self.base_url}/stats/{user_id}/trend", params=params, timeout=self.timeout)
+            if r.ok:
+                return True, "ok", r.json().get("points", [])
+            return False, f"{r.status_code}: {r.text}", []
+        except Exception as e:
+            return False, str(e), []
+
     # ---------- PROFILE ----------
     def get_profile(self, user_id: int) -> Tuple[bool, str, Dict[str, Any]]:
         try:
@@ -144,6 +208,24 @@ class APIClient:
         except Exception as e:
             return False, str(e)
 
+    def delete_account(self, user_id: int) -> Tuple[bool, str, Dict[str, Any]]:
+        try:
+            r = self.session.delete(f"{self.base_url}/account/{user_id}", timeout=self.timeout)
+            if r.ok:
+                return True, "ok", r.json().get("purge", {})
+            return False, f"{r.status_code}: {r.text}", {}
+        except Exception as e:
+            return False, str(e), {}
+
+    def get_account_purge(self, user_id: int) -> Tuple[bool, str, Dict[str, Any]]:
+        try:
+            r = self.session.get(f"{self.base_url}/account/{user_id}/purge", timeout=self.timeout)
+            if r.ok:
+                return True, "ok", r.json().get("purge", {})
+            return False, f"{r.status_code}: {r.text}", {}
+        except Exception as e:
+            return False, str(e), {}
+
     # ---------- DEVICES / SESSIONS ----------
     def get_devices(self, user_id: int) -> Tuple[bool, str, List[Dict[str, Any]]]:
         try:
@@ -196,6 +278,19 @@ class APIClient:
         except Exception as e:
             return False, str(e), {}
 
+    def stream_export(self, user_id: int) -> Tuple[bool, str, Dict[str, Any], Iterator[Dict[str, Any]]]:
+        """Export as (meta, entries): entries are parsed off the response as they arrive."""
+        try:
+            r = self.session.get(
+                f"{self.base_url}/export/{user_id}", params={"stream": "1"}, stream=True, timeout=self.timeout
+            )
+            if not r.ok:
+                return False, f"{r.status_code}: {r.text}", {}, iter(())
+            lines = (json.loads(line) for line in r.iter_lines(decode_unicode=True) if line)
+            return True, "ok", next(lines, {}), lines
+        except Exception as e:
+            return False, str(e), {}, iter(())
+
     def import_vault(self, user_id: int, vault: Dict[str, Any]) -> Tuple[bool, str, int]:
         try:
             r = self.session.post(f"{self.base_url}/import/{user_id}", json={"vault": vault}, timeout=self.timeout)
@@ -204,3 +299,107 @@ class APIClient:
             return False, f"{r.status_code}: {r.text}", 0
         except Exception as e:
             return False, str(e), 0
+
+    # ---------- AUDIT ----------
+    def get_audit_page(
+        self,
+        user_id: int,
+        category: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50,
+    ) -> Tuple[bool, str, Dict[str, Any]]:
+        """One journal page: {"items": [...], "next_cursor": str | None}."""
+        try:
+            params = {"category": category, "since": since, "until": until, "cursor": cursor, "limit": limit}
+            r = self.session.get(
+                f"{self.base_url}/audit/{user_id}",
+                params={k: v for k, v in params.items() if v is not None},
+                timeout=self.timeout,
+            )
+            if r.ok:
+                return True, "ok", r.json()
+            return False, f"{r.status_code}: {r.text}", {}
+        except Exception as e:
+            return False, str(e), {}
+
+    # ---------- CHANGE EVENTS ----------
+    def get_password_entry(self, pid: int) -> Tuple[bool, str, Dict[str, Any]]:
+        """One entry in the get_passwords() format (to apply a change event)."""
+        try:
+            r = self.session.get(f"{self.base_url}/passwords/{pid}/entry", timeout=self.timeout)
+            if r.ok:
+                return True, "ok", r.json().get("entry", {})
+            return False, f"{r.status_code}: {r.text}", {}
+        except Exception as e:
+            return False, str(e), {}
+
+    def start_event_listener(
+        self,
+        user_id: int,
+        on_event: Callable[[Dict[str, Any]], None],
+        include_own: bool = False,
+        heartbeat_timeout: float = 45.0,
+    ) -> None:
+        """Follow /events/<user_id> until stop_event_listener() (a client runs
+        one listener: starting another stops the previous one).
+
+        `on_event` runs on the listener thread (GUI code must hop to its own
+        thread) with {"id", "op", "version"}; op "reset" means changes were
+        missed and the full list should be reloaded once. Reconnects with
+        Last-Event-ID and a growing delay (max 30 s); a silent connection is
+        dropped after `heartbeat_timeout` seconds.
+        """
+        listener = _EventListener()
+        stop = listener.stop
+
+        def _run() -> None:
+            last_id: Optional[str] = None
+            delay = 1.0
+            with requests.Session() as http:
+                while not stop.is_set():
+                    headers = {"Accept": "text/event-stream"}
+                    if last_id:
+                        headers["Last-Event-ID"] = last_id
+                    try:
+                        with http.get(
+                            f"{self.base_url}/events/{user_id}",
+                            headers=headers,
+                            stream=True,
+                            timeout=(self.timeout, heartbeat_timeout),
+                        ) as r:
+                            r.raise_for_status()
+                            listener.response = r
+                            if stop.is_set():  # stopped while connecting
+                                return
+                            delay = 1.0
+                            for msg in iter_sse(r.iter_lines(decode_unicode=True)):
+                                if stop.is_set():
+                                    return
+                                if msg["id"]:
+                                    last_id = msg["id"]
+                                evt = json.loads(msg["data"] or "{}")
+                                if not include_own and evt.get("src") == self.client_id:
+                                    continue
+                                on_event(evt)
+                    except Exception:
+                        pass
+                    finally:
+                        listener.response = None
+                    if stop.wait(delay):
+                        return
+                    delay = min(30.0, delay * 2)
+
+        listener.thread = threading.Thread(target=_run, name="pg-events", daemon=True)
+        with self._listener_lock:
+            previous, self._listener = self._listener, listener
+        if previous is not None:
+            previous.close()  # one listener per client
+        listener.thread.start()
+
+    def stop_event_listener(self) -> None:
+        with self._listener_lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.close()
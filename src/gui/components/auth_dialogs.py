@@ -703,7 +703,17 @@ class ForgotPasswordDialog(QDialog):
             QMessageBox.warning(self, "Trop court", "Le mot de passe doit contenir au moins 8 caractères.")
             return
 
-        ok = self.auth.update_password_with_code(email, code, new_pw)
+        lost = self.auth.entries_lost_on_reset(email)
+        if lost and QMessageBox.warning(
+            self, "Entrées chiffrées",
+            f"{lost} entrée(s) du coffre sont chiffrées avec l'ancien mot de passe maître.\n"
+            "Elles seront définitivement supprimées par la réinitialisation.\n\n"
+            "Continuer ?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No,
+        ) != QMessageBox.Yes:
+            return
+
+        ok = self.auth.update_password_with_code(email, code, new_pw, discard_locked_entries=bool(lost))
         if ok:
             QMessageBox.information(self, "OK", "Mot de passe mis à jour.")
             self.accept()
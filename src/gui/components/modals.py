@@ -3,11 +3,15 @@ from PyQt5.QtWidgets import (
     QDialog, QLabel, QLineEdit, QPushButton, QVBoxLayout, QHBoxLayout,
     QFormLayout, QCheckBox, QComboBox, QWidget, QFrame, QMessageBox,
     QApplication, QProgressBar, QSizePolicy, QTextEdit, QScrollArea, QSpinBox,
-    QFileDialog, QInputDialog, QGridLayout, QAbstractSpinBox
+    QFileDialog, QInputDialog, QGridLayout, QAbstractSpinBox,
+    QListView, QStyledItemDelegate, QAbstractItemView
 )
 
-from PyQt5.QtCore import Qt, pyqtSignal, QPropertyAnimation, QEasingCurve, QTimer
-from PyQt5.QtGui import QFont, QPixmap
+from PyQt5.QtCore import (
+    Qt, pyqtSignal, QPropertyAnimation, QEasingCurve, QTimer,
+    QAbstractListModel, QModelIndex, QSize,
+)
+from PyQt5.QtGui import QFont, QPixmap, QColor, QPainter, QPen, QFontMetrics
 import random, string, re
 from datetime import datetime
 from src.auth.auth_manager import AuthManager, verify_password
@@ -15,9 +19,9 @@ from src.backend.api_client import APIClient
 from src.security.password_tools import check_pwned_password
 from src.gui.styles.styles import Styles
 try:
-    from src.security.audit import log_action
+    from src.security.audit import log_event
 except Exception:  # fallback if module is missing
-    def log_action(*_args, **_kwargs):
+    def log_event(*_args, **_kwargs):
         return None
 import csv
 import webbrowser
@@ -1788,7 +1792,20 @@ class ForgotPasswordDialog(QDialog):
             return
 
         try:
-            ok = self.auth.update_password_with_code(self.email_for_reset, code, n1)
+            lost = self.auth.entries_lost_on_reset(self.email_for_reset)
+            if lost and QMessageBox.warning(
+                self,
+                "Entrées chiffrées",
+                f"⚠️ {lost} entrée(s) de votre coffre sont chiffrées avec l'ancien mot de passe maître.\n\n"
+                "Sans lui, elles ne peuvent pas être récupérées et seront supprimées "
+                "par la réinitialisation.\n\nContinuer ?",
+                QMessageBox.Yes | QMessageBox.No,
+                QMessageBox.No,
+            ) != QMessageBox.Yes:
+                return
+            ok = self.auth.update_password_with_code(
+                self.email_for_reset, code, n1, discard_locked_entries=bool(lost)
+            )
             if ok:
                 QMessageBox.information(
                     self,
@@ -2136,11 +2153,12 @@ class EditProfileModal(QDialog):
         if not ok:
             QMessageBox.warning(self, "Erreur", "Mise a jour impossible")
             return
-        if new_pwd:
-            self.auth.update_master_password(email, new_pwd)
+        if new_pwd and not self.auth.change_master_password(email, current_pwd, new_pwd):
+            QMessageBox.warning(self, "Erreur", "Mot de passe actuel incorrect: mot de passe inchange")
+            return
 
         try:
-            log_action(user.get('id'), 'user.profile_updated', 'profile updated')
+            log_event(user.get('id'), 'profile', 'update', details='profile updated')
         except Exception:
             pass
 
@@ -2713,6 +2731,126 @@ class DeviceSessionsModal(QDialog):
         else:
             QMessageBox.warning(self, "Erreur", "Impossible de deconnecter l'appareil.")
 
+class AuditLogListModel(QAbstractListModel):
+    """Journal rows fetched one keyset page at a time as the view scrolls down.
+
+    QListView calls canFetchMore()/fetchMore() when the last rows come into
+    view, so only the pages actually looked at are queried and kept.
+    """
+
+    PAGE_SIZE = 50
+    ICONS = {"login": "LOG", "password": "PWD", "vault": "BOX", "failed": "ERR"}
+
+    def __init__(self, auth_manager, user_id: int, parent=None):
+        super().__init__(parent)
+        self.auth = auth_manager
+        self.user_id = user_id
+        self.filter_key = "all"
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+
+    def reset(self, filter_key: str) -> None:
+        self.beginResetModel()
+        self.filter_key = filter_key
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return row["title"]
+        if role == Qt.UserRole:
+            return row
+        return None
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent):
+        if parent.isValid() or self._exhausted:
+            return
+        try:
+            page = self.auth.list_audit_logs_page(
+                self.user_id, self.filter_key, cursor=self._cursor, limit=self.PAGE_SIZE
+            )
+        except Exception:
+            page = {"items": [], "next_cursor": None}
+        items = [self._display(r) for r in page.get("items") or []]
+        self._cursor = page.get("next_cursor")
+        self._exhausted = self._cursor is None
+        if items:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+            self._rows.extend(items)
+            self.endInsertRows()
+
+    @classmethod
+    def _display(cls, row: dict) -> dict:
+        # formatted once here so paint() only draws
+        when = row.get("created_at")
+        ts = when.strftime("%d/%m/%Y %H:%M") if when else "-"
+        details = row.get("details") or "Aucun detail"
+        return {
+            "icon": cls.ICONS.get(row.get("category") or "", "EVT"),
+            "title": (row.get("action") or "-").replace(":", " - "),
+            "subtitle": f"{ts}  -  {details}",
+        }
+
+
+class AuditLogDelegate(QStyledItemDelegate):
+    """Paints one journal row as a card (no widget per row)."""
+
+    ROW_HEIGHT = 62
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), self.ROW_HEIGHT)
+
+    def paint(self, painter, option, index):
+        row = index.data(Qt.UserRole)
+        if not row:
+            return
+        painter.save()
+        painter.setRenderHint(QPainter.Antialiasing)
+        card = option.rect.adjusted(0, 4, -6, -4)
+        painter.setPen(QPen(QColor(148, 163, 184, 62), 1))
+        painter.setBrush(QColor(30, 41, 59, 235))
+        painter.drawRoundedRect(card, 14, 14)
+
+        font = QFont(option.font)
+        font.setPointSize(8)
+        font.setBold(True)
+        painter.setFont(font)
+        painter.setPen(QColor("#dbeafe"))
+        icon_rect = card.adjusted(12, 0, 0, 0)
+        icon_rect.setWidth(34)
+        painter.drawText(icon_rect, Qt.AlignVCenter | Qt.AlignLeft, row["icon"])
+
+        text_left = icon_rect.right() + 12
+        text_width = card.right() - 12 - text_left
+        font.setPointSize(10)
+        painter.setFont(font)
+        painter.setPen(QColor("#f8fafc"))
+        title = QFontMetrics(font).elidedText(row["title"], Qt.ElideRight, text_width)
+        painter.drawText(text_left, card.top() + 22, title)
+
+        font.setBold(False)
+        font.setPointSize(8)
+        painter.setFont(font)
+        painter.setPen(QColor("#cbd5e1"))
+        sub = QFontMetrics(font).elidedText(row["subtitle"], Qt.ElideRight, text_width)
+        painter.drawText(text_left, card.top() + 42, sub)
+        painter.restore()
+
+
 class AuditLogModal(QDialog):
     def __init__(self, user_id: int, auth_manager: AuthManager, parent=None):
         super().__init__(parent)
@@ -2803,12 +2941,17 @@ class AuditLogModal(QDialog):
         bar.addStretch()
         root.addLayout(bar)
 
-        self.scroll = QScrollArea()
-        self.scroll.setWidgetResizable(True)
-        self.scroll.setFrameShape(QFrame.NoFrame)
-        self.scroll.setStyleSheet("""
-            QScrollArea { background: transparent; border: none; }
-            QScrollArea::viewport { background: transparent; }
+        self.model = AuditLogListModel(self.auth, self.user_id, self)
+        self.list_view = QListView()
+        self.list_view.setModel(self.model)
+        self.list_view.setItemDelegate(AuditLogDelegate(self.list_view))
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.list_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.list_view.setFocusPolicy(Qt.NoFocus)
+        self.list_view.setFrameShape(QFrame.NoFrame)
+        self.list_view.setStyleSheet("""
+            QListView { background: transparent; border: none; }
             QScrollBar:vertical {
                 background: rgba(255,255,255,0.04);
                 width: 8px;
@@ -2824,14 +2967,16 @@ class AuditLogModal(QDialog):
             QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical { height: 0px; }
             QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical { background: transparent; }
         """)
+        root.addWidget(self.list_view, 1)
 
-        self.list_container = QWidget()
-        self.list_container.setStyleSheet("background: transparent;")
-        self.list_layout = QVBoxLayout(self.list_container)
-        self.list_layout.setContentsMargins(0, 0, 0, 0)
-        self.list_layout.setSpacing(10)
-        self.scroll.setWidget(self.list_container)
-        root.addWidget(self.scroll, 1)
+        self.empty_card = QFrame()
+        self.empty_card.setObjectName("journalCard")
+        empty_l = QVBoxLayout(self.empty_card)
+        empty_l.setContentsMargins(14, 12, 14, 12)
+        self.empty_label = QLabel("")
+        self.empty_label.setStyleSheet("color:#94a3b8; font-size:12px;")
+        empty_l.addWidget(self.empty_label)
+        root.addWidget(self.empty_card)
 
         close_btn = QPushButton("Fermer")
         close_btn.setStyleSheet("""
@@ -2858,71 +3003,19 @@ class AuditLogModal(QDialog):
         return ["all", "login", "password", "vault", "failed"][self.filter_combo.currentIndex()]
 
     def _refresh(self):
-        for i in reversed(range(self.list_layout.count())):
-            w = self.list_layout.itemAt(i).widget()
-            if w:
-                w.setParent(None)
-
-        def _add_empty_card(message: str):
-            card = QFrame()
-            card.setObjectName("journalCard")
-            l = QVBoxLayout(card)
-            l.setContentsMargins(14, 12, 14, 12)
-            info = QLabel(message)
-            info.setStyleSheet("color:#94a3b8; font-size:12px;")
-            l.addWidget(info)
-            self.list_layout.addWidget(card)
-
-        if not hasattr(self.auth, "list_audit_logs"):
-            _add_empty_card("Journal indisponible.")
-            return
-
-        logs = self.auth.list_audit_logs(self.user_id, self._filter_key())
-        if not logs:
-            _add_empty_card("Aucun journal disponible pour ce filtre.")
+        if not hasattr(self.auth, "list_audit_logs_page"):
+            self._show_empty("Journal indisponible.")
             return
-
-        icon_map = {
-            "login": "LOG",
-            "password": "PWD",
-            "vault": "BOX",
-            "failed": "ERR",
-        }
-
-        for row in logs:
-            action = row.get("action", "-")
-            when = row.get("created_at")
-            ts = when.strftime("%d/%m/%Y %H:%M") if when else "-"
-            details = row.get("details") or ""
-
-            kind = "login"
-            if "password" in action:
-                kind = "password"
-            elif "vault" in action or "export" in action:
-                kind = "vault"
-            elif "failed" in action or "error" in action:
-                kind = "failed"
-
-            card = QFrame()
-            card.setObjectName("journalCard")
-            row_l = QHBoxLayout(card)
-            row_l.setContentsMargins(12, 10, 12, 10)
-            row_l.setSpacing(12)
-
-            icon = QLabel(icon_map.get(kind, "EVT"))
-            icon.setStyleSheet("font-size:11px; font-weight:700; color:#dbeafe;")
-
-            text_col = QVBoxLayout()
-            title = QLabel(action.replace(":", " - "))
-            title.setStyleSheet("font-weight:700; font-size:13px; color:#f8fafc;")
-            details_txt = details if details else "Aucun detail"
-            sub = QLabel(f"{ts}  -  {details_txt}")
-            sub.setStyleSheet("color:#cbd5e1; font-size:11px;")
-            sub.setWordWrap(True)
-            text_col.addWidget(title)
-            text_col.addWidget(sub)
-
-            row_l.addWidget(icon)
-            row_l.addLayout(text_col, 1)
-            self.list_layout.addWidget(card)
+        self.model.reset(self._filter_key())
+        if self.model.rowCount() == 0:
+            self._show_empty("Aucun journal disponible pour ce filtre.")
+        else:
+            self.empty_card.hide()
+            self.list_view.show()
+            self.list_view.scrollToTop()
+
+    def _show_empty(self, message: str):
+        self.list_view.hide()
+        self.empty_label.setText(message)
+        self.empty_card.show()
 
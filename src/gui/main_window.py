@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import threading
-import json
 import os
 from datetime import datetime, timedelta
 from PyQt5.QtCore import QTimer
@@ -9,7 +8,7 @@ from PyQt5.QtWidgets import (
     QMessageBox, QApplication, QPushButton, QDialog, QGridLayout, QLineEdit, QMenu, QAction,
     QFileDialog, QComboBox, QStackedLayout, QScrollArea
 )
-from PyQt5.QtCore import Qt, QTimer, pyqtSignal, QEvent, QRectF, QPointF
+from PyQt5.QtCore import Qt, QTimer, QThreadPool, pyqtSignal, QEvent, QRectF, QPointF
 from PyQt5.QtGui import QFont, QColor, QPainter, QPen, QPainterPath, QLinearGradient
 
 # UI + components
@@ -19,6 +18,7 @@ from src.gui.components.modals import (
     LoginModal, RegisterModal, AddPasswordModal,
     EditPasswordModal, ViewPasswordModal, TwoFactorModal, PasswordStrengthChecker
 )
+from src.gui.components.threading_utils import TaskWorker
 from src.gui.styles.styles import Styles
 from src.gui.autofill import (
     autofill_with_selenium,
@@ -31,8 +31,16 @@ from src.auth.auth_manager import AuthManager, verify_password
 from src.security.encryption import (
     encrypt_for_storage,
     decrypt_any,
-    encrypt_vault_payload,
-    decrypt_vault_payload,
+)
+from src.security.key_session import VaultKeySession
+from src.security.pgvault import open_pgvault, write_pgvault
+from src.security.envelope import (
+    current_version,
+    decrypt_entry,
+    encrypt_entry,
+    reencrypt_if_stale,
+    session_keys,
+    unlock_data_keys,
 )
 
 
@@ -196,10 +204,12 @@ class CategoryBarChartWidget(QWidget):
 
 
 class TrendChartWidget(QWidget):
-    def __init__(self, labels: list[str], values: list[int], parent=None):
+    def __init__(self, labels: list[str], values: list[int], parent=None, max_value: int | None = None):
         super().__init__(parent)
         self.labels = labels
         self.values = values
+        # fixed scale (e.g. 100 for a score) instead of the largest value
+        self.max_value = max_value
         self.setMinimumHeight(170)
 
     def paintEvent(self, _event):
@@ -211,7 +221,7 @@ class TrendChartWidget(QWidget):
             p.drawText(r, Qt.AlignCenter, "Pas de donnees")
             return
 
-        maxv = max(1, max(self.values))
+        maxv = self.max_value or max(1, max(self.values))
         n = len(self.values)
         if n == 1:
             points = [QPointF(r.center().x(), r.center().y())]
@@ -388,6 +398,9 @@ class UserProfileWidget(QWidget):
 
 # ----------------------------- Main Window -----------------------------
 class MainWindow(QMainWindow):
+    # change events from the backend (emitted on the listener thread)
+    vault_changed = pyqtSignal(dict)
+
     def __init__(self, parent=None):
         super().__init__(parent)
         self.api_client = APIClient("http://127.0.0.1:5000")
@@ -395,11 +408,19 @@ class MainWindow(QMainWindow):
         # State
         self.current_user = None
         self._all_passwords = []
+        self._pending_changes = {}
+        self._changes_timer = QTimer(self)
+        self._changes_timer.setSingleShot(True)
+        self._changes_timer.setInterval(150)
+        self._changes_timer.timeout.connect(self._apply_vault_changes)
+        self.vault_changed.connect(self._on_vault_event)
         self._locked_user = None
         self._lock_timeout_ms = 3 * 60 * 1000
         self._lock_timer = QTimer(self)
         self._lock_timer.setSingleShot(True)
         self._lock_timer.timeout.connect(self._lock_due_to_inactivity)
+        # Argon2id keys (encrypted export/import) live as long as the vault stays unlocked
+        self.vault_keys = VaultKeySession(ttl_seconds=self._lock_timeout_ms / 1000)
 
         # UI
         self._build_ui()
@@ -634,6 +655,7 @@ class MainWindow(QMainWindow):
     def _reset_inactivity_timer(self):
         if self.current_user:
             self._lock_timer.start(self._lock_timeout_ms)
+            self.vault_keys.touch()
 
     def _lock_due_to_inactivity(self):
         if self.current_user:
@@ -647,6 +669,8 @@ class MainWindow(QMainWindow):
             QMessageBox.information(self, "Verrouillage", "Coffre verrouillé après inactivité.")
         self._locked_user = self.current_user
         self.current_user = None
+        self.vault_keys.forget()
+        self._stop_live_updates()
         self._all_passwords = []
         self.password_list.load_passwords([])
         self._show_passwords_page()
@@ -654,6 +678,7 @@ class MainWindow(QMainWindow):
 
     def _apply_lock_timeout(self, minutes: int):
         self._lock_timeout_ms = int(minutes * 60 * 1000)
+        self.vault_keys.set_ttl(self._lock_timeout_ms / 1000)
         self._reset_inactivity_timer()
 
     def _init_lock_menu(self):
@@ -733,10 +758,12 @@ class MainWindow(QMainWindow):
             except Exception:
                 ok = False
             if ok:
+                self._unlock_data_keys(self._locked_user, pwd.text())
                 self.current_user = self._locked_user
                 self._locked_user = None
                 d.accept()
                 self.load_passwords()
+                self._start_live_updates()
                 self._reset_inactivity_timer()
             else:
                 QMessageBox.warning(d, "Erreur", "Mot de passe incorrect.")
@@ -796,13 +823,13 @@ class MainWindow(QMainWindow):
                 else:
                     self._show_error_dialog("MFA", "Vérification Auth App indisponible. Activez TOTP dans Profil.")
                 return
-            self._show_totp_login(user, login_dlg)
+            self._show_totp_login(user, login_dlg, password)
             return
 
         if method == "email":
             sent = self.auth.send_2fa_code(user["email"], int(user["id"]), "login")
             if sent:
-                self._show_2fa_login(user, login_dlg)
+                self._show_2fa_login(user, login_dlg, password)
             elif login_dlg and hasattr(login_dlg, "set_error"):
                 login_dlg.set_error("❌ Impossible d'envoyer le code email de vérification.")
             else:
@@ -812,7 +839,7 @@ class MainWindow(QMainWindow):
         if login_dlg and hasattr(login_dlg, "set_error"):
             login_dlg.set_error("ℹ️ Vérification annulée.")
 
-    def _show_2fa_login(self, user: dict, login_dlg: QDialog | None = None):
+    def _show_2fa_login(self, user: dict, login_dlg: QDialog | None = None, password: str | None = None):
         dlg = TwoFactorModal(user["email"], "<code envoyé>", self)
 
         def verify():
@@ -827,7 +854,7 @@ class MainWindow(QMainWindow):
                 ok = self.auth.verify_2fa(user["email"], code)
             if ok:
                 dlg.accept()
-                self._finalize_login(user)
+                self._finalize_login(user, password)
                 if login_dlg:
                     login_dlg.accept()
             else:
@@ -842,7 +869,7 @@ class MainWindow(QMainWindow):
 
         dlg.exec_()
 
-    def _show_totp_login(self, user: dict, login_dlg: QDialog | None = None):
+    def _show_totp_login(self, user: dict, login_dlg: QDialog | None = None, password: str | None = None):
         dlg = TwoFactorModal(user["email"], "<totp>", self, method="totp")
 
         def verify():
@@ -860,7 +887,7 @@ class MainWindow(QMainWindow):
                     except Exception:
                         pass
                 dlg.accept()
-                self._finalize_login(user)
+                self._finalize_login(user, password)
                 if login_dlg:
                     login_dlg.accept()
             else:
@@ -917,9 +944,9 @@ class MainWindow(QMainWindow):
             return
         
         # Show email verification dialog
-        self._show_email_verification(email, user_id)
+        self._show_email_verification(email, user_id, password)
 
-    def _show_email_verification(self, email: str, user_id: int):
+    def _show_email_verification(self, email: str, user_id: int, password: str | None = None):
         """Show email verification dialog with resend option"""
         dlg = QDialog(self)
         dlg.setWindowTitle("✅ Vérification de l'email")
@@ -1064,7 +1091,7 @@ class MainWindow(QMainWindow):
                     "email": state["email"],
                     "username": state["email"].split('@')[0]
                 }
-                self._finalize_login(user)
+                self._finalize_login(user, password)
             else:
                 QMessageBox.warning(
                     dlg,
@@ -1143,7 +1170,7 @@ class MainWindow(QMainWindow):
             )
             self._auth_flow()
 
-    def _finalize_login(self, user: dict):
+    def _finalize_login(self, user: dict, master_password: str | None = None):
         name = (user.get("username") or user.get("email", "").split("@")[0]).capitalize()
         initials = (name[:2] or "US").upper()
 
@@ -1169,7 +1196,10 @@ class MainWindow(QMainWindow):
         prof.edit_profile_clicked.connect(self._show_edit_profile_modal)
         self.user_box.addWidget(prof)
 
+        if master_password:
+            self._unlock_data_keys(self.current_user, master_password)
         QTimer.singleShot(0, self.load_passwords)
+        self._start_live_updates()
         QMessageBox.information(self, "Bienvenue", f"✅ Bienvenue {name}!")
 
     def _show_error_dialog(self, title: str, message: str):
@@ -1209,7 +1239,9 @@ class MainWindow(QMainWindow):
         for p in self._all_passwords:
             if p.get("trashed_at"):
                 p["category"] = "trash"
-        
+        self._render_passwords()
+
+    def _render_passwords(self):
         visible = [p for p in self._all_passwords if p.get("category") != "trash"]
         self.password_list.load_passwords(visible)
 
@@ -1242,6 +1274,55 @@ class MainWindow(QMainWindow):
         if self.content_stack.currentWidget() == self.stats_page:
             self._render_stats_page()
 
+    # ---------------- Live updates (GET /events) ----------------
+    def _start_live_updates(self):
+        if not self.current_user:
+            return
+        self._pending_changes = {}
+        self.api_client.start_event_listener(self.current_user["id"], self.vault_changed.emit)
+
+    def _stop_live_updates(self):
+        self.api_client.stop_event_listener()
+        self._changes_timer.stop()
+        self._pending_changes = {}
+
+    def _on_vault_event(self, evt: dict):
+        # bursts (another device saving several entries) are applied together
+        op = evt.get("op")
+        if op in ("reset", "import") or evt.get("id") is None:
+            self._pending_changes[None] = "reset"
+        else:
+            self._pending_changes[evt["id"]] = op
+        self._changes_timer.start()
+
+    def _apply_vault_changes(self):
+        changes, self._pending_changes = self._pending_changes, {}
+        if not self.current_user or not changes:
+            return
+        if None in changes:
+            self.load_passwords()
+            return
+        by_id = {p.get("id"): i for i, p in enumerate(self._all_passwords)}
+        removed = set()
+        for pid, op in changes.items():
+            if op == "delete":
+                removed.add(pid)
+                continue
+            ok, _, entry = self.api_client.get_password_entry(pid)
+            if not ok or not entry:
+                removed.add(pid)  # deleted meanwhile
+                continue
+            if entry.get("trashed_at"):
+                entry["category"] = "trash"
+            if pid in by_id:
+                self._all_passwords[by_id[pid]] = entry
+            else:
+                by_id[pid] = len(self._all_passwords)
+                self._all_passwords.append(entry)
+        if removed:
+            self._all_passwords = [p for p in self._all_passwords if p.get("id") not in removed]
+        self._render_passwords()
+
     def _update_score_badge(self, visible):
         total = len(visible)
         strong = sum(1 for p in visible if p.get("strength") == "strong")
@@ -1418,16 +1499,10 @@ class MainWindow(QMainWindow):
     def _export_encrypted_vault(self):
         if not self.current_user:
             return
-        ok, msg, vault = self.api_client.export_vault(self.current_user["id"])
-        if not ok:
-            self._show_error_dialog("Erreur", msg)
-            return
-
         passphrase = self._prompt_passphrase("Export chiffré (.pgvault)", confirm=True)
         if not passphrase:
             return
 
-        enc = encrypt_vault_payload(vault, passphrase)
         filename, _ = QFileDialog.getSaveFileName(
             self, "Exporter le coffre", "vault.pgvault", "Password Guardian Vault (*.pgvault)"
         )
@@ -1435,8 +1510,18 @@ class MainWindow(QMainWindow):
             return
         if not filename.lower().endswith(".pgvault"):
             filename += ".pgvault"
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(enc, f, indent=2)
+
+        # v2: entries go from the HTTP response to the file chunk by chunk
+        ok, msg, meta, entries = self.api_client.stream_export(self.current_user["id"])
+        if not ok:
+            self._show_error_dialog("Erreur", msg)
+            return
+        try:
+            with open(filename, "wb") as f:
+                write_pgvault(f, entries, passphrase, meta=meta, key_session=self.vault_keys)
+        except Exception as e:
+            self._show_error_dialog("Erreur", f"Export impossible: {e}")
+            return
         QMessageBox.information(self, "Export", " Export chiffré terminé.")
 
     def _import_encrypted_vault(self):
@@ -1453,22 +1538,37 @@ class MainWindow(QMainWindow):
             return
 
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                blob = json.load(f)
-            vault = decrypt_vault_payload(blob, passphrase)
-        except Exception as e:
-            self._show_error_dialog("Erreur", f"Impossible de déchiffrer: {e}")
+            f = open(filename, "rb")
+        except OSError as e:
+            self._show_error_dialog("Erreur", f"Impossible d'ouvrir: {e}")
             return
+        with f:
+            try:
+                # v2 files stream entry by entry; v1 files are still read whole
+                items = open_pgvault(f, passphrase, key_session=self.vault_keys)
+            except Exception as e:
+                self._show_error_dialog("Erreur", f"Impossible de déchiffrer: {e}")
+                return
 
-        items = vault.get("passwords") or []
-        if not isinstance(items, list):
-            self._show_error_dialog("Erreur", "Format de coffre invalide.")
-            return
+            mode = self._prompt_import_mode()
+            if not mode:
+                return
+            try:
+                imported, updated, skipped = self._import_vault_items(items, mode)
+            except ValueError as e:
+                self.load_passwords()
+                self._show_error_dialog("Erreur", f"Import interrompu (fichier endommagé): {e}")
+                return
 
-        mode = self._prompt_import_mode()
-        if not mode:
-            return
+        self.load_passwords()
+        QMessageBox.information(
+            self,
+            "Import terminÃ©",
+            f"AjoutÃ©s: {imported}\nMises Ã  jour: {updated}\nIgnorÃ©s: {skipped}",
+        )
 
+    def _import_vault_items(self, items, mode: str):
+        """Apply imported entries (any iterable) with the chosen mode; returns (added, updated, skipped)."""
         existing = {}
         for p in self._all_passwords:
             key = (str(p.get("site_name", "")).strip().lower(), str(p.get("username", "")).strip().lower())
@@ -1540,13 +1640,7 @@ class MainWindow(QMainWindow):
                 imported += 1
             else:
                 skipped += 1
-
-        self.load_passwords()
-        QMessageBox.information(
-            self,
-            "Import terminÃ©",
-            f"AjoutÃ©s: {imported}\nMises Ã  jour: {updated}\nIgnorÃ©s: {skipped}",
-        )
+        return imported, updated, skipped
 
     def _show_devices_placeholder(self):
         if not self.current_user:
@@ -1823,47 +1917,29 @@ class MainWindow(QMainWindow):
         cl.addWidget(ctitle)
         cl.addWidget(CategoryBarChartWidget(top_cats))
 
-        # Panel 3: 6-month trend
+        # Panel 3: weekly security score trend
         trend_box = QFrame()
         trend_box.setStyleSheet(panel_style)
         tl = QVBoxLayout(trend_box)
         tl.setContentsMargins(14, 12, 14, 12)
         tl.setSpacing(8)
-        ttitle = QLabel("Activité mensuelle (6 mois)")
+        ttitle = QLabel("Score de sécurité (12 semaines)")
         ttitle.setStyleSheet(f"color:{Styles.TEXT_PRIMARY}; font-size:13px; font-weight:700;")
         tl.addWidget(ttitle)
-        month_labels = []
-        month_keys = []
-        now = datetime.utcnow()
-        for i in range(5, -1, -1):
-            d = (now.replace(day=1) - timedelta(days=1)).replace(day=1) if i else now.replace(day=1)
-            # normalize by subtracting i months
-            cursor = now.replace(day=1)
-            for _ in range(i):
-                cursor = (cursor - timedelta(days=1)).replace(day=1)
-            key = f"{cursor.year:04d}-{cursor.month:02d}"
-            month_keys.append(key)
-            month_labels.append(cursor.strftime("%b"))
-        month_values = {k: 0 for k in month_keys}
-        for p in passwords:
-            ts = p.get("created_at") or p.get("last_updated") or ""
-            dt = None
-            s = str(ts).strip()
-            if s:
-                try:
-                    dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
-                except Exception:
-                    try:
-                        dt = datetime.strptime(s[:19], "%Y-%m-%d %H:%M:%S")
-                    except Exception:
-                        dt = None
-            if dt is None:
+        # served from the daily snapshots: one small request, whatever the vault size
+        ok_t, points = False, []
+        if self.current_user:
+            ok_t, _msg_t, points = self.api_client.get_stats_trend(self.current_user["id"], "week", "12w")
+        trend_labels, trend_vals = [], []
+        for point in points if ok_t else []:
+            try:
+                label = datetime.fromisoformat(point["start"]).strftime("%d/%m")
+                value = int(point.get("score") or 0)
+            except (KeyError, TypeError, ValueError):
                 continue
-            mk = f"{dt.year:04d}-{dt.month:02d}"
-            if mk in month_values:
-                month_values[mk] += 1
-        trend_vals = [month_values[k] for k in month_keys]
-        tl.addWidget(TrendChartWidget(month_labels, trend_vals))
+            trend_labels.append(label)
+            trend_vals.append(value)
+        tl.addWidget(TrendChartWidget(trend_labels, trend_vals, max_value=100))
 
         # Panel 4: Hygiene + tips
         hygiene = QFrame()
@@ -1915,6 +1991,37 @@ class MainWindow(QMainWindow):
             return
         self.on_copy_password(token_or_dict)
 
+    # ---------------- Envelope keys ----------------
+    def _unlock_data_keys(self, user: dict, master_password: str) -> None:
+        """Unwrap the user's data keys into the key session (see src/security/envelope.py).
+
+        Argon2id takes a noticeable moment: it runs on the thread pool, and is
+        only started once the login (MFA included) has succeeded."""
+        user_id = int(user["id"])
+        worker = TaskWorker(unlock_data_keys, user_id, master_password, self.vault_keys)
+        worker.signals.finished.connect(lambda _version: self._on_data_keys_unlocked(user_id))
+        worker.signals.error.connect(self._on_data_keys_error)
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_data_keys_unlocked(self, user_id: int) -> None:
+        # logged out (or switched user) while the keys were being derived
+        if not self.current_user or int(self.current_user["id"]) != user_id:
+            self.vault_keys.forget()
+
+    def _on_data_keys_error(self, message: str) -> None:
+        self._show_error_dialog(
+            "Clés du coffre",
+            "Les clés de chiffrement du coffre n'ont pas pu être déverrouillées.\n\n"
+            "Les entrées chiffrées avec ces clés restent illisibles et les nouvelles "
+            f"entrées utilisent la clé de stockage.\n\n({message})",
+        )
+
+    def _encrypt_entry(self, plain: str) -> str:
+        version = current_version(self.vault_keys)
+        if version is None:
+            return encrypt_for_storage(plain)
+        return encrypt_entry(plain, session_keys(self.vault_keys)[version], version)
+
     def _decrypt_from_backend(self, password_id: int) -> str:
         """
         Get plain password from backend reveal.
@@ -1926,6 +2033,18 @@ class MainWindow(QMainWindow):
         if not token:
             raise ValueError("Mot de passe vide")
 
+        if isinstance(token, str) and token.startswith("ek1:"):
+            keys = session_keys(self.vault_keys)
+            plain = decrypt_entry(token, keys)
+            # lazy re-encryption: an entry under an older data key moves to the current one
+            try:
+                fresh = reencrypt_if_stale(token, keys, current_version(self.vault_keys))
+                if fresh:
+                    self.api_client.update_password(password_id, {"encrypted_password": fresh})
+            except Exception as e:
+                print(f"⚠️ re-encryption skipped: {e}")
+            return plain
+
         # If it's an encrypted token, decrypt locally
         try:
             if isinstance(token, str) and (token.startswith("gAAAA") or token.startswith("gcm1:")):
@@ -2113,12 +2232,12 @@ class MainWindow(QMainWindow):
                     QMessageBox.warning(self, "Erreur", "Utilisateur non connecté.")
                     return
                 
-                #  Send plain password to backend - backend will hash it
+                # encrypted client-side under the current data key
                 ok, msg, response = self.api_client.add_password(
                     user_id=self.current_user["id"],
                     site_name=site_name,
                     username=username,
-                    encrypted_password=plain_password,  # Backend expects this key name
+                    encrypted_password=self._encrypt_entry(plain_password),
                     category=category,
                     site_url=site_url,
                     strength=strength,
@@ -2172,7 +2291,7 @@ class MainWindow(QMainWindow):
         dlg = EditPasswordModal(p_prefill, self)
 
         def _upd(_id, new_plain, _lm):
-            enc = encrypt_for_storage(new_plain)
+            enc = self._encrypt_entry(new_plain)
             strength = PasswordStrengthChecker.check_strength(new_plain)[0]
             ok, msg = self.api_client.update_password(
                 password_id=_id,
@@ -2552,6 +2671,8 @@ class MainWindow(QMainWindow):
         if rep != QMessageBox.Yes:
             return
         self.current_user = None
+        self.vault_keys.forget()
+        self._stop_live_updates()
         for i in reversed(range(self.user_box.count())):
             w = self.user_box.itemAt(i).widget()
             if w:
@@ -2,30 +2,46 @@
 """Audit log helper.
 
 Centralizes security-relevant event logging so the app can show an
-"Audit Logs" view.
+"Audit Logs" view. Rows are hash-chained when flushed (database/audit_chain.py).
 """
 
 from __future__ import annotations
 
+import base64
 from datetime import datetime
 from typing import Optional
 
-from database.engine import SessionLocal
+from database.audit_archive import default_archive
+from database.audit_chain import verify_chains
+from database.engine import user_session, user_sessionmaker
 from database.models import ActivityLog
+from database.queries import STATEMENTS
 
+# Sentinels for unused bounds of the keyset page statements
+_MIN_TIME = datetime(1970, 1, 1)
+_MAX_TIME = datetime(9999, 12, 31)
+_MAX_ID = 2 ** 62
+MAX_PAGE_SIZE = 200
 
-def log_action(
+
+def log_event(
     user_id: int,
-    action: str,
+    category: str,
+    verb: str,
+    target_id: Optional[int] = None,
+    target_label: Optional[str] = None,
     details: Optional[str] = None,
     ip_address: Optional[str] = None,
 ) -> None:
     try:
-        with SessionLocal() as s:
+        with user_session(user_id) as s:
             s.add(
-                ActivityLog(
-                    user_id=user_id,
-                    action=action,
+                ActivityLog.event(
+                    user_id,
+                    category,
+                    verb,
+                    target_id=target_id,
+                    target_label=target_label,
                     details=details,
                     ip_address=ip_address,
                     created_at=datetime.utcnow(),
@@ -35,3 +51,120 @@ def log_action(
     except Exception:
         # Audit logging should never crash the app
         return
+
+
+def log_action(
+    user_id: int,
+    action: str,
+    details: Optional[str] = None,
+    ip_address: Optional[str] = None,
+) -> None:
+    """Legacy entry point: `action` like "user.profile_updated" or "password:update:Gmail"."""
+    category, verb, target_id, target_label = ActivityLog.parse_action(action)
+    log_event(user_id, category or "other", verb or "event", target_id, target_label, details, ip_address)
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{int(row_id)}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+_EVENT_FIELDS = (
+    "id", "action", "category", "verb", "target_id", "target_label", "details", "ip_address", "created_at",
+)
+
+
+def event_to_dict(r: ActivityLog) -> dict:
+    return {name: getattr(r, name) for name in _EVENT_FIELDS}
+
+
+def list_events(
+    user_id: int,
+    category: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> dict:
+    """One page of a user's journal, newest first.
+
+    Keyset pagination on (created_at, id): pass the returned `next_cursor`
+    back to get the following page (None when there is none). `since` is
+    inclusive, `until` exclusive. Each page is a range scan on
+    (user_id, [category,] created_at), whatever the page number.
+
+    Archived rows (database/audit_archive.py) are merged in when the page
+    reaches past the hot rows; a full page of recent rows never touches
+    the archive.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    cursor_at, cursor_id = decode_cursor(cursor) if cursor else (_MAX_TIME, _MAX_ID)
+    params = {
+        "user_id": int(user_id),
+        "since": since or _MIN_TIME,
+        "until": until or _MAX_TIME,
+        "cursor_at": cursor_at,
+        "cursor_id": cursor_id,
+        # one extra row tells whether another page exists
+        "limit": limit + 1,
+    }
+    if category and category != "all":
+        stmt = STATEMENTS.get("activity_logs.page_by_category")
+        params["category"] = category
+    else:
+        stmt = STATEMENTS.get("activity_logs.page")
+    with user_session(user_id) as s:
+        items = [event_to_dict(r) for r in s.execute(stmt, params).scalars()]
+    items = _merge_archived(user_id, items, category, since, until, cursor_at, cursor_id, limit + 1)
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(last["created_at"], last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _merge_archived(user_id, items, category, since, until, cursor_at, cursor_id, wanted) -> list:
+    archive = default_archive()
+    if not archive.has_user(user_id):
+        return items
+    # archived rows older than the last hot row of a full page cannot make the cut
+    lower = since
+    if len(items) >= wanted:
+        oldest = items[-1]["created_at"]
+        lower = max(lower, oldest) if lower else oldest
+    archived = archive.query(
+        user_id,
+        category=category if category and category != "all" else None,
+        since=lower,
+        until=until,
+        before=(cursor_at, cursor_id),
+        limit=wanted,
+    )
+    if not archived:
+        return items
+    hot_ids = {r["id"] for r in items}
+    merged = items + [
+        {k: rec.get(k) for k in _EVENT_FIELDS} for rec in archived if rec["id"] not in hot_ids
+    ]
+    merged.sort(key=lambda r: (r["created_at"], r["id"]), reverse=True)
+    return merged[:wanted]
+
+
+def verify_journal(user_id: int, checkpoint: bool = True) -> dict:
+    """Check a user's audit hash chain since its last checkpoint.
+
+    Returns {"ok", "rows", "failures"}; rows archived or checkpointed earlier
+    are not read again.
+    """
+    report = verify_chains(user_sessionmaker(user_id), user_id=user_id, checkpoint=checkpoint)
+    return {"ok": not report["broken"], "rows": report["rows"], "failures": report["failures"]}
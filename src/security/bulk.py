@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""Batch encryption / decryption of vault tokens.
+
+decrypt_any() / encrypt_for_storage() (src/security/encryption.py) handle one
+token and build a new cipher object per call. Whole-vault work (reuse
+detection, re-encryption, plaintext export) goes through this module instead:
+
+- decrypt_many(): any mix of Fernet ("gAAAA..."), legacy "gcm1:", "zk1:"
+  and envelope "ek1:" tokens; each chunk is grouped by format and decrypted with one cipher
+  context per format (one Fernet, one AESGCM per key)
+- encrypt_many(): plaintexts -> tokens of one format
+
+Packed binary ciphertexts (src/security/ciphertext.py, as stored in
+Passwords.encrypted_password) are decrypted straight from memoryview slices of
+the blob, without base64 or intermediate copies.
+
+Chunks fan out over a thread pool (OpenSSL releases the GIL in the AEAD and
+HMAC calls) with a bounded number of chunks in flight, and results come back
+as a generator in input order, so memory stays flat on large vaults.
+"""
+
+from __future__ import annotations
+
+import base64
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from src.security.ciphertext import FORMAT_NAMES, OPAQUE, Blob, fernet_open, is_packed, open_blob
+
+FORMATS = ("fernet", "gcm1", "zk1")
+DEFAULT_CHUNK_SIZE = 512
+
+
+def token_format(token) -> Optional[str]:
+    if is_packed(token):
+        blob = open_blob(token)
+        if blob.fmt != OPAQUE:
+            return FORMAT_NAMES[blob.fmt]
+        token = str(blob.body, "utf-8", errors="ignore")
+    elif isinstance(token, (bytes, bytearray, memoryview)):
+        token = bytes(token).decode("utf-8", errors="ignore")
+    if not token:
+        return None
+    if token.startswith("gAAAA"):
+        return "fernet"
+    if token.startswith("gcm1:"):
+        return "gcm1"
+    if token.startswith("zk1:"):
+        return "zk1"
+    if token.startswith("ek1:"):
+        return "ek1"  # envelope-encrypted (src/security/envelope.py)
+    return None
+
+
+def _b64url(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+class _Ciphers:
+    """Cipher contexts shared by every chunk of one call."""
+
+    def __init__(self, zk_key=None, data_keys=None):
+        from src.security.encryption import derive_key, get_fernet
+
+        self._get_fernet = get_fernet
+        self._derive_gcm = derive_key
+        self._fernet = None
+        self._fernet_key = None
+        self._gcm = None
+        self._zk = AESGCM(bytes(zk_key)) if zk_key is not None else None
+        self._data_keys = data_keys or {}
+
+    @property
+    def fernet(self):
+        if self._fernet is None:
+            self._fernet = self._get_fernet()
+        return self._fernet
+
+    @property
+    def fernet_key(self) -> bytes:
+        if self._fernet_key is None:
+            from src.security.encryption import get_fernet_key
+            self._fernet_key = base64.urlsafe_b64decode(get_fernet_key())
+        return self._fernet_key
+
+    @property
+    def gcm(self) -> AESGCM:
+        if self._gcm is None:
+            self._gcm = AESGCM(bytes(self._derive_gcm()))
+        return self._gcm
+
+    @property
+    def zk(self) -> AESGCM:
+        if self._zk is None:
+            raise ValueError("zk1 token: a vault key is required")
+        return self._zk
+
+    # ---------- one format, many tokens ----------
+    def decrypt(self, fmt: str, token: str) -> str:
+        if fmt == "fernet":
+            return self.fernet.decrypt(token.encode("utf-8")).decode("utf-8")
+        if fmt == "gcm1":
+            raw = base64.b64decode(token[5:])
+            # stored as iv | tag | ciphertext, AESGCM wants ciphertext | tag
+            return self.gcm.decrypt(raw[:12], raw[28:] + raw[12:28], None).decode("utf-8")
+        if fmt == "zk1":
+            raw = _b64url(token[4:])
+            return self.zk.decrypt(raw[:12], raw[12:], None).decode("utf-8")
+        if fmt == "ek1":
+            from src.security.envelope import decrypt_entry
+            return decrypt_entry(token, self._data_keys)
+        raise ValueError("Unknown encryption format.")
+
+    def open(self, fmt: str, blob: Blob) -> str:
+        """Packed ciphertext: decrypts the nonce / body views in place."""
+        if fmt == "fernet":
+            return fernet_open(blob.body, self.fernet_key).decode("utf-8")
+        if fmt == "gcm1":
+            return self.gcm.decrypt(blob.nonce, blob.body, None).decode("utf-8")
+        if fmt == "zk1":
+            return self.zk.decrypt(blob.nonce, blob.body, None).decode("utf-8")
+        if fmt == "ek1":
+            from src.security.envelope import open_entry
+            return open_entry(blob.key_version, blob.nonce, blob.body, self._data_keys)
+        raise ValueError("Unknown encryption format.")
+
+    def encrypt(self, fmt: str, plaintext: str) -> str:
+        data = plaintext.encode("utf-8")
+        if fmt == "fernet":
+            return self.fernet.encrypt(data).decode("utf-8")
+        nonce = os.urandom(12)
+        if fmt == "gcm1":
+            ct = self.gcm.encrypt(nonce, data, None)
+            return "gcm1:" + base64.b64encode(nonce + ct[-16:] + ct[:-16]).decode("utf-8")
+        if fmt == "zk1":
+            payload = nonce + self.zk.encrypt(nonce, data, None)
+            return "zk1:" + base64.urlsafe_b64encode(payload).decode("utf-8").rstrip("=")
+        raise ValueError(f"Unknown target format: {fmt}")
+
+
+def _decrypt_chunk(ciphers: _Ciphers, chunk: List, errors: str, offset: int = 0) -> List[Optional[str]]:
+    """offset: position of chunk[0] in the caller's input (error messages)."""
+    out: List[Optional[str]] = [None] * len(chunk)
+    groups = {}
+    for i, token in enumerate(chunk):
+        if is_packed(token):
+            blob = open_blob(token)
+            if blob.fmt != OPAQUE:
+                groups.setdefault(FORMAT_NAMES[blob.fmt], []).append((i, blob))
+                continue
+            token = str(blob.body, "utf-8")
+        elif isinstance(token, (bytes, bytearray, memoryview)):
+            token = bytes(token).decode("utf-8", errors="ignore")
+        groups.setdefault(token_format(token), []).append((i, token))
+    for fmt, items in groups.items():
+        for i, token in items:
+            try:
+                if fmt is None:
+                    raise ValueError("Empty token cannot be decrypted" if not token else "Unknown encryption format.")
+                if isinstance(token, Blob):
+                    out[i] = ciphers.open(fmt, token)
+                else:
+                    out[i] = ciphers.decrypt(fmt, token)
+            except Exception as e:
+                if errors == "raise":
+                    raise ValueError(f"{fmt or 'unknown'} decryption failed at item {offset + i}: {e}") from e
+                # errors="none": the slot stays None
+    return out
+
+
+def _fan_out(
+    items: Iterable,
+    work: Callable[[List, int], List],
+    workers: Optional[int],
+    chunk_size: int,
+) -> Iterator:
+    workers = workers if workers is not None else min(8, os.cpu_count() or 1)
+    chunk_size = max(1, int(chunk_size))
+    it = iter(items)
+
+    def _chunks():
+        chunk, offset = [], 0
+        for item in it:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk, offset
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            yield chunk, offset
+
+    if workers <= 1:
+        for chunk, offset in _chunks():
+            yield from work(chunk, offset)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pg-crypto") as pool:
+        pending = deque()
+        try:
+            for chunk, offset in _chunks():
+                pending.append(pool.submit(work, chunk, offset))
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for fut in pending:
+                fut.cancel()
+
+
+def decrypt_many(
+    tokens: Iterable,
+    zk_key=None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    errors: str = "raise",
+    data_keys=None,
+) -> Iterator[Optional[str]]:
+    """Plaintexts of `tokens`, in order.
+
+    zk_key: vault key for "zk1:" tokens (bytes / memoryview from
+    VaultKeySession); data_keys: {version: key} for "ek1:" tokens
+    (envelope.session_keys()). errors="raise" stops at the first bad token
+    (ValueError); errors="none" yields None for it and goes on.
+    """
+    if errors not in ("raise", "none"):
+        raise ValueError("errors must be 'raise' or 'none'")
+    ciphers = _Ciphers(zk_key, data_keys)
+    return _fan_out(tokens, lambda chunk, offset: _decrypt_chunk(ciphers, chunk, errors, offset), workers, chunk_size)
+
+
+def encrypt_many(
+    plaintexts: Iterable[str],
+    fmt: str = "fernet",
+    zk_key=None,
+    workers: Optional[int] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[str]:
+    """Tokens of `plaintexts` in format `fmt` ("fernet", "gcm1" or "zk1"), in order."""
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt must be one of {', '.join(FORMATS)}")
+    ciphers = _Ciphers(zk_key)
+    if fmt == "zk1":
+        ciphers.zk  # fail before the first chunk
+    return _fan_out(plaintexts, lambda chunk, _offset: [ciphers.encrypt(fmt, p) for p in chunk], workers, chunk_size)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""Compact binary form of the vault tokens.
+
+The text tokens ("gAAAA...", "gcm1:", "zk1:", "ek1:") are base64 of binary
+data, a third larger than the data itself. Passwords.encrypted_password keeps
+the binary form instead (database/models.CipherText) and base64 only happens
+where a token leaves the backend as JSON.
+
+Layout (big-endian):
+
+    magic 0xE1 | format u8 | key version u16 | nonce (12, AEAD formats) | body
+
+- format: 0 opaque text (unrecognised or non-canonical token, UTF-8 body),
+  1 fernet (body: the raw Fernet token), 2 gcm1, 3 zk1, 4 ek1
+- AEAD bodies are ciphertext | tag, the order AESGCM.decrypt() takes, so
+  open_blob() hands out memoryview slices that decrypt without copies
+- key version: data key of "ek1" entries (src/security/envelope.py), 0 otherwise
+
+pack() / unpack() convert losslessly; pack() falls back to format 0 when a
+token would not come back byte-identical.
+"""
+
+from __future__ import annotations
+
+import base64
+import struct
+from typing import NamedTuple, Optional
+
+MAGIC = 0xE1
+_HEADER = struct.Struct(">BBH")
+NONCE_SIZE = 12
+
+OPAQUE, FERNET, GCM1, ZK1, EK1 = range(5)
+FORMAT_NAMES = {OPAQUE: None, FERNET: "fernet", GCM1: "gcm1", ZK1: "zk1", EK1: "ek1"}
+_AEAD = (GCM1, ZK1, EK1)
+
+
+class Blob(NamedTuple):
+    fmt: int
+    key_version: int
+    nonce: memoryview
+    body: memoryview
+
+
+def _b64url_decode(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+def _b64url_encode(raw) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def is_packed(value) -> bool:
+    return isinstance(value, (bytes, bytearray, memoryview)) and len(value) >= _HEADER.size and value[0] == MAGIC
+
+
+def _encode(token: str) -> bytes:
+    if token.startswith("gAAAA"):
+        return _HEADER.pack(MAGIC, FERNET, 0) + base64.urlsafe_b64decode(token)
+    if token.startswith("gcm1:"):
+        raw = base64.b64decode(token[5:], validate=True)
+        # text layout is iv | tag | ciphertext
+        return _HEADER.pack(MAGIC, GCM1, 0) + raw[:12] + raw[28:] + raw[12:28]
+    if token.startswith("zk1:"):
+        return _HEADER.pack(MAGIC, ZK1, 0) + _b64url_decode(token[4:])
+    if token.startswith("ek1:"):
+        version, _, payload = token[4:].partition(":")
+        return _HEADER.pack(MAGIC, EK1, int(version)) + _b64url_decode(payload)
+    raise ValueError("opaque")
+
+
+def pack(token: Optional[str]) -> Optional[bytes]:
+    """Binary form of a text token (None stays None)."""
+    if token is None:
+        return None
+    try:
+        blob = _encode(token)
+        if unpack(blob) == token:
+            return blob
+    except Exception:
+        pass
+    return _HEADER.pack(MAGIC, OPAQUE, 0) + token.encode("utf-8")
+
+
+def open_blob(blob) -> Blob:
+    """Header fields and zero-copy views of nonce and body."""
+    view = memoryview(blob)
+    magic, fmt, version = _HEADER.unpack_from(view)
+    if magic != MAGIC or fmt not in FORMAT_NAMES:
+        raise ValueError("not a packed ciphertext")
+    if fmt in _AEAD:
+        start = _HEADER.size + NONCE_SIZE
+        if len(view) < start + 16:
+            raise ValueError("truncated ciphertext")
+        return Blob(fmt, version, view[_HEADER.size:start], view[start:])
+    return Blob(fmt, version, view[0:0], view[_HEADER.size:])
+
+
+def unpack(blob) -> str:
+    """Text token of a packed blob."""
+    b = open_blob(blob)
+    if b.fmt == OPAQUE:
+        return str(b.body, "utf-8")
+    if b.fmt == FERNET:
+        return base64.urlsafe_b64encode(b.body).decode("ascii")
+    if b.fmt == GCM1:
+        return "gcm1:" + base64.b64encode(bytes(b.nonce) + b.body[-16:] + b.body[:-16]).decode("ascii")
+    if b.fmt == ZK1:
+        return "zk1:" + _b64url_encode(bytes(b.nonce) + b.body)
+    return f"ek1:{b.key_version}:" + _b64url_encode(bytes(b.nonce) + b.body)
+
+
+def fernet_open(body, key: bytes, ttl: Optional[int] = None) -> bytes:
+    """Decrypt a raw (binary) Fernet token held in a buffer, without base64.
+
+    key: the 32 raw key bytes (signing key | encryption key).
+    """
+    import time
+    from cryptography.hazmat.primitives import hashes, hmac, padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    view = memoryview(body)
+    if len(view) < 1 + 8 + 16 + 16 + 32 or view[0] != 0x80:
+        raise ValueError("invalid Fernet token")
+    h = hmac.HMAC(bytes(key[:16]), hashes.SHA256())
+    h.update(view[:-32])
+    try:
+        h.verify(bytes(view[-32:]))
+    except Exception as e:
+        raise ValueError("invalid Fernet token") from e
+    if ttl is not None:
+        (timestamp,) = struct.unpack_from(">Q", view, 1)
+        if timestamp + ttl < int(time.time()):
+            raise ValueError("expired Fernet token")
+    decryptor = Cipher(algorithms.AES(bytes(key[16:32])), modes.CBC(bytes(view[9:25]))).decryptor()
+    padded = decryptor.update(view[25:-32]) + decryptor.finalize()
+    unpadder = padding.PKCS7(128).unpadder()
+    return unpadder.update(padded) + unpadder.finalize()
@@ -14,7 +14,6 @@ import base64
 import os
 from dataclasses import dataclass
 
-from argon2.low_level import Type, hash_secret_raw
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 
@@ -35,15 +34,16 @@ def derive_vault_key(master_password: str, salt_b64: str, params: KdfParams | No
     """Derive a 256-bit vault key from a master password + salt using Argon2id."""
     if params is None:
         params = KdfParams()
+    from src.security.kdf_service import KDF
+
     salt = base64.urlsafe_b64decode(_pad_b64(salt_b64))
-    return hash_secret_raw(
-        secret=master_password.encode("utf-8"),
-        salt=salt,
-        time_cost=params.time_cost,
-        memory_cost=params.memory_cost_kib,
-        parallelism=params.parallelism,
-        hash_len=params.hash_len,
-        type=Type.ID,
+    return KDF.argon2id(
+        master_password.encode("utf-8"),
+        salt,
+        params.time_cost,
+        params.memory_cost_kib,
+        params.parallelism,
+        params.hash_len,
     )
 
 
@@ -1,8 +1,18 @@
 # -*- coding: utf-8 -*-
 # src/security/encryption.py
+#
+# Key material (FERNET, AES_GCM_KEY) is derived on first use, not at import:
+# PBKDF2 costs a few hundred ms of CPU and most importers (backend, tests)
+# never touch these keys. Derived keys are cached per process; set
+# PG_KEY_CACHE=keyring (OS keyring, needs the optional "keyring" package) or
+# PG_KEY_CACHE=file (PG_KEY_CACHE_FILE, default ~/.password_guardian/keys.json,
+# mode 0600) to also skip the derivation in later processes.
 import base64
 import json
 import hashlib
+import os
+import threading
+from pathlib import Path
 from cryptography.fernet import Fernet
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
@@ -14,6 +24,115 @@ from Crypto.Random import get_random_bytes
 MASTER_PASSWORD = "YourSecretMasterPassword2024!".encode("utf-8")
 SALT = b"salt_password_guardian_2024"
 
+FERNET_ITERATIONS = 100000
+AES_GCM_SALT = b"legacy_aes_gcm_salt"
+AES_GCM_ITERATIONS = 200000
+
+
+# ============================================================
+# LAZY KEY CACHE
+# ============================================================
+_KEYRING_SERVICE = "password-guardian"
+_keys = {}
+_fernet = None
+_keys_lock = threading.Lock()
+
+
+def _cache_mode() -> str:
+    return (os.getenv("PG_KEY_CACHE") or "off").strip().lower()
+
+
+def _cache_file() -> Path:
+    return Path(os.getenv("PG_KEY_CACHE_FILE") or Path.home() / ".password_guardian" / "keys.json")
+
+
+def _cache_slot(name: str, salt: bytes, iterations: int) -> str:
+    # changes with the password and the parameters, so a stale entry is never used
+    h = hashlib.sha256(b"pg-key-cache|" + name.encode("utf-8") + b"|" + salt + b"|"
+                       + str(iterations).encode("ascii") + b"|" + MASTER_PASSWORD)
+    return f"{name}-{h.hexdigest()[:16]}"
+
+
+def _load_persisted(slot: str):
+    mode = _cache_mode()
+    try:
+        if mode == "keyring":
+            import keyring
+            value = keyring.get_password(_KEYRING_SERVICE, slot)
+        elif mode == "file":
+            value = json.loads(_cache_file().read_text(encoding="utf-8")).get(slot)
+        else:
+            return None
+        key = base64.b64decode(value) if value else None
+        return key if key and len(key) == 32 else None
+    except Exception:
+        # unreadable cache, missing keyring backend...: derive instead
+        return None
+
+
+def _store_persisted(slot: str, key: bytes) -> None:
+    mode = _cache_mode()
+    value = base64.b64encode(key).decode("ascii")
+    try:
+        if mode == "keyring":
+            import keyring
+            keyring.set_password(_KEYRING_SERVICE, slot, value)
+        elif mode == "file":
+            path = _cache_file()
+            path.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                data = {}
+            data[slot] = value
+            tmp = path.with_name(path.name + ".tmp")
+            fd = os.open(str(tmp), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as fh:
+                json.dump(data, fh)
+            os.replace(tmp, path)
+    except Exception:
+        pass
+
+
+def _derived(name: str, salt: bytes, iterations: int) -> bytes:
+    """PBKDF2-SHA256 key, derived at most once per process (thread-safe)."""
+    key = _keys.get(name)
+    if key is not None:
+        return key
+    with _keys_lock:
+        key = _keys.get(name)
+        if key is None:
+            slot = _cache_slot(name, salt, iterations)
+            key = _load_persisted(slot)
+            if key is None:
+                key = hashlib.pbkdf2_hmac("sha256", MASTER_PASSWORD, salt, iterations)
+                _store_persisted(slot, key)
+            _keys[name] = key
+        return key
+
+
+def clear_key_cache(persisted: bool = False) -> None:
+    """Forget derived keys (and, with `persisted`, the keyring/file entries)."""
+    global _fernet
+    with _keys_lock:
+        _keys.clear()
+        _fernet = None
+    if not persisted:
+        return
+    slots = [_cache_slot("fernet", SALT, FERNET_ITERATIONS), _cache_slot("aes_gcm", AES_GCM_SALT, AES_GCM_ITERATIONS)]
+    try:
+        if _cache_mode() == "keyring":
+            import keyring
+            for slot in slots:
+                try:
+                    keyring.delete_password(_KEYRING_SERVICE, slot)
+                except Exception:
+                    pass
+        elif _cache_mode() == "file":
+            _cache_file().unlink()
+    except Exception:
+        pass
+
 
 # ============================================================
 # FERNET KEY (used by backend)
@@ -22,11 +141,18 @@ def get_fernet_key():
     """
     Generates the same AES-256 Fernet key the backend uses.
     """
-    kdf = hashlib.pbkdf2_hmac("sha256", MASTER_PASSWORD, SALT, 100000)
-    return base64.urlsafe_b64encode(kdf[:32])
+    return base64.urlsafe_b64encode(_derived("fernet", SALT, FERNET_ITERATIONS)[:32])
 
 
-FERNET = Fernet(get_fernet_key())
+def get_fernet() -> Fernet:
+    """The shared Fernet instance (key derived on first call)."""
+    global _fernet
+    if _fernet is None:
+        key = get_fernet_key()
+        with _keys_lock:
+            if _fernet is None:
+                _fernet = Fernet(key)
+    return _fernet
 
 
 # ============================================================
@@ -36,10 +162,16 @@ def derive_key():
     """
     Derives a 32-byte AES-GCM key from MASTER_PASSWORD.
     """
-    return hashlib.pbkdf2_hmac("sha256", MASTER_PASSWORD, b"legacy_aes_gcm_salt", 200000)
+    return _derived("aes_gcm", AES_GCM_SALT, AES_GCM_ITERATIONS)
 
 
-AES_GCM_KEY = derive_key()
+def __getattr__(name):
+    # FERNET / AES_GCM_KEY stay importable, but are only built when asked for
+    if name == "FERNET":
+        return get_fernet()
+    if name == "AES_GCM_KEY":
+        return derive_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def encrypt_aes_gcm(plaintext: str) -> str:
@@ -50,7 +182,7 @@ def encrypt_aes_gcm(plaintext: str) -> str:
     plaintext_bytes = plaintext.encode("utf-8")
     iv = get_random_bytes(12)
 
-    cipher = AES.new(AES_GCM_KEY, AES.MODE_GCM, nonce=iv)
+    cipher = AES.new(derive_key(), AES.MODE_GCM, nonce=iv)
     ciphertext, tag = cipher.encrypt_and_digest(plaintext_bytes)
 
     payload = iv + tag + ciphertext
@@ -71,7 +203,7 @@ def decrypt_aes_gcm(token: str) -> str:
         tag = decoded[12:28]
         ciphertext = decoded[28:]
 
-        cipher = AES.new(AES_GCM_KEY, AES.MODE_GCM, nonce=iv)
+        cipher = AES.new(derive_key(), AES.MODE_GCM, nonce=iv)
         plaintext = cipher.decrypt_and_verify(ciphertext, tag)
 
         return plaintext.decode("utf-8")
@@ -100,7 +232,7 @@ def decrypt_any(token: str) -> str:
     # -----------------------------
     if token.startswith("gAAAA"):
         try:
-            return FERNET.decrypt(token.encode("utf-8")).decode("utf-8")
+            return get_fernet().decrypt(token.encode("utf-8")).decode("utf-8")
         except Exception as e:
             raise ValueError(f"Fernet decryption failed: {e}")
 
@@ -124,7 +256,7 @@ def encrypt_for_storage(plaintext: str) -> str:
     Encrypt using FERNET (same as backend).
     """
     try:
-        return FERNET.encrypt(plaintext.encode("utf-8")).decode("utf-8")
+        return get_fernet().encrypt(plaintext.encode("utf-8")).decode("utf-8")
     except Exception as e:
         raise ValueError(f"Fernet encryption failed: {e}")
 
@@ -140,38 +272,52 @@ def _argon2_key(
     parallelism: int = 2,
     hash_len: int = 32,
 ) -> bytes:
-    try:
-        from argon2.low_level import hash_secret_raw, Type
-    except Exception as e:
-        raise RuntimeError("argon2-cffi is required for vault encryption") from e
-
-    return hash_secret_raw(
-        secret=passphrase.encode("utf-8"),
-        salt=salt,
-        time_cost=time_cost,
-        memory_cost=memory_cost,
-        parallelism=parallelism,
-        hash_len=hash_len,
-        type=Type.ID,
+    from src.security.kdf_service import KDF
+
+    return KDF.argon2id(passphrase.encode("utf-8"), salt, time_cost, memory_cost, parallelism, hash_len)
+
+
+def _session_key(key_session, passphrase: str, salt: bytes, kdf: dict):
+    """Argon2id file key through a VaultKeySession (src/security/key_session.py).
+
+    Cached per salt: every export draws a fresh salt, so files never share a
+    key, while importing a file exported in this session skips the KDF."""
+    from src.security.crypto import KdfParams
+
+    params = KdfParams(
+        time_cost=int(kdf.get("time_cost", 3)),
+        memory_cost_kib=int(kdf.get("memory_cost", 65536)),
+        parallelism=int(kdf.get("parallelism", 2)),
+        hash_len=int(kdf.get("hash_len", 32)),
     )
 
+    def _kdf(secret, salt_str, p):
+        return _argon2_key(secret, _b64_salt(salt_str), p.time_cost, p.memory_cost_kib, p.parallelism, p.hash_len)
+
+    salt_str = base64.urlsafe_b64encode(salt).decode("utf-8").rstrip("=")
+    return key_session.derive(passphrase, salt_str, params, slot=f"pgvault:{salt_str}", kdf=_kdf)
 
-def encrypt_vault_payload(vault: dict, passphrase: str) -> dict:
+
+def _b64_salt(salt_str: str) -> bytes:
+    return base64.urlsafe_b64decode(salt_str + "=" * (-len(salt_str) % 4))
+
+
+def encrypt_vault_payload(vault: dict, passphrase: str, key_session=None) -> dict:
     if not passphrase:
         raise ValueError("Passphrase required")
 
+    from src.security.kdf_calibration import kdf_dict
+
     salt = get_random_bytes(16)
     nonce = get_random_bytes(12)
-    kdf_params = {
-        "name": "argon2id",
-        "time_cost": 3,
-        "memory_cost": 65536,
-        "parallelism": 2,
-        "hash_len": 32,
-    }
-    # _argon2_key does not accept "name"
-    _kdf = {k: v for k, v in kdf_params.items() if k != "name"}
-    key = _argon2_key(passphrase, salt, **_kdf)
+    # host-calibrated parameters; the file records them, so it opens anywhere
+    kdf_params = kdf_dict()
+    if key_session is not None:
+        key = _session_key(key_session, passphrase, salt, kdf_params)
+    else:
+        # _argon2_key does not accept "name"
+        _kdf = {k: v for k, v in kdf_params.items() if k != "name"}
+        key = _argon2_key(passphrase, salt, **_kdf)
 
     cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
     plaintext = json.dumps(vault, ensure_ascii=True).encode("utf-8")
@@ -188,7 +334,7 @@ def encrypt_vault_payload(vault: dict, passphrase: str) -> dict:
     }
 
 
-def decrypt_vault_payload(blob: dict, passphrase: str) -> dict:
+def decrypt_vault_payload(blob: dict, passphrase: str, key_session=None) -> dict:
     if not passphrase:
         raise ValueError("Passphrase required")
     if not isinstance(blob, dict) or blob.get("format") != "pgvault":
@@ -200,14 +346,17 @@ def decrypt_vault_payload(blob: dict, passphrase: str) -> dict:
     tag = base64.b64decode(blob.get("tag", ""))
     ciphertext = base64.b64decode(blob.get("ciphertext", ""))
 
-    key = _argon2_key(
-        passphrase,
-        salt,
-        time_cost=int(kdf.get("time_cost", 3)),
-        memory_cost=int(kdf.get("memory_cost", 65536)),
-        parallelism=int(kdf.get("parallelism", 2)),
-        hash_len=int(kdf.get("hash_len", 32)),
-    )
+    if key_session is not None:
+        key = _session_key(key_session, passphrase, salt, kdf)
+    else:
+        key = _argon2_key(
+            passphrase,
+            salt,
+            time_cost=int(kdf.get("time_cost", 3)),
+            memory_cost=int(kdf.get("memory_cost", 65536)),
+            parallelism=int(kdf.get("parallelism", 2)),
+            hash_len=int(kdf.get("hash_len", 32)),
+        )
     cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
     plaintext = cipher.decrypt_and_verify(ciphertext, tag)
     return json.loads(plaintext.decode("utf-8"))
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""Envelope encryption of vault entries.
+
+Key hierarchy:
+- data keys: random 256-bit keys, one per version and user, that encrypt the
+  entries ("ek1:<version>:<base64url(nonce | ciphertext)>", AES-256-GCM with
+  the version bound as associated data)
+- KEK: derive_vault_key(master password, salt) (Argon2id); it only wraps
+  the data keys, stored in the vault_keys table (database/models.VaultKey)
+
+Changing the master password re-wraps the data keys (rewrap_data_keys): one
+small row per key version, whatever the vault size. A reset by e-mail code
+cannot (the old password is unknown): the keys and the entries under them
+are dropped with discard_data_keys, which callers only do once the user
+has accepted losing locked_entry_count() entries. rotate_data_key() adds
+a new version; entries under older versions stay readable and are moved to
+the current key lazily when they are read (reencrypt_if_stale).
+Passwords.key_version mirrors the version of each "ek1:" token, so the
+backend can count what is still under an old key.
+
+Unlocked data keys are kept in a VaultKeySession (src/security/key_session.py)
+under the slots "dek:<version>", zeroized on lock / logout.
+"""
+
+from __future__ import annotations
+
+import base64
+import os
+from datetime import datetime
+from typing import Dict, Mapping, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from src.security.crypto import KdfParams, new_salt
+from src.security.kdf_calibration import calibrated_params
+
+PREFIX = "ek1:"
+_SLOT = "dek:"
+
+
+class EnvelopeError(ValueError):
+    pass
+
+
+def _b64e(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64d(s: str) -> bytes:
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+
+# ============================================================
+# KEYS
+# ============================================================
+def new_data_key() -> bytes:
+    return AESGCM.generate_key(bit_length=256)
+
+
+def _wrap_aad(user_id: int, version: int) -> bytes:
+    return f"pg-dek|{int(user_id)}|{int(version)}".encode("ascii")
+
+
+def wrap_key(data_key, kek, user_id: int, version: int) -> str:
+    nonce = os.urandom(12)
+    return _b64e(nonce + AESGCM(bytes(kek)).encrypt(nonce, bytes(data_key), _wrap_aad(user_id, version)))
+
+
+def unwrap_key(wrapped: str, kek, user_id: int, version: int) -> bytes:
+    raw = _b64d(wrapped)
+    try:
+        return AESGCM(bytes(kek)).decrypt(raw[:12], raw[12:], _wrap_aad(user_id, version))
+    except InvalidTag as e:
+        raise EnvelopeError("wrong master password or damaged key") from e
+
+
+# ============================================================
+# ENTRIES
+# ============================================================
+def entry_key_version(token) -> Optional[int]:
+    """Data key version of an "ek1:" token, None for any other format."""
+    if not isinstance(token, str) or not token.startswith(PREFIX):
+        return None
+    version, _, _ = token[len(PREFIX):].partition(":")
+    return int(version) if version.isdigit() else None
+
+
+def encrypt_entry(plaintext: str, data_key, version: int) -> str:
+    nonce = os.urandom(12)
+    aad = f"ek1|{int(version)}".encode("ascii")
+    ct = AESGCM(bytes(data_key)).encrypt(nonce, plaintext.encode("utf-8"), aad)
+    return f"{PREFIX}{int(version)}:{_b64e(nonce + ct)}"
+
+
+def open_entry(version: int, nonce, ciphertext, keys: Mapping[int, object]) -> str:
+    """Decrypt ek1 parts; nonce / ciphertext may be memoryview slices of a
+    packed blob (src/security/ciphertext.py)."""
+    key = keys.get(version)
+    if key is None:
+        raise EnvelopeError(f"data key version {version} is not unlocked")
+    try:
+        pt = AESGCM(bytes(key)).decrypt(nonce, ciphertext, f"ek1|{version}".encode("ascii"))
+    except InvalidTag as e:
+        raise EnvelopeError("ek1 decryption failed") from e
+    return pt.decode("utf-8")
+
+
+def decrypt_entry(token: str, keys: Mapping[int, object]) -> str:
+    version = entry_key_version(token)
+    if version is None:
+        raise EnvelopeError("not an ek1 token")
+    raw = memoryview(_b64d(token.split(":", 2)[2]))
+    return open_entry(version, raw[:12], raw[12:], keys)
+
+
+def reencrypt_if_stale(token: str, keys: Mapping[int, object], current: int) -> Optional[str]:
+    """The token under the current data key, or None when it already is (or is not ek1)."""
+    version = entry_key_version(token)
+    if version is None or version == current:
+        return None
+    return encrypt_entry(decrypt_entry(token, keys), keys[current], current)
+
+
+# ============================================================
+# SESSION HELPERS
+# ============================================================
+def session_keys(session) -> Dict[int, memoryview]:
+    """Unlocked data keys of a VaultKeySession, by version."""
+    return {int(name[len(_SLOT):]): key for name, key in session.slots(_SLOT).items()}
+
+
+def current_version(session) -> Optional[int]:
+    keys = session_keys(session)
+    return max(keys) if keys else None
+
+
+# ============================================================
+# STORAGE (vault_keys, in the user's data database)
+# ============================================================
+def _params(row) -> KdfParams:
+    return KdfParams(
+        time_cost=row.kdf_time_cost, memory_cost_kib=row.kdf_memory_kib, parallelism=row.kdf_parallelism
+    )
+
+
+def _kek(master_password: str, salt: str, params: KdfParams, session=None):
+    if session is not None:
+        return session.derive(master_password, salt, params, slot="kek")
+    from src.security.crypto import derive_vault_key
+    return derive_vault_key(master_password, salt, params)
+
+
+def _new_row(user_id: int, version: int, data_key, kek, salt: str, params: KdfParams):
+    from database.models import VaultKey
+
+    return VaultKey(
+        user_id=int(user_id),
+        version=version,
+        wrapped_key=wrap_key(data_key, kek, user_id, version),
+        kek_salt=salt,
+        kdf_time_cost=params.time_cost,
+        kdf_memory_kib=params.memory_cost_kib,
+        kdf_parallelism=params.parallelism,
+    )
+
+
+def unlock_data_keys(user_id: int, master_password: str, session, params: Optional[KdfParams] = None) -> int:
+    """Unwrap every data key of the user into `session`; creates version 1 on
+    first use. Returns the current version. Raises EnvelopeError when the
+    password does not unwrap the keys."""
+    from sqlalchemy import select
+    from database.engine import user_session
+    from database.models import VaultKey
+
+    with user_session(user_id) as db:
+        rows = db.execute(
+            select(VaultKey).where(VaultKey.user_id == int(user_id)).order_by(VaultKey.version)
+        ).scalars().all()
+        if not rows:
+            params = params or calibrated_params()
+            salt = new_salt()
+            data_key = new_data_key()
+            db.add(_new_row(user_id, 1, data_key, _kek(master_password, salt, params, session), salt, params))
+            db.commit()
+            session.put(f"{_SLOT}1", data_key)
+            return 1
+        for row in rows:
+            kek = _kek(master_password, row.kek_salt, _params(row), session)
+            session.put(f"{_SLOT}{row.version}", unwrap_key(row.wrapped_key, kek, user_id, row.version))
+        return rows[-1].version
+
+
+def rewrap_data_keys(
+    user_id: int,
+    old_password: str,
+    new_password: str,
+    session=None,
+    params: Optional[KdfParams] = None,
+    db=None,
+) -> int:
+    """Master password change: re-wrap the data keys under a KEK from the new
+    password (fresh salt, host-calibrated parameters unless `params` is given),
+    in one transaction. Entries are not touched. Returns the number of keys
+    re-wrapped.
+
+    With `db` (a session on the user's data database) the changes are made in
+    that session and left for the caller to commit, e.g. together with the
+    new password hash."""
+    from contextlib import nullcontext
+    from sqlalchemy import select
+    from database.engine import user_session
+    from database.models import VaultKey
+
+    with (nullcontext(db) if db is not None else user_session(user_id)) as s:
+        rows = s.execute(select(VaultKey).where(VaultKey.user_id == int(user_id))).scalars().all()
+        if not rows:
+            return 0
+        params = params or calibrated_params()
+        salt = new_salt()
+        new_kek = _kek(new_password, salt, params)
+        now = datetime.utcnow()
+        for row in rows:
+            old_kek = _kek(old_password, row.kek_salt, _params(row), session)
+            data_key = unwrap_key(row.wrapped_key, old_kek, user_id, row.version)
+            row.wrapped_key = wrap_key(data_key, new_kek, user_id, row.version)
+            row.kek_salt = salt
+            row.kdf_time_cost = params.time_cost
+            row.kdf_memory_kib = params.memory_cost_kib
+            row.kdf_parallelism = params.parallelism
+            row.rewrapped_at = now
+        if db is None:
+            s.commit()
+    if session is not None:
+        session.forget("kek")
+    return len(rows)
+
+
+def locked_entry_count(user_id: int, passwords) -> int:
+    """Entries of the user readable only through the data keys ("ek1:"
+    tokens), wherever `passwords` (backend_api/repository.py) stores them."""
+    return passwords.count_keyed(user_id)
+
+
+def discard_data_keys(user_id: int, db, passwords) -> int:
+    """Delete the entries under the user's data keys (through `passwords`),
+    then the keys themselves: the only way forward when the master password
+    is lost. The key rows are deleted in `db`, left for the caller to commit
+    (e.g. with the new password hash). Returns the number of entries deleted."""
+    from sqlalchemy import delete
+    from database.models import VaultKey
+
+    entries = passwords.delete_keyed(user_id)
+    db.execute(delete(VaultKey).where(VaultKey.user_id == int(user_id)))
+    return entries
+
+
+def rotate_data_key(user_id: int, master_password: str, session) -> int:
+    """Add a new data key version (new entries use it, old ones move lazily)."""
+    from sqlalchemy import select
+    from database.engine import user_session
+    from database.models import VaultKey
+
+    unlock_data_keys(user_id, master_password, session)
+    with user_session(user_id) as db:
+        latest = db.execute(
+            select(VaultKey).where(VaultKey.user_id == int(user_id)).order_by(VaultKey.version.desc()).limit(1)
+        ).scalar_one()
+        version = latest.version + 1
+        params = _params(latest)
+        kek = _kek(master_password, latest.kek_salt, params, session)
+        data_key = new_data_key()
+        db.add(_new_row(user_id, version, data_key, kek, latest.kek_salt, params))
+        db.commit()
+    session.put(f"{_SLOT}{version}", data_key)
+    return version
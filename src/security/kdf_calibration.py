@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Argon2id parameter calibration.
+
+KdfParams() defaults (t=3, 64 MiB, p=2) are slow on a small VM and weak on a
+large server. calibrate() benchmarks Argon2id on the host and picks the
+strongest parameters that stay under a latency target and a memory budget:
+
+1. parallelism: the CPU count, at most 4
+2. memory: the largest step (19 MiB, 32 MiB, 64 MiB, ... up to the budget)
+   whose single pass takes at most half the target
+3. time cost: as many passes as fit in the target, checked by measuring
+
+Results never go below the OWASP floor (19 MiB with t=2, or t=1 from 46 MiB)
+unless the memory budget itself is lower.
+
+The result is saved as a profile (PG_KDF_PROFILE, default
+~/.password_guardian/kdf.json; "off" disables it) and calibrated_params()
+hands it to new keys: envelope data keys (vault_keys rows) and .pgvault
+exports. Both store the parameters they were made with, so keys and files
+stay readable on any host. With PG_KDF_AUTOCALIBRATE=1 a missing profile is
+calibrated on first use.
+
+CLI:
+    python -m src.security.kdf_calibration [--target-ms 500] [--max-memory-mib 256] [--save]
+    python -m src.security.kdf_calibration --save --rewrap-user 3   # re-wrap a user's data keys
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from src.security.crypto import KdfParams
+
+DEFAULT_TARGET_MS = 500.0
+DEFAULT_MAX_MEMORY_KIB = 256 * 1024
+FLOOR_MEMORY_KIB = 19456  # OWASP: 19 MiB, t=2
+ONE_PASS_MEMORY_KIB = 47104  # OWASP: 46 MiB, t=1
+MAX_TIME_COST = 10
+
+_cached: Optional[KdfParams] = None
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class Calibration:
+    params: KdfParams
+    measured_ms: float
+    target_ms: float
+    max_memory_kib: int
+    host: str = ""
+    calibrated_at: str = ""
+
+    def to_dict(self) -> dict:
+        return {
+            **asdict(self.params),
+            "measured_ms": round(self.measured_ms, 1),
+            "target_ms": self.target_ms,
+            "max_memory_kib": self.max_memory_kib,
+            "host": self.host,
+            "calibrated_at": self.calibrated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Calibration":
+        return cls(
+            params=KdfParams(
+                time_cost=int(data["time_cost"]),
+                memory_cost_kib=int(data["memory_cost_kib"]),
+                parallelism=int(data["parallelism"]),
+                hash_len=int(data.get("hash_len", 32)),
+            ),
+            measured_ms=float(data.get("measured_ms", 0.0)),
+            target_ms=float(data.get("target_ms", DEFAULT_TARGET_MS)),
+            max_memory_kib=int(data.get("max_memory_kib", DEFAULT_MAX_MEMORY_KIB)),
+            host=str(data.get("host", "")),
+            calibrated_at=str(data.get("calibrated_at", "")),
+        )
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def measure_ms(params: KdfParams, rounds: int = 2) -> float:
+    """Fastest of `rounds` Argon2id derivations with `params`, in milliseconds
+    (run directly, not through the KDF pool: queueing would skew the result)."""
+    from src.security.kdf_service import argon2id_raw
+
+    best = float("inf")
+    for _ in range(max(1, rounds)):
+        salt = os.urandom(16)
+        t0 = time.perf_counter()
+        argon2id_raw(b"calibration-probe", salt, params.time_cost, params.memory_cost_kib,
+                     params.parallelism, params.hash_len)
+        best = min(best, (time.perf_counter() - t0) * 1000.0)
+    return best
+
+
+def _memory_steps(max_memory_kib: int) -> List[int]:
+    steps = [FLOOR_MEMORY_KIB]
+    m = 32768
+    while m <= max_memory_kib:
+        steps.append(m)
+        m *= 2
+    steps = [s for s in steps if s <= max_memory_kib]
+    return steps or [max(8 * 1024, int(max_memory_kib))]
+
+
+def _min_time_cost(memory_kib: int) -> int:
+    return 1 if memory_kib >= ONE_PASS_MEMORY_KIB else 2
+
+
+def calibrate(
+    target_ms: Optional[float] = None,
+    max_memory_kib: Optional[int] = None,
+    parallelism: Optional[int] = None,
+    hash_len: int = 32,
+    measure: Callable[[KdfParams], float] = measure_ms,
+) -> Calibration:
+    """Strongest Argon2id parameters within `target_ms` and `max_memory_kib` on this host."""
+    target = float(target_ms or _env_float("PG_KDF_TARGET_MS", DEFAULT_TARGET_MS))
+    budget = int(max_memory_kib or _env_float("PG_KDF_MAX_MEMORY_MIB", DEFAULT_MAX_MEMORY_KIB / 1024) * 1024)
+    lanes = int(parallelism or min(4, os.cpu_count() or 1))
+
+    def _params(t: int, m: int) -> KdfParams:
+        return KdfParams(time_cost=t, memory_cost_kib=m, parallelism=lanes, hash_len=hash_len)
+
+    steps = _memory_steps(budget)
+    memory, one_pass = steps[0], measure(_params(1, steps[0]))
+    for m in steps[1:]:
+        ms = measure(_params(1, m))
+        if ms > target / 2:
+            break
+        memory, one_pass = m, ms
+
+    floor = _min_time_cost(memory)
+    t = max(floor, min(MAX_TIME_COST, int(target // max(one_pass, 0.001))))
+    measured = measure(_params(t, memory))
+    while t > floor and measured > target:
+        t -= 1
+        measured = measure(_params(t, memory))
+
+    return Calibration(
+        params=_params(t, memory),
+        measured_ms=measured,
+        target_ms=target,
+        max_memory_kib=budget,
+        host=platform.node(),
+        calibrated_at=datetime.utcnow().isoformat(timespec="seconds"),
+    )
+
+
+# ============================================================
+# PROFILE
+# ============================================================
+def profile_path() -> Optional[Path]:
+    value = (os.getenv("PG_KDF_PROFILE") or "").strip()
+    if value.lower() == "off":
+        return None
+    return Path(value) if value else Path.home() / ".password_guardian" / "kdf.json"
+
+
+def load_profile(path: Optional[Path] = None) -> Optional[Calibration]:
+    path = path or profile_path()
+    if path is None:
+        return None
+    try:
+        return Calibration.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_profile(calibration: Calibration, path: Optional[Path] = None) -> Optional[Path]:
+    global _cached
+    path = path or profile_path()
+    if path is None:
+        return None
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(calibration.to_dict(), indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    with _cache_lock:
+        _cached = calibration.params
+    return path
+
+
+def calibrated_params() -> KdfParams:
+    """Parameters for new keys: the saved profile, else the KdfParams() defaults."""
+    global _cached
+    if _cached is not None:
+        return _cached
+    with _cache_lock:
+        if _cached is None:
+            found = load_profile()
+            if found is None and os.getenv("PG_KDF_AUTOCALIBRATE", "").strip().lower() in {"1", "true", "yes", "on"}:
+                found = calibrate()
+                try:
+                    save_profile(found)
+                except OSError:
+                    pass
+            _cached = found.params if found is not None else KdfParams()
+        return _cached
+
+
+def clear_cache() -> None:
+    global _cached
+    with _cache_lock:
+        _cached = None
+
+
+def kdf_dict(params: Optional[KdfParams] = None) -> dict:
+    """The "kdf" object embedded in .pgvault files."""
+    p = params or calibrated_params()
+    return {
+        "name": "argon2id",
+        "time_cost": p.time_cost,
+        "memory_cost": p.memory_cost_kib,
+        "parallelism": p.parallelism,
+        "hash_len": p.hash_len,
+    }
+
+
+# ============================================================
+# CLI
+# ============================================================
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate Argon2id parameters for this host")
+    parser.add_argument("--target-ms", type=float, default=None, help=f"latency target (default {DEFAULT_TARGET_MS:g})")
+    parser.add_argument("--max-memory-mib", type=int, default=None, help="memory budget (default 256)")
+    parser.add_argument("--parallelism", type=int, default=None)
+    parser.add_argument("--save", action="store_true", help="write the profile used for new keys")
+    parser.add_argument("--profile", default=None, help="profile path (default PG_KDF_PROFILE)")
+    parser.add_argument("--rewrap-user", type=int, default=None,
+                        help="re-wrap this user's data keys with the new parameters (asks the master password)")
+    args = parser.parse_args(argv)
+
+    result = calibrate(
+        target_ms=args.target_ms,
+        max_memory_kib=args.max_memory_mib * 1024 if args.max_memory_mib else None,
+        parallelism=args.parallelism,
+    )
+    p = result.params
+    print(
+        f"argon2id t={p.time_cost} m={p.memory_cost_kib // 1024} MiB p={p.parallelism}: "
+        f"{result.measured_ms:.0f} ms (target {result.target_ms:.0f} ms)"
+    )
+    if args.save:
+        print(f"saved {save_profile(result, Path(args.profile) if args.profile else None)}")
+
+    if args.rewrap_user is not None:
+        import getpass
+        from database.engine import init_db
+        from src.security.envelope import rewrap_data_keys
+
+        init_db()
+        password = getpass.getpass("master password: ")
+        print(f"{rewrap_data_keys(args.rewrap_user, password, password, params=p)} key(s) re-wrapped")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
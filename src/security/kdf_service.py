@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""Bounded execution of the password KDFs.
+
+PBKDF2 (login, src/auth/auth_manager.py) and Argon2id (vault keys, exports)
+used to run on whichever thread asked, with no limit: a login burst or a few
+concurrent exports at 64+ MiB each could take every core and a lot of RAM.
+Every derivation now goes through KDF:
+
+- a fixed pool of worker threads (PG_KDF_WORKERS, default: CPU count, at
+  most 4). argon2-cffi and hashlib.pbkdf2_hmac release the GIL, so threads
+  run in parallel without the pickling and start-up cost of processes
+- a memory budget for Argon2id (PG_KDF_MEMORY_MIB, default 512): a
+  derivation reserves its memory_cost before it is queued and waits while
+  the budget is used up. A single request above the budget runs alone
+- a timeout on the wait (PG_KDF_TIMEOUT seconds, default 30): a job that
+  has not started by then is dropped and KdfTimeout is raised. A started
+  derivation always finishes
+- metrics per KDF: calls, timeouts, queue and run time (stats(), served by
+  GET /health)
+
+A derivation requested from a worker thread runs inline, so nested calls
+cannot deadlock the pool. PG_KDF_WORKERS=0 runs everything inline (memory
+budget and metrics still apply).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+DEFAULT_MEMORY_MIB = 512
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+class KdfTimeout(RuntimeError):
+    """A derivation waited longer than its timeout for a worker or memory."""
+
+
+def pbkdf2_raw(password: bytes, salt: bytes, iterations: int, hash_name: str = "sha256") -> bytes:
+    return hashlib.pbkdf2_hmac(hash_name, password, salt, int(iterations))
+
+
+def argon2id_raw(secret: bytes, salt: bytes, time_cost: int, memory_cost_kib: int,
+                 parallelism: int, hash_len: int = 32) -> bytes:
+    try:
+        from argon2.low_level import Type, hash_secret_raw
+    except Exception as e:
+        raise RuntimeError("argon2-cffi is required for vault encryption") from e
+
+    return hash_secret_raw(
+        secret=secret,
+        salt=salt,
+        time_cost=int(time_cost),
+        memory_cost=int(memory_cost_kib),
+        parallelism=int(parallelism),
+        hash_len=int(hash_len),
+        type=Type.ID,
+    )
+
+
+@dataclass
+class KindStats:
+    calls: int = 0
+    timeouts: int = 0
+    queue_ms_total: float = 0.0
+    queue_ms_max: float = 0.0
+    run_ms_total: float = 0.0
+
+    def to_dict(self) -> dict:
+        done = max(1, self.calls)
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "queue_ms_avg": round(self.queue_ms_total / done, 2),
+            "queue_ms_max": round(self.queue_ms_max, 2),
+            "run_ms_avg": round(self.run_ms_total / done, 2),
+        }
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class KdfService:
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        memory_budget_kib: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+    ):
+        if workers is None:
+            workers = int(_env_number("PG_KDF_WORKERS", min(4, os.cpu_count() or 1)))
+        if memory_budget_kib is None:
+            memory_budget_kib = int(_env_number("PG_KDF_MEMORY_MIB", DEFAULT_MEMORY_MIB) * 1024)
+        if timeout_seconds is None:
+            timeout_seconds = _env_number("PG_KDF_TIMEOUT", DEFAULT_TIMEOUT_SECONDS)
+        self.workers = max(0, int(workers))
+        self.memory_budget_kib = max(1, int(memory_budget_kib))
+        self.timeout_seconds = float(timeout_seconds)
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._memory = threading.Condition()
+        self._memory_used = 0
+        self._in_flight = 0
+        self._local = threading.local()
+        self._stats: Dict[str, KindStats] = {}
+
+    # ---------- memory budget ----------
+    def _reserve(self, kib: int, deadline: float) -> bool:
+        if kib <= 0:
+            return True
+        with self._memory:
+            while self._memory_used and self._memory_used + kib > self.memory_budget_kib:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._memory.wait(remaining)
+            self._memory_used += kib
+            return True
+
+    def _release(self, kib: int) -> None:
+        if kib <= 0:
+            return
+        with self._memory:
+            self._memory_used -= kib
+            self._memory.notify_all()
+
+    # ---------- execution ----------
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="kdf", initializer=self._mark_worker
+                )
+            return self._pool
+
+    def _mark_worker(self) -> None:
+        self._local.worker = True
+
+    def _kind(self, kind: str) -> KindStats:
+        stats = self._stats.get(kind)
+        if stats is None:
+            stats = self._stats.setdefault(kind, KindStats())
+        return stats
+
+    def _record(self, kind: str, queued_ms: float, run_ms: float) -> None:
+        with self._lock:
+            s = self._kind(kind)
+            s.calls += 1
+            s.queue_ms_total += queued_ms
+            s.queue_ms_max = max(s.queue_ms_max, queued_ms)
+            s.run_ms_total += run_ms
+
+    def _timed_out(self, kind: str, waited: float) -> KdfTimeout:
+        with self._lock:
+            self._kind(kind).timeouts += 1
+        return KdfTimeout(f"{kind} derivation waited more than {waited:.1f}s")
+
+    def run(self, kind: str, fn: Callable, *args, memory_kib: int = 0, timeout: Optional[float] = None):
+        """fn(*args) on a KDF worker once `memory_kib` of the budget is free.
+
+        Raises KdfTimeout when it has not started within `timeout` seconds
+        (default: the service timeout)."""
+        timeout = self.timeout_seconds if timeout is None else float(timeout)
+        memory_kib = min(max(0, int(memory_kib)), self.memory_budget_kib)
+        queued_at = time.monotonic()
+        deadline = queued_at + timeout
+
+        nested = getattr(self._local, "worker", False)
+        if not nested and not self._reserve(memory_kib, deadline):
+            raise self._timed_out(kind, timeout)
+        state = {"abandoned": False}
+        state_lock = threading.Lock()
+
+        def _job():
+            with state_lock:
+                if state["abandoned"]:
+                    return None
+                state["started"] = True
+            started = time.monotonic()
+            try:
+                return fn(*args)
+            finally:
+                self._record(kind, (started - queued_at) * 1000.0, (time.monotonic() - started) * 1000.0)
+                if not nested:
+                    self._release(memory_kib)
+                with self._lock:
+                    self._in_flight -= 1
+
+        with self._lock:
+            self._in_flight += 1
+        if nested or self.workers == 0:
+            return _job()
+
+        future = self._executor().submit(_job)
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            with state_lock:
+                if not state.get("started"):
+                    state["abandoned"] = True
+            if state["abandoned"]:
+                future.cancel()
+                self._release(memory_kib)
+                with self._lock:
+                    self._in_flight -= 1
+                raise self._timed_out(kind, timeout)
+            return future.result()  # already running: let it finish
+
+    # ---------- KDFs ----------
+    def pbkdf2(self, password: bytes, salt: bytes, iterations: int, hash_name: str = "sha256",
+               timeout: Optional[float] = None) -> bytes:
+        return self.run("pbkdf2", pbkdf2_raw, password, salt, iterations, hash_name, timeout=timeout)
+
+    def argon2id(self, secret: bytes, salt: bytes, time_cost: int, memory_cost_kib: int,
+                 parallelism: int, hash_len: int = 32, timeout: Optional[float] = None) -> bytes:
+        return self.run(
+            "argon2id", argon2id_raw, secret, salt, time_cost, memory_cost_kib, parallelism, hash_len,
+            memory_kib=memory_cost_kib, timeout=timeout,
+        )
+
+    # ---------- metrics ----------
+    def stats(self) -> dict:
+        with self._lock:
+            kinds = {name: s.to_dict() for name, s in self._stats.items()}
+            in_flight = self._in_flight
+        return {
+            "workers": self.workers,
+            "memory_budget_kib": self.memory_budget_kib,
+            "memory_in_use_kib": self._memory_used,
+            "in_flight": in_flight,
+            **kinds,
+        }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+KDF = KdfService()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Unlocked vault-key session.
+
+derive_vault_key() (src/security/crypto.py) runs Argon2id with 64 MiB of
+memory, about a second per call. VaultKeySession keeps derived keys while the
+vault is unlocked so repeated operations (unlock, importing a file exported
+in the same session) skip the KDF:
+
+- derive(): returns the cached key when the secret, salt and parameters
+  match, otherwise runs the KDF once and caches the result
+- get(): the cached key of a slot, or None once expired / forgotten
+- put(): keeps a key obtained otherwise (unwrapped data keys, see
+  src/security/envelope.py), wiped together with the others
+- forget(): zeroizes the key buffers (lock, logout, expiry)
+
+Keys live in a bytearray and are handed out as read-only memoryviews, so
+forget() also blanks every view callers still hold. The secret itself is not
+kept, only an HMAC of it under a random per-session key. The TTL slides with
+touch(); the GUI ties it to the inactivity lock (MainWindow._lock_timeout_ms).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+from src.security.crypto import KdfParams
+
+
+def _default_kdf(secret: str, salt: str, params: KdfParams) -> bytes:
+    from src.security.crypto import derive_vault_key
+
+    return derive_vault_key(secret, salt, params)
+
+
+@dataclass
+class _Entry:
+    buf: bytearray
+    salt: str
+    params: KdfParams
+    tag: bytes
+
+
+class VaultKeySession:
+    def __init__(self, ttl_seconds: float = 180.0, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = float(ttl_seconds)
+        self._clock = clock
+        self._pepper = os.urandom(32)
+        self._lock = threading.RLock()
+        self._entries: Dict[str, _Entry] = {}
+        self._expires_at = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self.derivations = 0
+        self.hits = 0
+
+    # ---------- public API ----------
+    def derive(
+        self,
+        secret: str,
+        salt: Optional[str] = None,
+        params: Optional[KdfParams] = None,
+        slot: str = "vault",
+        kdf: Callable[[str, str, KdfParams], bytes] = _default_kdf,
+    ) -> memoryview:
+        """Key for (secret, salt, params), derived at most once per session.
+
+        With salt=None the slot's current salt is reused when the secret and
+        parameters match (new_salt() otherwise); read it back with salt().
+        """
+        from src.security.crypto import new_salt
+
+        params = params or KdfParams()
+        tag = hmac.new(self._pepper, secret.encode("utf-8"), hashlib.sha256).digest()
+        with self._lock:
+            self._expire_if_due()
+            entry = self._entries.get(slot)
+            if (
+                entry is not None
+                and entry.params == params
+                and (salt is None or entry.salt == salt)
+                and hmac.compare_digest(entry.tag, tag)
+            ):
+                self.hits += 1
+                self._extend()
+                return memoryview(entry.buf).toreadonly()
+
+        salt = salt or new_salt()
+        raw = kdf(secret, salt, params)  # outside the lock: other slots stay usable
+        with self._lock:
+            self._zeroize(self._entries.pop(slot, None))
+            entry = self._entries[slot] = _Entry(bytearray(raw), salt, params, tag)
+            self.derivations += 1
+            self._extend()
+            return memoryview(entry.buf).toreadonly()
+
+    def put(self, slot: str, key) -> memoryview:
+        """Keep a key that is not derived here (e.g. an unwrapped data key)."""
+        with self._lock:
+            self._expire_if_due()
+            self._zeroize(self._entries.pop(slot, None))
+            entry = self._entries[slot] = _Entry(bytearray(key), "", KdfParams(), b"")
+            self._extend()
+            return memoryview(entry.buf).toreadonly()
+
+    def slots(self, prefix: str = "") -> Dict[str, memoryview]:
+        with self._lock:
+            self._expire_if_due()
+            return {
+                name: memoryview(entry.buf).toreadonly()
+                for name, entry in self._entries.items()
+                if name.startswith(prefix)
+            }
+
+    def get(self, slot: str = "vault") -> Optional[memoryview]:
+        with self._lock:
+            self._expire_if_due()
+            entry = self._entries.get(slot)
+            return memoryview(entry.buf).toreadonly() if entry is not None else None
+
+    def salt(self, slot: str = "vault") -> Optional[str]:
+        with self._lock:
+            self._expire_if_due()
+            entry = self._entries.get(slot)
+            return entry.salt if entry is not None else None
+
+    def forget(self, slot: Optional[str] = None) -> None:
+        """Zeroize one slot, or every key of the session."""
+        with self._lock:
+            names = list(self._entries) if slot is None else [slot]
+            for name in names:
+                self._zeroize(self._entries.pop(name, None))
+            if not self._entries and self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def touch(self) -> None:
+        """Slide the expiry (user activity)."""
+        with self._lock:
+            if self._entries:
+                self._extend()
+
+    def set_ttl(self, ttl_seconds: float) -> None:
+        with self._lock:
+            self.ttl_seconds = float(ttl_seconds)
+            if self._entries:
+                self._extend()
+
+    @property
+    def unlocked(self) -> bool:
+        with self._lock:
+            self._expire_if_due()
+            return bool(self._entries)
+
+    # ---------- internals ----------
+    @staticmethod
+    def _zeroize(entry: Optional[_Entry]) -> None:
+        if entry is not None:
+            for i in range(len(entry.buf)):
+                entry.buf[i] = 0
+
+    def _expire_if_due(self) -> None:
+        if self._entries and self._clock() >= self._expires_at:
+            self.forget()
+
+    def _extend(self) -> None:
+        self._expires_at = self._clock() + self.ttl_seconds
+        # one timer per session: it re-arms itself when the expiry moved
+        if self._timer is None:
+            self._arm(self.ttl_seconds)
+
+    def _arm(self, delay: float) -> None:
+        self._timer = threading.Timer(max(0.01, delay), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            if not self._entries:
+                return
+            remaining = self._expires_at - self._clock()
+            if remaining <= 0:
+                self.forget()
+            else:
+                self._arm(remaining)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Versioned account-password hashes.
+
+Users.password_hash used to be a bare hex PBKDF2-SHA256 digest with a fixed
+100,000 iterations (the salt in Users.salt), so the cost could never change.
+Hashes are now self-describing:
+
+    <algorithm>$<params>$<salt, base64>$<hash, base64>
+    pbkdf2-sha256$i=600000$...$...
+    argon2id$t=2,m=19456,p=1$...$...
+
+- the algorithm and its cost come from the deployment (PG_PASSWORD_HASH:
+  pbkdf2-sha256 or argon2id; PG_PBKDF2_ITERATIONS; PG_ARGON2_TIME_COST,
+  PG_ARGON2_MEMORY_KIB, PG_ARGON2_PARALLELISM), read on every call
+- verify() accepts every registered algorithm and the legacy hex digests,
+  and compares in constant time
+- needs_rehash() is true for a legacy hash or one made with another
+  algorithm or cost than the current policy; AuthManager.authenticate
+  replaces such a hash after a successful login
+
+Derivations run on the KDF pool (src/security/kdf_service.py). More
+algorithms plug in with register().
+"""
+
+from __future__ import annotations
+
+import base64
+import hmac
+import os
+from typing import Dict, Optional
+
+from src.security.kdf_service import KDF
+
+LEGACY_ITERATIONS = 100_000
+DEFAULT_ALGORITHM = "pbkdf2-sha256"
+DEFAULT_PBKDF2_ITERATIONS = 600_000
+SALT_SIZE = 16
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _b64decode(s: str) -> bytes:
+    return base64.b64decode(s + "=" * (-len(s) % 4), validate=True)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+class Hasher:
+    """One algorithm: its name, the policy parameters and the derivation."""
+
+    name = ""
+
+    def policy(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+    def derive(self, password: bytes, salt: bytes, params: Dict[str, int]) -> bytes:
+        raise NotImplementedError
+
+    @staticmethod
+    def format_params(params: Dict[str, int]) -> str:
+        return ",".join(f"{k}={v}" for k, v in params.items())
+
+    @staticmethod
+    def parse_params(text: str) -> Dict[str, int]:
+        params = {}
+        for item in text.split(","):
+            key, _, value = item.partition("=")
+            params[key] = int(value)
+        return params
+
+
+class Pbkdf2Sha256(Hasher):
+    name = "pbkdf2-sha256"
+
+    def policy(self) -> Dict[str, int]:
+        return {"i": max(1, _env_int("PG_PBKDF2_ITERATIONS", DEFAULT_PBKDF2_ITERATIONS))}
+
+    def derive(self, password: bytes, salt: bytes, params: Dict[str, int]) -> bytes:
+        return KDF.pbkdf2(password, salt, params["i"])
+
+
+class Argon2id(Hasher):
+    name = "argon2id"
+
+    def policy(self) -> Dict[str, int]:
+        # OWASP minimum: 19 MiB, two passes, one lane
+        return {
+            "t": max(1, _env_int("PG_ARGON2_TIME_COST", 2)),
+            "m": max(8, _env_int("PG_ARGON2_MEMORY_KIB", 19456)),
+            "p": max(1, _env_int("PG_ARGON2_PARALLELISM", 1)),
+        }
+
+    def derive(self, password: bytes, salt: bytes, params: Dict[str, int]) -> bytes:
+        return KDF.argon2id(password, salt, params["t"], params["m"], params["p"], 32)
+
+
+HASHERS: Dict[str, Hasher] = {}
+
+
+def register(hasher: Hasher) -> None:
+    HASHERS[hasher.name] = hasher
+
+
+register(Pbkdf2Sha256())
+register(Argon2id())
+
+
+def current_hasher() -> Hasher:
+    return HASHERS.get((os.getenv("PG_PASSWORD_HASH") or "").strip().lower(), HASHERS[DEFAULT_ALGORITHM])
+
+
+def hash_password(password: str, hasher: Optional[Hasher] = None) -> str:
+    """Encoded hash of `password` under the current policy (or `hasher`)."""
+    hasher = hasher or current_hasher()
+    params = hasher.policy()
+    salt = os.urandom(SALT_SIZE)
+    digest = hasher.derive(password.encode("utf-8"), salt, params)
+    return "$".join((hasher.name, hasher.format_params(params), _b64encode(salt), _b64encode(digest)))
+
+
+def is_legacy(stored: str) -> bool:
+    return "$" not in (stored or "")
+
+
+def verify(stored: str, password: str, legacy_salt: Optional[str] = None) -> bool:
+    """True if `password` matches `stored` (legacy hex digests need their Users.salt)."""
+    if not stored or password is None:
+        return False
+    secret = password.encode("utf-8")
+    if is_legacy(stored):
+        if legacy_salt is None:
+            return False
+        digest = KDF.pbkdf2(secret, legacy_salt.encode("utf-8"), LEGACY_ITERATIONS)
+        return hmac.compare_digest(digest.hex(), stored)
+    try:
+        name, params_text, salt_text, digest_text = stored.split("$")
+        hasher = HASHERS[name]
+        params = hasher.parse_params(params_text)
+        salt, expected = _b64decode(salt_text), _b64decode(digest_text)
+        digest = hasher.derive(secret, salt, params)
+    except (KeyError, ValueError):
+        return False
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    """True when `stored` was not made with the current algorithm and cost."""
+    if is_legacy(stored):
+        return True
+    name, _, rest = stored.partition("$")
+    hasher = current_hasher()
+    if name != hasher.name:
+        return True
+    try:
+        return hasher.parse_params(rest.partition("$")[0]) != hasher.policy()
+    except ValueError:
+        return True
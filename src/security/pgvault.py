@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+"""Streaming .pgvault v2 files.
+
+v1 (encrypt_vault_payload in src/security/encryption.py) is one JSON document
+holding the whole vault as a single AES-GCM message: export and import need
+several times the vault size in memory and nothing is readable before the
+last byte is decrypted. v2 streams:
+
+    magic "PGVAULT\\x02" | u32 header length | header (JSON)
+    chunk records: flags u8 | u32 length | AES-256-GCM(ciphertext | tag)
+    index record (flags = INDEX)
+    footer: u64 offset of the index record | "PGVIDX\\x00\\x02"
+
+- the plaintext is JSON lines (a {"meta": ...} line, then one entry per
+  line), optionally deflated, cut into fixed-size chunks (chunk_size bytes,
+  the final one shorter, possibly empty)
+- each chunk is authenticated on its own, STREAM-style: nonce = 7-byte random
+  prefix | u32 chunk counter | flag byte (1 on the final chunk), with the
+  header as associated data. Reordered, dropped or truncated chunks, and a
+  file cut at a chunk boundary, all fail to decrypt
+- index: every `index_every` entries the compressor is fully flushed and
+  (entry number, stream offset) recorded, so PgVaultReader.entries(start)
+  seeks to the right chunk instead of decrypting from the beginning
+- write_pgvault() consumes an iterable and PgVaultReader yields entries, so
+  memory stays at about one chunk either way
+
+open_pgvault() reads v1 files too (those load whole, as before).
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import os
+import struct
+import zlib
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+MAGIC = b"PGVAULT\x02"
+FOOTER_MAGIC = b"PGVIDX\x00\x02"
+DEFAULT_CHUNK_SIZE = 64 * 1024
+INDEX_EVERY = 128
+FLAG_FINAL = 0x01
+FLAG_INDEX = 0x02
+
+_LEN = struct.Struct(">I")
+_RECORD = struct.Struct(">BI")
+_FOOTER = struct.Struct(">Q8s")
+_TAG_SIZE = 16
+
+
+def _file_key(passphrase: str, salt: bytes, kdf: dict, key_session=None):
+    from src.security.encryption import _argon2_key, _session_key
+
+    if key_session is not None:
+        return _session_key(key_session, passphrase, salt, kdf)
+    return _argon2_key(
+        passphrase,
+        salt,
+        time_cost=int(kdf.get("time_cost", 3)),
+        memory_cost=int(kdf.get("memory_cost", 65536)),
+        parallelism=int(kdf.get("parallelism", 2)),
+        hash_len=int(kdf.get("hash_len", 32)),
+    )
+
+
+def _nonce(prefix: bytes, counter: int, flag: int) -> bytes:
+    return prefix + struct.pack(">IB", counter, flag)
+
+
+def _line(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=True, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+# ============================================================
+# WRITER
+# ============================================================
+class _ChunkWriter:
+    def __init__(self, fh: BinaryIO, aead: AESGCM, prefix: bytes, aad: bytes, chunk_size: int):
+        self.fh = fh
+        self.aead = aead
+        self.prefix = prefix
+        self.aad = aad
+        self.chunk_size = chunk_size
+        self.buf = bytearray()
+        self.counter = 0
+        self.offset = 0  # bytes of (compressed) stream written so far
+
+    def _record(self, data, flags: int, nonce_flag: int) -> None:
+        ct = self.aead.encrypt(_nonce(self.prefix, self.counter, nonce_flag), bytes(data), self.aad)
+        self.fh.write(_RECORD.pack(flags, len(ct)))
+        self.fh.write(ct)
+        self.counter += 1
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self.buf += data
+        self.offset += len(data)
+        while len(self.buf) >= self.chunk_size:
+            self._record(memoryview(self.buf)[:self.chunk_size], 0, 0)
+            del self.buf[:self.chunk_size]
+
+    def finish(self) -> None:
+        self._record(self.buf, FLAG_FINAL, FLAG_FINAL)
+        self.buf = bytearray()
+
+    def index(self, data: bytes) -> None:
+        self._record(data, FLAG_INDEX, FLAG_INDEX)
+
+
+def write_pgvault(
+    fh: BinaryIO,
+    entries: Iterable[dict],
+    passphrase: str,
+    meta: Optional[dict] = None,
+    key_session=None,
+    compress: bool = True,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    index_every: int = INDEX_EVERY,
+    kdf: Optional[dict] = None,
+) -> int:
+    """Write a v2 vault to a binary file object. Returns the number of entries."""
+    if not passphrase:
+        raise ValueError("Passphrase required")
+    chunk_size = max(1, int(chunk_size))
+    index_every = max(1, int(index_every))
+    if kdf is None:
+        from src.security.kdf_calibration import kdf_dict
+        kdf = kdf_dict()  # host-calibrated, recorded in the header
+    kdf = dict(kdf)
+
+    salt = os.urandom(16)  # per file, also with a key session
+    key = _file_key(passphrase, salt, kdf, key_session)
+    prefix = os.urandom(7)
+    header = json.dumps({
+        "format": "pgvault",
+        "version": 2,
+        "cipher": "aes-256-gcm",
+        "kdf": kdf,
+        "salt": base64.b64encode(salt).decode("ascii"),
+        "nonce_prefix": base64.b64encode(prefix).decode("ascii"),
+        "chunk_size": chunk_size,
+        "compression": "deflate" if compress else "none",
+    }, sort_keys=True).encode("utf-8")
+    head = MAGIC + _LEN.pack(len(header)) + header
+    fh.write(head)
+
+    out = _ChunkWriter(fh, AESGCM(bytes(key)), prefix, head, chunk_size)
+    deflate = zlib.compressobj(6, zlib.DEFLATED, -15) if compress else None
+
+    def _emit(data: bytes) -> None:
+        out.write(deflate.compress(data) if deflate else data)
+
+    def _sync() -> None:
+        # full flush: decompression can restart here, which is what the index points at
+        if deflate:
+            out.write(deflate.flush(zlib.Z_FULL_FLUSH))
+
+    _emit(_line({"meta": meta or {}}))
+    points = []
+    n = 0
+    for entry in entries:
+        if n % index_every == 0:
+            _sync()
+            points.append([n, out.offset])
+        _emit(_line(entry))
+        n += 1
+    if deflate:
+        out.write(deflate.flush())
+    out.finish()
+
+    index_at = fh.tell() if hasattr(fh, "tell") else 0
+    out.index(json.dumps({"entries": n, "points": points}).encode("utf-8"))
+    fh.write(_FOOTER.pack(index_at, FOOTER_MAGIC))
+    return n
+
+
+# ============================================================
+# READER
+# ============================================================
+class PgVaultReader:
+    """Entries of a .pgvault file (v2 streamed, v1 loaded whole).
+
+    The passphrase is checked on open (the first chunk carries the meta line).
+    """
+
+    def __init__(self, fh: BinaryIO, passphrase: str, key_session=None):
+        if not passphrase:
+            raise ValueError("Passphrase required")
+        self.fh = fh
+        self.version = 1
+        self.meta: dict = {}
+        self._v1_entries = None
+        self._index = None
+
+        magic = fh.read(len(MAGIC))
+        if magic != MAGIC:
+            from src.security.encryption import decrypt_vault_payload
+
+            rest = fh.read()
+            if isinstance(rest, bytes):
+                rest = (magic + rest).decode("utf-8")
+            else:
+                rest = magic.decode("utf-8") + rest
+            vault = decrypt_vault_payload(json.loads(rest), passphrase, key_session=key_session)
+            self._v1_entries = vault.get("passwords") or []
+            if not isinstance(self._v1_entries, list):
+                raise ValueError("Invalid vault format")
+            self.meta = {k: v for k, v in vault.items() if k != "passwords"}
+            return
+
+        self.version = 2
+        (size,) = _LEN.unpack(fh.read(_LEN.size))
+        raw_header = fh.read(size)
+        header = json.loads(raw_header.decode("utf-8"))
+        if header.get("format") != "pgvault" or header.get("version") != 2:
+            raise ValueError("Invalid vault format")
+        self._aad = magic + _LEN.pack(size) + raw_header
+        self._payload_at = len(self._aad)
+        self._chunk_size = int(header["chunk_size"])
+        self._compressed = header.get("compression") == "deflate"
+        self._prefix = base64.b64decode(header["nonce_prefix"])
+        key = _file_key(passphrase, base64.b64decode(header["salt"]), header.get("kdf") or {}, key_session)
+        self._aead = AESGCM(bytes(key))
+
+        first = next(self._lines(0), None)
+        if first is None or "meta" not in first:
+            raise ValueError("Invalid vault format")
+        self.meta = first["meta"]
+
+    # ---------- chunks ----------
+    def _decrypt(self, counter: int, flags: int, ct: bytes) -> bytes:
+        nonce_flag = flags & (FLAG_FINAL | FLAG_INDEX)
+        try:
+            return self._aead.decrypt(_nonce(self._prefix, counter, nonce_flag), ct, self._aad)
+        except InvalidTag as e:
+            raise ValueError("Wrong passphrase or damaged vault file") from e
+
+    def _chunks(self, counter: int) -> Iterator[bytes]:
+        """Plaintext chunks from `counter` to the final one."""
+        self.fh.seek(self._payload_at + counter * (_RECORD.size + self._chunk_size + _TAG_SIZE))
+        while True:
+            head = self.fh.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                raise ValueError("Truncated vault file")
+            flags, length = _RECORD.unpack(head)
+            if flags & FLAG_INDEX:
+                raise ValueError("Truncated vault file")
+            ct = self.fh.read(length)
+            if len(ct) < length:
+                raise ValueError("Truncated vault file")
+            yield self._decrypt(counter, flags, ct)
+            if flags & FLAG_FINAL:
+                return
+            counter += 1
+
+    def _lines(self, offset: int) -> Iterator[dict]:
+        counter, skip = divmod(offset, self._chunk_size)
+        inflate = zlib.decompressobj(-15) if self._compressed else None
+        pending = bytearray()
+        for chunk in self._chunks(counter):
+            data = memoryview(chunk)[skip:]
+            skip = 0
+            pending += inflate.decompress(data) if inflate else data
+            start = 0
+            while True:
+                end = pending.find(b"\n", start)
+                if end < 0:
+                    break
+                yield json.loads(bytes(pending[start:end]))
+                start = end + 1
+            del pending[:start]
+        if inflate:
+            pending += inflate.flush()
+        if pending.strip():
+            raise ValueError("Damaged vault file")
+
+    # ---------- index ----------
+    def index(self) -> dict:
+        """{"entries": n, "points": [[entry, offset], ...]} (needs a seekable file)."""
+        if self._index is None:
+            self.fh.seek(-_FOOTER.size, os.SEEK_END)
+            at, magic = _FOOTER.unpack(self.fh.read(_FOOTER.size))
+            if magic != FOOTER_MAGIC:
+                raise ValueError("Vault index missing")
+            self.fh.seek(at)
+            flags, length = _RECORD.unpack(self.fh.read(_RECORD.size))
+            if not flags & FLAG_INDEX:
+                raise ValueError("Vault index missing")
+            counter = (at - self._payload_at) // (_RECORD.size + self._chunk_size + _TAG_SIZE) + 1
+            self._index = json.loads(self._decrypt(counter, flags, self.fh.read(length)).decode("utf-8"))
+        return self._index
+
+    def __len__(self) -> int:
+        if self._v1_entries is not None:
+            return len(self._v1_entries)
+        return int(self.index()["entries"])
+
+    # ---------- entries ----------
+    def entries(self, start: int = 0) -> Iterator[dict]:
+        if self._v1_entries is not None:
+            yield from self._v1_entries[start:]
+            return
+        if start <= 0:
+            lines = self._lines(0)
+            next(lines)  # meta
+            yield from lines
+            return
+        points = [p for p in self.index()["points"] if p[0] <= start]
+        if not points:
+            return
+        first, offset = points[-1]
+        for i, entry in enumerate(self._lines(offset), start=first):
+            if i >= start:
+                yield entry
+
+    def __iter__(self) -> Iterator[dict]:
+        return self.entries()
+
+
+def open_pgvault(fh: BinaryIO, passphrase: str, key_session=None) -> PgVaultReader:
+    return PgVaultReader(fh, passphrase, key_session=key_session)
@@ -0,0 +1,94 @@
+import importlib
+import os
+import tempfile
+import unittest
+
+
+class AccountPurgeTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_purge_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import backend_api.maintenance as maintenance_module
+        import backend_api.purge as purge_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(maintenance_module)
+        self.purge = importlib.reload(purge_module)
+        self.engine_module.init_db()
+
+        m = self.models
+        with self.engine_module.SessionLocal() as s:
+            heavy = m.User(username="heavy", email="heavy@example.com", password_hash="x", salt="y")
+            other = m.User(username="other", email="other@example.com", password_hash="x", salt="y")
+            s.add_all([heavy, other])
+            s.flush()
+            self.heavy_id, self.other_id = heavy.id, other.id
+            for uid in (heavy.id, other.id):
+                for i in range(5):
+                    s.add(m.Password(user_id=uid, site_name=f"s{i}", username="u", encrypted_password="t"))
+                for i in range(7):
+                    s.add(m.ActivityLog(user_id=uid, action=f"password:add:s{i}"))
+            s.flush()
+            first_pw = s.query(m.Password).filter(m.Password.user_id == heavy.id).first()
+            s.add(m.PasswordHistory(password_id=first_pw.id, old_encrypted_password="h"))
+            s.commit()
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _count(self, model, uid) -> int:
+        from sqlalchemy import func, select
+        col = model.id if model is self.models.User else model.user_id
+        with self.engine_module.SessionLocal() as s:
+            return s.execute(select(func.count()).select_from(model).where(col == uid)).scalar_one()
+
+    def test_purge_is_resumable_and_leaves_other_users_alone(self):
+        queued = self.purge.request_account_purge(self.heavy_id)
+        self.assertEqual(queued["status"], "pending")
+        self.assertEqual(queued["step"], "passwords")
+
+        runs = 0
+        while True:
+            runs += 1
+            result = self.purge.run_purge(queued["id"], batch_size=2, pause_seconds=0, max_batches=2)
+            if result["done"]:
+                break
+            status = self.purge.purge_status(self.heavy_id)
+            self.assertEqual(status["status"], "running")
+            self.assertGreater(status["deleted_rows"], 0)
+        self.assertGreater(runs, 1)
+
+        m = self.models
+        final = self.purge.purge_status(self.heavy_id)
+        self.assertEqual(final["status"], "done")
+        self.assertEqual(final["deleted_rows"], 5 + 7 + 1)
+        self.assertEqual(self._count(m.User, self.heavy_id), 0)
+        self.assertEqual(self._count(m.Password, self.heavy_id), 0)
+        self.assertEqual(self._count(m.ActivityLog, self.heavy_id), 0)
+        self.assertEqual(self._count(m.Password, self.other_id), 5)
+        self.assertEqual(self._count(m.ActivityLog, self.other_id), 7)
+
+    def test_requested_purge_locks_login_and_is_idempotent(self):
+        first = self.purge.request_account_purge(self.heavy_id)
+        again = self.purge.request_account_purge(self.heavy_id)
+        self.assertEqual(first["id"], again["id"])
+        with self.engine_module.SessionLocal() as s:
+            self.assertEqual(s.get(self.models.User, self.heavy_id).password_hash, "!purge")
+        self.assertIsNone(self.purge.request_account_purge(9999))
+
+        totals = self.purge.run_pending_purges(batch_size=100, pause_seconds=0)
+        self.assertEqual(totals["completed"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
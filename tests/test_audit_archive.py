@@ -0,0 +1,102 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class AuditArchiveTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_archive_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "hot.db").replace("\\", "/")
+        os.environ["AUDIT_ARCHIVE_DIR"] = os.path.join(self.tmp, "archive")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.maintenance as maintenance_module
+        import src.security.audit as audit_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.maintenance = importlib.reload(maintenance_module)
+        self.audit = importlib.reload(audit_module)
+        self.engine_module.init_db()
+
+        m = self.models
+        self.now = datetime(2026, 6, 1)
+        with self.engine_module.SessionLocal() as s:
+            user = m.User(username="arch", email="arch@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+            # 40 rows, one every 5 days back from `now`: spans several months
+            for i in range(40):
+                s.add(m.ActivityLog.event(
+                    self.uid, "password" if i % 3 == 0 else "login", "update",
+                    target_label=f"row{i}", created_at=self.now - timedelta(days=5 * i),
+                ))
+            s.commit()
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        os.environ.pop("AUDIT_ARCHIVE_DIR", None)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _hot_count(self):
+        from sqlalchemy import func, select
+        with self.engine_module.SessionLocal() as s:
+            return s.execute(select(func.count()).select_from(self.models.ActivityLog)).scalar_one()
+
+    def _full_journal(self, **kwargs):
+        ids, cursor = [], None
+        while True:
+            page = self.audit.list_events(self.uid, cursor=cursor, limit=7, **kwargs)
+            ids.extend(r["id"] for r in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return ids
+
+    def test_old_rows_move_to_segments_and_stay_queryable(self):
+        before = self._full_journal()
+        before_pw = self._full_journal(category="password")
+        policy = self.maintenance.RetentionPolicy(batch_size=8, batch_pause_seconds=0, audit_archive_days=60)
+
+        result = self.maintenance.archive_audit_logs(policy, now=self.now)
+
+        self.assertEqual(result["archived"], 27)  # rows 13..39 are older than 60 days
+        self.assertEqual(self._hot_count(), 13)
+        archive = self.audit.default_archive()
+        stats = archive.stats()
+        self.assertEqual((stats["users"], stats["rows"]), (1, 27))
+        self.assertGreater(stats["segments"], 3)
+
+        # paging across the hot/archive boundary returns the same journal
+        self.assertEqual(self._full_journal(), before)
+        self.assertEqual(self._full_journal(category="password"), before_pw)
+
+        window = self.audit.list_events(
+            self.uid, since=self.now - timedelta(days=100), until=self.now - timedelta(days=80), limit=50,
+        )["items"]
+        self.assertEqual([r["target_label"] for r in window], ["row17", "row18", "row19", "row20"])
+
+        # running again finds nothing left to move
+        self.assertEqual(self.maintenance.archive_audit_logs(policy, now=self.now)["archived"], 0)
+
+    def test_torn_segment_tail_is_dropped_on_next_append(self):
+        archive = self.audit.default_archive()
+        row = {"id": 1, "user_id": self.uid, "category": "login", "created_at": datetime(2026, 1, 2)}
+        archive.append(self.uid, [row])
+        seg = os.path.join(os.environ["AUDIT_ARCHIVE_DIR"], str(self.uid), "2026-01.seg")
+        with open(seg, "ab") as f:
+            f.write(b"PGAB\x00\x00")  # interrupted append
+
+        archive.append(self.uid, [dict(row, id=2, created_at=datetime(2026, 1, 3))])
+
+        self.assertEqual([r["id"] for r in archive.query(self.uid)], [2, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+
+class AuditChainTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_chain_")
+        self.db_path = os.path.join(self.tmp, "chain.db")
+        os.environ["DATABASE_URL"] = "sqlite:///" + self.db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import src.security.audit as audit_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.audit = importlib.reload(audit_module)
+        self.engine_module.init_db()
+        from database import audit_chain
+        self.chain = audit_chain
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="chain", email="chain@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.chain.forget_heads()
+        self.engine_module.engine.dispose()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _sql(self, statement, **params):
+        from sqlalchemy import text
+        with self.engine_module.engine.begin() as conn:
+            return conn.execute(text(statement), params)
+
+    def test_rows_are_chained_and_checkpoints_bound_the_next_run(self):
+        for i in range(5):
+            self.audit.log_event(self.uid, "password", "update", target_label=f"site{i}")
+
+        first = self.audit.verify_journal(self.uid)
+        self.assertEqual((first["ok"], first["rows"]), (True, 5))
+
+        self.audit.log_event(self.uid, "vault", "export")
+        second = self.audit.verify_journal(self.uid)
+        self.assertEqual((second["ok"], second["rows"]), (True, 1))
+        with self.engine_module.SessionLocal() as s:
+            cp = s.query(self.models.AuditCheckpoint).filter_by(user_id=self.uid).one()
+            self.assertEqual(cp.verified_rows, 6)
+
+    def test_steady_state_write_issues_only_the_insert(self):
+        from sqlalchemy import event
+
+        self.audit.log_event(self.uid, "login", "success")  # warms the chain head
+        statements = []
+        listener = lambda *args: statements.append(args[2].split()[0].upper())  # noqa: E731
+        event.listen(self.engine_module.engine, "before_cursor_execute", listener)
+        try:
+            self.audit.log_event(self.uid, "login", "success")
+        finally:
+            event.remove(self.engine_module.engine, "before_cursor_execute", listener)
+        self.assertEqual(statements, ["INSERT"])
+
+    def test_tampering_is_reported_and_checkpoint_kept(self):
+        for verb in ("add", "update", "delete"):
+            self.audit.log_event(self.uid, "password", verb, target_label="Gmail")
+        self.assertTrue(self.audit.verify_journal(self.uid)["ok"])
+        self.audit.log_event(self.uid, "password", "reveal", target_label="Bank")
+        self.audit.log_event(self.uid, "vault", "export")
+
+        row_id = self._sql("SELECT id FROM activity_logs WHERE verb = 'reveal'").scalar()
+        self._sql("UPDATE activity_logs SET target_label = 'Other' WHERE id = :i", i=row_id)
+
+        report = self.audit.verify_journal(self.uid)
+        self.assertFalse(report["ok"])
+        self.assertEqual(report["failures"][0]["row_id"], row_id)
+        with self.engine_module.SessionLocal() as s:
+            self.assertEqual(s.query(self.models.AuditCheckpoint).one().verified_rows, 3)
+
+        self._sql("UPDATE audit_checkpoints SET verified_rows = 99")
+        self.assertEqual(self.audit.verify_journal(self.uid)["failures"][0]["reason"], "checkpoint signature")
+
+    def test_concurrent_writer_and_legacy_rows_keep_one_chain(self):
+        from sqlalchemy.orm import sessionmaker
+
+        self._sql(
+            "INSERT INTO activity_logs (user_id, action, category, verb, created_at) "
+            "VALUES (:u, 'login:success', 'login', 'success', :t)",
+            u=self.uid, t=datetime(2025, 1, 1),
+        )
+        self.engine_module.init_db()  # seals the legacy row
+
+        # a second engine on the same file plays another process with its own cache
+        other = self.engine_module._create_engine(os.environ["DATABASE_URL"])
+        OtherSession = sessionmaker(bind=other)
+        try:
+            for i in range(3):
+                self.audit.log_event(self.uid, "password", "update", target_label=f"a{i}")
+                with OtherSession() as s:
+                    s.add(self.models.ActivityLog.event(self.uid, "login", "success", details=f"b{i}"))
+                    s.commit()
+        finally:
+            other.dispose()
+
+        report = self.audit.verify_journal(self.uid)
+        self.assertEqual((report["ok"], report["rows"]), (True, 7))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import importlib
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class StructuredAuditTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_audit_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import src.security.audit as audit_module
+        import src.auth.auth_manager as auth_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        self.queries = importlib.reload(queries_module)
+        self.audit = importlib.reload(audit_module)
+        self.auth_module = importlib.reload(auth_module)
+        self.engine_module.init_db()
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="audit", email="audit@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def test_parse_action(self):
+        parse = self.models.ActivityLog.parse_action
+        self.assertEqual(parse("password:update:Gmail"), ("password", "update", None, "Gmail"))
+        self.assertEqual(parse("password:add:My:Site"), ("password", "add", None, "My:Site"))
+        self.assertEqual(parse("session:revoke:42"), ("session", "revoke", 42, None))
+        self.assertEqual(parse("user.profile_updated"), ("user", "profile_updated", None, None))
+        self.assertEqual(parse("vault:export"), ("vault", "export", None, None))
+
+    def test_migration_backfills_legacy_rows(self):
+        from sqlalchemy import text
+
+        base = datetime(2026, 1, 1)
+        with self.engine_module.engine.begin() as conn:
+            for i, action in enumerate(["password:update:Gmail", "session:revoke:7", "vault:export", "weird"]):
+                conn.execute(
+                    text("INSERT INTO activity_logs (user_id, action, created_at) VALUES (:u, :a, :t)"),
+                    {"u": self.uid, "a": action, "t": base + timedelta(minutes=i)},
+                )
+
+        self.engine_module.init_db()  # runs the backfill
+
+        with self.engine_module.SessionLocal() as s:
+            rows = {r.action: r for r in s.query(self.models.ActivityLog)}
+        self.assertEqual((rows["password:update:Gmail"].category, rows["password:update:Gmail"].verb,
+                          rows["password:update:Gmail"].target_label), ("password", "update", "Gmail"))
+        self.assertEqual(rows["session:revoke:7"].target_id, 7)
+        self.assertEqual(rows["weird"].category, "weird")
+        self.assertEqual(self.engine_module.backfill_activity_log_columns(self.engine_module.engine), 0)
+
+    def test_filtered_journal_is_an_index_range_scan(self):
+        self.audit.log_event(self.uid, "password", "update", target_id=3, target_label="Gmail")
+        self.audit.log_event(self.uid, "vault", "export")
+        self.audit.log_action(self.uid, "user.profile_updated", "legacy caller")
+
+        auth = self.auth_module.AuthManager()
+        logs = auth.list_audit_logs(self.uid, "password")
+        self.assertEqual([(r["verb"], r["target_id"], r["target_label"]) for r in logs], [("update", 3, "Gmail")])
+        self.assertEqual(logs[0]["action"], "password:update:Gmail")
+        self.assertEqual(len(auth.list_audit_logs(self.uid)), 3)
+        self.assertEqual(auth.list_audit_logs(self.uid, "user")[0]["verb"], "profile_updated")
+
+        stmt = self.queries.STATEMENTS.get("activity_logs.by_user_category")
+        compiled = stmt.compile(self.engine_module.engine)
+        with self.engine_module.engine.connect() as conn:
+            plan = " ".join(
+                str(r[-1]) for r in conn.exec_driver_sql(
+                    "EXPLAIN QUERY PLAN " + str(compiled), (self.uid, "password")
+                )
+            )
+        self.assertIn("ix_activity_logs_user_category_created", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def _seed_journal(self, n=7):
+        base = datetime(2026, 3, 1)
+        with self.engine_module.SessionLocal() as s:
+            for i in range(n):
+                s.add(self.models.ActivityLog.event(
+                    self.uid, "password" if i % 2 else "login", "update",
+                    created_at=base + timedelta(hours=i // 2),  # pairs share a timestamp
+                ))
+            s.commit()
+        return base
+
+    def test_keyset_pages_cover_the_journal_once(self):
+        self._seed_journal()
+        seen, cursor = [], None
+        while True:
+            page = self.audit.list_events(self.uid, cursor=cursor, limit=3)
+            seen.extend(r["id"] for r in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+        ordered = self.audit.list_events(self.uid, limit=50)["items"]
+        self.assertEqual(seen, [r["id"] for r in ordered])
+
+        first = self.audit.list_events(self.uid, category="password", limit=2)
+        rest = self.audit.list_events(self.uid, category="password", cursor=first["next_cursor"], limit=2)
+        self.assertEqual(len(first["items"] + rest["items"]), 3)
+        self.assertIsNone(rest["next_cursor"])
+
+        with self.assertRaises(ValueError):
+            self.audit.list_events(self.uid, cursor="not-a-cursor")
+
+    def test_audit_endpoint_filters_by_time_window(self):
+        import backend_api.app as app_module
+
+        app_module = importlib.reload(app_module)
+        base = self._seed_journal()
+        client = app_module.app.test_client()
+
+        resp = client.get(f"/audit/{self.uid}", query_string={
+            "since": (base + timedelta(hours=1)).isoformat(),
+            "until": (base + timedelta(hours=3)).isoformat(),
+        })
+        body = resp.get_json()
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(body["items"]), 4)
+        self.assertIsNone(body["next_cursor"])
+        self.assertEqual(client.get(f"/audit/{self.uid}?cursor=%%%").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
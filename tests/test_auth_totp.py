@@ -14,10 +14,12 @@ class AuthTotpTests(unittest.TestCase):
 
         import database.engine as engine_module
         import database.models as models_module
+        import database.queries as queries_module
         import src.auth.auth_manager as auth_module
 
         self.engine_module = importlib.reload(engine_module)
         self.models_module = importlib.reload(models_module)
+        importlib.reload(queries_module)
         self.auth_module = importlib.reload(auth_module)
         self.engine_module.init_db()
 
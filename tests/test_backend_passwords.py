@@ -0,0 +1,145 @@
+import importlib
+import json
+import os
+import tempfile
+import unittest
+
+
+class BackendPasswordReadTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_backend_pw_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models_module = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models_module.User(
+                username="reader", email="reader@example.com", password_hash="x", salt="y"
+            )
+            s.add(user)
+            s.commit()
+            self.user_id = int(user.id)
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _add(self, site_name: str, **extra) -> int:
+        payload = {
+            "user_id": self.user_id,
+            "site_name": site_name,
+            "username": "alice",
+            "encrypted_password": "gAAAAA-token",
+        }
+        payload.update(extra)
+        r = self.client.post("/passwords", json=payload)
+        self.assertEqual(r.status_code, 200)
+        return r.get_json()["id"]
+
+    def test_list_returns_plain_rows(self):
+        pid = self._add("Gmail", favorite=True, site_url="https://mail.example.com")
+        self.client.post(f"/passwords/{pid}/trash")
+
+        rows = self.client.get(f"/passwords/{self.user_id}").get_json()
+
+        self.assertEqual(len(rows), 1)
+        row = rows[0]
+        self.assertEqual(row["id"], pid)
+        self.assertEqual(row["user_id"], self.user_id)
+        self.assertEqual(row["site_name"], "Gmail")
+        self.assertEqual(row["site_url"], "https://mail.example.com")
+        self.assertEqual(row["encrypted_password"], "gAAAAA-token")
+        self.assertTrue(row["favorite"])
+        self.assertIsNotNone(row["trashed_at"])
+        self.assertIsNotNone(row["created_at"])
+
+    def test_export_only_includes_user_rows(self):
+        self._add("Gmail")
+        self._add("GitHub", category="work")
+
+        vault = self.client.get(f"/export/{self.user_id}").get_json()["vault"]
+        names = sorted(p["site_name"] for p in vault["passwords"])
+
+        self.assertEqual(names, ["GitHub", "Gmail"])
+        self.assertNotIn("id", vault["passwords"][0])
+        self.assertEqual(self.client.get("/export/999").get_json()["vault"]["passwords"], [])
+
+    def test_streamed_export_is_json_lines(self):
+        self._add("Gmail")
+        self._add("GitHub", category="work")
+
+        r = self.client.get(f"/export/{self.user_id}?stream=1")
+        self.assertEqual(r.mimetype, "application/x-ndjson")
+        lines = [json.loads(line) for line in r.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines[0]["version"], 1)
+        self.assertEqual(sorted(e["site_name"] for e in lines[1:]), ["GitHub", "Gmail"])
+        self.assertNotIn("id", lines[1])
+
+        # the stream reads rows lazily instead of loading the vault first
+        repo = self.app_module.passwords
+        repo.export_rows = lambda user_id: self.fail("export_rows used for a stream")
+        try:
+            r = self.client.get(f"/export/{self.user_id}?stream=1")
+            self.assertEqual(len(r.get_data(as_text=True).splitlines()), 3)
+        finally:
+            del repo.export_rows
+
+    def test_import_commits_in_batches(self):
+        def items():
+            for i in range(5):
+                yield {"site_name": f"site{i}", "username": "alice", "encrypted_password": "gAAAAA-token"}
+            raise RuntimeError("client went away")
+
+        with self.assertRaises(RuntimeError):
+            self.app_module.passwords.add_many(self.user_id, items(), batch_size=2)
+        # the two full batches were committed, the open one was rolled back
+        rows = self.client.get(f"/passwords/{self.user_id}").get_json()
+        self.assertEqual(len(rows), 4)
+
+    def test_hot_statements_are_reused(self):
+        stmts = self.app_module.STATEMENTS
+        self.client.get(f"/passwords/{self.user_id}")
+        first = stmts.get("passwords.rows_by_user")
+        before = stmts.stats()["hits"]
+
+        self.client.get(f"/passwords/{self.user_id}")
+
+        self.assertIs(stmts.get("passwords.rows_by_user"), first)
+        self.assertGreaterEqual(stmts.stats()["hits"], before + 2)
+        self.assertIn("statement_cache", self.client.get("/health").get_json())
+
+    def test_statement_counters_are_exact_under_threads(self):
+        import threading
+        from database.queries import StatementRegistry
+
+        reg = StatementRegistry()
+        reg.register("one", lambda: object())
+
+        def _hammer():
+            for _ in range(2000):
+                reg.get("one")
+
+        threads = [threading.Thread(target=_hammer) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual((reg.stats()["hits"], reg.stats()["misses"]), (8 * 2000 - 1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
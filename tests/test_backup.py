@@ -0,0 +1,72 @@
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from database.backup import backup_sqlite, list_snapshots
+
+
+class OnlineBackupTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_backup_")
+        self.src = os.path.join(self.tmp, "source.db")
+        self.dest = os.path.join(self.tmp, "snapshots")
+        conn = sqlite3.connect(self.src)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, blob BLOB)")
+        conn.executemany("INSERT INTO t (blob) VALUES (?)", [(os.urandom(800),) for _ in range(3000)])
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_backup_completes_while_writers_commit(self):
+        stop = threading.Event()
+        writes = []
+
+        def writer():
+            w = sqlite3.connect(self.src, timeout=5)
+            while not stop.is_set():
+                w.execute("INSERT INTO t (blob) VALUES (?)", (b"x" * 50,))
+                w.commit()
+                writes.append(1)
+                time.sleep(0.001)
+            w.close()
+
+        th = threading.Thread(target=writer)
+        th.start()
+        try:
+            report = backup_sqlite(self.dest, source_path=self.src, pages_per_step=50,
+                                   step_sleep=0.002, compress=False, keep=0)
+        finally:
+            stop.set()
+            th.join()
+
+        self.assertEqual(report["integrity"], "ok")
+        self.assertGreater(report["steps"], 1)
+        self.assertGreater(len(writes), 0)
+        conn = sqlite3.connect(report["path"])
+        try:
+            self.assertGreaterEqual(conn.execute("SELECT count(*) FROM t").fetchone()[0], 3000)
+        finally:
+            conn.close()
+
+    def test_compressed_snapshots_and_retention(self):
+        for _ in range(3):
+            report = backup_sqlite(self.dest, source_path=self.src, step_sleep=0, keep=2)
+
+        snaps = list_snapshots(self.dest)
+        self.assertEqual(len(snaps), 2)
+        self.assertTrue(report["path"].endswith(".db.gz"))
+        self.assertEqual(len(report["pruned"]), 1)
+        with gzip.open(report["path"], "rb") as f:
+            self.assertEqual(f.read(16), b"SQLite format 3\x00")
+
+
+if __name__ == "__main__":
+    unittest.main()
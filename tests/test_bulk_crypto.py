@@ -0,0 +1,58 @@
+import os
+import unittest
+
+from src.security.bulk import decrypt_many, encrypt_many, token_format
+from src.security.crypto import decrypt_secret, encrypt_secret
+from src.security.encryption import decrypt_any, encrypt_aes_gcm, encrypt_for_storage
+
+
+class BulkCryptoTests(unittest.TestCase):
+    def setUp(self):
+        self.key = os.urandom(32)
+
+    def test_mixed_formats_decrypt_in_input_order(self):
+        plain = [f"pw-{i}" for i in range(50)]
+        makers = (encrypt_for_storage, encrypt_aes_gcm, lambda p: "zk1:" + encrypt_secret(p, self.key))
+        tokens = [makers[i % 3](p) for i, p in enumerate(plain)]
+        for workers in (1, 4):
+            out = decrypt_many(tokens, zk_key=self.key, workers=workers, chunk_size=7)
+            self.assertEqual(list(out), plain)
+
+    def test_encrypt_many_matches_the_single_token_readers(self):
+        plain = ["a", "é", ""]
+        self.assertEqual([decrypt_any(t) for t in encrypt_many(plain, "fernet")], plain)
+        self.assertEqual([decrypt_any(t) for t in encrypt_many(plain, "gcm1", workers=2, chunk_size=1)], plain)
+        zk = list(encrypt_many(plain, "zk1", zk_key=memoryview(self.key)))
+        self.assertEqual([token_format(t) for t in zk], ["zk1"] * 3)
+        self.assertEqual([decrypt_secret(t, self.key) for t in zk], plain)
+        with self.assertRaises(ValueError):
+            list(encrypt_many(plain, "zk1"))
+
+    def test_bad_tokens_raise_or_yield_none(self):
+        tokens = [encrypt_for_storage("ok"), "gcm1:AAAA", "plain", encrypt_aes_gcm("ok2")]
+        self.assertEqual(list(decrypt_many(tokens, errors="none")), ["ok", None, None, "ok2"])
+        with self.assertRaises(ValueError):
+            list(decrypt_many(tokens))
+        # the reported position is in the whole input, not in the chunk
+        for workers in (1, 2):
+            with self.assertRaisesRegex(ValueError, "at item 1:"):
+                list(decrypt_many(tokens, workers=workers, chunk_size=1))
+            with self.assertRaisesRegex(ValueError, "at item 5:"):
+                list(decrypt_many([encrypt_for_storage("ok")] * 5 + ["gcm1:AAAA"], workers=workers, chunk_size=2))
+
+    def test_results_stream_lazily(self):
+        produced = []
+
+        def source():
+            for i in range(10000):
+                produced.append(i)
+                yield encrypt_aes_gcm("x") if i < 5 else "gcm1:"
+
+        gen = decrypt_many(source(), workers=2, chunk_size=100, errors="none")
+        self.assertEqual(next(gen), "x")
+        self.assertLess(len(produced), 1000)  # only a few chunks read ahead
+        gen.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class PackedCiphertextTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_ciphertext_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "vault.db").replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+        self.repo = self.app_module.passwords
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="bin", email="bin@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _tokens(self, zk_key, data_key):
+        from src.security.crypto import encrypt_secret
+        from src.security.encryption import encrypt_aes_gcm, encrypt_for_storage
+        from src.security.envelope import encrypt_entry
+
+        return [
+            encrypt_for_storage("fernet-pw"),
+            encrypt_aes_gcm("gcm-pw"),
+            "zk1:" + encrypt_secret("zk-pw", zk_key),
+            encrypt_entry("ek-pw", data_key, 2),
+        ]
+
+    def test_pack_round_trips_and_is_smaller(self):
+        from src.security.ciphertext import open_blob, pack, unpack
+
+        for token in self._tokens(os.urandom(32), os.urandom(32)):
+            blob = pack(token)
+            self.assertEqual(unpack(blob), token)
+            self.assertLess(len(blob), len(token) * 0.8)
+        self.assertEqual(open_blob(pack(self._tokens(os.urandom(32), os.urandom(32))[3])).key_version, 2)
+        # anything else is kept verbatim
+        for opaque in ("legacy-plain", "gcm1:broken", ""):
+            self.assertEqual(unpack(pack(opaque)), opaque)
+
+    def _storage_class(self, pid):
+        from sqlalchemy import text
+
+        local_id = self.engine_module.decode_row_id(pid)[1]
+        with self.engine_module.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT typeof(encrypted_password) FROM passwords WHERE id = :id"), {"id": local_id}
+            ).scalar()
+
+    def test_column_is_binary_and_text_rows_are_backfilled(self):
+        from sqlalchemy import text
+
+        token = self._tokens(os.urandom(32), os.urandom(32))[0]
+        pid = self.repo.add(self.uid, {"site_name": "a", "username": "u", "encrypted_password": token})
+        self.assertEqual(self._storage_class(pid), "blob")
+        self.assertEqual(self.repo.get(pid)["encrypted_password"], token)
+
+        # a row written before the column went binary
+        with self.engine_module.engine.begin() as conn:
+            conn.execute(text(
+                "INSERT INTO passwords (user_id, site_name, username, encrypted_password, category, strength, "
+                "favorite, last_updated) VALUES (:uid, 'old', 'u', :tok, 'personal', 'medium', 0, '2020-01-01 00:00:00')"
+            ), {"uid": self.uid, "tok": token})
+            legacy = conn.execute(text("SELECT max(id) FROM passwords")).scalar()
+        self.assertEqual(self._storage_class(legacy), "text")
+        self.assertEqual(self.repo.get(legacy)["encrypted_password"], token)
+
+        self.assertEqual(self.engine_module.pack_text_ciphertexts(self.engine_module.engine, batch_size=1), 1)
+        self.assertEqual(self._storage_class(legacy), "blob")
+        rec = self.repo.get(legacy)
+        self.assertEqual(rec["encrypted_password"], token)
+        self.assertEqual(rec["last_updated"].year, 2020)
+
+    def test_bulk_decrypts_stored_blobs_in_place(self):
+        from src.security.bulk import decrypt_many
+
+        zk_key, data_key = os.urandom(32), os.urandom(32)
+        for i, tok in enumerate(self._tokens(zk_key, data_key)):
+            self.repo.add(self.uid, {"site_name": f"s{i}", "username": "u", "encrypted_password": tok})
+        page = self.repo.secrets_page(self.uid, 0, 10, raw=True)
+        self.assertTrue(all(isinstance(blob, bytes) for _, blob in page))
+        plains = decrypt_many((memoryview(blob) for _, blob in page), zk_key=zk_key,
+                              data_keys={2: data_key}, workers=2, chunk_size=2)
+        self.assertEqual(list(plains), ["fernet-pw", "gcm-pw", "zk-pw", "ek-pw"])
+
+        # compare-and-swap accepts the stored form
+        pid, blob = page[0]
+        self.assertEqual(self.repo.swap_secrets(self.uid, [(pid, blob, "gAAAA-new")]), 1)
+        self.assertEqual(self.repo.get(pid)["encrypted_password"], "gAAAA-new")
+
+    def test_reveal_over_a_binary_transport(self):
+        from src.security.ciphertext import unpack
+
+        token = self._tokens(os.urandom(32), os.urandom(32))[1]
+        pid = self.repo.add(self.uid, {"site_name": "a", "username": "u", "encrypted_password": token})
+        self.assertEqual(self.client.get(f"/passwords/{pid}/reveal").get_json()["encrypted_password"], token)
+        r = self.client.get(f"/passwords/{pid}/reveal", headers={"Accept": "application/octet-stream"})
+        self.assertEqual(r.mimetype, "application/octet-stream")
+        self.assertEqual(unpack(r.data), token)
+
+
+if __name__ == "__main__":
+    unittest.main()
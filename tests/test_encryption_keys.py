@@ -0,0 +1,72 @@
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+
+class LazyKeyTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_keys_")
+        self.env = mock.patch.dict(os.environ, {"PG_KEY_CACHE": "off"})
+        self.env.start()
+        self.calls = []
+        real = hashlib.pbkdf2_hmac
+
+        def counting(*args, **kwargs):
+            self.calls.append(args[3])
+            return real(*args, **kwargs)
+
+        self.pbkdf2 = mock.patch("hashlib.pbkdf2_hmac", side_effect=counting)
+        self.pbkdf2.start()
+        import src.security.encryption as enc
+        self.enc = importlib.reload(enc)
+
+    def tearDown(self):
+        self.pbkdf2.stop()
+        self.env.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_import_derives_nothing_and_first_use_derives_once(self):
+        self.assertEqual(self.calls, [])
+        barrier = threading.Barrier(8)
+        tokens = []
+
+        def worker():
+            barrier.wait()
+            tokens.append(self.enc.encrypt_for_storage("secret"))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.calls, [100000])
+        self.assertEqual({self.enc.decrypt_any(t) for t in tokens}, {"secret"})
+        self.assertEqual(self.enc.decrypt_any(self.enc.encrypt_aes_gcm("old")), "old")
+        self.assertEqual(self.calls, [100000, 200000])
+        self.assertIs(self.enc.FERNET, self.enc.get_fernet())
+
+    def test_file_cache_skips_derivation_in_next_process(self):
+        path = os.path.join(self.tmp, "keys.json")
+        os.environ.update(PG_KEY_CACHE="file", PG_KEY_CACHE_FILE=path)
+        token = self.enc.encrypt_for_storage("secret")
+        self.assertEqual(len(self.calls), 1)
+        if os.name != "nt":
+            self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+        self.enc.clear_key_cache()  # a new process: nothing in memory
+        self.assertEqual(self.enc.decrypt_any(token), "secret")
+        self.assertEqual(len(self.calls), 1)
+
+        self.enc.clear_key_cache(persisted=True)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.enc.decrypt_any(token), "secret")
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class EnvelopeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_envelope_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "vault.db").replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.app as app_module
+        from src.security import envelope
+        from src.security.crypto import KdfParams
+        from src.security.key_session import VaultKeySession
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+        self.env = envelope
+        self.params = KdfParams(time_cost=1, memory_cost_kib=8192, parallelism=1)
+        self.session = VaultKeySession(ttl_seconds=60)
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="env", email="env@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.session.forget()
+        self.engine_module.engine.dispose()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _key_rows(self):
+        from sqlalchemy import select
+
+        with self.engine_module.user_session(self.uid) as db:
+            return [
+                (r.version, r.wrapped_key, r.kek_salt)
+                for r in db.execute(select(self.models.VaultKey).order_by(self.models.VaultKey.version)).scalars()
+            ]
+
+    def test_first_unlock_creates_version_one_and_entries_round_trip(self):
+        self.assertEqual(self.env.unlock_data_keys(self.uid, "master-pass-1", self.session, self.params), 1)
+        self.assertEqual(len(self._key_rows()), 1)
+        keys = self.env.session_keys(self.session)
+        token = self.env.encrypt_entry("hunter2", keys[1], 1)
+        self.assertTrue(token.startswith("ek1:1:"))
+        self.assertEqual(self.env.entry_key_version(token), 1)
+        self.assertEqual(self.env.decrypt_entry(token, keys), "hunter2")
+
+        # a fresh session unlocks the same key from the stored row
+        from src.security.key_session import VaultKeySession
+        other = VaultKeySession(ttl_seconds=60)
+        self.assertEqual(self.env.unlock_data_keys(self.uid, "master-pass-1", other), 1)
+        self.assertEqual(self.env.decrypt_entry(token, self.env.session_keys(other)), "hunter2")
+        with self.assertRaises(self.env.EnvelopeError):
+            self.env.unlock_data_keys(self.uid, "wrong-password", VaultKeySession(ttl_seconds=60))
+
+    def test_master_password_change_rewraps_keys_only(self):
+        from src.security.key_session import VaultKeySession
+
+        self.env.unlock_data_keys(self.uid, "old-password", self.session, self.params)
+        token = self.env.encrypt_entry("secret", self.env.session_keys(self.session)[1], 1)
+        before = self._key_rows()
+
+        self.assertEqual(self.env.rewrap_data_keys(self.uid, "old-password", "new-password", params=self.params), 1)
+        after = self._key_rows()
+        self.assertNotEqual(before[0][1:], after[0][1:])
+
+        with self.assertRaises(self.env.EnvelopeError):
+            self.env.unlock_data_keys(self.uid, "old-password", VaultKeySession(ttl_seconds=60))
+        fresh = VaultKeySession(ttl_seconds=60)
+        self.env.unlock_data_keys(self.uid, "new-password", fresh)
+        self.assertEqual(self.env.decrypt_entry(token, self.env.session_keys(fresh)), "secret")
+
+    def test_rotation_and_lazy_reencryption(self):
+        self.env.unlock_data_keys(self.uid, "master-pass-1", self.session, self.params)
+        old = self.env.encrypt_entry("pw", self.env.session_keys(self.session)[1], 1)
+
+        self.assertEqual(self.env.rotate_data_key(self.uid, "master-pass-1", self.session), 2)
+        keys = self.env.session_keys(self.session)
+        self.assertEqual(sorted(keys), [1, 2])
+        self.assertEqual(self.env.current_version(self.session), 2)
+
+        moved = self.env.reencrypt_if_stale(old, keys, 2)
+        self.assertEqual(self.env.entry_key_version(moved), 2)
+        self.assertEqual(self.env.decrypt_entry(moved, keys), "pw")
+        self.assertIsNone(self.env.reencrypt_if_stale(moved, keys, 2))
+        self.assertIsNone(self.env.reencrypt_if_stale("gAAAA-not-envelope", keys, 2))
+
+        self.session.forget()
+        with self.assertRaises(self.env.EnvelopeError):
+            self.env.decrypt_entry(moved, self.env.session_keys(self.session))
+
+    def test_backend_tracks_key_versions(self):
+        self.env.unlock_data_keys(self.uid, "master-pass-1", self.session, self.params)
+        keys = self.env.session_keys(self.session)
+        for tok in (self.env.encrypt_entry("a", keys[1], 1), self.env.encrypt_entry("b", keys[1], 1), "gAAAA-x"):
+            r = self.client.post("/passwords", json={
+                "user_id": self.uid, "site_name": "s", "username": "u", "encrypted_password": tok,
+            })
+            self.assertIn(r.status_code, (200, 201))
+        versions = self.client.get(f"/vault/{self.uid}/key-versions").get_json()["versions"]
+        self.assertEqual(versions, [{"version": None, "entries": 1}, {"version": 1, "entries": 2}])
+
+    def test_account_password_changes_keep_the_keys_usable(self):
+        from datetime import datetime, timedelta
+        from sqlalchemy import update
+        import src.auth.auth_manager as auth_module
+        from src.security.key_session import VaultKeySession
+
+        saved = os.environ.get("PG_PBKDF2_ITERATIONS")
+        os.environ["PG_PBKDF2_ITERATIONS"] = "1000"
+
+        def restore():
+            if saved is None:
+                os.environ.pop("PG_PBKDF2_ITERATIONS", None)
+            else:
+                os.environ["PG_PBKDF2_ITERATIONS"] = saved
+
+        self.addCleanup(restore)
+        auth_manager = importlib.reload(auth_module)
+        auth = auth_manager.AuthManager(passwords=self.app_module.passwords)
+        email = "env@example.com"
+
+        def set_hash(password):
+            pw_hash, salt = auth_manager.hash_password(password)
+            with self.engine_module.SessionLocal() as s:
+                s.execute(update(self.models.User).where(self.models.User.id == self.uid)
+                          .values(password_hash=pw_hash, salt=salt))
+                s.commit()
+
+        def password_is(password):
+            u = auth._user_by_email(email)
+            return auth_manager.verify_password(u["password_hash"], u["salt"], password)
+
+        set_hash("first-password")
+        self.env.unlock_data_keys(self.uid, "first-password", self.session, self.params)
+        token = self.env.encrypt_entry("secret", self.env.session_keys(self.session)[1], 1)
+        self.client.post("/passwords", json={
+            "user_id": self.uid, "site_name": "s", "username": "u", "encrypted_password": token,
+        })
+
+        self.assertTrue(auth.change_master_password(email, "first-password", "second-password"))
+        self.assertTrue(password_is("second-password"))
+        self.env.unlock_data_keys(self.uid, "second-password", VaultKeySession(ttl_seconds=60))
+
+        # keys that no longer open: the change fails and the hash is kept
+        self.env.rewrap_data_keys(self.uid, "second-password", "elsewhere", params=self.params)
+        self.assertFalse(auth.change_master_password(email, "second-password", "third-password"))
+        self.assertTrue(password_is("second-password"))
+
+        # a reset by code would strand the ek1 entry: refused until confirmed
+        auth.pending_reset[email] = {"code": "123456", "expires": datetime.utcnow() + timedelta(minutes=5)}
+        self.assertEqual(auth.entries_lost_on_reset(email), 1)
+        self.assertFalse(auth.update_password_with_code(email, "123456", "fourth-password"))
+        self.assertTrue(password_is("second-password"))
+
+        self.assertTrue(auth.update_password_with_code(
+            email, "123456", "fourth-password", discard_locked_entries=True
+        ))
+        self.assertTrue(password_is("fourth-password"))
+        self.assertEqual((self._key_rows(), auth.entries_lost_on_reset(email)), ([], 0))
+        self.assertEqual(self.client.get(f"/passwords/{self.uid}").get_json(), [])
+        self.assertEqual(self.env.unlock_data_keys(self.uid, "fourth-password", VaultKeySession(ttl_seconds=60)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
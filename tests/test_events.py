@@ -0,0 +1,192 @@
+import importlib
+import json
+import os
+import tempfile
+import unittest
+
+
+class ChangeEventTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_events_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+        os.environ["SSE_HEARTBEAT_SECONDS"] = "0.05"
+        os.environ["SSE_MAX_STREAM_SECONDS"] = "0.2"
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.events as events_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.events = importlib.reload(events_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="sse", email="sse@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        os.environ.pop("SSE_HEARTBEAT_SECONDS", None)
+        os.environ.pop("SSE_MAX_STREAM_SECONDS", None)
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _add(self, name, client_id="other"):
+        r = self.client.post("/passwords", headers={"X-Client-Id": client_id}, json={
+            "user_id": self.uid, "site_name": name, "username": "me",
+            "encrypted_password": "tok", "strength": "weak",
+        })
+        return r.get_json()["id"]
+
+    def _read(self, last_event_id=None):
+        from src.backend.api_client import iter_sse
+
+        headers = {"Last-Event-ID": last_event_id} if last_event_id else {}
+        body = self.client.get(f"/events/{self.uid}", headers=headers).get_data(as_text=True)
+        return list(iter_sse(body.split("\n"))), body
+
+    def test_bus_resumes_and_resets(self):
+        bus = self.events.ChangeBus(replay_size=3)
+        first = bus.publish(1, 10, "add")
+        for i in range(2):
+            bus.publish(1, 11 + i, "update")
+        ok, missed = bus.since(1, bus.event_id(first))
+        self.assertTrue(ok)
+        self.assertEqual([e["version"] for e in missed], [2, 3])
+
+        bus.publish(1, 13, "delete")  # version 1 falls out of the buffer
+        self.assertEqual(bus.since(1, bus.event_id(first))[0], True)  # 2..4 still buffered
+        self.assertEqual(bus.since(1, f"{bus.boot}-0"), (False, []))
+        self.assertEqual(bus.since(1, "otherboot-3"), (False, []))
+        self.assertEqual(bus.since(2, None), (False, []))
+
+    def test_stream_replays_after_last_event_id(self):
+        a = self._add("a")
+        b = self._add("b", client_id="gui-1")
+        self.client.delete(f"/passwords/{a}")
+
+        events, body = self._read()
+        self.assertTrue(body.startswith("retry: 3000"))
+        self.assertIn(": ping", body)
+        self.assertEqual(events, [])  # a fresh subscriber only gets new changes
+
+        first = f"{self.app_module.change_bus.boot}-1"
+        events, _ = self._read(first)
+        self.assertEqual(
+            [json.loads(e["data"]) for e in events],
+            [{"id": b, "op": "add", "version": 2, "src": "gui-1"}, {"id": a, "op": "delete", "version": 3}],
+        )
+        self.assertEqual(events[-1]["id"], f"{self.app_module.change_bus.boot}-3")
+
+        events, _ = self._read("stale-7")
+        self.assertEqual([e["event"] for e in events], ["reset"])
+
+    def test_job_and_repository_changes_are_published_once(self):
+        from datetime import datetime
+        from backend_api.maintenance import RetentionPolicy, sweep_expired
+        from backend_api.purge import request_account_purge, run_pending_purges
+
+        repo = self.app_module.passwords
+        bus = self.app_module.change_bus
+        a, b = self._add("a"), self._add("b")
+        self.client.put(f"/passwords/{a}", headers={"X-Client-Id": "gui-1"}, json={"username": "new"})
+        self.assertEqual(repo.swap_secrets(self.uid, [(a, "tok", "gAAAA-new")]), 1)  # re-encryption
+        repo.update(b, {"trashed_at": datetime(2000, 1, 1)}, op="trash")
+        sweep_expired(RetentionPolicy(batch_pause_seconds=0), passwords=repo)
+        repo.add(self.uid, {"site_name": "c", "username": "u", "encrypted_password": "tok"})
+        request_account_purge(self.uid)
+        run_pending_purges(pause_seconds=0, passwords=repo)
+
+        ok, events = bus.since(self.uid, f"{bus.boot}-2")
+        self.assertTrue(ok)
+        self.assertEqual([(e["id"], e["op"], e.get("src")) for e in events], [
+            (a, "update", "gui-1"),
+            (a, "update", None),
+            (b, "trash", None),
+            (None, "delete", None),
+            (events[4]["id"], "add", None),
+            (None, "purge", None),
+        ])
+
+    def test_entry_endpoint_matches_list_format(self):
+        pid = self._add("Gmail")
+        listed = self.client.get(f"/passwords/{self.uid}").get_json()
+        entry = self.client.get(f"/passwords/{pid}/entry").get_json()["entry"]
+        self.assertEqual(entry, listed[0])
+        self.assertEqual(self.client.get("/passwords/999999/entry").status_code, 404)
+
+    def test_iter_sse_parsing(self):
+        from src.backend.api_client import iter_sse
+
+        lines = ["retry: 3000", "", ": ping", "", "id: x-1", "event: change", "data: {\"a\":", "data: 1}", ""]
+        self.assertEqual(list(iter_sse(lines)), [{"id": "x-1", "event": "change", "data": "{\"a\":\n1}"}])
+
+    def test_listeners_keep_their_own_connection(self):
+        import threading
+        from unittest import mock
+        from src.backend import api_client
+
+        opened = []
+
+        class _Response:
+            def __init__(self):
+                self.closed = threading.Event()
+                opened.append(self)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.closed.set()
+
+            def raise_for_status(self):
+                pass
+
+            def iter_lines(self, decode_unicode=True):
+                self.closed.wait(5)
+                return iter(())
+
+            def close(self):
+                self.closed.set()
+
+        class _Http:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            def get(self, *args, **kwargs):
+                return _Response()
+
+        client = api_client.APIClient()
+        with mock.patch.object(api_client.requests, "Session", _Http):
+            client.start_event_listener(1, lambda evt: None)
+            first = client._listener
+            first.thread.join(0.2)
+            client.start_event_listener(1, lambda evt: None)
+            second = client._listener
+            first.thread.join(2)
+            self.assertFalse(first.thread.is_alive())
+            self.assertTrue(opened[0].closed.is_set())
+            self.assertTrue(second.thread.is_alive())
+            self.assertFalse(opened[-1].closed.is_set())
+            client.stop_event_listener()
+            second.thread.join(2)
+            self.assertFalse(second.thread.is_alive())
+            self.assertTrue(all(r.closed.is_set() for r in opened))
+
+
+if __name__ == "__main__":
+    unittest.main()
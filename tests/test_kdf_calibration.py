@@ -0,0 +1,103 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def _cost(per_kib_pass):
+    """Fake benchmark: milliseconds proportional to memory x passes."""
+    calls = []
+
+    def measure(params):
+        calls.append(params)
+        return params.memory_cost_kib * params.time_cost * per_kib_pass
+
+    measure.calls = calls
+    return measure
+
+
+class KdfCalibrationTests(unittest.TestCase):
+    def setUp(self):
+        from src.security import kdf_calibration
+
+        self.cal = kdf_calibration
+        self.tmp = tempfile.mkdtemp(prefix="pg_kdf_")
+        self._saved = {k: os.environ.get(k) for k in ("PG_KDF_PROFILE", "PG_KDF_AUTOCALIBRATE")}
+        os.environ["PG_KDF_PROFILE"] = os.path.join(self.tmp, "kdf.json")
+        os.environ.pop("PG_KDF_AUTOCALIBRATE", None)
+        self.cal.clear_cache()
+
+    def tearDown(self):
+        for k, v in self._saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        self.cal.clear_cache()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_picks_strongest_parameters_within_target_and_budget(self):
+        # fast host: memory grows to the budget, passes fill the target
+        fast = self.cal.calibrate(target_ms=500, max_memory_kib=256 * 1024, parallelism=2, measure=_cost(1 / 4096))
+        self.assertEqual(fast.params.memory_cost_kib, 256 * 1024)
+        self.assertEqual(fast.params.time_cost, 7)
+        self.assertEqual(fast.params.parallelism, 2)
+        self.assertLessEqual(fast.measured_ms, 500)
+
+        capped = self.cal.calibrate(target_ms=500, max_memory_kib=64 * 1024, parallelism=1, measure=_cost(1 / 4096))
+        self.assertEqual(capped.params.memory_cost_kib, 64 * 1024)
+        self.assertEqual(capped.params.time_cost, self.cal.MAX_TIME_COST)
+
+        # slow host: stays on the smallest step with the two passes it requires
+        slow = self.cal.calibrate(target_ms=500, max_memory_kib=256 * 1024, parallelism=1, measure=_cost(1 / 100))
+        self.assertEqual(slow.params.memory_cost_kib, self.cal.FLOOR_MEMORY_KIB)
+        self.assertEqual(slow.params.time_cost, 2)
+
+        # too slow for any target: the floor still applies
+        floor = self.cal.calibrate(target_ms=50, max_memory_kib=256 * 1024, parallelism=1, measure=_cost(1 / 10))
+        self.assertEqual((floor.params.memory_cost_kib, floor.params.time_cost), (self.cal.FLOOR_MEMORY_KIB, 2))
+        self.assertGreater(floor.measured_ms, 50)
+
+    def test_profile_round_trip_feeds_new_keys(self):
+        from src.security.crypto import KdfParams
+
+        self.assertEqual(self.cal.calibrated_params(), KdfParams())
+        result = self.cal.calibrate(target_ms=200, max_memory_kib=8 * 1024, parallelism=1, measure=_cost(1 / 1000))
+        self.assertEqual(result.params.memory_cost_kib, 8 * 1024)
+
+        path = self.cal.save_profile(result)
+        self.assertTrue(path.exists())
+        self.assertEqual(self.cal.load_profile().params, result.params)
+        self.cal.clear_cache()
+        self.assertEqual(self.cal.calibrated_params(), result.params)
+        self.assertEqual(self.cal.kdf_dict()["memory_cost"], 8 * 1024)
+
+        os.environ["PG_KDF_PROFILE"] = "off"
+        self.cal.clear_cache()
+        self.assertEqual(self.cal.calibrated_params(), KdfParams())
+
+    def test_exports_record_the_calibrated_parameters(self):
+        from src.security.crypto import KdfParams
+        from src.security.encryption import decrypt_vault_payload, encrypt_vault_payload
+        from src.security.pgvault import open_pgvault, write_pgvault
+
+        params = KdfParams(time_cost=1, memory_cost_kib=8192, parallelism=1)
+        self.cal.save_profile(self.cal.Calibration(params=params, measured_ms=1.0, target_ms=500, max_memory_kib=8192))
+
+        payload = encrypt_vault_payload({"passwords": []}, "passphrase")
+        self.assertEqual(payload["kdf"]["memory_cost"], 8192)
+
+        buf = io.BytesIO()
+        write_pgvault(buf, [{"site_name": "a"}], "passphrase")
+
+        # a host with a different profile still opens both
+        os.environ["PG_KDF_PROFILE"] = "off"
+        self.cal.clear_cache()
+        self.assertEqual(decrypt_vault_payload(payload, "passphrase"), {"passwords": []})
+        buf.seek(0)
+        self.assertEqual(list(open_pgvault(buf, "passphrase")), [{"site_name": "a"}])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import importlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+
+class _Probe:
+    """Callable that records how many calls overlap."""
+
+    def __init__(self, hold=0.05):
+        self.hold = hold
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.hold)
+        with self.lock:
+            self.active -= 1
+        return "done"
+
+
+class KdfServiceTests(unittest.TestCase):
+    def setUp(self):
+        from src.security.kdf_service import KdfService
+
+        self.service = KdfService(workers=4, memory_budget_kib=100, timeout_seconds=5)
+
+    def tearDown(self):
+        self.service.shutdown()
+
+    def _burst(self, n, **kw):
+        probe = _Probe()
+        threads = [threading.Thread(target=self.service.run, args=("probe", probe), kwargs=kw) for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return probe
+
+    def test_pool_and_memory_budget_bound_concurrency(self):
+        self.assertLessEqual(self._burst(8).peak, 4)
+        self.assertEqual(self._burst(4, memory_kib=60).peak, 1)
+        # above the budget: runs, alone
+        self.assertEqual(self.service.run("probe", _Probe(0), memory_kib=10_000), "done")
+
+        stats = self.service.stats()
+        self.assertEqual(stats["probe"]["calls"], 13)
+        self.assertGreater(stats["probe"]["queue_ms_max"], 0)
+        self.assertEqual((stats["in_flight"], stats["memory_in_use_kib"]), (0, 0))
+
+    def test_jobs_that_cannot_start_in_time_are_dropped(self):
+        from src.security.kdf_service import KdfService, KdfTimeout
+
+        service = KdfService(workers=1, memory_budget_kib=100, timeout_seconds=5)
+        gate = threading.Event()
+        ran = []
+        blocker = threading.Thread(target=service.run, args=("slow", gate.wait))
+        blocker.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(KdfTimeout):
+                service.run("fast", lambda: ran.append(1), timeout=0.05)
+        finally:
+            gate.set()
+            blocker.join()
+        service.shutdown()
+        self.assertEqual(ran, [])
+        stats = service.stats()
+        self.assertEqual(stats["fast"]["timeouts"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+        # waiting for memory counts against the timeout too
+        self.service._reserve(100, time.monotonic())
+        with self.assertRaises(KdfTimeout):
+            self.service.run("mem", lambda: None, memory_kib=10, timeout=0.05)
+        self.service._release(100)
+
+    def test_nested_derivation_runs_inline(self):
+        from src.security.kdf_service import KdfService
+
+        service = KdfService(workers=1, memory_budget_kib=100, timeout_seconds=2)
+        inner = lambda: service.run("inner", lambda: "inner-done", memory_kib=100)
+        self.assertEqual(service.run("outer", inner, memory_kib=100), "inner-done")
+        service.shutdown()
+
+
+class KdfRoutingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_kdf_service_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "vault.db").replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.app_module = importlib.reload(app_module)
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_password_and_vault_kdfs_go_through_the_service(self):
+        from src.auth.auth_manager import hash_password, verify_password
+        from src.security.crypto import KdfParams, derive_vault_key, new_salt
+        from src.security.encryption import _argon2_key
+        from src.security.kdf_service import KDF
+
+        def calls(kind):
+            return KDF.stats().get(kind, {}).get("calls", 0)
+
+        pbkdf2, argon = calls("pbkdf2"), calls("argon2id")
+        stored, salt = hash_password("correct horse")
+        self.assertTrue(verify_password(stored, salt, "correct horse"))
+        self.assertFalse(verify_password(stored, salt, "wrong"))
+        self.assertEqual(calls("pbkdf2"), pbkdf2 + 3)
+
+        params = KdfParams(time_cost=1, memory_cost_kib=8192, parallelism=1)
+        salt = new_salt()
+        key = derive_vault_key("master", salt, params)
+        self.assertEqual(len(key), 32)
+        self.assertEqual(derive_vault_key("master", salt, params), key)
+        _argon2_key("passphrase", os.urandom(16), 1, 8192, 1, 32)
+        self.assertEqual(calls("argon2id"), argon + 3)
+
+        health = self.app_module.app.test_client().get("/health").get_json()
+        self.assertIn("argon2id", health["kdf"])
+        self.assertIn("queue_ms_avg", health["kdf"]["pbkdf2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
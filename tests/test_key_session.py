@@ -0,0 +1,93 @@
+import unittest
+
+from src.security.crypto import KdfParams
+from src.security.key_session import VaultKeySession
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class VaultKeySessionTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.session = VaultKeySession(ttl_seconds=60, clock=self.clock)
+        self.calls = []
+
+    def tearDown(self):
+        self.session.forget()
+
+    def _kdf(self, secret, salt, params):
+        self.calls.append((secret, salt))
+        return bytes([len(self.calls)]) * 32
+
+    def test_repeated_derive_runs_the_kdf_once(self):
+        key = self.session.derive("master", "c2FsdA", kdf=self._kdf)
+        again = self.session.derive("master", "c2FsdA", kdf=self._kdf)
+        self.assertEqual(bytes(key), bytes(again))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(bytes(self.session.get()), bytes(key))
+
+        # another secret, salt or parameter set is a new derivation
+        self.session.derive("other", "c2FsdA", kdf=self._kdf)
+        self.session.derive("other", "c2FsdA", KdfParams(time_cost=4), kdf=self._kdf)
+        self.assertEqual(len(self.calls), 3)
+
+    def test_forget_zeroizes_views_already_handed_out(self):
+        key = self.session.derive("master", "c2FsdA", kdf=self._kdf)
+        self.session.forget()
+        self.assertEqual(bytes(key), bytes(32))
+        self.assertIsNone(self.session.get())
+        self.assertFalse(self.session.unlocked)
+        with self.assertRaises(TypeError):
+            key[0] = 1  # read-only view
+
+    def test_ttl_slides_with_activity_and_expires(self):
+        key = self.session.derive("master", "c2FsdA", kdf=self._kdf)
+        self.clock.now += 50
+        self.session.touch()
+        self.clock.now += 50
+        self.assertIsNotNone(self.session.get())
+        self.clock.now += 61
+        self.assertIsNone(self.session.get())
+        self.assertEqual(bytes(key), bytes(32))
+
+    def test_vault_import_reuses_the_export_key_of_its_file(self):
+        from src.security.encryption import decrypt_vault_payload, encrypt_vault_payload
+
+        vault = {"passwords": [{"site_name": "a"}]}
+        first = encrypt_vault_payload(vault, "pass", key_session=self.session)
+        second = encrypt_vault_payload(vault, "pass", key_session=self.session)
+        # every file gets its own salt, hence its own key
+        self.assertNotEqual(first["salt"], second["salt"])
+        self.assertNotEqual(first["nonce"], second["nonce"])
+        self.assertEqual(decrypt_vault_payload(second, "pass", key_session=self.session), vault)
+        self.assertEqual(decrypt_vault_payload(first, "pass", key_session=self.session), vault)
+        self.assertEqual(decrypt_vault_payload(first, "pass"), vault)  # plain Argon2id path
+        self.assertEqual((self.session.derivations, self.session.hits), (2, 2))
+
+    def test_pgvault_files_do_not_share_a_salt(self):
+        import io
+        import json
+        from src.security.pgvault import _LEN, MAGIC, open_pgvault, write_pgvault
+
+        kdf = {"name": "argon2id", "time_cost": 1, "memory_cost": 8192, "parallelism": 1, "hash_len": 32}
+        salts = []
+        for _ in range(2):
+            buf = io.BytesIO()
+            write_pgvault(buf, [{"site_name": "a"}], "pass", key_session=self.session, kdf=kdf)
+            (size,) = _LEN.unpack_from(buf.getvalue(), len(MAGIC))
+            header = buf.getvalue()[len(MAGIC) + _LEN.size:len(MAGIC) + _LEN.size + size]
+            salts.append(json.loads(header)["salt"])
+            buf.seek(0)
+            self.assertEqual(list(open_pgvault(buf, "pass", key_session=self.session)), [{"site_name": "a"}])
+        self.assertNotEqual(salts[0], salts[1])
+        self.assertEqual((self.session.derivations, self.session.hits), (2, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
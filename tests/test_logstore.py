@@ -0,0 +1,235 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from database.logstore import LogStore, LogStoreError
+
+
+class LogStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_logstore_")
+        self.path = os.path.join(self.tmp, "vault.vlog")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_reopen_uses_index_and_replays_only_the_tail(self):
+        with LogStore(self.path, checkpoint_every=10_000) as store:
+            ids = [store.put(1, {"site_name": f"s{i}"}) for i in range(50)]
+            store.delete(ids[0])
+            store.put(2, {"site_name": "other"})
+        # close() wrote the index: nothing left to replay
+        store = LogStore(self.path)
+        self.assertEqual(store.replayed_frames, 0)
+        store.put(1, {"site_name": "late"})
+        store._fh.close()  # simulate a crash: no checkpoint on close
+
+        store = LogStore(self.path)
+        try:
+            self.assertEqual(store.replayed_frames, 1)
+            self.assertEqual(len(store.records_for_user(1)), 50)
+            self.assertIsNone(store.get(ids[0]))
+            self.assertEqual(store.get(ids[1]), (1, {"site_name": "s1"}))
+            # deleted ids are never handed out again
+            self.assertGreater(store.put(1, {"site_name": "new"}), max(ids) + 1)
+        finally:
+            store.close()
+
+    def test_torn_tail_is_cut_off_and_tampering_is_detected(self):
+        with LogStore(self.path) as store:
+            store.put(1, {"site_name": "kept"})
+        with open(self.path, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x01\x02")  # half-written frame
+
+        with LogStore(self.path) as store:
+            self.assertEqual(store.recovered_bytes, 6)
+            self.assertEqual([r["site_name"] for _rid, r in store.records_for_user(1)], ["kept"])
+
+        os.remove(self.path + ".idx")
+        with self.assertRaises(LogStoreError):
+            LogStore(self.path, key=os.urandom(32))
+
+    def test_compaction_drops_dead_frames(self):
+        store = LogStore(self.path, compact_min_bytes=1 << 30)
+        try:
+            rid = store.put(1, {"v": 0})
+            for i in range(200):
+                store.put(1, {"v": i}, rid=rid)
+            keep = store.put(1, {"v": "keep"})
+            before = store.stats()
+
+            report = store.compact()
+
+            self.assertLess(report["after_bytes"], before["log_bytes"] // 10)
+            self.assertEqual(store.stats()["dead_bytes"], 0)
+            self.assertEqual(store.get(rid), (1, {"v": 199}))
+            store.close()
+            store = LogStore(self.path)
+            self.assertEqual(store.stats()["generation"], before["generation"] + 1)
+            self.assertEqual(store.get(keep), (1, {"v": "keep"}))
+        finally:
+            store.close()
+
+
+class LogRepositoryApiTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_logrepo_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "users.db").replace("\\", "/")
+        os.environ["VAULT_STORE"] = "log"
+        os.environ["VAULT_LOG_PATH"] = os.path.join(self.tmp, "vault.vlog")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+
+    def tearDown(self):
+        self.app_module.passwords.store.close()
+        self.engine_module.engine.dispose()
+        os.environ.pop("VAULT_STORE", None)
+        os.environ.pop("VAULT_LOG_PATH", None)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def test_crud_through_the_log_repository(self):
+        c = self.client
+        pid = c.post("/passwords", json={"user_id": 1, "site_name": "Gmail", "username": "me",
+                                         "encrypted_password": "tok", "strength": "strong"}).get_json()["id"]
+        c.post("/passwords", json={"user_id": 1, "site_name": "Bank", "username": "me",
+                                   "encrypted_password": "tok2", "strength": "weak"})
+
+        self.assertEqual(c.put(f"/passwords/{pid}", json={"username": "new"}).status_code, 200)
+        self.assertEqual(c.post(f"/passwords/{pid}/trash").status_code, 200)
+        self.assertTrue(c.post(f"/passwords/{pid}/favorite").get_json()["favorite"])
+
+        rows = {r["site_name"]: r for r in c.get("/passwords/1").get_json()}
+        self.assertEqual(rows["Gmail"]["username"], "new")
+        self.assertIsNotNone(rows["Gmail"]["trashed_at"])
+        stats = c.get("/stats/1").get_json()
+        self.assertEqual((stats["total"], stats["active"], stats["trashed"]), (2, 1, 1))
+
+        self.assertEqual(c.delete(f"/passwords/{pid}").status_code, 200)
+        self.assertEqual(c.get(f"/passwords/{pid}/reveal").status_code, 404)
+        self.assertEqual([r["site_name"] for r in c.get("/passwords/1").get_json()], ["Bank"])
+
+    def test_concurrent_updates_of_one_entry_keep_both_changes(self):
+        import threading
+        import time
+
+        repo = self.app_module.passwords
+        pid = repo.add(1, {"site_name": "Gmail", "username": "me", "encrypted_password": "tok"})
+        real_get = repo.store.get
+
+        def slow_get(rid):
+            found = real_get(rid)
+            time.sleep(0.05)  # widen the read-modify-write window
+            return found
+
+        repo.store.get = slow_get
+        try:
+            threads = [
+                threading.Thread(target=repo.update, args=(pid, {"username": "new"})),
+                threading.Thread(target=repo.update, args=(pid, {"category": "work"})),
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            repo.store.get = real_get
+        rec = repo.get(pid)
+        self.assertEqual((rec["username"], rec["category"]), ("new", "work"))
+
+    def test_raw_secret_pages_are_packed(self):
+        repo = self.app_module.passwords
+        pid = repo.add(1, {"site_name": "Gmail", "encrypted_password": "gAAAA-old"})
+
+        (rid, blob), = repo.secrets_page(1, 0, 10, raw=True)
+        self.assertEqual((rid, blob), (pid, self.app_module.pack("gAAAA-old")))
+        self.assertEqual(repo.secrets_page(1, 0, 10), [(pid, "gAAAA-old")])
+        # compare-and-swap accepts the packed form, like the SQL store
+        self.assertEqual(repo.swap_secrets(1, [(pid, blob, "gAAAA-new")]), 1)
+        self.assertEqual(repo.get(pid)["encrypted_password"], "gAAAA-new")
+
+    def test_trash_retention_and_account_purge_reach_the_log(self):
+        from datetime import datetime
+        from backend_api.maintenance import RetentionPolicy, sweep_expired
+        from backend_api.purge import request_account_purge, run_pending_purges
+
+        repo = self.app_module.passwords
+        with self.engine_module.SessionLocal() as s:
+            user = self.app_module.User(username="gone", email="gone@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            uid = user.id
+        old = repo.add(uid, {"site_name": "old", "encrypted_password": "t", "trashed_at": datetime(2000, 1, 1)})
+        recent = repo.add(uid, {"site_name": "recent", "encrypted_password": "t", "trashed_at": datetime.utcnow()})
+        kept = repo.add(uid, {"site_name": "kept", "encrypted_password": "t"})
+        other = repo.add(uid + 1, {"site_name": "other", "encrypted_password": "t"})
+
+        totals = sweep_expired(RetentionPolicy(batch_pause_seconds=0), passwords=repo)
+        self.assertEqual(totals["trashed_passwords"], 1)
+        self.assertIsNone(repo.get(old))
+        self.assertIsNotNone(repo.get(recent))
+
+        request_account_purge(uid)
+        self.assertEqual(run_pending_purges(batch_size=1, pause_seconds=0, max_batches_per_run=1,
+                                            passwords=repo)["completed"], 0)
+        self.assertEqual(repo.count(uid), 1)
+        run_pending_purges(pause_seconds=0, passwords=repo)
+        self.assertEqual((repo.count(uid), repo.get(kept)), (0, None))
+        self.assertIsNotNone(repo.get(other))
+
+    def test_reset_by_code_sees_and_discards_entries_in_the_log(self):
+        from datetime import datetime, timedelta
+        from sqlalchemy import func, select
+        import database.models as models
+        import src.auth.auth_manager as auth_module
+        from src.security import envelope
+        from src.security.crypto import KdfParams
+        from src.security.key_session import VaultKeySession
+
+        os.environ["PG_PBKDF2_ITERATIONS"] = "1000"
+        self.addCleanup(os.environ.pop, "PG_PBKDF2_ITERATIONS", None)
+        auth_manager = importlib.reload(auth_module)
+        repo = self.app_module.passwords
+        email = "reset@example.com"
+        pw_hash, salt = auth_manager.hash_password("old-password")
+        with self.engine_module.SessionLocal() as s:
+            user = self.app_module.User(username="reset", email=email, password_hash=pw_hash, salt=salt)
+            s.add(user)
+            s.commit()
+            uid = user.id
+
+        keys = VaultKeySession(ttl_seconds=60)
+        params = KdfParams(time_cost=1, memory_cost_kib=8192, parallelism=1)
+        envelope.unlock_data_keys(uid, "old-password", keys, params)
+        sealed = envelope.encrypt_entry("secret", envelope.session_keys(keys)[1], 1)
+        self.client.post("/passwords", json={"user_id": uid, "site_name": "sealed", "username": "u",
+                                             "encrypted_password": sealed})
+        plain = repo.add(uid, {"site_name": "legacy", "username": "u", "encrypted_password": "gAAAA-x"})
+
+        auth = auth_manager.AuthManager(passwords=repo)
+        auth.pending_reset[email] = {"code": "123456", "expires": datetime.utcnow() + timedelta(minutes=5)}
+        self.assertEqual(auth.entries_lost_on_reset(email), 1)
+        self.assertFalse(auth.update_password_with_code(email, "123456", "new-password"))
+        self.assertEqual(repo.count(uid), 2)
+
+        self.assertTrue(auth.update_password_with_code(email, "123456", "new-password", discard_locked_entries=True))
+        self.assertEqual([r[0] for r in repo.list_rows(uid)], [plain])
+        with self.engine_module.SessionLocal() as s:
+            keys_left = s.execute(
+                select(func.count()).select_from(models.VaultKey).where(models.VaultKey.user_id == uid)
+            ).scalar_one()
+        self.assertEqual(keys_left, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
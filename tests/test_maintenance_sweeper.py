@@ -0,0 +1,115 @@
+import importlib
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+
+class ExpirySweeperTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_sweeper_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import backend_api.maintenance as maintenance_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        self.maintenance = importlib.reload(maintenance_module)
+        self.engine_module.init_db()
+
+        m = self.models
+        self.now = datetime(2026, 6, 1, 12, 0, 0)
+        past, future = self.now - timedelta(days=60), self.now + timedelta(days=1)
+        with self.engine_module.SessionLocal() as s:
+            user = m.User(username="sweep", email="sweep@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.flush()
+            uid = user.id
+            for i in range(5):
+                s.add(m.Session(user_id=uid, session_token=f"old{i}", expires_at=past))
+            s.add(m.Session(user_id=uid, session_token="live", expires_at=future))
+            s.add(m.OTPCode(user_id=uid, code="123456", expires_at=past))
+            s.add(m.TrustedDevice(user_id=uid, device_fingerprint="fp-old", trusted_until=past))
+            s.add(m.TrustedDevice(user_id=uid, device_fingerprint="fp-live", trusted_until=future))
+            s.add(m.RecoveryCode(user_id=uid, code_hash="used", used_at=past))
+            s.add(m.RecoveryCode(user_id=uid, code_hash="unused"))
+            old_trash = m.Password(user_id=uid, site_name="old", username="u",
+                                   encrypted_password="t", trashed_at=past)
+            s.add(old_trash)
+            s.add(m.Password(user_id=uid, site_name="recent", username="u",
+                             encrypted_password="t", trashed_at=self.now - timedelta(days=1)))
+            s.flush()
+            s.add(m.PasswordHistory(password_id=old_trash.id, old_encrypted_password="h"))
+            s.commit()
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _count(self, model) -> int:
+        from sqlalchemy import func, select
+        with self.engine_module.SessionLocal() as s:
+            return s.execute(select(func.count()).select_from(model)).scalar_one()
+
+    def test_sweep_deletes_only_expired_rows_in_batches(self):
+        policy = self.maintenance.RetentionPolicy(batch_size=2, batch_pause_seconds=0)
+        result = self.maintenance.sweep_expired(policy, now=self.now)
+
+        self.assertEqual(result["sessions"], 5)
+        self.assertEqual(result["otp_codes"], 1)
+        self.assertEqual(result["trusted_devices"], 1)
+        self.assertEqual(result["recovery_codes"], 1)
+        self.assertEqual(result["trashed_passwords"], 1)
+        m = self.models
+        self.assertEqual(self._count(m.Session), 1)
+        self.assertEqual(self._count(m.TrustedDevice), 1)
+        self.assertEqual(self._count(m.RecoveryCode), 1)
+        self.assertEqual(self._count(m.Password), 1)
+        self.assertEqual(self._count(m.PasswordHistory), 0)
+
+    def test_scheduler_records_job_metrics(self):
+        policy = self.maintenance.RetentionPolicy(batch_size=2, batch_pause_seconds=0)
+        scheduler = self.maintenance.MaintenanceScheduler()
+        scheduler.add_job("expiry_sweep", lambda: self.maintenance.sweep_expired(policy, now=self.now), 60)
+
+        scheduler.run_job("expiry_sweep")
+        scheduler.run_job("expiry_sweep")
+
+        job = scheduler.metrics()["jobs"]["expiry_sweep"]
+        self.assertEqual(job["runs"], 2)
+        self.assertEqual(job["failures"], 0)
+        self.assertEqual(job["totals"]["sessions"], 5)
+        self.assertEqual(job["last_result"]["sessions"], 0)
+
+    def test_sqlite_maintenance_reclaims_space_after_purge(self):
+        from database.sqlite_maintenance import run_sqlite_maintenance
+
+        engine = self.engine_module.engine
+        with engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA auto_vacuum").scalar(), 2)
+        m = self.models
+        with self.engine_module.SessionLocal() as s:
+            uid = s.query(m.User.id).scalar()
+            for i in range(400):
+                s.add(m.ActivityLog(user_id=uid, action="bulk", details="x" * 2000))
+            s.commit()
+            s.query(m.ActivityLog).delete()
+            s.commit()
+
+        result = run_sqlite_maintenance(engine, max_vacuum_pages=100000)
+
+        self.assertGreater(result["vacuum_pages"], 0)
+        self.assertGreater(result["reclaimed_bytes"], 0)
+        self.assertEqual(result["wal_bytes"], 0)
+        self.assertIn("total_ms", result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import hashlib
+import importlib
+import os
+import tempfile
+import unittest
+
+
+class PasswordHashTests(unittest.TestCase):
+    ENV = ("PG_PASSWORD_HASH", "PG_PBKDF2_ITERATIONS", "PG_ARGON2_MEMORY_KIB", "PG_ARGON2_TIME_COST")
+
+    def setUp(self):
+        self._saved = {k: os.environ.get(k) for k in self.ENV}
+        os.environ["PG_PBKDF2_ITERATIONS"] = "1000"
+        os.environ["PG_ARGON2_MEMORY_KIB"] = "8192"
+        os.environ["PG_ARGON2_TIME_COST"] = "1"
+        os.environ.pop("PG_PASSWORD_HASH", None)
+
+        fd, db_path = tempfile.mkstemp(prefix="pg_password_hash_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import src.auth.auth_manager as auth_module
+        from src.security import password_hash
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models_module = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.auth_module = importlib.reload(auth_module)
+        self.engine_module.init_db()
+        self.ph = password_hash
+
+        self.auth = self.auth_module.AuthManager()
+        self.email = "rehash@example.com"
+        self.password = "StrongPass123!"
+
+    def tearDown(self):
+        for k, v in self._saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _add_user(self, stored, salt):
+        with self.engine_module.SessionLocal() as s:
+            user = self.models_module.User(
+                username="rehash", email=self.email, password_hash=stored, salt=salt, email_verified=True,
+            )
+            s.add(user)
+            s.commit()
+            return int(user.id)
+
+    def _stored(self, uid):
+        with self.engine_module.SessionLocal() as s:
+            return s.get(self.models_module.User, uid).password_hash
+
+    def test_versioned_format_for_each_algorithm(self):
+        stored = self.ph.hash_password("pw")
+        self.assertTrue(stored.startswith("pbkdf2-sha256$i=1000$"))
+        self.assertEqual(len(stored.split("$")), 4)
+        self.assertTrue(self.ph.verify(stored, "pw"))
+        self.assertFalse(self.ph.verify(stored, "pW"))
+        self.assertNotEqual(self.ph.hash_password("pw"), stored)  # fresh salt
+        self.assertFalse(self.ph.needs_rehash(stored))
+
+        os.environ["PG_PASSWORD_HASH"] = "argon2id"
+        self.assertTrue(self.ph.needs_rehash(stored))
+        self.assertTrue(self.ph.verify(stored, "pw"))  # older algorithms still verify
+        argon = self.ph.hash_password("pw")
+        self.assertTrue(argon.startswith("argon2id$t=1,m=8192,p=1$"))
+        self.assertTrue(self.ph.verify(argon, "pw"))
+        self.assertFalse(self.ph.needs_rehash(argon))
+
+        os.environ["PG_ARGON2_TIME_COST"] = "2"
+        self.assertTrue(self.ph.needs_rehash(argon))
+
+        for broken in ("", "bcrypt$x$y$z", "pbkdf2-sha256$i=1000$not base64!$x", "pbkdf2-sha256$n=1$AA$AA"):
+            self.assertFalse(self.ph.verify(broken, "pw"))
+
+    def test_legacy_hex_hashes_still_verify(self):
+        salt = os.urandom(32).hex()
+        legacy = hashlib.pbkdf2_hmac("sha256", b"pw", salt.encode("utf-8"), 100000).hex()
+        self.assertTrue(self.auth_module.verify_password(legacy, salt, "pw"))
+        self.assertFalse(self.auth_module.verify_password(legacy, salt, "other"))
+        self.assertFalse(self.ph.verify(legacy, "pw"))  # needs its salt
+        self.assertTrue(self.ph.needs_rehash(legacy))
+
+    def test_successful_login_upgrades_a_stale_hash(self):
+        salt = os.urandom(32).hex()
+        legacy = hashlib.pbkdf2_hmac("sha256", self.password.encode("utf-8"), salt.encode("utf-8"), 100000).hex()
+        uid = self._add_user(legacy, salt)
+
+        # a failed login leaves it alone
+        self.assertIsNotNone(self.auth.authenticate(self.email, "wrong", send_2fa=False)["error"])
+        self.assertIsNone(self.auth.last_rehash)
+
+        self.assertIsNone(self.auth.authenticate(self.email, self.password, send_2fa=False)["error"])
+        self.assertTrue(self.auth.last_rehash.result(timeout=10))
+        upgraded = self._stored(uid)
+        self.assertTrue(upgraded.startswith("pbkdf2-sha256$i=1000$"))
+
+        # the next login verifies the new hash and has nothing to upgrade
+        self.auth.last_rehash = None
+        self.assertIsNone(self.auth.authenticate(self.email, self.password, send_2fa=False)["error"])
+        self.assertIsNone(self.auth.last_rehash)
+
+        # a raised cost upgrades again; a hash changed meanwhile is not overwritten
+        os.environ["PG_PBKDF2_ITERATIONS"] = "2000"
+        self.assertTrue(self.auth._rehash_later(uid, upgraded, self.password).result(timeout=10))
+        self.assertTrue(self._stored(uid).startswith("pbkdf2-sha256$i=2000$"))
+        self.assertFalse(self.auth._rehash_later(uid, upgraded, self.password).result(timeout=10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import io
+import json
+import unittest
+
+from src.security.pgvault import open_pgvault, write_pgvault
+
+KDF = {"name": "argon2id", "time_cost": 1, "memory_cost": 8192, "parallelism": 1, "hash_len": 32}
+
+
+def _entries(n):
+    return [{"site_name": f"s{i}", "username": "me", "encrypted_password": f"gAAAA{i:05d}" * 3} for i in range(n)]
+
+
+class PgVaultV2Tests(unittest.TestCase):
+    def _write(self, entries, **kwargs):
+        buf = io.BytesIO()
+        kwargs.setdefault("kdf", KDF)
+        n = write_pgvault(buf, iter(entries), "correct horse", meta={"version": 1}, **kwargs)
+        self.assertEqual(n, len(entries))
+        return buf.getvalue()
+
+    def test_round_trip_with_and_without_compression(self):
+        entries = _entries(500)
+        for compress in (True, False):
+            data = self._write(entries, compress=compress, chunk_size=300, index_every=40)
+            reader = open_pgvault(io.BytesIO(data), "correct horse")
+            self.assertEqual((reader.version, reader.meta, len(reader)), (2, {"version": 1}, 500))
+            self.assertEqual(list(reader), entries)
+        self.assertLess(len(self._write(entries, compress=True)), len(self._write(entries, compress=False)) / 2)
+
+    def test_index_seeks_into_the_middle(self):
+        entries = _entries(300)
+        reader = open_pgvault(io.BytesIO(self._write(entries, chunk_size=128, index_every=25)), "correct horse")
+        for start in (1, 24, 25, 26, 299, 300):
+            self.assertEqual(list(reader.entries(start)), entries[start:])
+
+    def test_empty_vault_and_chunk_sized_payloads(self):
+        self.assertEqual(list(open_pgvault(io.BytesIO(self._write([])), "correct horse")), [])
+        # payload lengths that end exactly on a chunk boundary get an empty final chunk
+        for size in range(60, 70):
+            entries = _entries(3)
+            data = self._write(entries, compress=False, chunk_size=size)
+            self.assertEqual(list(open_pgvault(io.BytesIO(data), "correct horse")), entries)
+
+    def test_wrong_passphrase_tampering_and_truncation_are_rejected(self):
+        entries = _entries(200)
+        data = self._write(entries, chunk_size=256)
+        with self.assertRaises(ValueError):
+            open_pgvault(io.BytesIO(data), "wrong")
+
+        header_end = 8 + 4 + int.from_bytes(data[8:12], "big")
+        record = 5 + 256 + 16
+
+        flipped = bytearray(data)
+        flipped[header_end + record + 20] ^= 1  # inside the second chunk
+        with self.assertRaises(ValueError):
+            list(open_pgvault(io.BytesIO(bytes(flipped)), "correct horse"))
+
+        swapped = bytearray(data)
+        a, b = header_end + record, header_end + 2 * record
+        swapped[a:b], swapped[b:b + record] = data[b:b + record], data[a:b]
+        with self.assertRaises(ValueError):
+            list(open_pgvault(io.BytesIO(bytes(swapped)), "correct horse"))
+
+        # cut on a chunk boundary: the last chunk read is not flagged final
+        cut = data[:header_end + 2 * record]
+        with self.assertRaises(ValueError):
+            list(open_pgvault(io.BytesIO(cut), "correct horse"))
+
+        # a non-final chunk relabelled as final does not authenticate
+        relabelled = bytearray(cut)
+        relabelled[header_end + record] = 0x01
+        with self.assertRaises(ValueError):
+            list(open_pgvault(io.BytesIO(bytes(relabelled)), "correct horse"))
+
+    def test_v1_files_stay_readable(self):
+        import src.security.encryption as enc
+
+        real = enc._argon2_key
+        enc._argon2_key = lambda p, s, **kw: real(p, s, 1, 8192, 1, 32)
+        try:
+            blob = enc.encrypt_vault_payload({"version": 1, "passwords": _entries(3)}, "correct horse")
+        finally:
+            enc._argon2_key = real
+        blob["kdf"].update(time_cost=1, memory_cost=8192, parallelism=1)
+        reader = open_pgvault(io.BytesIO(json.dumps(blob, indent=2).encode("utf-8")), "correct horse")
+        self.assertEqual((reader.version, reader.meta, len(reader)), (1, {"version": 1}, 3))
+        self.assertEqual(list(reader), _entries(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class ReencryptionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_reencrypt_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "vault.db").replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.reencrypt as reencrypt_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.reencrypt = importlib.reload(reencrypt_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+        self.repo = self.app_module.passwords
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="rot", email="rot@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _seed(self, repo, tokens):
+        return [
+            repo.add(self.uid, {"site_name": f"s{i}", "username": "me", "encrypted_password": tok})
+            for i, tok in enumerate(tokens)
+        ]
+
+    def test_job_checkpoints_resumes_and_rewrites_only_what_is_needed(self):
+        from src.security.encryption import decrypt_any, encrypt_aes_gcm, encrypt_for_storage
+
+        tokens = [encrypt_aes_gcm(f"pw{i}") for i in range(5)]
+        tokens += [encrypt_for_storage("kept"), "legacy-plain", "gcm1:broken"]
+        ids = self._seed(self.repo, tokens)
+        before = self.repo.get(ids[0])["last_updated"]
+
+        job = self.reencrypt.request_reencryption(self.uid, "fernet")
+        self.assertEqual(job["status"], "pending")
+        first = self.reencrypt.run_reencryption(self.repo, job["id"], batch_size=3, max_batches=1)
+        self.assertEqual((first["processed"], first["done"]), (3, 0))
+        state = self.reencrypt.reencryption_status(self.uid)
+        self.assertEqual((state["status"], state["last_id"], state["total"]), ("running", ids[2], 8))
+
+        # the maintenance job picks the running job up where it stopped
+        totals = self.reencrypt.run_pending_reencryptions(self.repo, batch_size=3)
+        self.assertEqual(totals["completed"], 1)
+        state = self.reencrypt.reencryption_status(self.uid)
+        self.assertEqual(
+            (state["status"], state["processed"], state["rewritten"], state["skipped"], state["failed"]),
+            ("done", 8, 5, 2, 1),
+        )
+        self.assertEqual(state["progress"], 1.0)
+
+        stored = [self.repo.get(pid)["encrypted_password"] for pid in ids]
+        self.assertTrue(all(t.startswith("gAAAA") for t in stored[:6]))
+        self.assertEqual([decrypt_any(t) for t in stored[:5]], [f"pw{i}" for i in range(5)])
+        self.assertEqual(stored[5:], tokens[5:])  # already fernet, plain, unreadable
+        self.assertEqual(self.repo.get(ids[0])["last_updated"], before)
+
+    def test_concurrent_edit_wins_over_the_rewrite(self):
+        from src.security.encryption import encrypt_aes_gcm
+
+        ids = self._seed(self.repo, [encrypt_aes_gcm("a"), encrypt_aes_gcm("b")])
+        repo = self.repo
+
+        class EditingRepo:
+            def __getattr__(self, name):
+                return getattr(repo, name)
+
+            def swap_secrets(self, user_id, changes):
+                repo.update(ids[0], {"encrypted_password": "gAAAA-edited-by-user"})
+                return repo.swap_secrets(user_id, changes)
+
+        job = self.reencrypt.request_reencryption(self.uid, "fernet")
+        self.reencrypt.run_reencryption(EditingRepo(), job["id"])
+        self.assertEqual(repo.get(ids[0])["encrypted_password"], "gAAAA-edited-by-user")
+        self.assertTrue(repo.get(ids[1])["encrypted_password"].startswith("gAAAA"))
+        state = self.reencrypt.reencryption_status(self.uid)
+        self.assertEqual((state["rewritten"], state["skipped"]), (1, 1))
+
+    def test_zk1_key_rotation_on_the_log_store(self):
+        from backend_api.repository import LogPasswordRepository
+        from database.logstore import LogStore
+        from src.security.crypto import decrypt_secret, encrypt_secret
+
+        old_key, new_key = os.urandom(32), os.urandom(32)
+        with LogStore(os.path.join(self.tmp, "vault.vlog")) as store:
+            repo = LogPasswordRepository(store)
+            ids = self._seed(repo, ["zk1:" + encrypt_secret(f"z{i}", old_key) for i in range(4)])
+            job = self.reencrypt.request_reencryption(self.uid, "zk1")
+            # the server-side job cannot run it without the key
+            self.assertEqual(self.reencrypt.run_pending_reencryptions(repo)["processed"], 0)
+            result = self.reencrypt.run_reencryption(repo, job["id"], batch_size=3, zk_key=new_key,
+                                                     source_zk_key=old_key, rate_per_second=1000)
+            self.assertEqual((result["rewritten"], result["done"]), (4, 1))
+            self.assertEqual([decrypt_secret(repo.get(pid)["encrypted_password"], new_key) for pid in ids],
+                             [f"z{i}" for i in range(4)])
+
+    def test_endpoints(self):
+        self.assertEqual(self.client.post(f"/vault/{self.uid}/reencrypt", json={"target": "zk1"}).status_code, 400)
+        self.assertEqual(self.client.get(f"/vault/{self.uid}/reencrypt").status_code, 404)
+        r = self.client.post(f"/vault/{self.uid}/reencrypt", json={"target": "gcm1"})
+        self.assertEqual(r.status_code, 202)
+        job = self.client.get(f"/vault/{self.uid}/reencrypt").get_json()["job"]
+        self.assertEqual((job["target"], job["status"]), ("gcm1", "pending"))
+        self.assertEqual(self.client.post("/vault/999999/reencrypt", json={}).status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
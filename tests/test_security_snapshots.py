@@ -0,0 +1,83 @@
+import importlib
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+
+class SecuritySnapshotTests(unittest.TestCase):
+    def setUp(self):
+        fd, db_path = tempfile.mkstemp(prefix="pg_snapshots_", suffix=".db")
+        os.close(fd)
+        self.db_path = db_path
+        os.environ["DATABASE_URL"] = "sqlite:///" + db_path.replace("\\", "/")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.snapshots as snapshots_module
+        import backend_api.app as app_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        self.snapshots = importlib.reload(snapshots_module)
+        self.app_module = importlib.reload(app_module)
+        self.client = self.app_module.app.test_client()
+
+        with self.engine_module.SessionLocal() as s:
+            user = self.models.User(username="snap", email="snap@example.com", password_hash="x", salt="y")
+            s.add(user)
+            s.commit()
+            self.uid = user.id
+
+    def tearDown(self):
+        self.engine_module.engine.dispose()
+        try:
+            os.remove(self.db_path)
+        except OSError:
+            pass
+
+    def _add(self, strength):
+        r = self.client.post("/passwords", json={
+            "user_id": self.uid, "site_name": strength, "username": "me",
+            "encrypted_password": "tok", "strength": strength,
+        })
+        return r.get_json()["id"]
+
+    def test_daily_snapshots_feed_weekly_trend(self):
+        repo = self.app_module.passwords
+        monday = date(2026, 9, 7)
+        weak = self._add("weak")
+        self._add("strong")
+        self.snapshots.take_snapshots(repo, day=monday)
+        self.client.put(f"/passwords/{weak}", json={"strength": "strong"})
+        self.snapshots.take_snapshots(repo, day=monday + timedelta(days=2))
+        self._add("medium")
+        report = self.snapshots.take_snapshots(repo, day=monday + timedelta(days=7))
+        self.assertEqual(report, {"users": 1, "written": 1})
+        # already snapshotted: the vault is not read again
+        self.assertEqual(self.snapshots.take_snapshots(repo, day=monday + timedelta(days=7))["written"], 0)
+
+        points = self.snapshots.trend(self.uid, "week", "4w", today=monday + timedelta(days=8))
+        self.assertEqual([p["start"] for p in points], [monday, monday + timedelta(days=7)])
+        self.assertEqual([p["score"] for p in points], [100, 83])  # last snapshot of each week
+        self.assertEqual(points[0]["strong"], 2)
+
+        daily = self.snapshots.trend(self.uid, "day", "30d", today=monday + timedelta(days=8))
+        self.assertEqual([p["score"] for p in daily], [50, 100, 83])
+
+    def test_trend_endpoint(self):
+        self._add("strong")
+        self._add("weak")
+        body = self.client.get(f"/stats/{self.uid}/trend?bucket=month&range=6m").get_json()
+        # first request of the day takes today's snapshot
+        self.assertEqual(len(body["points"]), 1)
+        self.assertEqual((body["points"][0]["score"], body["points"][0]["added"]), (50, 2))
+        self.assertEqual(self.client.get(f"/stats/{self.uid}/trend?bucket=year").status_code, 400)
+        self.assertEqual(self.client.get(f"/stats/{self.uid}/trend?range=forever").status_code, 400)
+        self.assertEqual(self.client.get(f"/stats/{self.uid}").get_json()["score"], 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
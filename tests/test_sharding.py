@@ -0,0 +1,131 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class UserShardingTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp(prefix="pg_shards_")
+        os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(self.tmp, "directory.db").replace("\\", "/")
+        os.environ["DB_SHARDS"] = "3"
+        os.environ["DB_SHARD_DIR"] = os.path.join(self.tmp, "shards")
+
+        import database.engine as engine_module
+        import database.models as models_module
+        import database.queries as queries_module
+        import backend_api.maintenance as maintenance_module
+        import backend_api.purge as purge_module
+        import backend_api.app as app_module
+        import database.shards as shards_module
+
+        self.engine_module = importlib.reload(engine_module)
+        self.models = importlib.reload(models_module)
+        importlib.reload(queries_module)
+        importlib.reload(maintenance_module)
+        self.purge = importlib.reload(purge_module)
+        self.app_module = importlib.reload(app_module)
+        self.shards = importlib.reload(shards_module)
+        self.client = self.app_module.app.test_client()
+
+        m = self.models
+        with self.engine_module.SessionLocal() as s:
+            users = [m.User(username=f"u{i}", email=f"u{i}@example.com", password_hash="x", salt="y")
+                     for i in range(4)]
+            s.add_all(users)
+            s.commit()
+            self.user_ids = [u.id for u in users]
+
+    def tearDown(self):
+        for eng in self.engine_module.all_engines():
+            eng.dispose()
+        os.environ.pop("DB_SHARDS", None)
+        os.environ.pop("DB_SHARD_DIR", None)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def _add(self, uid, name):
+        resp = self.client.post("/passwords", json={
+            "user_id": uid, "site_name": name, "username": "me", "encrypted_password": "tok",
+        })
+        self.assertEqual(resp.status_code, 200)
+        return resp.get_json()["id"]
+
+    def _count(self, factory, model, uid):
+        from sqlalchemy import func, select
+        with factory() as s:
+            return s.execute(select(func.count()).select_from(model).where(model.user_id == uid)).scalar_one()
+
+    def test_rows_live_in_the_users_shard_and_ids_route_back(self):
+        e, m = self.engine_module, self.models
+        ids = {uid: self._add(uid, f"site{uid}") for uid in self.user_ids}
+
+        for uid in self.user_ids:
+            shard = e.shard_of(uid)
+            self.assertEqual(self._count(e.shard_sessions[shard], m.Password, uid), 1)
+            self.assertEqual(self._count(e.SessionLocal, m.Password, uid), 0)
+        # local ids repeat across shard files, public ids do not
+        self.assertEqual(len(set(ids.values())), len(ids))
+
+        uid = self.user_ids[1]
+        self.assertEqual(self.client.post(f"/passwords/{ids[uid]}/trash").status_code, 200)
+        rows = self.client.get(f"/passwords/{uid}").get_json()
+        self.assertEqual([r["id"] for r in rows], [ids[uid]])
+        self.assertIsNotNone(rows[0]["trashed_at"])
+        other = self.client.get(f"/passwords/{self.user_ids[0]}").get_json()
+        self.assertIsNone(other[0]["trashed_at"])
+
+    def test_move_user_to_another_shard(self):
+        e, m = self.engine_module, self.models
+        uid = self.user_ids[0]
+        pid = self._add(uid, "a")
+        self._add(uid, "b")
+        factory, local = e.row_sessionmaker(pid)
+        with factory() as s:
+            s.add(m.PasswordHistory(password_id=local, old_encrypted_password="old"))
+            s.commit()
+
+        source = e.shard_of(uid)
+        target = (source + 1) % e.SHARD_COUNT
+        counts = self.shards.move_user(uid, target)
+
+        self.assertEqual(counts["passwords"], 2)
+        self.assertEqual(counts["password_history"], 1)
+        self.assertEqual(e.shard_of(uid), target)
+        self.assertEqual(self._count(e.shard_sessions[source], m.Password, uid), 0)
+        rows = self.client.get(f"/passwords/{uid}").get_json()
+        self.assertEqual(sorted(r["site_name"] for r in rows), ["a", "b"])
+
+    def test_rebalance_spreads_users_sharing_a_shard(self):
+        e = self.engine_module
+        first, last = self.user_ids[0], self.user_ids[3]
+        self.assertEqual(e.shard_of(first), e.shard_of(last))
+        for uid in (first, last):
+            for i in range(3):
+                self._add(uid, f"s{i}")
+        before = sum(s["rows"] for s in self.shards.shard_status())
+
+        moves = self.shards.rebalance()
+
+        self.assertEqual(len(moves), 1)
+        self.assertNotEqual(e.shard_of(first), e.shard_of(last))
+        self.assertEqual(self.shards.plan_rebalance(), [])
+        self.assertEqual(sum(s["rows"] for s in self.shards.shard_status()), before)
+
+    def test_purge_spans_directory_and_shard(self):
+        e, m = self.engine_module, self.models
+        uid = self.user_ids[2]
+        self._add(uid, "gone")
+        self.assertEqual(self.client.delete(f"/account/{uid}").status_code, 202)
+
+        self.purge.run_pending_purges(batch_size=10, pause_seconds=0)
+
+        self.assertEqual(self._count(e.shard_sessions[uid % e.SHARD_COUNT], m.Password, uid), 0)
+        with e.SessionLocal() as s:
+            self.assertIsNone(s.get(m.User, uid))
+            self.assertIsNone(s.get(m.UserShard, uid))
+        self.assertEqual(self.purge.purge_status(uid)["status"], "done")
+
+
+if __name__ == "__main__":
+    unittest.main()